@@ -176,6 +176,7 @@ func setupRoutes(h *handlers.Handlers, authProvider auth.AuthProvider, logger *o
 
 	apiRouter := r.PathPrefix("/api/v1").Subrouter()
 	apiRouter.Use(middleware.RequireAuth(authProvider))
+	apiRouter.Use(middleware.ConditionalGET())
 
 	// Existing API routes
 	apiRouter.HandleFunc("/dashboard/summary", h.GetDashboardSummary).Methods("GET")
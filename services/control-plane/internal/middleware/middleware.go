@@ -3,7 +3,10 @@
 package middleware
 
 import (
+	"bytes"
 	"context"
+	"crypto/sha256"
+	"fmt"
 	"net/http"
 	"strings"
 	"time"
@@ -105,6 +108,51 @@ func RequireAuth(provider auth.AuthProvider) func(http.Handler) http.Handler {
 	}
 }
 
+// ConditionalGET 為成功的 GET 回應計算 ETag，並在 If-None-Match 相符時回傳 304 Not Modified，
+// 讓客戶端 (例如 SRE Assistant 的快取) 以條件請求重新驗證，不必重新下載整個回應。
+func ConditionalGET() func(http.Handler) http.Handler {
+	return func(next http.Handler) http.Handler {
+		return http.HandlerFunc(func(w http.ResponseWriter, r *http.Request) {
+			if r.Method != http.MethodGet {
+				next.ServeHTTP(w, r)
+				return
+			}
+
+			buf := &bufferedResponseWriter{header: w.Header(), statusCode: http.StatusOK}
+			next.ServeHTTP(buf, r)
+
+			if buf.statusCode == http.StatusOK {
+				if w.Header().Get("ETag") == "" {
+					sum := sha256.Sum256(buf.body.Bytes())
+					w.Header().Set("ETag", fmt.Sprintf(`W/"%x"`, sum[:16]))
+				}
+				if etagMatches(r.Header.Get("If-None-Match"), w.Header().Get("ETag")) {
+					w.Header().Del("Content-Type")
+					w.Header().Del("Content-Length")
+					w.WriteHeader(http.StatusNotModified)
+					return
+				}
+			}
+			w.WriteHeader(buf.statusCode)
+			w.Write(buf.body.Bytes())
+		})
+	}
+}
+
+// etagMatches 以弱比較 (忽略 W/ 前綴) 檢查 If-None-Match 是否包含目前的 ETag。
+func etagMatches(ifNoneMatch, etag string) bool {
+	if ifNoneMatch == "" || etag == "" {
+		return false
+	}
+	for _, candidate := range strings.Split(ifNoneMatch, ",") {
+		candidate = strings.TrimSpace(candidate)
+		if candidate == "*" || strings.TrimPrefix(candidate, "W/") == strings.TrimPrefix(etag, "W/") {
+			return true
+		}
+	}
+	return false
+}
+
 // RequireSession 是一個保護 Web UI 頁面的中介軟體。
 // 在 dev 模式下，它會檢查一個簡單的 session cookie。
 // 在 keycloak 模式下，它會與 OIDC 整合（TODO）。
@@ -144,3 +192,16 @@ func (rw *responseWriter) WriteHeader(code int) {
 	rw.statusCode = code
 	rw.ResponseWriter.WriteHeader(code)
 }
+
+// bufferedResponseWriter 暫存處理器的回應，讓 ConditionalGET 能在送出前計算 ETag。
+type bufferedResponseWriter struct {
+	header     http.Header
+	statusCode int
+	body       bytes.Buffer
+}
+
+func (b *bufferedResponseWriter) Header() http.Header { return b.header }
+
+func (b *bufferedResponseWriter) WriteHeader(code int) { b.statusCode = code }
+
+func (b *bufferedResponseWriter) Write(p []byte) (int, error) { return b.body.Write(p) }
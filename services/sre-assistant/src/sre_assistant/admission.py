@@ -0,0 +1,228 @@
+# services/sre-assistant/src/sre_assistant/admission.py
+"""
+診斷任務的准入控制
+所有已接受但尚未完成的任務都計入有界佇列 (performance.task_queue_size) 與各類型的上限；
+超過時拒絕並依目前的排隊量與平均執行時間估算 Retry-After，
+而不是無限制地累積背景任務。佇列深度與等待時間匯出為 Prometheus 指標供自動擴展使用。
+已接受的任務依優先級與呼叫端由 WeightedFairScheduler 分配執行名額
+"""
+
+import math
+import time
+import structlog
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from .scheduler import WeightedFairScheduler
+
+logger = structlog.get_logger(__name__)
+
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "sre_assistant_admission_queue_depth",
+    "已接受但尚未完成的診斷任務數 (state=queued 等待執行 / running 執行中)",
+    ("request_type", "state"),
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "sre_assistant_admission_wait_seconds",
+    "診斷任務從被接受到開始執行的等待時間",
+    ("request_type",),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+ADMISSION_REJECTED = Counter(
+    "sre_assistant_admission_rejected_total",
+    "因佇列已滿而被拒絕 (429) 的診斷任務數",
+    ("request_type", "reason"),
+)
+
+
+class AdmissionRejected(Exception):
+    """佇列已滿；retry_after 為建議的重試秒數"""
+
+    def __init__(self, request_type: str, reason: str, retry_after: int):
+        super().__init__(f"{request_type} 任務佇列已滿 ({reason})，請於 {retry_after} 秒後重試")
+        self.request_type = request_type
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class QueueBacklog:
+    """
+    外部任務佇列 (Redis Stream) 的待處理量快照
+
+    - by_type: 各請求類型已排入但尚未確認完成的任務數
+    - by_client: 各呼叫端已排入但尚未確認完成的任務數
+    - durations: worker 回報的各類型平均執行時間 (秒)
+    - concurrency: 目前存活的 worker 執行名額總數；0 表示沒有 worker 在消化佇列
+    """
+
+    __slots__ = ("by_type", "by_client", "durations", "concurrency")
+
+    def __init__(self, by_type: Optional[Dict[str, int]] = None, by_client: Optional[Dict[str, int]] = None, durations: Optional[Dict[str, float]] = None, concurrency: int = 0):
+        self.by_type = dict(by_type or {})
+        self.by_client = dict(by_client or {})
+        self.durations = dict(durations or {})
+        self.concurrency = concurrency
+
+    @property
+    def total(self) -> int:
+        return sum(self.by_type.values())
+
+
+class AdmissionTicket:
+    """一個已被接受的任務；必須以 AdmissionController.slot() 執行或以 release() 釋放"""
+
+    __slots__ = ("request_type", "priority", "client", "admitted_at", "released")
+
+    def __init__(self, request_type: str, priority: str = "P2", client: str = "anonymous"):
+        self.request_type = request_type
+        self.priority = priority
+        self.client = client
+        self.admitted_at = time.monotonic()
+        self.released = False
+
+
+class AdmissionController:
+    """
+    有界佇列 + 有限並行度
+
+    - max_queue_size: 所有類型已接受但未完成的任務總數上限
+    - type_limits: 各請求類型的上限，例如 {"bulk_remediation": 20}
+    - client_limit: 單一呼叫端已接受但未完成的任務上限 (None 表示不限制)
+    - p0_reserved_queue: 佇列中保留給 P0 的容量；非 P0 任務在總數達到 max_queue_size - p0_reserved_queue 時即被拒絕
+    - concurrency: 本程序中同時執行的工作流程數；其餘已接受的任務在 slot() 中依優先級排隊
+    - default_priorities: 請求未指定優先級時各類型的預設值，例如 {"execute_query": "P3"}
+    - Retry-After ≈ 需要先完成的任務數 × 平均執行時間 / 並行度 (佇列模式為 worker 回報的值)，限制在 [min_retry_after, max_retry_after]
+    """
+
+    def __init__(self, max_queue_size: int = 1000, concurrency: int = 4, type_limits: Optional[Dict[str, int]] = None, default_duration: float = 30.0, min_retry_after: int = 1, max_retry_after: int = 300, client_limit: Optional[int] = None, p0_reserved_queue: int = 0, scheduler: Optional[WeightedFairScheduler] = None, default_priorities: Optional[Dict[str, str]] = None):
+        self.max_queue_size = max(1, max_queue_size)
+        self.concurrency = max(1, concurrency)
+        self.type_limits = dict(type_limits or {})
+        self.default_duration = default_duration
+        self.min_retry_after = min_retry_after
+        self.max_retry_after = max_retry_after
+        self.client_limit = client_limit
+        self.p0_reserved_queue = min(max(0, p0_reserved_queue), self.max_queue_size - 1)
+        self.scheduler = scheduler or WeightedFairScheduler(self.concurrency)
+        self.default_priorities = dict(default_priorities or {})
+        self._clients: Dict[str, int] = {}
+        self._queued: Dict[str, int] = {}
+        self._running: Dict[str, int] = {}
+        # 以指數移動平均估算各類型的執行時間
+        self._durations: Dict[str, float] = {}
+
+    def depth(self, request_type: Optional[str] = None) -> int:
+        if request_type is not None:
+            return self._queued.get(request_type, 0) + self._running.get(request_type, 0)
+        return sum(self._queued.values()) + sum(self._running.values())
+
+    def admit(self, request_type: str, backlog: Optional[QueueBacklog] = None, priority: Optional[str] = None, client: Optional[str] = None) -> AdmissionTicket:
+        """
+        接受或拒絕一個任務
+
+        `backlog` 為外部佇列 (Redis Stream 任務佇列) 的待處理量；提供時總上限、各類型與各呼叫端上限
+        以佇列中的任務數加上本程序尚未排入佇列的憑證計算，Retry-After 改用 worker 回報的
+        執行時間與 worker 的並行度估算
+        """
+        priority = self.scheduler.normalize(priority or self.default_priorities.get(request_type))
+        client = client or "anonymous"
+        total, type_depth, client_depth = self.depth(), self.depth(request_type), self._clients.get(client, 0)
+        durations, concurrency = self._durations, self.concurrency
+        if backlog is not None:
+            total += backlog.total
+            type_depth += backlog.by_type.get(request_type, 0)
+            client_depth += backlog.by_client.get(client, 0)
+            durations, concurrency = {**self._durations, **backlog.durations}, backlog.concurrency
+        capacity = self.max_queue_size if priority == "P0" else self.max_queue_size - self.p0_reserved_queue
+        if total >= capacity:
+            self._reject(request_type, "queue_full", total - capacity + 1, self.average_duration(durations=durations), concurrency)
+        limit = self.type_limits.get(request_type)
+        if limit is not None and type_depth >= limit:
+            self._reject(request_type, "type_limit", type_depth - limit + 1, self.average_duration(request_type, durations), concurrency)
+        if self.client_limit is not None and client_depth >= self.client_limit:
+            self._reject(request_type, "client_limit", client_depth - self.client_limit + 1, self.average_duration(request_type, durations), concurrency)
+
+        ticket = AdmissionTicket(request_type, priority, client)
+        self._queued[request_type] = self._queued.get(request_type, 0) + 1
+        self._clients[client] = self._clients.get(client, 0) + 1
+        self._export(request_type)
+        return ticket
+
+    def release(self, ticket: AdmissionTicket):
+        """不經 slot() 執行就結束的任務 (例如已交給外部任務佇列)"""
+        if ticket.released:
+            return
+        ticket.released = True
+        self._queued[ticket.request_type] -= 1
+        self._release_client(ticket.client)
+        self._export(ticket.request_type)
+
+    @asynccontextmanager
+    async def slot(self, ticket: AdmissionTicket):
+        """依優先級與呼叫端等待執行名額；離開時釋放名額並更新平均執行時間"""
+        request_type = ticket.request_type
+        try:
+            priority = await self.scheduler.acquire(ticket.priority, ticket.client)
+        except BaseException:
+            self.release(ticket)
+            raise
+        ticket.released = True
+        started = time.monotonic()
+        ADMISSION_WAIT_SECONDS.labels(request_type).observe(started - ticket.admitted_at)
+        self._queued[request_type] -= 1
+        self._running[request_type] = self._running.get(request_type, 0) + 1
+        self._export(request_type)
+        try:
+            yield
+        finally:
+            self._running[request_type] -= 1
+            self._release_client(ticket.client)
+            self._record_duration(request_type, time.monotonic() - started)
+            self._export(request_type)
+            self.scheduler.release(priority)
+
+    def average_duration(self, request_type: Optional[str] = None, durations: Optional[Dict[str, float]] = None) -> float:
+        durations = self._durations if durations is None else durations
+        if request_type in durations:
+            return durations[request_type]
+        if durations:
+            return sum(durations.values()) / len(durations)
+        return self.default_duration
+
+    def retry_after(self, excess: int, average_duration: float, concurrency: Optional[int] = None) -> int:
+        """concurrency 預設為本程序的並行度；為 0 (沒有 worker 消化佇列) 時回傳上限"""
+        concurrency = self.concurrency if concurrency is None else concurrency
+        if concurrency <= 0:
+            return self.max_retry_after
+        seconds = math.ceil(max(excess, 1) * average_duration / concurrency)
+        return int(min(max(seconds, self.min_retry_after), self.max_retry_after))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_queue_size": self.max_queue_size,
+            "concurrency": self.concurrency,
+            "queued": {key: value for key, value in self._queued.items() if value},
+            "running": {key: value for key, value in self._running.items() if value},
+            "waiting_by_priority": {priority: self.scheduler.waiting(priority) for priority in self.scheduler.weights},
+        }
+
+    def _reject(self, request_type: str, reason: str, excess: int, average_duration: float, concurrency: Optional[int] = None):
+        retry_after = self.retry_after(excess, average_duration, concurrency)
+        ADMISSION_REJECTED.labels(request_type, reason).inc()
+        logger.warning(f"🚦 拒絕 {request_type} 任務 ({reason})，目前佇列 {self.depth()}/{self.max_queue_size}，Retry-After {retry_after}s")
+        raise AdmissionRejected(request_type, reason, retry_after)
+
+    def _release_client(self, client: str):
+        self._clients[client] -= 1
+        if not self._clients[client]:
+            del self._clients[client]
+
+    def _record_duration(self, request_type: str, duration: float, alpha: float = 0.2):
+        previous = self._durations.get(request_type)
+        self._durations[request_type] = duration if previous is None else alpha * duration + (1 - alpha) * previous
+
+    def _export(self, request_type: str):
+        ADMISSION_QUEUE_DEPTH.labels(request_type, "queued").set(self._queued.get(request_type, 0))
+        ADMISSION_QUEUE_DEPTH.labels(request_type, "running").set(self._running.get(request_type, 0))
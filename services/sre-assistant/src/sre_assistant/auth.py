@@ -8,7 +8,7 @@
 import time
 import httpx
 import structlog
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Set
 
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPAuthorizationCredentials
@@ -111,6 +111,18 @@ async def decode_token(token: str) -> Dict[str, Any]:
         raise e
 
 
+def token_roles(payload: Dict[str, Any]) -> Set[str]:
+    """
+    收集 Token 中的角色：Keycloak 的 realm_access / resource_access (僅限發出請求的客戶端) 與頂層的 roles
+    """
+    roles = set(payload.get("roles") or [])
+    roles.update((payload.get("realm_access") or {}).get("roles") or [])
+    client = payload.get("azp")
+    if client:
+        roles.update(((payload.get("resource_access") or {}).get(client) or {}).get("roles") or [])
+    return roles
+
+
 async def verify_token(creds: HTTPAuthorizationCredentials = Depends(security)) -> Dict[str, Any]:
     """
     驗證來自 Control Plane 的 M2M JWT Token。
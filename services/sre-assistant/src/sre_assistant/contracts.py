@@ -71,6 +71,7 @@ class ToolResult(BaseModel):
     success: bool
     data: Optional[Dict[str, Any]] = None
     error: Optional[ToolError] = None
+    metadata: Optional[Dict[str, Any]] = None
 
 # ============================================
 # New API Contracts from openapi.yaml
@@ -80,6 +81,7 @@ class AlertAnalysisRequest(BaseModel):
     """定義告警分析請求的資料結構。"""
     alert_ids: List[str] = Field(..., description="要分析的告警 ID 列表")
     correlation_window: int = Field(300, description="關聯時間窗口（秒）")
+    priority: Optional[Literal['P0', 'P1', 'P2', 'P3']] = Field(None, description="排程優先級（未提供時依請求類型的預設值）")
 
 class CapacityAnalysisRequest(BaseModel):
     """定義容量分析請求的資料結構。"""
@@ -124,6 +126,19 @@ class ExecuteRequest(BaseModel):
     query: str = Field(..., description="自然語言查詢")
     context: Optional[Dict[str, Any]] = Field(None, description="查詢上下文")
     options: Optional[Dict[str, Any]] = Field(None, description="執行選項")
+    priority: Optional[Literal['P0', 'P1', 'P2', 'P3']] = Field(None, description="排程優先級（未提供時依請求類型的預設值）")
+
+class BulkRemediationRequest(BaseModel):
+    """定義大量修復請求的資料結構：將同一個自動化腳本分波次套用到多個資源。"""
+    script_id: str = Field(..., description="要執行的腳本 ID")
+    target_resources: List[str] = Field(..., min_length=1, description="目標資源 ID 列表")
+    parameters: Optional[Dict[str, Any]] = Field(None, description="腳本參數")
+    dry_run: bool = Field(False, description="是否只做模擬執行")
+    concurrency: Optional[int] = Field(None, ge=1, le=50, description="同時進行的 Control Plane 呼叫數")
+    wave_size: Optional[int] = Field(None, ge=1, description="每個波次的資源數")
+    max_failures: Optional[int] = Field(None, ge=1, description="失敗資源數達到此值時停止")
+    max_failure_ratio: Optional[float] = Field(None, ge=0, le=1, description="波次結束時失敗比例超過此值則停止")
+    priority: Optional[Literal['P0', 'P1', 'P2', 'P3']] = Field(None, description="排程優先級（未提供時依請求類型的預設值）")
 
 # ============================================
 # Models for Skeleton Completion
@@ -156,6 +171,7 @@ class WorkflowTemplate(BaseModel):
     name: str = Field(..., description="模板名稱")
     description: Optional[str] = Field(None, description="模板描述")
     parameters: List[Dict[str, Any]] = Field([], description="模板參數定義")
+    nodes: List[Dict[str, Any]] = Field([], description="DAG 節點 (名稱、相依節點、逾時)")
 
 class ToolStatus(BaseModel):
     """代表單一診斷工具的健康狀態。"""
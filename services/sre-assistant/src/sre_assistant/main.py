@@ -4,12 +4,14 @@ SRE Assistant 主程式入口
 提供 REST API 端點供 Control Plane 呼叫 (已重構為非同步)
 """
 
-from fastapi import FastAPI, HTTPException, Depends, Request, BackgroundTasks, Response
+from fastapi import FastAPI, HTTPException, Depends, Request, BackgroundTasks, Response, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from contextlib import asynccontextmanager
 from datetime import datetime, timezone, timedelta
 import uuid
 import asyncio
+import json
 from typing import Dict, Any, Optional, List
 import redis.asyncio as redis
 import asyncpg
@@ -18,7 +20,7 @@ import httpx
 from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 
 from .dependencies import config_manager, security
-from .auth import verify_token, decode_token
+from .auth import verify_token, decode_token, token_roles
 
 from .contracts import (
     DiagnosticRequest,
@@ -28,6 +30,7 @@ from .contracts import (
     CapacityAnalysisRequest,
     CapacityAnalysisResponse,
     ExecuteRequest,
+    BulkRemediationRequest,
     DiagnosticHistoryList,
     DiagnosticHistoryItem,
     WorkflowTemplate,
@@ -35,17 +38,21 @@ from .contracts import (
     Pagination,
 )
 from .workflow import SREWorkflow, SREWorkflowRequest
+from .tools.loki_tail import LokiTailManager
+from .tools.logql_guard import SelectorRejectedError
+from .tools.template_profiles import TemplateProfiler
+from .tools.cache_invalidation import CacheInvalidationListener
+from .tools.resource_inventory import InventorySyncer, SQLiteInventoryStore, PostgresInventoryStore
+from .task_queue import DiagnosisTaskQueue
+from .admission import AdmissionController, AdmissionRejected, AdmissionTicket, ADMISSION_QUEUE_DEPTH
+from .scheduler import WeightedFairScheduler
 
 # --- 結構化日誌 & OpenTelemetry 設定 ---
 import structlog
 import contextvars
 from opentelemetry import trace
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
-from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
-from opentelemetry.sdk.resources import Resource, SERVICE_NAME
 from opentelemetry.instrumentation.fastapi import OpenTelemetryMiddleware
-from opentelemetry.instrumentation.httpx import HTTPXClientInstrumentor
+from .observability import configure_logging, init_tracer
 
 # 1. 為請求 ID 和 Trace ID 建立 ContextVar
 request_id_var = contextvars.ContextVar("request_id", default=None)
@@ -57,58 +64,6 @@ def get_trace_id(span):
         return format(span.get_span_context().trace_id, '032x')
     return None
 
-def configure_logging():
-    """設定 structlog 以輸出 JSON 格式的日誌，並包含 trace_id"""
-    processors = [
-        structlog.contextvars.merge_contextvars,
-        structlog.stdlib.add_logger_name,
-        structlog.stdlib.add_log_level,
-        structlog.processors.TimeStamper(fmt="iso"),
-        structlog.processors.format_exc_info,
-        structlog.processors.JSONRenderer(),
-    ]
-    structlog.configure(
-        processors=processors,
-        logger_factory=structlog.stdlib.LoggerFactory(),
-        wrapper_class=structlog.stdlib.BoundLogger,
-        cache_logger_on_first_use=True,
-    )
-
-def init_tracer(config, logger):
-    """初始化 OpenTelemetry Tracer Provider，使其更具彈性"""
-    try:
-        service_name = config.get("otel.service_name", "sre-assistant")
-        endpoint = config.get("otel.exporter_endpoint", "localhost:4317")
-
-        if not endpoint:
-            logger.info("OTEL_EXPORTER_OTLP_ENDPOINT 未設定，將禁用 tracing。")
-            return False
-
-        logger.info(f"正在初始化 OTel Tracer... Service: {service_name}, Endpoint: {endpoint}")
-
-        resource = Resource(attributes={
-            SERVICE_NAME: service_name
-        })
-
-        # 建立一個非阻塞的 OTLP gRPC exporter
-        # 注意：這裡我們不使用 with-block 的 gRPC 連線，以避免在無法連線時阻塞啟動
-        otlp_exporter = OTLPSpanExporter(endpoint=endpoint, insecure=True)
-
-        provider = TracerProvider(resource=resource)
-        provider.add_span_processor(BatchSpanProcessor(otlp_exporter))
-
-        trace.set_tracer_provider(provider)
-
-        # 自動儀器化 httpx 客戶端，使其自動傳播追蹤上下文
-        HTTPXClientInstrumentor().instrument()
-
-        logger.info("✅ OTel Tracer Provider 初始化成功")
-        return True
-
-    except Exception as e:
-        logger.warning(f"初始化 OTel Tracer Provider 失敗，將禁用 tracing: {e}", exc_info=True)
-        return False
-
 # 在應用啟動時設定日誌
 configure_logging()
 logger = structlog.get_logger(__name__)
@@ -119,6 +74,12 @@ workflow: Optional[SREWorkflow] = None
 redis_client: Optional[redis.Redis] = None
 db_pool: Optional[asyncpg.Pool] = None
 http_client: Optional[httpx.AsyncClient] = None
+tail_manager: Optional[LokiTailManager] = None
+template_profiler: Optional[TemplateProfiler] = None
+cache_invalidation_listener: Optional[CacheInvalidationListener] = None
+inventory_syncer: Optional[InventorySyncer] = None
+task_queue: Optional[DiagnosisTaskQueue] = None
+admission: Optional[AdmissionController] = None
 app_ready = False
 startup_time = time.time() # 應用程式啟動時間
 
@@ -131,7 +92,7 @@ async def lifespan(app: FastAPI):
     並在應用關閉時執行 `finally` 區塊中的程式碼。
     這對於初始化和清理資源 (如資料庫連接、背景任務) 非常有用。
     """
-    global workflow, redis_client, db_pool, http_client, app_ready
+    global workflow, redis_client, db_pool, http_client, tail_manager, template_profiler, cache_invalidation_listener, inventory_syncer, task_queue, admission, app_ready
     
     logger.info("🚀 正在啟動 SRE Assistant...")
     
@@ -172,6 +133,80 @@ async def lifespan(app: FastAPI):
         workflow = SREWorkflow(config, redis_client, http_client)
         logger.info("✅ 工作流程引擎與任務儲存已初始化")
 
+        # Loki tail 管理器：共享上游 WebSocket，透過 SSE 扇出給各會話
+        tail_manager = LokiTailManager(workflow.loki_tool)
+
+        # 模板頻率基線背景工作 (測試環境不啟動)
+        if config_manager.environment != "test" and config.loki.get("profile_job_enabled", True):
+            template_profiler = TemplateProfiler(
+                workflow.loki_tool,
+                workflow.loki_tool.profile_store,
+                interval_seconds=config.loki.get("profile_interval_seconds", 3600),
+                fetch_limit=config.loki.get("profile_fetch_limit", 5000),
+                max_pages=config.loki.get("profile_max_pages", 20),
+                catch_up_periods=config.loki.get("profile_catch_up_periods", 3),
+            )
+            template_profiler.start()
+
+        # Control Plane 快取失效廣播訂閱 (測試環境不啟動)
+        if config_manager.environment != "test" and config.control_plane.get("invalidation_listener_enabled", True):
+            cache_invalidation_listener = CacheInvalidationListener(workflow.control_plane_tool.cache_tags)
+            cache_invalidation_listener.start()
+
+        # 本地資源庫存鏡像同步 (測試環境不啟動)；inventory_store 可為 memory / sqlite / postgres
+        if config_manager.environment != "test" and config.control_plane.get("inventory_enabled", True):
+            store_type = config.control_plane.get("inventory_store", "memory")
+            inventory_store = None
+            if store_type == "sqlite":
+                inventory_store = SQLiteInventoryStore(config.control_plane.get("inventory_sqlite_path", "/tmp/sre-assistant-inventory.db"))
+            elif store_type == "postgres" and db_pool:
+                inventory_store = PostgresInventoryStore(db_pool)
+            control_plane_tool = workflow.control_plane_tool
+            inventory_syncer = InventorySyncer(
+                control_plane_tool,
+                control_plane_tool.inventory,
+                store=inventory_store,
+                interval_seconds=config.control_plane.get("inventory_sync_interval_seconds", 60),
+                full_sync_every=config.control_plane.get("inventory_full_sync_every", 60),
+                max_failed_syncs=config.control_plane.get("inventory_max_failed_syncs", 3),
+                page_size=control_plane_tool.page_size,
+            )
+            inventory_syncer.start()
+
+        # 准入控制：有界佇列 + 各類型上限，超過時以 429 / Retry-After 拒絕；
+        # 已接受的任務依嚴重程度 (P0–P3) 與呼叫端以加權公平排程取得執行名額
+        performance = config.get("performance", {})
+        background_workers = performance.get("background_workers", 4)
+        admission = AdmissionController(
+            max_queue_size=performance.get("task_queue_size", 1000),
+            concurrency=background_workers,
+            type_limits=performance.get("task_type_limits", {}),
+            default_duration=performance.get("task_default_duration_seconds", 30),
+            min_retry_after=performance.get("retry_after_min_seconds", 1),
+            max_retry_after=performance.get("retry_after_max_seconds", 300),
+            client_limit=performance.get("task_client_limit"),
+            p0_reserved_queue=performance.get("p0_reserved_queue", 0),
+            scheduler=WeightedFairScheduler(
+                background_workers,
+                weights=performance.get("priority_weights", {}),
+                p0_reserved_slots=performance.get("p0_reserved_slots", 1),
+            ),
+            default_priorities=performance.get("default_priorities", {}),
+        )
+
+        # 持久化任務佇列：啟用時 API 只負責排入任務，由獨立的 worker 程序 (sre_assistant.worker) 執行
+        queue_config = config.get("task_queue", {})
+        if queue_config.get("enabled", False):
+            task_queue = DiagnosisTaskQueue(
+                redis_client,
+                stream=queue_config.get("stream", "sre:diagnostics"),
+                group=queue_config.get("group", "sre-workers"),
+                dead_letter_stream=queue_config.get("dead_letter_stream", "sre:diagnostics:dead"),
+                local_types=queue_config.get("local_types", ["bulk_remediation"]),
+            )
+            await task_queue.ensure_group()
+            logger.info(f"✅ 診斷任務將依優先級排入 Redis Stream {', '.join(task_queue.streams.values())}")
+
         # 初始化 OTel Tracer
         init_tracer(config, logger)
 
@@ -185,6 +220,16 @@ async def lifespan(app: FastAPI):
         yield # Still yield to allow the app to run and report not ready
     finally:
         # 在應用程式關閉時，優雅地關閉所有客戶端和連線池
+        if template_profiler:
+            await template_profiler.stop()
+        if cache_invalidation_listener:
+            await cache_invalidation_listener.stop()
+        if inventory_syncer:
+            await inventory_syncer.stop()
+        if tail_manager:
+            await tail_manager.close()
+        if workflow:
+            await workflow.control_plane_tool.execution_tracker.stop()
         if http_client:
             await http_client.aclose()
             logger.info("HTTP 客戶端已關閉")
@@ -296,7 +341,35 @@ async def request_context_middleware(request: Request, call_next):
 
 
 # === 背景任務執行器 ===
-async def run_workflow_bg(session_id: uuid.UUID, request: SREWorkflowRequest, request_type: str):
+async def admit_task(request_type: str, request: SREWorkflowRequest, token: Dict[str, Any]) -> Optional[AdmissionTicket]:
+    """
+    在排入背景任務前進行准入控制；佇列已滿時回傳 429 與估算的 Retry-After。
+    啟用持久化任務佇列時，以 Redis 中各類型尚未完成的任務數檢查總上限與各類型上限，
+    並以 worker 回報的執行時間與執行名額估算 Retry-After。
+    優先級取自請求的 severity / priority 欄位，呼叫端以 JWT 的 azp (客戶端) 或 sub 識別；
+    P0 會佔用保留的執行名額與佇列容量，只有具備 performance.p0_roles 角色的呼叫端可以使用，
+    其他呼叫端送出的 P0 降為 P1。
+    """
+    if not admission:
+        return None
+    backlog = None
+    if task_queue:
+        backlog = await task_queue.backlog()
+        ADMISSION_QUEUE_DEPTH.labels("all", "stream").set(backlog.total)
+    try:
+        priority = getattr(request, "severity", None) or getattr(request, "priority", None)
+        client = token.get("azp") or token.get("sub")
+        if priority == "P0":
+            p0_roles = set(config_manager.get_config().get("performance", {}).get("p0_roles", ["sre-oncall"]))
+            if not token_roles(token) & p0_roles:
+                logger.warning(f"🚦 呼叫端 {client} 沒有 P0 權限 ({', '.join(sorted(p0_roles))})，{request_type} 任務降為 P1")
+                priority = "P1"
+        return admission.admit(request_type, backlog=backlog, priority=priority, client=client)
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+async def run_workflow_bg(session_id: uuid.UUID, request: SREWorkflowRequest, request_type: str, ticket: Optional[AdmissionTicket] = None):
     """
     一個通用的包裝函式，用於在背景執行工作流程並更新任務狀態。
 
@@ -304,6 +377,7 @@ async def run_workflow_bg(session_id: uuid.UUID, request: SREWorkflowRequest, re
         session_id: 此次任務的唯一會話 ID。
         request: API 請求的資料模型。
         request_type: 請求的類型，用於在工作流程中進行路由。
+        ticket: admit_task() 發出的准入憑證；執行前需等待並行名額。
     """
     initial_status = DiagnosticStatus(
         session_id=session_id,
@@ -311,13 +385,26 @@ async def run_workflow_bg(session_id: uuid.UUID, request: SREWorkflowRequest, re
         progress=10,
         current_step=f"開始執行 {request_type} 工作流程"
     )
-    # 將初始狀態寫入 Redis，設定 24 小時過期
-    await redis_client.set(
-        str(session_id),
-        initial_status.model_dump_json(),
-        ex=86400
-    )
-    await workflow.execute(session_id, request, request_type)
+    queued_status = initial_status.model_copy(update={"progress": 0, "current_step": f"{request_type} 工作流程已排入佇列，等待執行"})
+    try:
+        # 將初始狀態寫入 Redis，設定 24 小時過期
+        # 不可重複執行的類型 (task_queue.local_types) 即使啟用佇列也在本程序中執行
+        if task_queue and task_queue.accepts(request_type):
+            await redis_client.set(str(session_id), queued_status.model_dump_json(), ex=86400)
+            priority, client = (ticket.priority, ticket.client) if ticket else ("P2", "anonymous")
+            await task_queue.enqueue(session_id, request_type, request, priority=priority, client=client)
+            return
+        if not ticket:
+            await redis_client.set(str(session_id), initial_status.model_dump_json(), ex=86400)
+            await workflow.execute(session_id, request, request_type)
+            return
+        await redis_client.set(str(session_id), queued_status.model_dump_json(), ex=86400)
+        async with admission.slot(ticket):
+            await redis_client.set(str(session_id), initial_status.model_dump_json(), ex=86400)
+            await workflow.execute(session_id, request, request_type)
+    finally:
+        if ticket:
+            admission.release(ticket)
 
 
 # === API 端點 ===
@@ -412,8 +499,9 @@ async def diagnose_deployment(
     """
     接收部署診斷請求，並非同步處理。
     """
+    ticket = await admit_task("deployment", request, token)
     session_id = uuid.uuid4()
-    background_tasks.add_task(run_workflow_bg, session_id, request, "deployment")
+    background_tasks.add_task(run_workflow_bg, session_id, request, "deployment", ticket)
     
     return DiagnosticResponse(
         session_id=session_id,
@@ -447,8 +535,9 @@ async def analyze_alerts(
     """
     接收告警分析請求，並非同步處理。
     """
+    ticket = await admit_task("alert_analysis", request, token)
     session_id = uuid.uuid4()
-    background_tasks.add_task(run_workflow_bg, session_id, request, "alert_analysis")
+    background_tasks.add_task(run_workflow_bg, session_id, request, "alert_analysis", ticket)
 
     return DiagnosticResponse(
         session_id=session_id,
@@ -480,8 +569,9 @@ async def execute_query(
     """
     接收自然語言查詢請求，並非同步處理。
     """
+    ticket = await admit_task("execute_query", request, token)
     session_id = uuid.uuid4()
-    background_tasks.add_task(run_workflow_bg, session_id, request, "execute_query")
+    background_tasks.add_task(run_workflow_bg, session_id, request, "execute_query", ticket)
 
     return DiagnosticResponse(
         session_id=session_id,
@@ -490,6 +580,87 @@ async def execute_query(
         estimated_time=180
     )
 
+@app.post("/api/v1/remediations/bulk", tags=["Diagnostics"], status_code=202, response_model=DiagnosticResponse)
+async def bulk_remediation(
+    request: BulkRemediationRequest,
+    background_tasks: BackgroundTasks,
+    token: Dict[str, Any] = Depends(verify_token)
+):
+    """
+    接收大量修復請求，於背景分波次執行；進度可由診斷狀態端點查詢。
+    """
+    ticket = await admit_task("bulk_remediation", request, token)
+    session_id = uuid.uuid4()
+    background_tasks.add_task(run_workflow_bg, session_id, request, "bulk_remediation", ticket)
+
+    return DiagnosticResponse(
+        session_id=session_id,
+        status="accepted",
+        message=f"大量修復任務已接受 ({len(request.target_resources)} 個資源)，正在背景處理中。",
+    )
+
+@app.get("/api/v1/logs/tail", tags=["Diagnostics"])
+async def tail_logs(
+    request: Request,
+    service: str,
+    namespace: Optional[str] = None,
+    log_level: str = "all",
+    pattern: str = "",
+    token: Dict[str, Any] = Depends(verify_token)
+):
+    """
+    以 Server-Sent Events 即時推送 Loki 日誌 (取代重複輪詢 /execute)。
+
+    相同 (selector, filter) 的所有訂閱者共享一條上游 tail 連線；
+    除了 `log` 事件外，也會定期推送線上分析的 `analysis` 事件。
+    """
+    if not tail_manager:
+        raise HTTPException(status_code=503, detail="日誌即時追蹤尚未初始化。")
+
+    config = config_manager.get_config()
+    heartbeat = config.loki.get("tail_heartbeat_seconds", 15)
+    analysis_interval = config.loki.get("tail_analysis_interval_seconds", 5)
+
+    try:
+        query = await tail_manager.resolve_query(service, namespace, log_level, pattern)
+    except SelectorRejectedError as e:
+        raise HTTPException(status_code=400, detail={"message": str(e), **e.details})
+    subscription = await tail_manager.subscribe(query)
+
+    async def event_stream():
+        last_analysis = time.monotonic()
+        try:
+            while not await request.is_disconnected():
+                entry = await subscription.get(timeout=min(heartbeat, analysis_interval))
+                if entry is not None:
+                    yield f"event: log\ndata: {json.dumps(entry, ensure_ascii=False)}\n\n"
+                if time.monotonic() - last_analysis >= analysis_interval:
+                    last_analysis = time.monotonic()
+                    yield f"event: analysis\ndata: {json.dumps(tail_manager.snapshot(query), ensure_ascii=False)}\n\n"
+                elif entry is None:
+                    yield ": keep-alive\n\n"
+        finally:
+            await tail_manager.unsubscribe(subscription)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/api/v1/logs/summary", tags=["Diagnostics"])
+async def get_log_summary(
+    service: str,
+    namespace: Optional[str] = None,
+    hours: int = Query(24, ge=1, le=168),
+    top: int = Query(10, ge=1, le=64),
+    token: Dict[str, Any] = Depends(verify_token)
+):
+    """
+    彙總過去 `hours` 小時內日誌查詢保存的摘要分片：受影響的 pod / trace / 使用者數量 (HyperLogLog)
+    與最常見的錯誤模板 (SpaceSaving)，不需重新查詢 Loki。
+    """
+    try:
+        return await workflow.loki_tool.summarize_sketches(service, namespace, hours, top)
+    except SelectorRejectedError as e:
+        raise HTTPException(status_code=400, detail={"message": str(e), **e.details})
+
 @app.get("/api/v1/diagnostics/history", tags=["Diagnostics"], response_model=DiagnosticHistoryList)
 async def get_diagnostic_history(
     page: int = 1,
@@ -518,14 +689,11 @@ async def get_diagnostic_history(
 @app.get("/api/v1/workflows/templates", tags=["Workflows"], response_model=List[WorkflowTemplate])
 async def list_workflow_templates(token: Dict[str, Any] = Depends(verify_token)):
     """
-    獲取工作流模板 (骨架)。
+    獲取工作流模板：即工作流程引擎中以 DAG 宣告的工作流程定義。
     """
-    # 模擬數據
-    templates = [
-        WorkflowTemplate(id="deployment_diagnosis", name="部署問題診斷", description="分析部署失敗或應用程式啟動異常問題。", parameters=[]),
-        WorkflowTemplate(id="alert_correlation", name="告警關聯分析", description="分析多個告警之間的關聯性，尋找根本原因。", parameters=[{"name": "alert_ids", "type": "list"}]),
-    ]
-    return templates
+    if not workflow:
+        raise HTTPException(status_code=503, detail="工作流程引擎尚未初始化。")
+    return [WorkflowTemplate(**template) for template in workflow.templates()]
 
 @app.get("/api/v1/tools/status", tags=["Tools"], response_model=Dict[str, ToolStatus])
 async def get_tools_status(token: Dict[str, Any] = Depends(verify_token)):
@@ -0,0 +1,66 @@
+# services/sre-assistant/src/sre_assistant/observability.py
+"""
+結構化日誌與 OpenTelemetry 的共用設定
+API (main.py) 與診斷 worker (worker.py) 都從這裡初始化，worker 不需要匯入 FastAPI 應用程式
+"""
+
+import structlog
+from opentelemetry import trace
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+from opentelemetry.sdk.resources import Resource, SERVICE_NAME
+from opentelemetry.instrumentation.httpx import HTTPXClientInstrumentor
+
+
+def configure_logging():
+    """設定 structlog 以輸出 JSON 格式的日誌，並包含 trace_id"""
+    processors = [
+        structlog.contextvars.merge_contextvars,
+        structlog.stdlib.add_logger_name,
+        structlog.stdlib.add_log_level,
+        structlog.processors.TimeStamper(fmt="iso"),
+        structlog.processors.format_exc_info,
+        structlog.processors.JSONRenderer(),
+    ]
+    structlog.configure(
+        processors=processors,
+        logger_factory=structlog.stdlib.LoggerFactory(),
+        wrapper_class=structlog.stdlib.BoundLogger,
+        cache_logger_on_first_use=True,
+    )
+
+def init_tracer(config, logger):
+    """初始化 OpenTelemetry Tracer Provider，使其更具彈性"""
+    try:
+        service_name = config.get("otel.service_name", "sre-assistant")
+        endpoint = config.get("otel.exporter_endpoint", "localhost:4317")
+
+        if not endpoint:
+            logger.info("OTEL_EXPORTER_OTLP_ENDPOINT 未設定，將禁用 tracing。")
+            return False
+
+        logger.info(f"正在初始化 OTel Tracer... Service: {service_name}, Endpoint: {endpoint}")
+
+        resource = Resource(attributes={
+            SERVICE_NAME: service_name
+        })
+
+        # 建立一個非阻塞的 OTLP gRPC exporter
+        # 注意：這裡我們不使用 with-block 的 gRPC 連線，以避免在無法連線時阻塞啟動
+        otlp_exporter = OTLPSpanExporter(endpoint=endpoint, insecure=True)
+
+        provider = TracerProvider(resource=resource)
+        provider.add_span_processor(BatchSpanProcessor(otlp_exporter))
+
+        trace.set_tracer_provider(provider)
+
+        # 自動儀器化 httpx 客戶端，使其自動傳播追蹤上下文
+        HTTPXClientInstrumentor().instrument()
+
+        logger.info("✅ OTel Tracer Provider 初始化成功")
+        return True
+
+    except Exception as e:
+        logger.warning(f"初始化 OTel Tracer Provider 失敗，將禁用 tracing: {e}", exc_info=True)
+        return False
@@ -0,0 +1,178 @@
+# services/sre-assistant/src/sre_assistant/pii_scrubber.py
+"""
+個資 (PII) 遮罩
+在診斷證據寫入狀態儲存前遮罩 email、權杖、IP 與信用卡號
+
+整批日誌先串接並以 `str.translate` 做一次字元摺疊 (數字 → '0'、大寫 → 小寫)，
+再以「字面字元開頭」的觸發樣式快速掃描整批文字，只有命中的行才執行完整的遮罩樣式。
+觸發條件盡量是純字串 (以 `str.find` 搜尋)，因此絕大多數不含個資的行幾乎沒有額外成本。
+"""
+
+import re
+from bisect import bisect_right
+from itertools import accumulate
+from typing import Any, Iterator, List, Tuple, Union
+
+# 批次掃描時用於串接多行的分隔字元 (任何樣式都不會跨越它)
+_SEPARATOR = "\x1e"
+
+_FOLD = str.maketrans("0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ", "0000000000abcdefghijklmnopqrstuvwxyz")
+
+
+def _luhn_valid(digits: str) -> bool:
+    total, parity = 0, len(digits) % 2
+    for index, char in enumerate(digits):
+        value = ord(char) - 48
+        if index % 2 == parity:
+            value *= 2
+            if value > 9:
+                value -= 9
+        total += value
+    return total % 10 == 0
+
+
+def _keep_prefix(match: "re.Match") -> str:
+    return match.group(1) + "[REDACTED]"
+
+
+def _mask_card(match: "re.Match") -> str:
+    # 只有通過 Luhn 檢查的數字串才視為卡號，避免誤遮訂單編號等長數字
+    digits = match.group(0).replace(" ", "").replace("-", "")
+    return "[CARD]" if _luhn_valid(digits) else match.group(0)
+
+
+def _valid_ipv4(match: "re.Match") -> str:
+    return "[IP]" if all(int(octet) <= 255 for octet in match.group(0).split(".")) else match.group(0)
+
+
+_H = "[0-9A-Fa-f]{1,4}"
+# RFC 4291 的完整與 "::" 壓縮形式 (至少包含一個十六進位群組，單獨的 "::" 不算)
+_IPV6 = r"(?<![:\w])(?:" + "|".join([
+    rf"(?:{_H}:){{7}}{_H}",
+    rf"(?:{_H}:){{1,7}}:",
+    rf"(?:{_H}:){{1,6}}:{_H}",
+    rf"(?:{_H}:){{1,5}}(?::{_H}){{1,2}}",
+    rf"(?:{_H}:){{1,4}}(?::{_H}){{1,3}}",
+    rf"(?:{_H}:){{1,3}}(?::{_H}){{1,4}}",
+    rf"(?:{_H}:){{1,2}}(?::{_H}){{1,5}}",
+    rf"{_H}:(?::{_H}){{1,6}}",
+    rf":(?::{_H}){{1,7}}",
+]) + r")(?![:\w])"
+
+# (名稱, 觸發條件 (字串或樣式，套用在摺疊後的文字上，必須是完整樣式的必要條件), 完整樣式, 替換)
+_RULES: List[Tuple[str, List[Union[str, "re.Pattern"]], "re.Pattern", Any]] = [
+    ("email", ["@"],
+     re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,}"), "[EMAIL]"),
+    ("jwt", ["eyj"],
+     re.compile(r"\beyJ[A-Za-z0-9_-]{5,}\.[A-Za-z0-9_-]{5,}\.[A-Za-z0-9_-]{5,}"), "[TOKEN]"),
+    ("bearer", ["bearer"],
+     re.compile(r"(\b[Bb]earer[ \t]+)[A-Za-z0-9._~+/=-]{8,}"), _keep_prefix),
+    ("secret", ["passw", "pwd", "secret", "token", "key", "authorization"],
+     re.compile(r"(\b(?i:password|passwd|pwd|secret|token|api[_-]?key|access[_-]?key|client[_-]?secret|authorization)[\"']?[ \t]*[:=][ \t]*[\"']?)(?:[Bb]earer[ \t]+)?[^\s\"'&,;]+"), _keep_prefix),
+    ("aws", ["akia"],
+     re.compile(r"\bAKIA[0-9A-Z]{16}\b"), "[TOKEN]"),
+    ("ipv4", [re.compile(r"\.0{1,3}\.0{1,3}\.")],
+     re.compile(r"(?<![\d.])\d{1,3}(?:\.\d{1,3}){3}(?![\d.])"), _valid_ipv4),
+    # 完整形式必有連續的 "h:h:h:"，壓縮形式必有 "::"
+    ("ipv6", ["::", re.compile(r":[0-9a-f]{1,4}:[0-9a-f]{1,4}:[0-9a-f]{1,4}:")],
+     re.compile(_IPV6), "[IP]"),
+    ("card", ["0000000000000", re.compile("0000[ -]0000")],
+     re.compile(r"(?<![\d-])(?:\d{13,19}|\d{4}([ -])\d{4}\1\d{4}\1\d{1,7}|\d{4}([ -])\d{6}\2\d{5})(?![\d-])"), _mask_card),
+]
+
+
+class PIIScrubber:
+    """
+    PII 遮罩器
+
+    - `scrub_lines` 批次處理多行 (建議的用法)
+    - `scrub` 處理單一字串
+    - `scrub_evidence` 處理證據字典 / 列表中的所有字串 (整棵結構只做一次批次遮罩)
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+
+    def scrub(self, text: str) -> str:
+        if not self.enabled or not text:
+            return text
+        return self.scrub_lines([text])[0]
+
+    def scrub_lines(self, lines: List[str]) -> List[str]:
+        if not self.enabled or not lines:
+            return lines
+        joined = _SEPARATOR.join(lines)
+        if joined.count(_SEPARATOR) != len(lines) - 1:
+            # 行內本身含有分隔字元，退回逐行處理
+            return [self.scrub_lines([line])[0] for line in lines]
+
+        folded = joined.translate(_FOLD)
+        starts = [0, *accumulate(len(line) + 1 for line in lines[:-1])]
+
+        result = list(lines)
+        for _, triggers, pattern, replacement in _RULES:
+            for index in self._candidate_lines(folded, starts, triggers):
+                result[index] = pattern.sub(replacement, result[index])
+        return result
+
+    @staticmethod
+    def _candidate_lines(folded: str, starts: List[int], triggers: List[Union[str, "re.Pattern"]]) -> List[int]:
+        """回傳觸發條件命中的行索引 (每行最多回傳一次，命中後直接跳到下一行)"""
+        candidates = set()
+        for trigger in triggers:
+            literal = isinstance(trigger, str)
+            position = 0
+            while True:
+                if literal:
+                    found = folded.find(trigger, position)
+                else:
+                    match = trigger.search(folded, position)
+                    found = match.start() if match else -1
+                if found < 0:
+                    break
+                index = bisect_right(starts, found) - 1
+                candidates.add(index)
+                if index + 1 >= len(starts):
+                    break
+                position = starts[index + 1]
+        return sorted(candidates)
+
+    def scrub_evidence(self, evidence: Any) -> Any:
+        """
+        遮罩證據中的所有字串：先收集整棵結構中的字串做一次批次遮罩，再依相同順序重建結構
+        """
+        if not self.enabled or evidence is None:
+            return evidence
+        strings: List[str] = []
+        self._collect(evidence, strings)
+        if not strings:
+            return evidence
+        return self._rebuild(evidence, iter(self.scrub_lines(strings)))
+
+    def _collect(self, value: Any, strings: List[str]):
+        if isinstance(value, str):
+            strings.append(value)
+        elif isinstance(value, dict):
+            for item in value.values():
+                self._collect(item, strings)
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                self._collect(item, strings)
+
+    def _rebuild(self, value: Any, scrubbed: Iterator[str]) -> Any:
+        if isinstance(value, str):
+            return next(scrubbed)
+        if isinstance(value, dict):
+            return {key: self._rebuild(item, scrubbed) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self._rebuild(item, scrubbed) for item in value]
+        return value
+
+
+def scrubber_from_config(config) -> PIIScrubber:
+    """依 `compliance.pii_detection` 建立遮罩器 (未設定時停用)"""
+    try:
+        enabled = config.get("compliance", {}).get("pii_detection", False)
+    except Exception:
+        enabled = False
+    return PIIScrubber(enabled=enabled is True)
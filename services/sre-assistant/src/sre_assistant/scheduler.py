@@ -0,0 +1,161 @@
+# services/sre-assistant/src/sre_assistant/scheduler.py
+"""
+依嚴重程度加權的公平排程器
+等待執行名額的診斷任務依優先級 (P0–P3) 分類，類別之間以權重做 stride 排程，
+同一類別內各呼叫端輪流取得名額，並保留部分名額只供 P0 使用
+"""
+
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Deque
+
+import structlog
+from prometheus_client import Gauge
+
+logger = structlog.get_logger(__name__)
+
+PRIORITY_CLASSES = ("P0", "P1", "P2", "P3")
+DEFAULT_PRIORITY_WEIGHTS = {"P0": 8, "P1": 4, "P2": 2, "P3": 1}
+
+SCHEDULER_WAITING = Gauge(
+    "sre_assistant_scheduler_waiting",
+    "等待執行名額的診斷任務數",
+    ("priority",),
+)
+SCHEDULER_RUNNING = Gauge(
+    "sre_assistant_scheduler_running",
+    "執行中的診斷任務數",
+    ("priority",),
+)
+
+
+def validate_priority_weights(weights: Optional[Dict[str, float]]) -> Dict[str, float]:
+    """
+    合併預設權重並檢查設定 (performance.priority_weights)：未知的優先級或非正數的權重拋出 ValueError，
+    避免 stride 排程以 0 作除數
+    """
+    weights = dict(weights or {})
+    unknown = set(weights) - set(PRIORITY_CLASSES)
+    if unknown:
+        raise ValueError(f"performance.priority_weights 含有未知的優先級: {', '.join(sorted(unknown))}")
+    for priority, weight in weights.items():
+        if isinstance(weight, bool) or not isinstance(weight, (int, float)) or weight <= 0:
+            raise ValueError(f"performance.priority_weights.{priority} 必須是正數，目前為 {weight!r}")
+    return {**DEFAULT_PRIORITY_WEIGHTS, **weights}
+
+
+class WeightedFairScheduler:
+    """
+    有限並行度的加權公平排程
+
+    - weights: 各優先級的權重；所有類別都有任務等待時，P0:P1:P2:P3 取得名額的比例約為權重比，
+      低優先級不會被完全餓死
+    - 同一優先級內以呼叫端 (client) 輪詢，單一呼叫端大量送出的任務不會排擠其他呼叫端
+    - p0_reserved_slots: 保留給 P0 的名額；非 P0 任務最多同時執行 concurrency - p0_reserved_slots 個
+    """
+
+    def __init__(self, concurrency: int = 4, weights: Optional[Dict[str, float]] = None, p0_reserved_slots: int = 0):
+        self.concurrency = max(1, concurrency)
+        self.weights = validate_priority_weights(weights)
+        self.p0_reserved_slots = min(max(0, p0_reserved_slots), self.concurrency - 1)
+        # 優先級 → 呼叫端 → 等待中的 future (依抵達順序)
+        self._waiting: Dict[str, "OrderedDict[str, Deque[asyncio.Future]]"] = {priority: OrderedDict() for priority in PRIORITY_CLASSES}
+        self._running: Dict[str, int] = {priority: 0 for priority in PRIORITY_CLASSES}
+        # stride 排程的虛擬時間；剛變為有任務等待的類別從目前的虛擬時間開始，不累積閒置期間的額度
+        self._pass: Dict[str, float] = {priority: 0.0 for priority in PRIORITY_CLASSES}
+        self._virtual_time = 0.0
+
+    @staticmethod
+    def normalize(priority: Optional[str]) -> str:
+        return priority if priority in PRIORITY_CLASSES else "P2"
+
+    @property
+    def running(self) -> int:
+        return sum(self._running.values())
+
+    def waiting(self, priority: Optional[str] = None) -> int:
+        priorities = [priority] if priority else PRIORITY_CLASSES
+        return sum(len(queue) for p in priorities for queue in self._waiting[p].values())
+
+    @asynccontextmanager
+    async def slot(self, priority: Optional[str] = None, client: Optional[str] = None):
+        priority = await self.acquire(priority, client)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    async def acquire(self, priority: Optional[str] = None, client: Optional[str] = None) -> str:
+        """等待執行名額；回傳正規化後的優先級 (release 時需傳回)"""
+        priority = self.normalize(priority)
+        client = client or "anonymous"
+        if not self.waiting(priority):
+            self._pass[priority] = max(self._pass[priority], self._virtual_time)
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[priority].setdefault(client, deque()).append(future)
+        self._export(priority)
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 名額已分配但呼叫端在取得前被取消
+                self.release(priority)
+            else:
+                self._discard(priority, client, future)
+            raise
+        return priority
+
+    def release(self, priority: str):
+        self._running[priority] -= 1
+        self._export(priority)
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.running < self.concurrency:
+            priority = self._next_priority()
+            if priority is None:
+                return
+            clients = self._waiting[priority]
+            client, queue = next(iter(clients.items()))
+            future = queue.popleft()
+            # 取出後將呼叫端移到隊尾，達成同類別內的輪詢
+            del clients[client]
+            if queue:
+                clients[client] = queue
+            self._virtual_time = self._pass[priority]
+            self._pass[priority] += 1.0 / self.weights[priority]
+            self._running[priority] += 1
+            future.set_result(None)
+            self._export(priority)
+
+    def _next_priority(self) -> Optional[str]:
+        non_p0_running = self.running - self._running["P0"]
+        candidates = []
+        for priority in PRIORITY_CLASSES:
+            if not self._waiting[priority]:
+                continue
+            if priority != "P0" and non_p0_running >= self.concurrency - self.p0_reserved_slots:
+                continue
+            candidates.append(priority)
+        if not candidates:
+            return None
+        # 虛擬時間相同時高優先級優先
+        return min(candidates, key=lambda priority: (self._pass[priority], PRIORITY_CLASSES.index(priority)))
+
+    def _discard(self, priority: str, client: str, future: asyncio.Future):
+        queue = self._waiting[priority].get(client)
+        if queue is None:
+            return
+        try:
+            queue.remove(future)
+        except ValueError:
+            pass
+        if not queue:
+            del self._waiting[priority][client]
+        self._export(priority)
+
+    def _export(self, priority: str):
+        SCHEDULER_WAITING.labels(priority).set(self.waiting(priority))
+        SCHEDULER_RUNNING.labels(priority).set(self._running[priority])
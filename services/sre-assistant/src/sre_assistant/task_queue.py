@@ -0,0 +1,379 @@
+# services/sre-assistant/src/sre_assistant/task_queue.py
+"""
+以 Redis Streams 實作的持久化診斷任務佇列
+API 只負責將任務依優先級 (P0–P3) 寫入各自的 stream；獨立的 worker 程序以消費者群組
+依權重從各優先級 stream 讀取並執行工作流程，高嚴重程度的任務不會排在大量低優先級任務之後。
+未確認 (XACK) 的任務在可見性逾時後由其他 worker 重新領取 (至少一次交付)，
+超過最大交付次數的任務移入死信 stream。
+各類型與各呼叫端尚未完成的任務數、worker 回報的平均執行時間與存活 worker 的執行名額另存於 Redis 雜湊，
+供 API 的准入控制跨程序檢查上限並估算 Retry-After
+"""
+
+import asyncio
+import json
+import time
+import uuid
+import structlog
+from typing import Dict, Any, Optional, Tuple, Callable, Awaitable, Iterable
+
+from .contracts import (
+    DiagnosticRequest,
+    AlertAnalysisRequest,
+    CapacityAnalysisRequest,
+    ExecuteRequest,
+    BulkRemediationRequest,
+)
+from .admission import ADMISSION_WAIT_SECONDS, QueueBacklog
+from .scheduler import WeightedFairScheduler, PRIORITY_CLASSES, DEFAULT_PRIORITY_WEIGHTS
+
+logger = structlog.get_logger(__name__)
+
+# XADD 與待處理數的增加在同一個腳本中完成，並以 "{stream}/{id}" 記錄任務的 [request_type, client]，
+# 讓確認時即使 stream 項目已被 XTRIM / XDEL 移除也能扣除正確的計數
+_ENQUEUE_SCRIPT = """
+local id = redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[1], '*', unpack(ARGV, 4))
+redis.call('HINCRBY', KEYS[2], ARGV[2], 1)
+redis.call('HINCRBY', KEYS[3], ARGV[3], 1)
+redis.call('HSET', KEYS[4], KEYS[1] .. '/' .. id, cjson.encode({ARGV[2], ARGV[3]}))
+return id
+"""
+
+# XACK 並依任務記錄扣除待處理數 (不低於 0)；記錄刪除後重複確認不會再次扣除
+_COMPLETE_SCRIPT = """
+local acked = redis.call('XACK', KEYS[1], ARGV[1], ARGV[2])
+local field = KEYS[1] .. '/' .. ARGV[2]
+local raw = redis.call('HGET', KEYS[4], field)
+if raw then
+    redis.call('HDEL', KEYS[4], field)
+    local task = cjson.decode(raw)
+    for i, counter in ipairs({KEYS[2], KEYS[3]}) do
+        if redis.call('HINCRBY', counter, task[i], -1) < 0 then
+            redis.call('HSET', counter, task[i], 0)
+        end
+    end
+end
+return acked
+"""
+
+# request_type → 請求模型 (與 SREWorkflow.execute 的路由一致)
+REQUEST_MODELS = {
+    "deployment": DiagnosticRequest,
+    "alert_analysis": AlertAnalysisRequest,
+    "capacity_analysis": CapacityAnalysisRequest,
+    "execute_query": ExecuteRequest,
+    "bulk_remediation": BulkRemediationRequest,
+}
+
+
+class DiagnosisTaskQueue:
+    """
+    診斷任務佇列 (每個優先級一個 Redis Stream + 共用名稱的消費者群組)
+
+    每個任務是一筆 `{stream}:{priority}` 的項目: {session_id, request_type, payload (請求 JSON), enqueued_at, priority, client}
+
+    - `{stream}:backlog`: request_type → 已排入但尚未確認 (XACK) 的任務數；與 XADD / XACK 在同一個腳本中增減
+    - `{stream}:clients`: client → 已排入但尚未確認的任務數，增減方式同上
+    - `{stream}:tasks`: "{priority stream}/{id}" → [request_type, client]；確認時據此扣除計數，不依賴 stream 項目仍然存在
+    - `{stream}:durations`: request_type → worker 量測的執行時間指數移動平均 (秒)
+    - `{stream}:workers`: consumer → {concurrency, expires_at}；worker 定期更新，過期的項目不計入
+    - `local_types`: 不可重複執行的請求類型 (例如 bulk_remediation 會再次對資源執行腳本)；
+      至少一次交付可能重新執行它們，因此不排入佇列，由 API 在自身程序中執行
+    """
+
+    def __init__(self, redis_client, stream: str = "sre:diagnostics", group: str = "sre-workers", dead_letter_stream: str = "sre:diagnostics:dead", max_length: int = 100000, local_types: Iterable[str] = ("bulk_remediation",)):
+        self.redis_client = redis_client
+        self.stream = stream
+        self.group = group
+        self.dead_letter_stream = dead_letter_stream
+        self.max_length = max_length
+        self.local_types = frozenset(local_types)
+        self.streams = {priority: f"{stream}:{priority}" for priority in PRIORITY_CLASSES}
+        self.backlog_key = f"{stream}:backlog"
+        self.clients_key = f"{stream}:clients"
+        self.tasks_key = f"{stream}:tasks"
+        self.durations_key = f"{stream}:durations"
+        self.workers_key = f"{stream}:workers"
+        self._group_ready = False
+
+    async def ensure_group(self):
+        if self._group_ready:
+            return
+        for stream in self.streams.values():
+            try:
+                await self.redis_client.xgroup_create(stream, self.group, id="0", mkstream=True)
+                logger.info(f"📮 已建立任務佇列消費者群組: {stream} / {self.group}")
+            except Exception as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+        self._group_ready = True
+
+    def accepts(self, request_type: str) -> bool:
+        return request_type in REQUEST_MODELS and request_type not in self.local_types
+
+    async def enqueue(self, session_id: uuid.UUID, request_type: str, request, priority: str = "P2", client: str = "anonymous") -> str:
+        """寫入該優先級的 stream，回傳 stream 項目 ID；client 供 worker 的公平排程與呼叫端上限使用"""
+        if request_type not in REQUEST_MODELS:
+            raise ValueError(f"未知的請求類型: {request_type}")
+        if request_type in self.local_types:
+            raise ValueError(f"{request_type} 不可重複執行，不能排入至少一次交付的任務佇列")
+        await self.ensure_group()
+        priority = WeightedFairScheduler.normalize(priority)
+        fields = {"session_id": str(session_id), "request_type": request_type, "payload": request.model_dump_json(), "enqueued_at": str(time.time()), "priority": priority, "client": client}
+        message_id = await self.redis_client.eval(
+            _ENQUEUE_SCRIPT, 4, self.streams[priority], self.backlog_key, self.clients_key, self.tasks_key,
+            self.max_length, request_type, client, *[item for pair in fields.items() for item in pair],
+        )
+        logger.info(f"📮 [Session: {session_id}] 已排入任務佇列 ({request_type}, {priority}): {message_id}")
+        return message_id
+
+    async def depth(self) -> Dict[str, int]:
+        """回傳所有優先級 stream 的長度、尚未交付與已交付但未確認的任務數"""
+        length, pending, lag = 0, 0, 0
+        for stream in self.streams.values():
+            length += await self.redis_client.xlen(stream)
+            try:
+                for group in await self.redis_client.xinfo_groups(stream):
+                    if group.get("name") == self.group:
+                        pending += group.get("pending") or 0
+                        lag += group.get("lag") or 0
+            except Exception:
+                pass
+        return {"length": length, "pending": pending, "lag": lag}
+
+    async def backlog(self) -> QueueBacklog:
+        """讀取各類型與各呼叫端的待處理任務數、worker 回報的平均執行時間與存活 worker 的執行名額總數"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.hgetall(self.backlog_key)
+        pipe.hgetall(self.clients_key)
+        pipe.hgetall(self.durations_key)
+        pipe.hgetall(self.workers_key)
+        counts, clients, durations, workers = await pipe.execute()
+        now, concurrency = time.time(), 0
+        for raw in (workers or {}).values():
+            try:
+                worker = json.loads(raw)
+            except (TypeError, ValueError):
+                continue
+            if worker.get("expires_at", 0) > now:
+                concurrency += int(worker.get("concurrency", 0))
+        return QueueBacklog(
+            by_type={key: max(int(value), 0) for key, value in (counts or {}).items()},
+            by_client={key: max(int(value), 0) for key, value in (clients or {}).items()},
+            durations={key: float(value) for key, value in (durations or {}).items()},
+            concurrency=concurrency,
+        )
+
+    async def complete(self, stream: str, message_id: str):
+        """確認任務並扣除該類型與該呼叫端的待處理數 (項目已被移除時同樣適用)"""
+        await self.redis_client.eval(_COMPLETE_SCRIPT, 4, stream, self.backlog_key, self.clients_key, self.tasks_key, self.group, message_id)
+
+    async def dead_letter(self, stream: str, message_id: str, fields: Dict[str, Any], error: str, deliveries: int):
+        """將任務移入死信 stream 並確認原項目"""
+        await self.redis_client.xadd(
+            self.dead_letter_stream,
+            {**fields, "original_id": message_id, "error": error[:1000], "deliveries": str(deliveries), "dead_at": str(time.time())},
+            maxlen=self.max_length,
+            approximate=True,
+        )
+        await self.complete(stream, message_id)
+
+    async def record_duration(self, request_type: str, duration: float, alpha: float = 0.2):
+        """以指數移動平均更新該類型的執行時間；多個 worker 同時更新時以最後寫入為準"""
+        previous = await self.redis_client.hget(self.durations_key, request_type)
+        average = duration if previous is None else alpha * duration + (1 - alpha) * float(previous)
+        await self.redis_client.hset(self.durations_key, request_type, f"{average:.3f}")
+
+    async def advertise(self, consumer: str, concurrency: int, ttl_seconds: float):
+        """登記 worker 的執行名額，ttl_seconds 內未再更新即視為已離線"""
+        await self.redis_client.hset(self.workers_key, consumer, json.dumps({"concurrency": concurrency, "expires_at": time.time() + ttl_seconds}))
+
+    async def retire(self, consumer: str):
+        await self.redis_client.hdel(self.workers_key, consumer)
+
+    @staticmethod
+    def decode(fields: Dict[str, Any]) -> Tuple[uuid.UUID, str, Any]:
+        """還原 (session_id, request_type, 請求模型)"""
+        request_type = fields["request_type"]
+        model = REQUEST_MODELS[request_type]
+        return uuid.UUID(fields["session_id"]), request_type, model.model_validate_json(fields["payload"])
+
+
+class DiagnosisWorker:
+    """
+    任務佇列消費者
+
+    - 以 XREADGROUP 從各優先級 stream 讀取新任務，最多同時持有 `concurrency` 個任務；
+      每個空出的名額以 stride 排程選擇優先級 (各類別都有任務時 P0:P1:P2:P3 約為權重比)，
+      沒有任務的類別讓出名額，且不累積閒置期間的額度
+    - 提供 `scheduler` 時，持有的任務再依優先級與呼叫端由 WeightedFairScheduler 分配執行名額，
+      讀取權重也沿用 scheduler 的權重
+    - 執行期間每 visibility_timeout / 3 以 XCLAIM 更新閒置時間 (心跳)，避免長時間的診斷被重新領取
+    - 以 XAUTOCLAIM 領取閒置超過 `visibility_timeout` 的任務 (原 worker 已崩潰或重啟)
+    - 任務成功或失敗後都會 XACK；工作流程以外的例外 (例如請求無法解析) 在超過 `max_deliveries` 後移入死信 stream
+    - 成功的任務回報執行時間，並定期登記本 worker 的執行名額，供 API 估算 Retry-After
+    """
+
+    def __init__(self, queue: DiagnosisTaskQueue, handler: Callable[[uuid.UUID, Any, str], Awaitable[None]], consumer: Optional[str] = None, concurrency: int = 4, visibility_timeout: float = 300, max_deliveries: int = 3, block_ms: int = 5000, scheduler: Optional[WeightedFairScheduler] = None):
+        self.queue = queue
+        self.handler = handler
+        self.consumer = consumer or f"worker-{uuid.uuid4().hex[:8]}"
+        self.concurrency = max(1, concurrency)
+        self.visibility_timeout = visibility_timeout
+        self.max_deliveries = max_deliveries
+        self.block_ms = block_ms
+        self.scheduler = scheduler
+        self.weights = scheduler.weights if scheduler else dict(DEFAULT_PRIORITY_WEIGHTS)
+        self._running: Dict[Tuple[str, str], asyncio.Task] = {}
+        self._stopping = asyncio.Event()
+        self._advertised_at = 0.0
+        self._pass: Dict[str, float] = {priority: 0.0 for priority in PRIORITY_CLASSES}
+        self._idle = set(PRIORITY_CLASSES)
+        self._virtual_time = 0.0
+
+    async def run(self):
+        await self.queue.ensure_group()
+        logger.info(f"👷 診斷 worker {self.consumer} 已啟動 (並行度 {self.concurrency})")
+        while not self._stopping.is_set():
+            try:
+                await self._advertise()
+                await self.reclaim()
+                free = self.concurrency - len(self._running)
+                if free <= 0:
+                    await asyncio.wait(list(self._running.values()), return_when=asyncio.FIRST_COMPLETED)
+                    continue
+                if not await self.fetch(free):
+                    await self._wait_for_tasks()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"診斷 worker {self.consumer} 讀取任務失敗: {e}", exc_info=True)
+                await asyncio.sleep(1)
+        try:
+            await self.queue.retire(self.consumer)
+        except Exception as e:
+            logger.warning(f"診斷 worker {self.consumer} 註銷執行名額失敗: {e}")
+        if self._running:
+            await asyncio.gather(*self._running.values(), return_exceptions=True)
+        logger.info(f"👷 診斷 worker {self.consumer} 已停止")
+
+    def stop(self):
+        """停止讀取新任務；執行中的任務會完成後才結束 run()"""
+        self._stopping.set()
+
+    async def fetch(self, free: int) -> int:
+        """依權重從各優先級 stream 讀取最多 free 個新任務 (每個名額一次非阻塞 XREADGROUP)；回傳讀取數量"""
+        fetched, empty = 0, set()
+        while fetched < free:
+            candidates = [priority for priority in PRIORITY_CLASSES if priority not in empty]
+            if not candidates:
+                break
+            for priority in candidates:
+                if priority in self._idle:
+                    self._pass[priority] = max(self._pass[priority], self._virtual_time)
+            # 虛擬時間相同時高優先級優先
+            priority = min(candidates, key=lambda p: (self._pass[p], PRIORITY_CLASSES.index(p)))
+            if not await self._read({self.queue.streams[priority]: ">"}, count=1):
+                empty.add(priority)
+                self._idle.add(priority)
+                continue
+            self._idle.discard(priority)
+            self._virtual_time = self._pass[priority]
+            self._pass[priority] += 1.0 / self.weights[priority]
+            fetched += 1
+        return fetched
+
+    async def _wait_for_tasks(self):
+        """所有優先級都沒有新任務時阻塞等待任一 stream；每個 stream 最多取一個，最多超出預取上限 3 個"""
+        await self._read({stream: ">" for stream in self.queue.streams.values()}, count=1, block=self.block_ms)
+
+    async def _read(self, streams: Dict[str, str], count: int, block: Optional[int] = None) -> int:
+        response = await self.queue.redis_client.xreadgroup(self.queue.group, self.consumer, streams, count=count, block=block)
+        started = 0
+        for stream, messages in response or []:
+            for message_id, fields in messages:
+                self._start(stream, message_id, fields, deliveries=1)
+                started += 1
+        return started
+
+    async def reclaim(self) -> int:
+        """依優先級順序領取閒置超過可見性逾時的任務；回傳領取數量"""
+        claimed = 0
+        for stream in self.queue.streams.values():
+            free = self.concurrency - len(self._running)
+            if free <= 0:
+                break
+            result = await self.queue.redis_client.xautoclaim(
+                stream, self.queue.group, self.consumer,
+                min_idle_time=int(self.visibility_timeout * 1000), start_id="0-0", count=free,
+            )
+            messages = result[1] if result and len(result) > 1 else []
+            for message_id, fields in messages:
+                if not fields or (stream, message_id) in self._running:
+                    # 項目已被 XTRIM / XDEL 移除時 fields 為空，直接確認並扣除計數
+                    if not fields:
+                        await self.queue.complete(stream, message_id)
+                    continue
+                deliveries = await self._deliveries(stream, message_id)
+                logger.warning(f"♻️ 診斷 worker {self.consumer} 重新領取閒置任務 {stream}/{message_id} (第 {deliveries} 次交付)")
+                self._start(stream, message_id, fields, deliveries)
+                claimed += 1
+        return claimed
+
+    async def _advertise(self):
+        """每 visibility_timeout / 3 登記一次執行名額，存活時間為一個 visibility_timeout"""
+        now = time.monotonic()
+        if now - self._advertised_at < self.visibility_timeout / 3:
+            return
+        concurrency = self.scheduler.concurrency if self.scheduler else self.concurrency
+        await self.queue.advertise(self.consumer, concurrency, ttl_seconds=self.visibility_timeout)
+        self._advertised_at = now
+
+    async def _deliveries(self, stream: str, message_id: str) -> int:
+        entries = await self.queue.redis_client.xpending_range(stream, self.queue.group, min=message_id, max=message_id, count=1)
+        return entries[0]["times_delivered"] if entries else 1
+
+    def _start(self, stream: str, message_id: str, fields: Dict[str, Any], deliveries: int):
+        task = asyncio.create_task(self._process(stream, message_id, fields, deliveries))
+        self._running[(stream, message_id)] = task
+        task.add_done_callback(lambda _: self._running.pop((stream, message_id), None))
+
+    async def _process(self, stream: str, message_id: str, fields: Dict[str, Any], deliveries: int):
+        if deliveries > self.max_deliveries:
+            await self.queue.dead_letter(stream, message_id, fields, "超過最大交付次數", deliveries)
+            logger.error(f"💀 任務 {message_id} 超過最大交付次數 {self.max_deliveries}，已移入死信佇列")
+            return
+        heartbeat = asyncio.create_task(self._heartbeat(stream, message_id))
+        try:
+            session_id, request_type, request = self.queue.decode(fields)
+            if self.scheduler:
+                async with self.scheduler.slot(fields.get("priority"), fields.get("client")):
+                    await self._handle(session_id, request, request_type, fields, deliveries)
+            else:
+                await self._handle(session_id, request, request_type, fields, deliveries)
+            await self.queue.complete(stream, message_id)
+        except Exception as e:
+            logger.error(f"❌ 任務 {message_id} 執行失敗 (第 {deliveries} 次交付): {e}", exc_info=True)
+            if deliveries >= self.max_deliveries:
+                await self.queue.dead_letter(stream, message_id, fields, f"{type(e).__name__}: {e}", deliveries)
+            # 否則保持未確認，可見性逾時後由任一 worker 重新領取
+        finally:
+            heartbeat.cancel()
+
+    async def _handle(self, session_id: uuid.UUID, request, request_type: str, fields: Dict[str, Any], deliveries: int):
+        if deliveries == 1 and fields.get("enqueued_at"):
+            ADMISSION_WAIT_SECONDS.labels(request_type).observe(max(time.time() - float(fields["enqueued_at"]), 0.0))
+        started = time.monotonic()
+        await self.handler(session_id, request, request_type)
+        await self.queue.record_duration(request_type, time.monotonic() - started)
+
+    async def _heartbeat(self, stream: str, message_id: str):
+        interval = max(self.visibility_timeout / 3, 0.01)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.queue.redis_client.xclaim(
+                    stream, self.queue.group, self.consumer,
+                    min_idle_time=0, message_ids=[message_id], justid=True,
+                )
+            except Exception as e:
+                logger.warning(f"任務 {message_id} 心跳失敗: {e}")
@@ -0,0 +1,138 @@
+# services/sre-assistant/src/sre_assistant/tools/bulk_remediation.py
+"""
+大量修復執行器
+將自動化腳本分波次套用到大量資源：波次內以有限並行度分塊呼叫 execute_script，
+每完成一個分塊就彙整進度，失敗數超過門檻時停止後續分塊與波次
+"""
+
+import asyncio
+import structlog
+from dataclasses import dataclass, field
+from typing import Dict, Any, Optional, List, Callable, Awaitable
+
+logger = structlog.get_logger(__name__)
+
+
+@dataclass
+class BulkRemediationProgress:
+    """大量修復的彙整進度 (以資源為單位計數)"""
+    total: int
+    total_waves: int
+    dry_run: bool = False
+    current_wave: int = 0
+    succeeded: List[str] = field(default_factory=list)
+    failed: Dict[str, str] = field(default_factory=dict)
+    skipped: List[str] = field(default_factory=list)
+    execution_ids: List[str] = field(default_factory=list)
+    stopped_reason: Optional[str] = None
+
+    @property
+    def completed(self) -> int:
+        return len(self.succeeded) + len(self.failed)
+
+    @property
+    def percent(self) -> int:
+        if not self.total:
+            return 100
+        return int((self.completed + len(self.skipped)) * 100 / self.total)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "total": self.total,
+            "completed": self.completed,
+            "succeeded": len(self.succeeded),
+            "failed": len(self.failed),
+            "skipped": len(self.skipped),
+            "current_wave": self.current_wave,
+            "total_waves": self.total_waves,
+            "dry_run": self.dry_run,
+            "failures": dict(self.failed),
+            "execution_ids": list(self.execution_ids),
+            "stopped_reason": self.stopped_reason,
+        }
+
+
+class BulkRemediationExecutor:
+    """
+    分波次、有限並行度的大量腳本執行
+
+    - 目標資源依 `wave_size` 分成波次，波次依序執行；波次內再依 `resources_per_call` 分塊，
+      最多 `concurrency` 個分塊同時呼叫 Control Plane
+    - 非模擬執行時，每個分塊透過 ControlPlaneTool.wait_for_execution (共用的批次輪詢迴圈) 等待結果
+    - `max_failures`：失敗資源數達到此值時立即停止，尚未開始的分塊標記為略過
+    - `max_failure_ratio`：每個波次結束時檢查累計失敗比例，超過時不再進行後續波次
+    - `on_progress(progress)` 在每個分塊完成時被呼叫，可用於更新會話狀態
+    """
+
+    def __init__(self, control_plane_tool, concurrency: int = 5, wave_size: int = 50, resources_per_call: int = 10, max_failures: Optional[int] = None, max_failure_ratio: Optional[float] = None, execution_timeout: Optional[float] = None):
+        self.control_plane_tool = control_plane_tool
+        self.concurrency = max(1, concurrency)
+        self.wave_size = max(1, wave_size)
+        self.resources_per_call = max(1, resources_per_call)
+        self.max_failures = max_failures
+        self.max_failure_ratio = max_failure_ratio
+        self.execution_timeout = execution_timeout
+
+    async def run(self, script_id: str, target_resources: List[str], parameters: Optional[Dict[str, Any]] = None, dry_run: bool = False, on_progress: Optional[Callable[[BulkRemediationProgress], Awaitable[None]]] = None) -> BulkRemediationProgress:
+        targets = list(dict.fromkeys(target_resources))
+        waves = [targets[i:i + self.wave_size] for i in range(0, len(targets), self.wave_size)]
+        progress = BulkRemediationProgress(total=len(targets), total_waves=len(waves), dry_run=dry_run)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        logger.info(f"🛠️ 大量修復 {script_id}: {len(targets)} 個資源、{len(waves)} 個波次、並行度 {self.concurrency}{' (模擬執行)' if dry_run else ''}")
+
+        async def run_chunk(chunk: List[str]):
+            async with semaphore:
+                if progress.stopped_reason:
+                    progress.skipped.extend(chunk)
+                    return
+                await self._execute_chunk(script_id, chunk, parameters, dry_run, progress)
+                if self.max_failures is not None and len(progress.failed) >= self.max_failures and not progress.stopped_reason:
+                    progress.stopped_reason = f"失敗資源數達到上限 {self.max_failures}"
+                    logger.warning(f"⚠️ 大量修復 {script_id} 停止: {progress.stopped_reason}")
+            if on_progress:
+                await on_progress(progress)
+
+        for index, wave in enumerate(waves, start=1):
+            if progress.stopped_reason:
+                progress.skipped.extend(wave)
+                continue
+            progress.current_wave = index
+            chunks = [wave[i:i + self.resources_per_call] for i in range(0, len(wave), self.resources_per_call)]
+            await asyncio.gather(*(run_chunk(chunk) for chunk in chunks))
+
+            ratio = len(progress.failed) / progress.completed if progress.completed else 0.0
+            if self.max_failure_ratio is not None and ratio > self.max_failure_ratio and not progress.stopped_reason:
+                progress.stopped_reason = f"第 {index} 波後失敗比例 {ratio:.0%} 超過上限 {self.max_failure_ratio:.0%}"
+                logger.warning(f"⚠️ 大量修復 {script_id} 停止: {progress.stopped_reason}")
+
+        if on_progress and progress.skipped:
+            await on_progress(progress)
+        logger.info(f"🛠️ 大量修復 {script_id} 結束: 成功 {len(progress.succeeded)}、失敗 {len(progress.failed)}、略過 {len(progress.skipped)}")
+        return progress
+
+    async def _execute_chunk(self, script_id: str, chunk: List[str], parameters: Optional[Dict[str, Any]], dry_run: bool, progress: BulkRemediationProgress):
+        result = await self.control_plane_tool.execute_script(script_id, parameters=parameters, target_resources=chunk, dry_run=dry_run)
+        if not result.success:
+            self._record(progress, chunk, error=result.error.message if result.error else "execute_script failed")
+            return
+        execution_id = result.data.get("execution_id")
+        if execution_id:
+            progress.execution_ids.append(execution_id)
+        if dry_run or not execution_id:
+            self._record(progress, chunk)
+            return
+
+        outcome = await self.control_plane_tool.wait_for_execution(execution_id, timeout=self.execution_timeout)
+        if not outcome.success:
+            self._record(progress, chunk, error=outcome.error.message if outcome.error else "wait_for_execution failed")
+        elif outcome.data.get("status") != "success":
+            self._record(progress, chunk, error=outcome.data.get("error") or f"execution {execution_id} {outcome.data.get('status')}")
+        else:
+            self._record(progress, chunk)
+
+    @staticmethod
+    def _record(progress: BulkRemediationProgress, chunk: List[str], error: Optional[str] = None):
+        if error is None:
+            progress.succeeded.extend(chunk)
+        else:
+            progress.failed.update({resource_id: error for resource_id in chunk})
@@ -0,0 +1,162 @@
+# services/sre-assistant/src/sre_assistant/tools/cache_invalidation.py
+"""
+以標籤為基礎的快取失效
+快取項目依實體類型與 ID 加上標籤 (例如 "incidents"、"incident:inc-1")，寫入操作使其標籤失效，
+並透過 Redis pub/sub 頻道讓 Control Plane 或其他副本廣播失效事件
+"""
+
+import asyncio
+import json
+import uuid
+import structlog
+from typing import Dict, Any, Optional, List, Iterable, Callable
+
+logger = structlog.get_logger(__name__)
+
+# 只延長存活時間：集合沒有存活時間 (剛建立) 或剩餘時間短於新值時才設定。
+# 等同 EXPIRE NX + EXPIRE GT，但不需要 Redis 7 (本機安裝腳本的 Redis 為 6.x)
+_EXTEND_TTL_SCRIPT = """
+local ttl = redis.call('TTL', KEYS[1])
+if ttl < tonumber(ARGV[1]) then
+    return redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return 0
+"""
+
+
+def cache_tags(collection: str, entity: Optional[str], data: Any) -> List[str]:
+    """
+    回傳快取項目的標籤：集合標籤 (任何同類型資料變更時失效) + 回應中每個實體的 ID 標籤
+    """
+    tags = [collection]
+    if not entity or not isinstance(data, dict):
+        return tags
+    items = data.get("items") if isinstance(data.get("items"), list) else [data]
+    for item in items:
+        if isinstance(item, dict) and item.get("id"):
+            tags.append(f"{entity}:{item['id']}")
+    return tags
+
+
+class CacheTagIndex:
+    """
+    Redis 中的標籤索引：`{prefix}:{tag}` → 帶有該標籤的快取鍵集合
+    """
+
+    def __init__(self, redis_client, prefix: str = "controlplane:tag", channel: str = "controlplane:invalidations"):
+        self.redis_client = redis_client
+        self.prefix = prefix
+        self.channel = channel
+        # 用於辨識自己發出的廣播，避免重複處理
+        self.origin = uuid.uuid4().hex
+        # 快取以外也需要跟著失效的本地狀態 (例如資源庫存)，本地與廣播的失效事件都會通知
+        self._listeners: List[Callable[[List[str]], Any]] = []
+
+    def add_listener(self, callback: Callable[[List[str]], Any]):
+        self._listeners.append(callback)
+
+    def _tag_key(self, tag: str) -> str:
+        return f"{self.prefix}:{tag}"
+
+    def add_to_pipeline(self, pipe, key: str, tags: Iterable[str], ttl_seconds: int):
+        """
+        在寫入快取的同一個 pipeline 中登記標籤
+
+        標籤集合由多個快取項目共用，存活時間只會延長 (以 Lua 腳本比較目前的 TTL)，
+        存活時間較短的項目 (例如負面快取) 不會讓同一標籤下較長壽的項目提早失去索引
+        """
+        for tag in tags:
+            tag_key = self._tag_key(tag)
+            pipe.sadd(tag_key, key)
+            pipe.eval(_EXTEND_TTL_SCRIPT, 1, tag_key, ttl_seconds)
+
+    async def invalidate(self, tags: Iterable[str], publish: bool = True) -> int:
+        """刪除帶有任一標籤的快取項目，並 (預設) 廣播失效事件；回傳刪除的快取鍵數量"""
+        tags = list(dict.fromkeys(tags))
+        for callback in self._listeners:
+            try:
+                callback(tags)
+            except Exception as e:
+                logger.warning(f"快取失效通知失敗 {tags}: {e}")
+        if not self.redis_client or not tags:
+            return 0
+        deleted = 0
+        try:
+            tag_keys = [self._tag_key(tag) for tag in tags]
+            pipe = self.redis_client.pipeline()
+            for tag_key in tag_keys:
+                pipe.smembers(tag_key)
+            members = await pipe.execute()
+            keys = {member.decode() if isinstance(member, bytes) else member for group in members for member in (group or [])}
+            deleted = len(keys)
+            await self.redis_client.delete(*keys, *tag_keys)
+            logger.info(f"🧹 快取標籤失效 {tags}: 刪除 {deleted} 個快取項目")
+        except Exception as e:
+            logger.error(f"快取標籤失效失敗 {tags}: {e}")
+        if publish:
+            await self.publish(tags)
+        return deleted
+
+    async def publish(self, tags: List[str]):
+        try:
+            await self.redis_client.publish(self.channel, json.dumps({"tags": tags, "origin": self.origin}))
+        except Exception as e:
+            logger.warning(f"快取失效廣播失敗: {e}")
+
+
+class CacheInvalidationListener:
+    """
+    訂閱失效頻道的背景工作
+
+    訊息格式: {"tags": ["incidents", "incident:inc-1"], "origin": "..."}；
+    Control Plane 發出的訊息可省略 origin。自己發出的訊息會被略過 (已在本地處理)。
+    """
+
+    def __init__(self, index: CacheTagIndex, reconnect_delay_seconds: float = 5):
+        self.index = index
+        self.reconnect_delay_seconds = reconnect_delay_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"📡 快取失效監聽已啟動: {self.index.channel}")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            pubsub = self.index.redis_client.pubsub()
+            try:
+                await pubsub.subscribe(self.index.channel)
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        await self.handle(message.get("data"))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"快取失效監聽中斷，{self.reconnect_delay_seconds}s 後重新訂閱: {e}")
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+            await asyncio.sleep(self.reconnect_delay_seconds)
+
+    async def handle(self, data: Any) -> int:
+        """處理一則失效訊息；回傳刪除的快取鍵數量"""
+        try:
+            payload: Dict[str, Any] = json.loads(data)
+        except (TypeError, ValueError):
+            logger.warning(f"無法解析快取失效訊息: {data!r}")
+            return 0
+        if payload.get("origin") == self.index.origin:
+            return 0
+        return await self.index.invalidate(payload.get("tags") or [], publish=False)
@@ -0,0 +1,90 @@
+# services/sre-assistant/src/sre_assistant/tools/cache_policy.py
+"""
+Control Plane 讀取快取策略
+每個端點宣告自己的 TTL、負面結果 TTL (404 / 空結果)、過期後的備援時間、最大快取大小與壓縮門檻，
+由 ControlPlaneTool 的單一快取引擎依策略執行
+"""
+
+import base64
+import zlib
+import structlog
+from dataclasses import dataclass, replace, fields
+from typing import Dict, Any, Optional, Tuple
+
+logger = structlog.get_logger(__name__)
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    """
+    單一端點的快取策略
+
+    - ttl_seconds: 正常結果的有效時間
+    - negative_ttl_seconds: 404 與空列表的有效時間 (0 表示不快取)
+    - stale_seconds: 過期後 Control Plane 無法回應 (逾時 / 連線失敗 / 5xx) 時仍可回傳舊資料的時間
+    - revalidate_seconds: 過期後保留 ETag / Last-Modified 以條件請求重新驗證的時間
+    - max_payload_bytes: 超過此大小的回應不寫入快取
+    - compress_min_bytes: 超過此大小的回應以 zlib 壓縮後寫入 (None 表示不壓縮)
+    """
+    ttl_seconds: int = 300
+    negative_ttl_seconds: int = 60
+    stale_seconds: int = 900
+    revalidate_seconds: int = 3600
+    max_payload_bytes: int = 4 * 1024 * 1024
+    compress_min_bytes: Optional[int] = 16 * 1024
+
+    @property
+    def redis_ttl_seconds(self) -> int:
+        """Redis 項目的存活時間需涵蓋重新驗證與過期備援的時間"""
+        return self.ttl_seconds + max(self.revalidate_seconds, self.stale_seconds)
+
+
+# 依資料變動頻率設定：告警規則與資源群組很少變動，事件與執行紀錄變動頻繁
+DEFAULT_CACHE_POLICIES: Dict[str, CachePolicy] = {
+    "resources": CachePolicy(ttl_seconds=300, negative_ttl_seconds=60, stale_seconds=900),
+    "resource_details": CachePolicy(ttl_seconds=300, negative_ttl_seconds=120, stale_seconds=900),
+    "resource_groups": CachePolicy(ttl_seconds=900, negative_ttl_seconds=300, stale_seconds=3600),
+    "audit_logs": CachePolicy(ttl_seconds=120, negative_ttl_seconds=60, stale_seconds=300),
+    "incidents": CachePolicy(ttl_seconds=30, negative_ttl_seconds=15, stale_seconds=120),
+    "alert_rules": CachePolicy(ttl_seconds=1800, negative_ttl_seconds=300, stale_seconds=3600),
+    "automation_executions": CachePolicy(ttl_seconds=30, negative_ttl_seconds=15, stale_seconds=120),
+}
+
+
+def load_cache_policies(overrides: Any = None, revalidate_seconds: Any = None) -> Dict[str, CachePolicy]:
+    """
+    以設定覆寫預設策略，例如 {"incidents": {"ttl_seconds": 10}}；未知的欄位會被忽略並記錄警告
+    """
+    policies = dict(DEFAULT_CACHE_POLICIES)
+    if isinstance(revalidate_seconds, (int, float)):
+        policies = {name: replace(policy, revalidate_seconds=int(revalidate_seconds)) for name, policy in policies.items()}
+    if not isinstance(overrides, dict):
+        return policies
+    known = {field.name for field in fields(CachePolicy)}
+    for name, values in overrides.items():
+        if not isinstance(values, dict):
+            continue
+        unknown = set(values) - known
+        if unknown:
+            logger.warning(f"忽略未知的快取策略欄位 {name}: {sorted(unknown)}")
+        policies[name] = replace(policies.get(name, CachePolicy()), **{key: value for key, value in values.items() if key in known})
+    return policies
+
+
+def encode_payload(payload: str, policy: CachePolicy) -> Optional[Tuple[Optional[str], str]]:
+    """
+    依策略編碼要寫入快取的 JSON 回應，回傳 (編碼方式, 內容)；超過大小上限時回傳 None
+    Redis 客戶端以 decode_responses=True 連線，壓縮結果以 base64 保存
+    """
+    raw = payload.encode("utf-8")
+    if len(raw) > policy.max_payload_bytes:
+        return None
+    if policy.compress_min_bytes is not None and len(raw) >= policy.compress_min_bytes:
+        return "zlib", base64.b64encode(zlib.compress(raw)).decode("ascii")
+    return None, payload
+
+
+def decode_payload(encoding: Optional[str], stored: str) -> str:
+    if encoding == "zlib":
+        return zlib.decompress(base64.b64decode(stored)).decode("utf-8")
+    return stored
@@ -50,6 +50,28 @@ class ResourceList(BaseModel):
     items: List[Resource]
     pagination: Pagination
 
+class BatchResourceOperation(BaseModel):
+    """
+    對應 control-plane-openapi.yaml 中的 BatchResourceOperation schema。
+    """
+    operation: str
+    resource_ids: List[str]
+    parameters: Optional[Dict[str, Any]] = None
+
+class BatchOperationFailure(BaseModel):
+    resource_id: str
+    error: Optional[str] = None
+
+class BatchOperationResult(BaseModel):
+    """
+    對應 control-plane-openapi.yaml 中的 BatchOperationResult schema。
+    operation 為 get 時，resources 包含成功取得的資源。
+    """
+    success_count: int = 0
+    failure_count: int = 0
+    failures: List[BatchOperationFailure] = []
+    resources: List[Resource] = []
+
 class ResourceGroup(BaseModel):
     """
     對應 control-plane-openapi.yaml 中的 ResourceGroup schema。
@@ -0,0 +1,142 @@
+# services/sre-assistant/src/sre_assistant/tools/control_plane_pagination.py
+"""
+Control Plane 列表自動分頁
+以非同步迭代器逐筆走訪所有頁面；取得第一頁的 total_pages 後，並行預先抓取接下來的 N 頁
+"""
+
+import asyncio
+import math
+import structlog
+from typing import Dict, Any, Optional, List, Callable, Awaitable, Iterator
+
+from ..contracts import ToolResult, ToolError
+
+logger = structlog.get_logger(__name__)
+
+
+class PageIterator:
+    """
+    分頁迭代器
+
+    - `fetch_page(page)` 回傳該頁的 ToolResult (data 需包含 items 與 pagination)
+    - 第一頁之後最多同時有 `prefetch` 個頁面請求在進行中，頁面依序產出
+    - 達到 `max_items`、走訪完畢或發生錯誤時立即取消尚未完成的請求
+
+    迭代器本身以 `__anext__` 保存狀態 (不是 async generator)，提前 break 不會延遲清理到垃圾回收；
+    可能提前離開迴圈的呼叫端應以 `async with` 使用，離開時預取請求一定會被取消：
+
+        async with tool.iter_incidents(params) as incidents:
+            async for incident in incidents:
+                ...
+
+    迭代結束後可從 `total`、`pages_fetched`、`truncated`、`error` 得知結果是否完整。
+    """
+
+    def __init__(self, fetch_page: Callable[[int], Awaitable[ToolResult]], max_items: Optional[int] = None, prefetch: int = 3):
+        self.fetch_page = fetch_page
+        self.max_items = max_items
+        self.prefetch = max(1, prefetch)
+        self.total: Optional[int] = None
+        self.total_pages: Optional[int] = None
+        self.pages_fetched = 0
+        self.truncated = False
+        self.error: Optional[ToolError] = None
+        self._pending: List[asyncio.Task] = []
+        self._started = False
+        self._finished = False
+        self._items: Iterator[Dict[str, Any]] = iter(())
+        self._next_page = 2
+        self._last_page = 1
+        self._yielded = 0
+
+    def __aiter__(self) -> "PageIterator":
+        return self
+
+    async def __anext__(self) -> Dict[str, Any]:
+        if self._finished:
+            raise StopAsyncIteration
+        try:
+            item = await self._next_item()
+        except BaseException:
+            await self.aclose()
+            raise
+        if item is None:
+            await self.aclose()
+            raise StopAsyncIteration
+        return item
+
+    async def __aenter__(self) -> "PageIterator":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def _next_item(self) -> Optional[Dict[str, Any]]:
+        """回傳下一筆資料；走訪結束時回傳 None"""
+        if not self._started:
+            self._started = True
+            first = await self.fetch_page(1)
+            if not self._accept(first):
+                return None
+            pagination = first.data.get("pagination") or {}
+            self.total = pagination.get("total")
+            self.total_pages = pagination.get("total_pages") or 1
+            self._last_page = self.total_pages
+            page_size = pagination.get("page_size")
+            if self.max_items is not None and page_size:
+                self._last_page = min(self._last_page, max(1, math.ceil(self.max_items / page_size)))
+            self._items = iter(first.data.get("items", []))
+
+        while True:
+            # 在處理目前頁面的同時，讓後續頁面的請求保持在預取視窗內
+            while self._next_page <= self._last_page and len(self._pending) < self.prefetch:
+                self._pending.append(asyncio.create_task(self.fetch_page(self._next_page)))
+                self._next_page += 1
+
+            item = next(self._items, None)
+            if item is not None:
+                if self.max_items is not None and self._yielded >= self.max_items:
+                    self.truncated = True
+                    return None
+                self._yielded += 1
+                return item
+
+            if not self._pending:
+                if self.total is not None and self._yielded < self.total:
+                    self.truncated = True
+                return None
+            page_result = await self._pending.pop(0)
+            if not self._accept(page_result):
+                self.truncated = True
+                return None
+            self._items = iter(page_result.data.get("items", []))
+
+    def _accept(self, result: ToolResult) -> bool:
+        if not result.success:
+            self.error = result.error
+            logger.warning(f"⚠️ Control Plane 分頁查詢在第 {self.pages_fetched + 1} 頁失敗: {result.error.message if result.error else ''}")
+            return False
+        self.pages_fetched += 1
+        return True
+
+    async def aclose(self):
+        """結束迭代並取消尚未完成的預取請求 (可重複呼叫)"""
+        self._finished = True
+        pending, self._pending = self._pending, []
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def collect(self) -> ToolResult:
+        """走訪所有頁面並彙整為一個 ToolResult；第一頁即失敗時回傳該錯誤"""
+        async with self:
+            items = [item async for item in self]
+        if self.error and not self.pages_fetched:
+            return ToolResult(success=False, error=self.error)
+        return ToolResult(success=True, data={
+            "items": items,
+            "total": self.total,
+            "pages_fetched": self.pages_fetched,
+            "truncated": self.truncated,
+        })
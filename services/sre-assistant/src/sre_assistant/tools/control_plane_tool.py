@@ -4,31 +4,46 @@ Control Plane 整合工具
 用於回調 Control Plane API 獲取審計日誌和變更歷史
 """
 
+import asyncio
+import functools
 import structlog
 import httpx
 import json
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 import jwt
 import time
-from datetime import datetime
+import uuid
 
-from pydantic import ValidationError
+from pydantic import TypeAdapter, ValidationError
 
 from ..contracts import ToolResult, ToolError
+from .control_plane_pagination import PageIterator
+from .cache_invalidation import CacheTagIndex, cache_tags
+from .cache_policy import CachePolicy, load_cache_policies, encode_payload, decode_payload
+from .execution_tracker import ExecutionTracker
+from .json_codec import json_loads, json_dumps
+from .resource_inventory import ResourceInventory
 from .control_plane_contracts import (
-    Resource, ResourceList, ResourceGroupList, AlertRuleList, ExecutionList,
+    Resource, ResourceList, ResourceGroupList, BatchResourceOperation, BatchOperationResult, AlertRuleList, ExecutionList,
     AuditLogList, IncidentList, Incident,
     AcknowledgeIncidentRequest, ScriptExecuteRequest, ExecutionTaskResponse
 )
 
 logger = structlog.get_logger(__name__)
 
+# 只在鎖仍屬於自己時刪除 (刷新超過鎖的存活時間後，鎖可能已被其他副本取得)
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
 
-def json_serial(obj):
-    """JSON serializer for objects not serializable by default json code"""
-    if isinstance(obj, datetime):
-        return obj.isoformat()
-    raise TypeError(f"Type {type(obj)} not serializable")
+@functools.lru_cache(maxsize=None)
+def _type_adapter(model) -> TypeAdapter:
+    """每個契約模型只建立一次 TypeAdapter (建立 validator 的成本遠高於驗證本身)"""
+    return TypeAdapter(model)
 
 
 class ControlPlaneTool:
@@ -44,13 +59,47 @@ class ControlPlaneTool:
         
         # 快取設定
         self.redis_client = redis_client
-        self.cache_ttl_seconds = config.control_plane.get("cache_ttl_seconds", 300) # 預設 5 分鐘
+        # 每個端點的快取策略 (TTL、負面結果 TTL、過期備援、大小上限與壓縮)，可由 cache_policies 設定覆寫
+        self.cache_policies: Dict[str, CachePolicy] = load_cache_policies(
+            config.control_plane.get("cache_policies", {}),
+            revalidate_seconds=config.control_plane.get("cache_revalidate_seconds", 3600),
+        )
+        # 快取項目依實體類型與 ID 加上標籤，寫入操作與 pub/sub 廣播會使對應標籤失效
+        self.cache_tags = CacheTagIndex(
+            redis_client,
+            channel=config.control_plane.get("invalidation_channel", "controlplane:invalidations"),
+        )
+        self.batch_chunk_size = config.control_plane.get("batch_chunk_size", 100)
+        self.page_size = config.control_plane.get("page_size", 100)
+        self.page_prefetch = config.control_plane.get("page_prefetch", 3)
+        self.max_list_items = config.control_plane.get("max_list_items", 1000)
+
+        # 自動化執行追蹤：所有等待中的執行共用一個批次輪詢迴圈
+        self.execution_tracker = ExecutionTracker(
+            self,
+            batch_size=config.control_plane.get("execution_poll_batch_size", 50),
+            min_interval=config.control_plane.get("execution_poll_min_seconds", 1.0),
+            max_interval=config.control_plane.get("execution_poll_max_seconds", 15.0),
+            max_pending_seconds=config.control_plane.get("execution_max_pending_seconds", 3600),
+        )
+
+        # 本地資源庫存鏡像：由 InventorySyncer 同步完成 (ready) 後，資源查詢優先在本地解析
+        self.inventory = ResourceInventory()
+        self.cache_tags.add_listener(self.inventory.invalidate_tags)
 
         self.client_id = config.control_plane.client_id
         self.client_secret = config.control_plane.client_secret
         self.token_url = config.auth.keycloak.token_url
         self.token = None
         self.token_expires_at = 0
+        self.token_issued_at = 0
+        # Token 生命週期超過此比例後於背景預先刷新
+        self.token_refresh_ratio = config.control_plane.get("token_refresh_ratio", 0.75)
+        # 啟用時透過 Redis 在 worker / 副本之間共用 Token
+        self.token_shared = config.control_plane.get("share_token_via_redis", False)
+        self.token_cache_key = "controlplane:m2m_token"
+        self._token_refresh_at = 0.0
+        self._refresh_future: Optional[asyncio.Future] = None
         
         logger.info(f"✅ Control Plane 工具初始化 (使用共享 HTTP 客戶端): {self.base_url}")
 
@@ -82,130 +131,139 @@ class ControlPlaneTool:
         查詢資源狀態 (GET /api/v1/resources)，帶有快取。
         """
         params_str = json.dumps(params, sort_keys=True) if params else "{}"
-        cache_key = f"controlplane:query_resources:{params_str}"
-
-        if cached_data := await self._get_from_cache(cache_key):
-            return ToolResult(success=True, data=cached_data)
-
-        try:
-            response_data = await self._make_request(method="GET", endpoint="/api/v1/resources", params=params)
-            validated_data = ResourceList.model_validate(response_data).model_dump()
-            await self._set_to_cache(cache_key, validated_data)
-            return ToolResult(success=True, data=validated_data)
-        except ValidationError as e:
-            return self._handle_validation_error(e, params)
-        except Exception as e:
-            return self._handle_error(e, params)
+        return await self._cached_get(f"controlplane:query_resources:{params_str}", "/api/v1/resources", ResourceList, "resources", params=params, tags=("resources", "resource"))
 
     async def get_resource_details(self, resource_id: str) -> ToolResult:
         """
         獲取資源詳情 (GET /api/v1/resources/{resourceId})，帶有快取。
         """
-        cache_key = f"controlplane:get_resource_details:{resource_id}"
-        if cached_data := await self._get_from_cache(cache_key):
-            return ToolResult(success=True, data=cached_data)
+        if self.inventory.ready:
+            resource = self.inventory.get(resource_id)
+            if resource is not None:
+                return ToolResult(success=True, data=resource)
+        return await self._cached_get(self._resource_cache_key(resource_id), f"/api/v1/resources/{resource_id}", Resource, "resource_details", error_params={"resource_id": resource_id}, tags=("resources", "resource"), entity_id=resource_id)
 
-        params = {"resource_id": resource_id}
-        try:
-            response_data = await self._make_request(method="GET", endpoint=f"/api/v1/resources/{resource_id}")
-            validated_data = Resource.model_validate(response_data).model_dump()
-            await self._set_to_cache(cache_key, validated_data)
-            return ToolResult(success=True, data=validated_data)
-        except ValidationError as e:
-            return self._handle_validation_error(e, params)
-        except Exception as e:
-            return self._handle_error(e, params)
+    async def get_resources_bulk(self, resource_ids: List[str]) -> ToolResult:
+        """
+        批次獲取多個資源詳情，帶有快取。
+
+        本地資源庫存已同步時先從庫存解析，其餘以一次 Redis MGET 取出已快取的資源 (與 get_resource_details 共用快取鍵)，
+        仍未命中的部分依 `batch_chunk_size` 分塊呼叫 POST /api/v1/resources/batch (operation=get)，
+        取得的結果再以 pipeline 一次寫回快取；Control Plane 回報不存在的 ID 依 resource_details 策略做負面快取，
+        在負面 TTL 內不再重新查詢。
+
+        回傳 data: {"resources": {resource_id: 資源}, "missing": [找不到或抓取失敗的 ID], "cache_hits": 命中數, "inventory_hits": 庫存命中數}
+        """
+        ids = list(dict.fromkeys(resource_ids))
+        params = {"resource_ids": ids}
+        resources = self.inventory.get_many(ids) if self.inventory.ready else {}
+        inventory_hits = len(resources)
+        known_missing: List[str] = []
+        if inventory_hits < len(ids):
+            hits, known_missing = await self._get_many_from_cache([resource_id for resource_id in ids if resource_id not in resources])
+            resources.update(hits)
+        cache_hits = len(resources) - inventory_hits + len(known_missing)
+        misses = [resource_id for resource_id in ids if resource_id not in resources and resource_id not in known_missing]
+
+        chunks = [misses[i:i + self.batch_chunk_size] for i in range(0, len(misses), self.batch_chunk_size)]
+        results = await asyncio.gather(*(self._fetch_resource_chunk(chunk) for chunk in chunks), return_exceptions=True)
+
+        fetched: Dict[str, Resource] = {}
+        not_found: List[str] = []
+        errors: List[Exception] = []
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, Exception):
+                errors.append(result)
+            else:
+                fetched.update(result)
+                not_found.extend(resource_id for resource_id in chunk if resource_id not in result)
+
+        if errors and not fetched and not resources:
+            # 全部失敗時沿用單筆查詢的錯誤格式
+            error = errors[0]
+            if isinstance(error, ValidationError):
+                return self._handle_validation_error(error, params)
+            return self._handle_error(error, params)
+        if errors:
+            logger.warning(f"⚠️ 批次獲取資源時有 {len(errors)}/{len(chunks)} 個分塊失敗: {errors[0]}")
+
+        await self._set_many_to_cache(fetched, not_found=not_found)
+        resources.update({resource_id: resource.model_dump() for resource_id, resource in fetched.items()})
+        missing = [resource_id for resource_id in ids if resource_id not in resources]
+        logger.info(f"🛂 (ControlPlaneTool) 批次獲取 {len(ids)} 個資源: 庫存命中 {inventory_hits}、快取命中 {cache_hits}、API 分塊 {len(chunks)}、缺少 {len(missing)}")
+        return ToolResult(success=True, data={"resources": resources, "missing": missing, "cache_hits": cache_hits, "inventory_hits": inventory_hits})
+
+    async def _fetch_resource_chunk(self, resource_ids: List[str]) -> Dict[str, Resource]:
+        request_body = BatchResourceOperation(operation="get", resource_ids=resource_ids)
+        response = await self._send(
+            method="POST",
+            endpoint="/api/v1/resources/batch",
+            json_data=request_body.model_dump(exclude_none=True)
+        )
+        response.raise_for_status()
+        result = _type_adapter(BatchOperationResult).validate_json(response.content)
+        for failure in result.failures:
+            logger.warning(f"批次獲取資源失敗 {failure.resource_id}: {failure.error}")
+        return {resource.id: resource for resource in result.resources}
 
     async def query_resource_groups(self, params: Optional[Dict] = None) -> ToolResult:
         """
         查詢資源群組 (GET /api/v1/resource-groups)，帶有快取。
         """
         params_str = json.dumps(params, sort_keys=True) if params else "{}"
-        cache_key = f"controlplane:query_resource_groups:{params_str}"
-        if cached_data := await self._get_from_cache(cache_key):
-            return ToolResult(success=True, data=cached_data)
-
-        try:
-            response_data = await self._make_request(method="GET", endpoint="/api/v1/resource-groups", params=params)
-            validated_data = ResourceGroupList.model_validate(response_data).model_dump()
-            await self._set_to_cache(cache_key, validated_data)
-            return ToolResult(success=True, data=validated_data)
-        except ValidationError as e:
-            return self._handle_validation_error(e, params)
-        except Exception as e:
-            return self._handle_error(e, params)
+        return await self._cached_get(f"controlplane:query_resource_groups:{params_str}", "/api/v1/resource-groups", ResourceGroupList, "resource_groups", params=params, tags=("resource_groups", "resource_group"))
 
     async def query_audit_logs(self, params: Optional[Dict] = None) -> ToolResult:
         """查詢部署相關的審計日誌 (GET /api/v1/audit-logs)，帶有快取。"""
         params_str = json.dumps(params, sort_keys=True) if params else "{}"
-        cache_key = f"controlplane:query_audit_logs:{params_str}"
-        if cached_data := await self._get_from_cache(cache_key):
-            return ToolResult(success=True, data=cached_data)
-
-        try:
-            response_data = await self._make_request(method="GET", endpoint="/api/v1/audit-logs", params=params)
-            validated_data = AuditLogList.model_validate(response_data).model_dump()
-            await self._set_to_cache(cache_key, validated_data)
-            return ToolResult(success=True, data=validated_data)
-        except ValidationError as e:
-            return self._handle_validation_error(e, params)
-        except Exception as e:
-            return self._handle_error(e, params)
+        return await self._cached_get(f"controlplane:query_audit_logs:{params_str}", "/api/v1/audit-logs", AuditLogList, "audit_logs", params=params, tags=("audit_logs", None))
 
     async def query_incidents(self, params: Optional[Dict] = None) -> ToolResult:
         """查詢相關事件 (GET /api/v1/incidents)，帶有快取。"""
         params_str = json.dumps(params, sort_keys=True) if params else "{}"
-        cache_key = f"controlplane:query_incidents:{params_str}"
-        if cached_data := await self._get_from_cache(cache_key):
-            return ToolResult(success=True, data=cached_data)
-
-        try:
-            response_data = await self._make_request(method="GET", endpoint="/api/v1/incidents", params=params)
-            validated_data = IncidentList.model_validate(response_data).model_dump()
-            await self._set_to_cache(cache_key, validated_data)
-            return ToolResult(success=True, data=validated_data)
-        except ValidationError as e:
-            return self._handle_validation_error(e, params)
-        except Exception as e:
-            return self._handle_error(e, params)
+        return await self._cached_get(f"controlplane:query_incidents:{params_str}", "/api/v1/incidents", IncidentList, "incidents", params=params, tags=("incidents", "incident"))
 
     async def get_alert_rules(self, params: Optional[Dict] = None) -> ToolResult:
         """
         獲取告警規則狀態 (GET /api/v1/alert-rules)，帶有快取。
         """
         params_str = json.dumps(params, sort_keys=True) if params else "{}"
-        cache_key = f"controlplane:get_alert_rules:{params_str}"
-        if cached_data := await self._get_from_cache(cache_key):
-            return ToolResult(success=True, data=cached_data)
-
-        try:
-            response_data = await self._make_request(method="GET", endpoint="/api/v1/alert-rules", params=params)
-            validated_data = AlertRuleList.model_validate(response_data).model_dump()
-            await self._set_to_cache(cache_key, validated_data)
-            return ToolResult(success=True, data=validated_data)
-        except ValidationError as e:
-            return self._handle_validation_error(e, params)
-        except Exception as e:
-            return self._handle_error(e, params)
+        return await self._cached_get(f"controlplane:get_alert_rules:{params_str}", "/api/v1/alert-rules", AlertRuleList, "alert_rules", params=params, tags=("alert_rules", "alert_rule"))
 
     async def query_automation_executions(self, params: Optional[Dict] = None) -> ToolResult:
         """
         查詢自動化腳本執行歷史 (GET /api/v1/automation/executions)，帶有快取。
         """
         params_str = json.dumps(params, sort_keys=True) if params else "{}"
-        cache_key = f"controlplane:query_automation_executions:{params_str}"
-        if cached_data := await self._get_from_cache(cache_key):
-            return ToolResult(success=True, data=cached_data)
+        return await self._cached_get(f"controlplane:query_automation_executions:{params_str}", "/api/v1/automation/executions", ExecutionList, "automation_executions", params=params, tags=("executions", "execution"))
 
-        try:
-            response_data = await self._make_request(method="GET", endpoint="/api/v1/automation/executions", params=params)
-            validated_data = ExecutionList.model_validate(response_data).model_dump()
-            await self._set_to_cache(cache_key, validated_data)
-            return ToolResult(success=True, data=validated_data)
-        except ValidationError as e:
-            return self._handle_validation_error(e, params)
-        except Exception as e:
-            return self._handle_error(e, params)
+    def iter_audit_logs(self, params: Optional[Dict] = None, max_items: Optional[int] = None) -> PageIterator:
+        """逐筆走訪所有頁面的審計日誌 (async with + async for)，每一頁仍經過 query_audit_logs 的快取"""
+        return self._paginate(self.query_audit_logs, params, max_items)
+
+    def iter_incidents(self, params: Optional[Dict] = None, max_items: Optional[int] = None) -> PageIterator:
+        """逐筆走訪所有頁面的事件 (async with + async for)"""
+        return self._paginate(self.query_incidents, params, max_items)
+
+    def iter_automation_executions(self, params: Optional[Dict] = None, max_items: Optional[int] = None) -> PageIterator:
+        """逐筆走訪所有頁面的自動化執行歷史 (async with + async for)"""
+        return self._paginate(self.query_automation_executions, params, max_items)
+
+    async def query_all_audit_logs(self, params: Optional[Dict] = None, max_items: Optional[int] = None) -> ToolResult:
+        """取得所有頁面的審計日誌 (最多 max_items 筆)"""
+        return await self.iter_audit_logs(params, max_items).collect()
+
+    async def query_all_incidents(self, params: Optional[Dict] = None, max_items: Optional[int] = None) -> ToolResult:
+        """取得所有頁面的事件 (最多 max_items 筆)"""
+        return await self.iter_incidents(params, max_items).collect()
+
+    def _paginate(self, query_page, params: Optional[Dict], max_items: Optional[int]) -> PageIterator:
+        base_params = {"page_size": self.page_size, **(params or {})}
+
+        async def fetch_page(page: int) -> ToolResult:
+            return await query_page({**base_params, "page": page})
+
+        return PageIterator(fetch_page, max_items=max_items if max_items is not None else self.max_list_items, prefetch=self.page_prefetch)
 
     async def acknowledge_incident(self, incident_id: str, acknowledged_by: Optional[str] = None, comment: Optional[str] = None) -> ToolResult:
         """
@@ -221,7 +279,9 @@ class ControlPlaneTool:
                 endpoint=f"/api/v1/incidents/{incident_id}/acknowledge",
                 json_data=json_data
             )
-            return ToolResult(success=True, data=Incident.model_validate(response_data).model_dump())
+            incident = Incident.model_validate(response_data).model_dump()
+            await self.invalidate(["incidents", f"incident:{incident_id}", "audit_logs"])
+            return ToolResult(success=True, data=incident)
         except ValidationError as e:
             return self._handle_validation_error(e, params)
         except Exception as e:
@@ -246,38 +306,210 @@ class ControlPlaneTool:
                 endpoint="/api/v1/automation/execute",
                 json_data=json_data
             )
-            return ToolResult(success=True, data=ExecutionTaskResponse.model_validate(response_data).model_dump())
+            execution = ExecutionTaskResponse.model_validate(response_data).model_dump()
+            tags = ["executions", "audit_logs"]
+            if not dry_run:
+                tags += [f"resource:{resource_id}" for resource_id in target_resources or []]
+            await self.invalidate(tags)
+            return ToolResult(success=True, data=execution)
         except ValidationError as e:
             return self._handle_validation_error(e, params)
         except Exception as e:
             return self._handle_error(e, params)
 
-    async def _get_from_cache(self, key: str) -> Optional[Any]:
+    async def _cached_get(self, cache_key: str, endpoint: str, model, policy_name: str, params: Optional[Dict] = None, error_params: Optional[Dict] = None, tags: Optional[tuple] = None, entity_id: Optional[str] = None) -> ToolResult:
+        """
+        依端點快取策略執行的快取 GET (所有快取讀取方法共用)
+
+        - 有效期限內直接回傳快取；404 與空列表以 negative_ttl_seconds 快取 (負面快取)
+        - 過期後以 If-None-Match / If-Modified-Since 重新驗證：304 只延長有效期限，不重新下載或解析
+        - Control Plane 逾時、連線失敗或 5xx 時，過期 stale_seconds 內的快取仍會被回傳
+        - tags 為 (集合, 實體) 時，快取項目會以集合標籤與回應中每個實體的 ID 標籤登記；
+          404 的負面快取沒有回應內容，改以集合標籤與 entity_id 登記，建立該實體時即可失效
+
+        回應直接以 TypeAdapter.validate_json 從位元組驗證，驗證後的 JSON 原樣 (或壓縮後) 存入快取；
+        命中時只需一次 JSON 解碼，不再重新驗證或序列化。
+        """
+        policy = self.cache_policies[policy_name]
+        error_params = error_params if error_params is not None else params
+        cached = await self._get_from_cache(cache_key)
+        meta, stored = cached if cached else ({}, None)
+        now = time.time()
+        if cached and meta["fresh_until"] > now:
+            logger.info(f"CACHE HIT: ControlPlaneTool cache hit for key: {cache_key}")
+            return self._cached_result(meta, stored, error_params)
+
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+        try:
+            response = await self._send(method="GET", endpoint=endpoint, params=params, headers=headers)
+            if response.status_code == 304 and cached and not meta.get("negative"):
+                logger.info(f"CACHE REVALIDATED: ControlPlaneTool 304 Not Modified for key: {cache_key}")
+                # 重新寫入時一併重新登記標籤，否則延長後的項目會比它的標籤索引活得更久
+                entry_tags = meta.get("tags")
+                await self._set_to_cache(cache_key, self._cache_entry(stored, policy, meta.get("encoding"), meta.get("etag"), meta.get("last_modified"), empty=meta.get("empty", False), tags=entry_tags), policy, tags=entry_tags)
+                return self._cached_result(meta, stored, error_params)
+            if response.status_code == 404 and policy.negative_ttl_seconds > 0:
+                negative_tags = cache_tags(tags[0], tags[1], {"id": entity_id} if entity_id else None) if tags else None
+                await self._set_to_cache(cache_key, self._cache_entry("", policy, negative=True), policy, tags=negative_tags)
+            response.raise_for_status()
+            validated = _type_adapter(model).validate_json(response.content)
+            # 只走一次 pydantic 序列化，快取內容由回傳值直接編碼
+            validated_data = validated.model_dump()
+            entry_tags = cache_tags(tags[0], tags[1], validated_data) if tags else None
+            empty = validated_data.get("items") == [] if isinstance(validated_data, dict) else False
+            encoded = encode_payload(json_dumps(validated_data), policy)
+            if encoded is None:
+                logger.warning(f"⚠️ 回應超過快取大小上限 {policy.max_payload_bytes} bytes，不寫入快取: {cache_key}")
+            elif not empty or policy.negative_ttl_seconds > 0:
+                encoding, payload = encoded
+                entry = self._cache_entry(payload, policy, encoding, response.headers.get("etag"), response.headers.get("last-modified"), empty=empty, tags=entry_tags)
+                await self._set_to_cache(cache_key, entry, policy, tags=entry_tags)
+            return ToolResult(success=True, data=validated_data)
+        except ValidationError as e:
+            return self._handle_validation_error(e, error_params)
+        except Exception as e:
+            if cached and not meta.get("negative") and self._is_transient(e) and meta["fresh_until"] + policy.stale_seconds > now:
+                logger.warning(f"CACHE STALE: Control Plane 無法回應 ({type(e).__name__})，回傳過期 {int(now - meta['fresh_until'])}s 的快取: {cache_key}")
+                return self._cached_result(meta, stored, error_params)
+            return self._handle_error(e, error_params)
+
+    @staticmethod
+    def _is_transient(e: Exception) -> bool:
+        if isinstance(e, httpx.HTTPStatusError):
+            return e.response.status_code >= 500
+        return isinstance(e, (httpx.TimeoutException, httpx.TransportError))
+
+    @staticmethod
+    def _cached_result(meta: Dict[str, Any], stored: str, error_params: Optional[Dict]) -> ToolResult:
+        """由快取項目建立 ToolResult；負面快取的 404 以與 API 錯誤相同的格式回傳"""
+        if meta.get("negative"):
+            return ToolResult(success=False, error=ToolError(
+                code="HTTP_STATUS_ERROR", message="API returned HTTP 404",
+                details={"status_code": 404, "cached": True, "params": error_params},
+            ))
+        return ToolResult(success=True, data=json_loads(decode_payload(meta.get("encoding"), stored)))
+
+    def _cache_entry(self, payload: str, policy: CachePolicy, encoding: Optional[str] = None, etag: Optional[str] = None, last_modified: Optional[str] = None, negative: bool = False, empty: bool = False, tags: Optional[List[str]] = None) -> str:
+        """
+        快取項目格式: 一行 JSON 標頭 ({etag, last_modified, fresh_until, encoding, negative, empty, tags}) + 換行 + 已驗證的 JSON 回應
+        標頭與回應分開保存，延長有效期限時不需要解析、解壓縮或重新序列化回應本身 (標籤也從標頭取回)。
+        negative (404) 與 empty (空列表) 的項目以 negative_ttl_seconds 作為有效時間。
+        """
+        ttl = policy.negative_ttl_seconds if negative or empty else policy.ttl_seconds
+        header = {"etag": etag, "last_modified": last_modified, "fresh_until": time.time() + ttl}
+        for flag, enabled in (("encoding", encoding), ("negative", negative), ("empty", empty), ("tags", tags)):
+            if enabled:
+                header[flag] = enabled
+        return f"{json.dumps(header)}\n{payload}"
+
+    @staticmethod
+    def _parse_entry(raw: Any) -> Optional[Tuple[Dict[str, Any], str]]:
+        """拆開快取項目為 (標頭, 保存的回應)；格式不符的舊項目回傳 None"""
+        if isinstance(raw, bytes):
+            raw = raw.decode("utf-8")
+        header, separator, payload = raw.partition("\n")
+        if not separator:
+            return None
+        try:
+            meta = json.loads(header)
+        except ValueError:
+            return None
+        if not isinstance(meta, dict) or "fresh_until" not in meta:
+            return None
+        return meta, payload
+
+    async def _get_from_cache(self, key: str) -> Optional[Tuple[Dict[str, Any], str]]:
+        """讀取快取項目，回傳 (標頭, 保存的回應)"""
         if not self.redis_client:
             return None
         try:
             cached_result = await self.redis_client.get(key)
             if cached_result:
-                logger.info(f"CACHE HIT: ControlPlaneTool cache hit for key: {key}")
-                return json.loads(cached_result)
+                return self._parse_entry(cached_result)
         except Exception as e:
             logger.error(f"Redis cache read failed for key {key}: {e}")
         return None
 
-    async def _set_to_cache(self, key: str, value: Any):
+    @staticmethod
+    def _resource_cache_key(resource_id: str) -> str:
+        return f"controlplane:get_resource_details:{resource_id}"
+
+    async def _get_many_from_cache(self, resource_ids: List[str]) -> Tuple[Dict[str, Any], List[str]]:
+        """以一次 MGET 讀取多個資源的快取，回傳 ({resource_id: 資源}, [負面快取中已知不存在的 ID])"""
+        if not self.redis_client or not resource_ids:
+            return {}, []
+        try:
+            values = await self.redis_client.mget([self._resource_cache_key(resource_id) for resource_id in resource_ids])
+            now = time.time()
+            hits, known_missing = {}, []
+            for resource_id, value in zip(resource_ids, values):
+                entry = self._parse_entry(value) if value else None
+                if not entry or entry[0]["fresh_until"] <= now:
+                    continue
+                meta, stored = entry
+                if meta.get("negative"):
+                    known_missing.append(resource_id)
+                else:
+                    hits[resource_id] = json_loads(decode_payload(meta.get("encoding"), stored))
+            if hits or known_missing:
+                logger.info(f"CACHE HIT: ControlPlaneTool multi-get hit {len(hits)}/{len(resource_ids)} resources ({len(known_missing)} known missing)")
+            return hits, known_missing
+        except Exception as e:
+            logger.error(f"Redis cache multi-get failed: {e}")
+        return {}, []
+
+    async def _set_many_to_cache(self, resources: Dict[str, Resource], not_found: Optional[List[str]] = None):
+        """以 pipeline 一次寫回多個資源的快取項目 (不存在的 ID 依負面 TTL 快取)"""
+        policy = self.cache_policies["resource_details"]
+        if policy.negative_ttl_seconds <= 0:
+            not_found = None
+        if not self.redis_client or not (resources or not_found):
+            return
+        try:
+            ttl = policy.redis_ttl_seconds
+            pipe = self.redis_client.pipeline()
+            for resource_id, resource in resources.items():
+                encoded = encode_payload(resource.model_dump_json(), policy)
+                if encoded is None:
+                    continue
+                key = self._resource_cache_key(resource_id)
+                pipe.set(key, self._cache_entry(encoded[1], policy, encoded[0]), ex=ttl)
+                self.cache_tags.add_to_pipeline(pipe, key, ["resources", f"resource:{resource_id}"], ttl)
+            for resource_id in not_found or []:
+                key = self._resource_cache_key(resource_id)
+                pipe.set(key, self._cache_entry("", policy, negative=True), ex=policy.negative_ttl_seconds)
+                self.cache_tags.add_to_pipeline(pipe, key, ["resources", f"resource:{resource_id}"], policy.negative_ttl_seconds)
+            await pipe.execute()
+            logger.info(f"CACHE SET: ControlPlaneTool cached {len(resources)} resources and {len(not_found or [])} missing IDs via pipeline")
+        except Exception as e:
+            logger.error(f"Redis cache pipeline write failed: {e}")
+
+    async def _set_to_cache(self, key: str, entry: str, policy: CachePolicy, tags: Optional[List[str]] = None):
         if not self.redis_client:
             return
         try:
-            # 使用 model_dump_json 以便 Pydantic 模型能被正確序列化
-            await self.redis_client.set(
-                key,
-                json.dumps(value, default=json_serial),
-                ex=self.cache_ttl_seconds,
-            )
+            # 過期後仍保留一段時間，讓 ETag / Last-Modified 可用於重新驗證，並在 Control Plane 無法回應時作為備援
+            ttl = policy.redis_ttl_seconds
+            if tags:
+                pipe = self.redis_client.pipeline()
+                pipe.set(key, entry, ex=ttl)
+                self.cache_tags.add_to_pipeline(pipe, key, tags, ttl)
+                await pipe.execute()
+            else:
+                await self.redis_client.set(key, entry, ex=ttl)
             logger.info(f"CACHE SET: ControlPlaneTool cached result for key: {key}")
         except Exception as e:
             logger.error(f"Redis cache write failed for key {key}: {e}")
 
+    async def invalidate(self, tags: List[str]) -> int:
+        """使帶有這些標籤的快取失效，並廣播給其他副本"""
+        return await self.cache_tags.invalidate(tags)
+
     def _handle_error(self, e: Exception, params: Optional[Dict]) -> ToolResult:
         if isinstance(e, httpx.HTTPStatusError):
             code, msg = "HTTP_STATUS_ERROR", f"API returned HTTP {e.response.status_code}"
@@ -299,13 +531,138 @@ class ControlPlaneTool:
         logger.error(f"❌ Control Plane API 回應資料格式無效: {e}", exc_info=True)
         return ToolResult(success=False, error=ToolError(code="VALIDATION_ERROR", message="API response validation failed", details={"validation_errors": e.errors(), "params": params}))
 
+    async def fetch_executions(self, execution_ids: List[str]) -> List[Dict[str, Any]]:
+        """
+        不經快取直接查詢多個執行的最新狀態 (GET /api/v1/automation/executions?ids=...)，供執行追蹤器輪詢使用
+        """
+        response = await self._send(
+            method="GET",
+            endpoint="/api/v1/automation/executions",
+            params={"ids": ",".join(execution_ids), "page_size": len(execution_ids)}
+        )
+        response.raise_for_status()
+        executions = _type_adapter(ExecutionList).validate_json(response.content)
+        return [execution.model_dump() for execution in executions.items]
+
+    async def fetch_resources_page(self, params: Dict[str, Any]) -> ToolResult:
+        """
+        不經快取直接查詢一頁資源 (GET /api/v1/resources)，供資源庫存同步使用 (支援 updated_after 游標)
+        """
+        try:
+            response = await self._send(method="GET", endpoint="/api/v1/resources", params=params)
+            response.raise_for_status()
+            return ToolResult(success=True, data=_type_adapter(ResourceList).validate_json(response.content).model_dump())
+        except ValidationError as e:
+            return self._handle_validation_error(e, params)
+        except Exception as e:
+            return self._handle_error(e, params)
+
+    async def wait_for_execution(self, execution_id: str, timeout: Optional[float] = None) -> ToolResult:
+        """
+        等待自動化執行完成 (success / failed)，回傳最新的執行資料
+        """
+        params = {"execution_id": execution_id, "timeout": timeout}
+        try:
+            execution = await self.execution_tracker.wait(execution_id, timeout=timeout)
+            return ToolResult(success=True, data=execution)
+        except asyncio.TimeoutError:
+            return ToolResult(success=False, error=ToolError(code="EXECUTION_TIMEOUT", message=f"Execution {execution_id} did not complete in time", details=params))
+
     async def _get_auth_token(self) -> Optional[str]:
         """
         獲取或刷新 M2M 認證 Token
+
+        - Token 仍有效但已超過生命週期的 `token_refresh_ratio` 時，在背景預先刷新，目前的請求直接使用舊 Token
+        - Token 已過期時，所有並行請求共用同一個進行中的刷新 (singleflight)，只會向 Keycloak 發出一次請求
         """
-        if self.token and self.token_expires_at > (time.time() + 60):
+        now = time.time()
+        if self.token and self.token_expires_at > (now + 60):
+            if now >= self._token_refresh_at and self._refresh_future is None:
+                logger.info("🔑 Token 即將到期，於背景預先刷新")
+                self._start_refresh()
+            return self.token
+        return await asyncio.shield(self._start_refresh())
+
+    def _start_refresh(self) -> asyncio.Future:
+        if self._refresh_future is None:
+            self._refresh_future = asyncio.ensure_future(self._refresh_token())
+            self._refresh_future.add_done_callback(self._clear_refresh_future)
+        return self._refresh_future
+
+    def _clear_refresh_future(self, future: asyncio.Future):
+        if self._refresh_future is future:
+            self._refresh_future = None
+        if not future.cancelled() and future.exception():
+            logger.error(f"❌ 背景刷新 Token 失敗: {future.exception()}")
+
+    async def _refresh_token(self) -> Optional[str]:
+        if self.token_shared and self.redis_client:
+            return await self._refresh_shared_token()
+        return await self._request_token()
+
+    async def _refresh_shared_token(self) -> Optional[str]:
+        """
+        透過 Redis 與其他 worker / 副本共用 Token：先讀取共用 Token，需要刷新時以 SET NX 取得鎖，
+        未取得鎖的一方等待持鎖者寫回新 Token (逾時則自行刷新)
+        """
+        if self._adopt_shared_token(await self._read_shared_token()):
+            return self.token
+
+        lock_key = f"{self.token_cache_key}:lock"
+        lock_token = uuid.uuid4().hex
+        try:
+            locked = await self.redis_client.set(lock_key, lock_token, nx=True, ex=max(int(self.timeout), 1) * 2)
+        except Exception as e:
+            logger.warning(f"Redis Token 鎖取得失敗，改為直接刷新: {e}")
+            return await self._request_token()
+
+        if not locked:
+            deadline = time.monotonic() + self.timeout
+            while time.monotonic() < deadline:
+                await asyncio.sleep(0.1)
+                if self._adopt_shared_token(await self._read_shared_token()):
+                    return self.token
+            logger.warning("⚠️ 等待其他副本刷新 Token 逾時，改為自行刷新")
+            return await self._request_token()
+
+        try:
+            token = await self._request_token()
+            if token:
+                payload = {"access_token": token, "issued_at": self.token_issued_at, "expires_at": self.token_expires_at}
+                ttl = int(self.token_expires_at - time.time())
+                if ttl > 0:
+                    await self.redis_client.set(self.token_cache_key, json.dumps(payload), ex=ttl)
+            return token
+        except Exception as e:
+            logger.error(f"Redis 共用 Token 寫入失敗: {e}")
             return self.token
+        finally:
+            try:
+                await self.redis_client.eval(_RELEASE_LOCK_SCRIPT, 1, lock_key, lock_token)
+            except Exception:
+                pass
+
+    async def _read_shared_token(self) -> Optional[Dict[str, Any]]:
+        try:
+            raw = await self.redis_client.get(self.token_cache_key)
+            return json.loads(raw) if raw else None
+        except Exception as e:
+            logger.warning(f"Redis 共用 Token 讀取失敗: {e}")
+            return None
+
+    def _adopt_shared_token(self, payload: Optional[Dict[str, Any]]) -> bool:
+        """共用 Token 尚未到達預先刷新時間點時採用它"""
+        if not payload or not payload.get("access_token"):
+            return False
+        issued_at, expires_at = payload.get("issued_at", 0), payload.get("expires_at", 0)
+        refresh_at = issued_at + (expires_at - issued_at) * self.token_refresh_ratio
+        if time.time() >= min(refresh_at, expires_at - 60):
+            return False
+        self.token, self.token_issued_at, self.token_expires_at = payload["access_token"], issued_at, expires_at
+        self._token_refresh_at = refresh_at
+        return True
 
+    async def _request_token(self) -> Optional[str]:
         logger.info("🔑 Token 過期或不存在，正在從 Keycloak 獲取新 Token...")
         try:
             data = {"client_id": self.client_id, "client_secret": self.client_secret, "grant_type": "client_credentials"}
@@ -318,7 +675,9 @@ class ControlPlaneTool:
             token_data = response.json()
             self.token = token_data["access_token"]
             decoded_token = jwt.decode(self.token, options={"verify_signature": False})
+            self.token_issued_at = decoded_token.get("iat") or time.time()
             self.token_expires_at = decoded_token.get("exp", 0)
+            self._token_refresh_at = self.token_issued_at + (self.token_expires_at - self.token_issued_at) * self.token_refresh_ratio
             logger.info("✅ 成功獲取並快取了新的 Token")
             return self.token
                 
@@ -330,13 +689,16 @@ class ControlPlaneTool:
         """
         向 Control Plane API 發送認證請求
         """
+        response = await self._send(method, endpoint, params=params, json_data=json_data)
+        response.raise_for_status()
+        return response.json()
+
+    async def _send(self, method: str, endpoint: str, params: Optional[Dict] = None, json_data: Optional[Dict] = None, headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        """發送認證請求並回傳原始回應 (供需要處理 304 等狀態碼的呼叫端使用)"""
         token = await self._get_auth_token()
         if not token:
             raise Exception("無法獲取認證 Token")
-            
-        headers = {"Authorization": f"Bearer {token}"}
+
+        request_headers = {"Authorization": f"Bearer {token}", **(headers or {})}
         url = f"{self.base_url}{endpoint}"
-        
-        response = await self.http_client.request(method, url, headers=headers, params=params, json=json_data, timeout=self.timeout)
-        response.raise_for_status()
-        return response.json()
+        return await self.http_client.request(method, url, headers=request_headers, params=params, json=json_data, timeout=self.timeout)
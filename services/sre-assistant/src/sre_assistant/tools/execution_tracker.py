@@ -0,0 +1,141 @@
+# services/sre-assistant/src/sre_assistant/tools/execution_tracker.py
+"""
+自動化腳本執行追蹤
+維護待完成的 execution ID 集合，由單一背景迴圈以批次查詢輪詢狀態，並解析呼叫端可 await 的 Future
+"""
+
+import asyncio
+import time
+import structlog
+from typing import Dict, Any, Optional, List
+
+logger = structlog.get_logger(__name__)
+
+TERMINAL_STATUSES = {"success", "failed"}
+
+
+class ExecutionTracker:
+    """
+    執行追蹤器
+
+    - `track(execution_id)` 回傳該執行的共享 Future，完成 (success / failed) 時以最新的執行資料解析
+    - 只要還有待完成的執行，背景迴圈就會以每批 `batch_size` 個 ID 查詢
+      GET /api/v1/automation/executions?ids=...，沒有待完成的執行時迴圈自動結束
+    - 輪詢間隔自適應：有狀態變化時回到 `min_interval`，否則每輪乘以 `backoff` 直到 `max_interval`
+    - 超過 `max_pending_seconds` 仍未完成的執行以 TimeoutError 結束追蹤
+    """
+
+    def __init__(self, control_plane_tool, batch_size: int = 50, min_interval: float = 1.0, max_interval: float = 15.0, backoff: float = 1.5, max_pending_seconds: float = 3600):
+        self.control_plane_tool = control_plane_tool
+        self.batch_size = batch_size
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.max_pending_seconds = max_pending_seconds
+        self._futures: Dict[str, asyncio.Future] = {}
+        self._started_at: Dict[str, float] = {}
+        self._last_status: Dict[str, Optional[str]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+    @property
+    def pending(self) -> List[str]:
+        return list(self._futures)
+
+    def track(self, execution_id: str) -> asyncio.Future:
+        """開始追蹤一個執行 (重複追蹤同一個 ID 會取得同一個 Future)"""
+        future = self._futures.get(execution_id)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._futures[execution_id] = future
+            self._started_at[execution_id] = time.monotonic()
+            self._last_status[execution_id] = None
+            # 新的執行加入時立即以最短間隔輪詢
+            self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return future
+
+    async def wait(self, execution_id: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """等待執行完成並回傳最新的執行資料；呼叫端逾時不會影響其他等待同一執行的呼叫端"""
+        return await asyncio.wait_for(asyncio.shield(self.track(execution_id)), timeout=timeout)
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for future in self._futures.values():
+            if not future.done():
+                future.cancel()
+        self._futures.clear()
+
+    async def _run(self):
+        interval = self.min_interval
+        while self._futures:
+            # 先清除再輪詢：輪詢期間加入的新執行會讓下一次等待立即結束
+            self._wakeup.clear()
+            try:
+                changed = await self.poll_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"自動化執行狀態輪詢失敗: {e}")
+                changed = False
+            if not self._futures:
+                break
+            interval = self.min_interval if changed else min(self.max_interval, interval * self.backoff)
+            if await self._sleep(interval):
+                interval = self.min_interval
+
+    async def _sleep(self, interval: float) -> bool:
+        """等待 `interval` 秒或直到有新的執行加入；回傳是否被提前喚醒"""
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=interval)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def poll_once(self) -> bool:
+        """輪詢一輪所有待完成的執行；回傳是否有任何執行的狀態改變"""
+        ids = list(self._futures)
+        batches = [ids[i:i + self.batch_size] for i in range(0, len(ids), self.batch_size)]
+        results = await asyncio.gather(*(self.control_plane_tool.fetch_executions(batch) for batch in batches), return_exceptions=True)
+
+        changed = False
+        for batch, result in zip(batches, results):
+            if isinstance(result, Exception):
+                logger.warning(f"查詢 {len(batch)} 個執行的狀態失敗: {result}")
+                continue
+            for execution in result:
+                execution_id = execution.get("id")
+                if execution_id not in self._futures:
+                    continue
+                status = execution.get("status")
+                if status != self._last_status.get(execution_id):
+                    changed = True
+                    self._last_status[execution_id] = status
+                if status in TERMINAL_STATUSES:
+                    logger.info(f"🤖 自動化執行 {execution_id} 已完成: {status}")
+                    self._resolve(execution_id, result=execution)
+
+        now = time.monotonic()
+        for execution_id, started_at in list(self._started_at.items()):
+            if now - started_at > self.max_pending_seconds:
+                logger.warning(f"⚠️ 自動化執行 {execution_id} 超過 {self.max_pending_seconds}s 仍未完成，停止追蹤")
+                self._resolve(execution_id, error=asyncio.TimeoutError(f"執行 {execution_id} 在 {self.max_pending_seconds}s 內未完成"))
+        return changed
+
+    def _resolve(self, execution_id: str, result: Optional[Dict[str, Any]] = None, error: Optional[BaseException] = None):
+        future = self._futures.pop(execution_id, None)
+        self._started_at.pop(execution_id, None)
+        self._last_status.pop(execution_id, None)
+        if future is None or future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
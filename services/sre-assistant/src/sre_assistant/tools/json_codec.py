@@ -0,0 +1,37 @@
+# services/sre-assistant/src/sre_assistant/tools/json_codec.py
+"""
+共用的 JSON 編解碼後端
+orjson 為選用依賴，存在時作為較快的 JSON 後端，否則退回標準函式庫
+"""
+
+import json
+from datetime import date, datetime
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 視安裝環境而定
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    # 與 orjson 一致，datetime / date 以 ISO 8601 輸出
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    json_loads = orjson.loads
+    JSON_DECODE_ERRORS = (orjson.JSONDecodeError,)
+
+    def json_dumps(value: Any) -> str:
+        """序列化為精簡的 JSON 字串 (支援 datetime)"""
+        return orjson.dumps(value).decode("utf-8")
+else:  # pragma: no cover - 視安裝環境而定
+    json_loads = json.loads
+    JSON_DECODE_ERRORS = (json.JSONDecodeError,)
+
+    def json_dumps(value: Any) -> str:
+        """序列化為精簡的 JSON 字串 (支援 datetime)"""
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=_default)
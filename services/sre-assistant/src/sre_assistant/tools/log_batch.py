@@ -0,0 +1,114 @@
+# services/sre-assistant/src/sre_assistant/tools/log_batch.py
+"""
+欄式 (columnar) 日誌批次
+以 int64 奈秒時間戳、標籤集合索引與訊息列表保存 Loki 查詢結果，僅在序列化時才格式化
+"""
+
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional, List, Tuple, Callable, Iterator
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def to_unix_ns(at: datetime) -> int:
+    """以整數運算換算奈秒時間戳 (經由 float 的 timestamp() * 1e9 會失去次微秒精度)；naive datetime 視為本地時間"""
+    delta = (at if at.tzinfo else at.astimezone()) - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 10**9 + delta.microseconds * 1000
+
+
+class LogBatch:
+    """
+    欄式日誌批次
+
+    - timestamps: array('q')，奈秒時間戳
+    - label_ids: array('I')，指向 label_sets 的索引 (相同標籤集合只存一份)
+    - messages: 原始日誌行
+    - parsed: 延遲解析的結果欄位，首次存取時才呼叫 parser
+    """
+
+    __slots__ = ("timestamps", "label_ids", "messages", "label_sets", "parser", "_parsed", "_label_index")
+
+    def __init__(self, parser: Optional[Callable[[str], Any]] = None):
+        self.timestamps = array("q")
+        self.label_ids = array("I")
+        self.messages: List[str] = []
+        self.label_sets: List[Dict[str, str]] = []
+        self.parser = parser
+        self._parsed: List[Any] = []
+        self._label_index: Dict[Tuple, int] = {}
+
+    @classmethod
+    def from_streams(cls, results: List[Dict[str, Any]], parser: Optional[Callable[[str], Any]] = None) -> "LogBatch":
+        """由 Loki `streams` 結果建立批次 (每個 stream 只做一次標籤駐留)"""
+        batch = cls(parser)
+        timestamps, label_ids, messages = batch.timestamps, batch.label_ids, batch.messages
+        for stream in results:
+            label_id = batch.intern_labels(stream.get("stream", {}))
+            for value in stream.get("values", []):
+                if len(value) >= 2:
+                    timestamps.append(int(value[0]))
+                    label_ids.append(label_id)
+                    messages.append(value[1])
+        batch._parsed = [None] * len(messages)
+        return batch
+
+    def intern_labels(self, labels: Dict[str, str]) -> int:
+        key = tuple(sorted(labels.items()))
+        label_id = self._label_index.get(key)
+        if label_id is None:
+            label_id = len(self.label_sets)
+            self._label_index[key] = label_id
+            self.label_sets.append(labels)
+        return label_id
+
+    def append(self, timestamp: int, labels: Dict[str, str], message: str, parsed: Any = None):
+        """附加單筆日誌 (供抽樣結果重建批次使用)"""
+        self.timestamps.append(timestamp)
+        self.label_ids.append(self.intern_labels(labels))
+        self.messages.append(message)
+        self._parsed.append(parsed)
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def sort(self, reverse: bool = True):
+        """依整數時間戳排序 (預設新到舊)，以索引排列一次重排所有欄位"""
+        order = sorted(range(len(self.messages)), key=self.timestamps.__getitem__, reverse=reverse)
+        self.timestamps = array("q", (self.timestamps[i] for i in order))
+        self.label_ids = array("I", (self.label_ids[i] for i in order))
+        self.messages = [self.messages[i] for i in order]
+        self._parsed = [self._parsed[i] for i in order]
+
+    def labels(self, index: int) -> Dict[str, str]:
+        return self.label_sets[self.label_ids[index]]
+
+    def parsed(self, index: int) -> Any:
+        result = self._parsed[index]
+        if result is None and self.parser is not None:
+            result = self._parsed[index] = self.parser(self.messages[index])
+        return result
+
+    def iter_parsed(self) -> Iterator[Tuple[str, Any]]:
+        for index, message in enumerate(self.messages):
+            yield message, self.parsed(index)
+
+    def iter_entries(self) -> Iterator[Tuple[str, Any, Dict[str, str]]]:
+        for index, message in enumerate(self.messages):
+            yield message, self.parsed(index), self.labels(index)
+
+    @staticmethod
+    def format_timestamp(ts_ns: int) -> str:
+        return datetime.fromtimestamp(ts_ns / 1e9, tz=timezone.utc).isoformat()
+
+    @staticmethod
+    def _serialize(parsed: Any) -> Any:
+        to_dict = getattr(parsed, "to_dict", None)
+        return to_dict() if to_dict is not None else parsed
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """序列化為 API 回應使用的逐行字典 (時間戳在此才格式化)"""
+        return [
+            {"timestamp": self.format_timestamp(self.timestamps[i]), "labels": self.labels(i), "message": self.messages[i], "parsed": self._serialize(self.parsed(i))}
+            for i in range(len(self.messages))
+        ]
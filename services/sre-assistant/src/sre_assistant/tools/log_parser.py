@@ -0,0 +1,87 @@
+# services/sre-assistant/src/sre_assistant/tools/log_parser.py
+"""
+延遲、嗅探式的日誌行解析
+先檢查第一個非空白字元再決定是否嘗試 JSON 解碼，欄位只在分析器實際存取時才提取
+"""
+
+from typing import Dict, Any, Optional, Callable
+
+from .json_codec import json_loads, JSON_DECODE_ERRORS
+
+_WHITESPACE = " \t\r\n"
+
+
+def looks_like_json(log_line: str) -> bool:
+    """以第一個非空白字元嗅探是否可能為 JSON 物件，避免對純文字行進行解碼"""
+    for char in log_line:
+        if char not in _WHITESPACE:
+            return char == "{"
+    return False
+
+
+class LazyLogLine:
+    """
+    延遲解析的日誌行，提供與 dict 相同的 `get` / `[]` 介面
+
+    - JSON 行：首次存取任一欄位時才解碼一次並快取
+    - 純文字行：`level`、`error_type` 等欄位各自在首次存取時才提取
+    """
+
+    __slots__ = ("line", "_extractors", "_fields", "_decoded")
+
+    def __init__(self, line: str, extractors: Optional[Dict[str, Callable[[str], Any]]] = None):
+        self.line = line
+        self._extractors = extractors or {}
+        self._fields: Dict[str, Any] = {}
+        # None: 尚未嘗試解碼；False: 非 JSON；dict: 解碼結果
+        self._decoded: Any = None if looks_like_json(line) else False
+
+    def _json(self) -> Optional[Dict[str, Any]]:
+        if self._decoded is None:
+            try:
+                decoded = json_loads(self.line)
+            except JSON_DECODE_ERRORS:
+                decoded = None
+            self._decoded = decoded if isinstance(decoded, dict) else False
+        return self._decoded or None
+
+    @property
+    def is_json(self) -> bool:
+        return self._json() is not None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        decoded = self._json()
+        if decoded is not None:
+            return decoded.get(key, default)
+        if key == "raw":
+            return self.line
+        if key not in self._fields:
+            extractor = self._extractors.get(key)
+            if extractor is None:
+                return default
+            self._fields[key] = extractor(self.line)
+        value = self._fields[key]
+        return default if value is None and default is not None else value
+
+    def __getitem__(self, key: str) -> Any:
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: str) -> bool:
+        decoded = self._json()
+        if decoded is not None:
+            return key in decoded
+        return key == "raw" or key in self._extractors
+
+    def to_dict(self) -> Dict[str, Any]:
+        """序列化時才提取全部欄位"""
+        decoded = self._json()
+        if decoded is not None:
+            return decoded
+        result = {"raw": self.line}
+        for key in self._extractors:
+            result[key] = self.get(key)
+        return result
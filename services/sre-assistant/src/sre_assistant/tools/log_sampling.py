@@ -0,0 +1,96 @@
+# services/sre-assistant/src/sre_assistant/tools/log_sampling.py
+"""
+分層蓄水池抽樣 (stratified reservoir sampling)
+在記憶體有上限的前提下，為每個時間桶 × (級別, 模板) 分層保留具代表性的樣本，並保證保留每個分層的首次出現
+"""
+
+import random
+from typing import Dict, Any, Optional, List, Tuple, Hashable
+
+# 一筆樣本: (timestamp_ns, labels, message, parsed)
+Row = Tuple[int, Dict[str, str], str, Any]
+
+OVERFLOW_STRATUM = ("__overflow__",)
+
+
+class StratifiedReservoirSampler:
+    """
+    分層蓄水池抽樣器
+
+    - 每個 (時間桶, 分層) 維持一個容量為 `per_stratum` 的蓄水池 (Algorithm R)
+    - 每個分層在整個查詢範圍內最早出現的那一筆一定會被保留
+    - 分層數超過 `max_strata` 後，新分層併入 overflow 分層，記憶體維持有界
+    """
+
+    def __init__(self, per_stratum: int = 5, max_strata: int = 1000, seed: Optional[int] = None):
+        self.per_stratum = max(1, per_stratum)
+        self.max_strata = max_strata
+        self._random = random.Random(seed)
+        self._reservoirs: Dict[Tuple[int, Hashable], List[Row]] = {}
+        self._seen: Dict[Tuple[int, Hashable], int] = {}
+        self._first: Dict[Hashable, Row] = {}
+        self.offered = 0
+
+    def offer(self, bucket: int, stratum: Hashable, row: Row):
+        """提供一筆日誌給抽樣器"""
+        self.offered += 1
+        if stratum not in self._first and len(self._first) >= self.max_strata:
+            stratum = OVERFLOW_STRATUM
+
+        first = self._first.get(stratum)
+        if first is None or row[0] < first[0]:
+            self._first[stratum] = row
+
+        key = (bucket, stratum)
+        seen = self._seen.get(key, 0) + 1
+        self._seen[key] = seen
+        reservoir = self._reservoirs.setdefault(key, [])
+        if len(reservoir) < self.per_stratum:
+            reservoir.append(row)
+        else:
+            slot = self._random.randrange(seen)
+            if slot < self.per_stratum:
+                reservoir[slot] = row
+
+    @property
+    def strata(self) -> int:
+        return len(self._first)
+
+    def sample(self, limit: Optional[int] = None) -> List[Row]:
+        """
+        回傳樣本 (依時間新到舊)：先放入各分層的首次出現，再輪流從各蓄水池取樣直到達到上限
+        """
+        selected: List[Row] = []
+        chosen = set()
+
+        def take(row: Row) -> bool:
+            marker = (row[0], row[2])
+            if marker in chosen:
+                return True
+            if limit is not None and len(selected) >= limit:
+                return False
+            chosen.add(marker)
+            selected.append(row)
+            return True
+
+        # 首次出現依時間先後保留，超過上限時優先保留較早出現的分層
+        for row in sorted(self._first.values(), key=lambda r: r[0]):
+            if not take(row):
+                break
+
+        queues = [list(reservoir) for _, reservoir in sorted(self._reservoirs.items(), key=lambda item: item[0][0])]
+        while queues and (limit is None or len(selected) < limit):
+            remaining = []
+            for queue in queues:
+                if not take(queue.pop()):
+                    remaining = []
+                    break
+                if queue:
+                    remaining.append(queue)
+            queues = remaining
+
+        selected.sort(key=lambda r: r[0], reverse=True)
+        return selected
+
+    def summary(self) -> Dict[str, Any]:
+        return {"offered": self.offered, "strata": self.strata, "reservoirs": len(self._reservoirs), "per_stratum": self.per_stratum}
@@ -0,0 +1,256 @@
+# services/sre-assistant/src/sre_assistant/tools/log_sketches.py
+"""
+串流摘要 (sketch)
+以固定記憶體回答「最常見的錯誤簽章」(SpaceSaving) 與「有多少不同的 pod / 使用者 / trace」(HyperLogLog)，
+兩者皆可合併並序列化到 Redis，讓不同時間分片與副本的結果能夠彙總
+"""
+
+import base64
+import hashlib
+import json
+import math
+import structlog
+from datetime import datetime
+from typing import Dict, Any, Optional, List, Iterable, Tuple
+
+logger = structlog.get_logger(__name__)
+
+
+class SpaceSaving:
+    """
+    SpaceSaving 熱門項目摘要 (Metwally et al.)
+
+    最多追蹤 `capacity` 個項目；計數的高估上限記錄在 error 中，
+    真實次數落在 [count - error, count] 之間。
+    """
+
+    __slots__ = ("capacity", "counters")
+
+    def __init__(self, capacity: int = 64):
+        self.capacity = max(1, capacity)
+        # {item: [count, error]}
+        self.counters: Dict[str, List[int]] = {}
+
+    def add(self, item: str, count: int = 1):
+        counter = self.counters.get(item)
+        if counter is not None:
+            counter[0] += count
+            return
+        if len(self.counters) < self.capacity:
+            self.counters[item] = [count, 0]
+            return
+        victim = min(self.counters, key=lambda k: self.counters[k][0])
+        floor = self.counters.pop(victim)[0]
+        self.counters[item] = [floor + count, floor]
+
+    def top(self, k: int = 5) -> List[Tuple[str, int, int]]:
+        """回傳前 k 名 (item, count, error)"""
+        ranked = sorted(self.counters.items(), key=lambda x: x[1][0], reverse=True)[:k]
+        return [(item, counter[0], counter[1]) for item, counter in ranked]
+
+    def merge(self, other: "SpaceSaving"):
+        """
+        合併另一個摘要：對方未追蹤的項目以其最小計數作為高估補償，最後截斷回容量
+        """
+        own_floor = self._floor()
+        other_floor = other._floor()
+        merged: Dict[str, List[int]] = {}
+        for item in set(self.counters) | set(other.counters):
+            a = self.counters.get(item, [own_floor, own_floor])
+            b = other.counters.get(item, [other_floor, other_floor])
+            merged[item] = [a[0] + b[0], a[1] + b[1]]
+        ranked = sorted(merged.items(), key=lambda x: x[1][0], reverse=True)[: self.capacity]
+        self.counters = dict(ranked)
+
+    def _floor(self) -> int:
+        if len(self.counters) < self.capacity or not self.counters:
+            return 0
+        return min(counter[0] for counter in self.counters.values())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"capacity": self.capacity, "counters": self.counters}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SpaceSaving":
+        sketch = cls(data.get("capacity", 64))
+        sketch.counters = {item: list(counter) for item, counter in data.get("counters", {}).items()}
+        return sketch
+
+
+class HyperLogLog:
+    """
+    HyperLogLog 基數估計 (2^precision 個 6-bit 暫存器，precision=12 時約 4KB、標準誤差約 1.6%)
+    """
+
+    __slots__ = ("precision", "registers")
+
+    def __init__(self, precision: int = 12):
+        if not 4 <= precision <= 16:
+            raise ValueError("HyperLogLog precision 必須介於 4 到 16 之間")
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+    def add(self, value: Any):
+        h = self._hash(str(value))
+        index = h >> (64 - self.precision)
+        remaining = (h << self.precision) & 0xFFFFFFFFFFFFFFFF
+        rank = (64 - self.precision + 1) if remaining == 0 else (64 - remaining.bit_length() + 1)
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values: Iterable[Any]):
+        for value in values:
+            self.add(value)
+
+    def count(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m) if m >= 128 else {16: 0.673, 32: 0.697, 64: 0.709}[m]
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def merge(self, other: "HyperLogLog"):
+        if other.precision != self.precision:
+            raise ValueError("無法合併不同 precision 的 HyperLogLog")
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"precision": self.precision, "registers": base64.b64encode(bytes(self.registers)).decode("ascii")}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "HyperLogLog":
+        sketch = cls(data.get("precision", 12))
+        registers = base64.b64decode(data.get("registers", ""))
+        if len(registers) == len(sketch.registers):
+            sketch.registers = bytearray(registers)
+        return sketch
+
+
+class LogSketches:
+    """
+    一次日誌分析的摘要集合：錯誤模板的熱門項目 + 各維度的不同值數量
+    """
+
+    def __init__(self, distinct_fields: Iterable[str] = ("pod", "trace_id", "user_id"), topk_capacity: int = 64, precision: int = 12):
+        self.distinct_fields = list(distinct_fields)
+        self.precision = precision
+        self.top_errors = SpaceSaving(topk_capacity)
+        self.distinct: Dict[str, HyperLogLog] = {field: HyperLogLog(precision) for field in self.distinct_fields}
+
+    def observe(self, labels: Dict[str, str], parsed: Any):
+        """以標籤優先、解析欄位其次，更新各維度的基數摘要"""
+        for field, hll in self.distinct.items():
+            value = labels.get(field) if labels else None
+            if value is None and parsed is not None:
+                value = parsed.get(field)
+            if value is not None and value != "":
+                hll.add(value)
+
+    def distinct_counts(self) -> Dict[str, int]:
+        return {field: hll.count() for field, hll in self.distinct.items()}
+
+    def merge(self, other: "LogSketches"):
+        self.top_errors.merge(other.top_errors)
+        for field, hll in other.distinct.items():
+            if field in self.distinct:
+                self.distinct[field].merge(hll)
+            else:
+                self.distinct[field] = HyperLogLog.from_dict(hll.to_dict())
+                self.distinct_fields.append(field)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"top_errors": self.top_errors.to_dict(), "distinct": {field: hll.to_dict() for field, hll in self.distinct.items()}}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LogSketches":
+        distinct = data.get("distinct", {})
+        sketches = cls(distinct_fields=[])
+        sketches.top_errors = SpaceSaving.from_dict(data.get("top_errors", {}))
+        sketches.distinct = {field: HyperLogLog.from_dict(raw) for field, raw in distinct.items()}
+        sketches.distinct_fields = list(sketches.distinct)
+        return sketches
+
+
+class SketchStore:
+    """
+    以 Redis 保存每次查詢的 LogSketches 分片，並跨分片彙總
+
+    分片以日誌的時間範圍 (分鐘對齊) 為鍵，重複查詢相同範圍只會覆寫同一個分片，
+    不同副本查詢同一範圍也不會累加；各分片的 [start, end) 登記在每個服務的有序集合索引中。
+    彙總時只選取完全落在視窗內且彼此不重疊的分片 (較長的優先)，
+    避免重疊的查詢把 SpaceSaving 的計數重複累加；HyperLogLog 的合併本身即為聯集
+    """
+
+    def __init__(self, redis_client, prefix: str = "loki:sketches", ttl_seconds: int = 7 * 86400):
+        self.redis_client = redis_client
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds
+
+    def _scope(self, namespace: str, service: str) -> str:
+        return f"{self.prefix}:{namespace or '-'}:{service or '-'}"
+
+    @staticmethod
+    def _minute(at: datetime) -> int:
+        return int(at.timestamp()) // 60
+
+    async def save(self, namespace: str, service: str, start: datetime, end: datetime, sketches: LogSketches) -> bool:
+        """寫入 [start, end) 的分片；同一範圍再次寫入時直接覆寫"""
+        if not self.redis_client:
+            return False
+        start_minute, end_minute = self._minute(start), max(self._minute(end), self._minute(start) + 1)
+        scope, shard = self._scope(namespace, service), f"{start_minute}-{end_minute}"
+        index_key = f"{scope}:index"
+        try:
+            pipe = self.redis_client.pipeline(transaction=True)
+            pipe.set(f"{scope}:{shard}", json.dumps(sketches.to_dict()), ex=self.ttl_seconds)
+            pipe.zadd(index_key, {shard: end_minute})
+            # 索引中已過期分片的項目一併清除
+            pipe.zremrangebyscore(index_key, "-inf", end_minute - self.ttl_seconds // 60)
+            pipe.expire(index_key, self.ttl_seconds)
+            await pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"Redis 日誌摘要寫入失敗: {e}")
+        return False
+
+    async def load(self, namespace: str, service: str, start: datetime, end: datetime) -> Tuple[Optional[LogSketches], int]:
+        """合併 [start, end] 內不重疊的分片；回傳 (合併後的摘要, 涵蓋的分鐘數)"""
+        if not self.redis_client:
+            return None, 0
+        start_minute, end_minute = self._minute(start), self._minute(end)
+        scope = self._scope(namespace, service)
+        try:
+            shards = []
+            for member in await self.redis_client.zrangebyscore(f"{scope}:index", start_minute, end_minute):
+                shard_start, _, shard_end = member.partition("-")
+                if shard_start.isdigit() and shard_end.isdigit() and int(shard_start) >= start_minute:
+                    shards.append((int(shard_start), int(shard_end), member))
+            selected: List[Tuple[int, int, str]] = []
+            for shard in sorted(shards, key=lambda x: (x[1] - x[0], x[1]), reverse=True):
+                if all(shard[1] <= other[0] or other[1] <= shard[0] for other in selected):
+                    selected.append(shard)
+            if not selected:
+                return None, 0
+
+            merged: Optional[LogSketches] = None
+            covered = 0
+            raws = await self.redis_client.mget([f"{scope}:{member}" for _, _, member in selected])
+            for (shard_start, shard_end, _), raw in zip(selected, raws):
+                if not raw:
+                    continue
+                sketches = LogSketches.from_dict(json.loads(raw))
+                covered += shard_end - shard_start
+                if merged is None:
+                    merged = sketches
+                else:
+                    merged.merge(sketches)
+            return merged, covered
+        except Exception as e:
+            logger.error(f"Redis 日誌摘要讀取失敗: {e}")
+        return None, 0
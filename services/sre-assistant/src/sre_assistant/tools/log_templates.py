@@ -0,0 +1,316 @@
+# services/sre-assistant/src/sre_assistant/tools/log_templates.py
+"""
+日誌模板探勘 (Drain 演算法)
+將日誌行歸納為穩定的模板 ID，並可透過 Redis 跨會話持久化
+"""
+
+import hashlib
+import heapq
+import json
+import re
+import time
+import structlog
+from redis.exceptions import WatchError
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List
+
+logger = structlog.get_logger(__name__)
+
+WILDCARD = "<*>"
+
+# 在分詞前先遮罩的變數樣式 (順序很重要：較具體的樣式優先)
+_MASK_PATTERNS = [
+    re.compile(r"\b\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?"),
+    re.compile(r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b"),
+    re.compile(r"\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b"),
+    re.compile(r"\b0x[0-9a-fA-F]+\b"),
+    re.compile(r"\b[0-9a-fA-F]{16,}\b"),
+    re.compile(r"(?<![\w.])[-+]?\d+(?:\.\d+)?(?:ms|s|m|h|b|kb|mb|gb)?\b", re.IGNORECASE),
+]
+
+
+class LogTemplate:
+    """
+    Drain 樹中的一個日誌模板 (叢集)
+    """
+
+    __slots__ = ("template_id", "tokens", "size")
+
+    def __init__(self, template_id: str, tokens: List[str], size: int = 0):
+        self.template_id = template_id
+        self.tokens = tokens
+        self.size = size
+
+    @property
+    def template(self) -> str:
+        return " ".join(self.tokens)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"id": self.template_id, "tokens": self.tokens, "size": self.size}
+
+
+class LogTemplateMiner:
+    """
+    串流式日誌模板探勘器 (Drain 固定深度解析樹)
+
+    樹的第一層依 token 數分流，其後以前 `depth - 2` 個 token 逐層分流，
+    葉節點保存候選模板，並以位置相似度挑選或合併模板。
+    已見過的遮罩後日誌行會進入 LRU 快取，重複的日誌行只需一次字典查找。
+    模板 ID 取自泛化後的 token (含數字的 token 視為萬用字元)，不依賴哪一行先被看見，各副本才能對齊。
+    """
+
+    def __init__(self, depth: int = 4, similarity_threshold: float = 0.4, max_children: int = 100, max_templates: int = 5000, cache_size: int = 10000, evict_fraction: float = 0.1):
+        """初始化模板探勘器"""
+        self.depth = depth
+        self.similarity_threshold = similarity_threshold
+        self.max_children = max_children
+        self.max_templates = max_templates
+        self.cache_size = cache_size
+        self.evict_fraction = evict_fraction
+
+        self.templates: Dict[str, LogTemplate] = {}
+        self._root: Dict[str, Any] = {}
+        self._line_cache: "OrderedDict[str, str]" = OrderedDict()
+        self.dirty = False
+
+    @staticmethod
+    def preprocess(message: str) -> List[str]:
+        """取第一行、遮罩變數並分詞"""
+        line = message.splitlines()[0] if message else ""
+        for pattern in _MASK_PATTERNS:
+            line = pattern.sub(WILDCARD, line)
+        return line.split()
+
+    def add(self, message: str) -> LogTemplate:
+        """
+        將日誌行加入探勘樹，回傳其所屬模板 (必要時建立或泛化模板)
+        """
+        tokens = self.preprocess(message)
+        cache_key = " ".join(tokens)
+
+        template_id = self._line_cache.get(cache_key)
+        if template_id is not None and template_id in self.templates:
+            self._line_cache.move_to_end(cache_key)
+            template = self.templates[template_id]
+            template.size += 1
+            return template
+
+        template = self._tree_search(tokens)
+        if template is None:
+            template = self._create_template(tokens)
+        else:
+            merged = [t if t == m else WILDCARD for t, m in zip(tokens, template.tokens)]
+            if merged != template.tokens:
+                template.tokens = merged
+                self.dirty = True
+        template.size += 1
+
+        self._line_cache[cache_key] = template.template_id
+        if len(self._line_cache) > self.cache_size:
+            self._line_cache.popitem(last=False)
+        return template
+
+    def match(self, message: str) -> Optional[LogTemplate]:
+        """只比對、不學習，回傳符合的既有模板"""
+        tokens = self.preprocess(message)
+        template_id = self._line_cache.get(" ".join(tokens))
+        if template_id is not None and template_id in self.templates:
+            return self.templates[template_id]
+        return self._tree_search(tokens)
+
+    @staticmethod
+    def _generalize(token: str) -> str:
+        """解析樹分流與模板 ID 共用的泛化規則：含數字的 token 視為變數"""
+        return WILDCARD if any(c.isdigit() for c in token) else token
+
+    def _leaf_for(self, tokens: List[str], create: bool) -> Optional[List[str]]:
+        """沿解析樹走到葉節點，回傳葉節點上的模板 ID 列表"""
+        length_key = str(len(tokens))
+        if length_key not in self._root:
+            if not create:
+                return None
+            self._root[length_key] = {}
+        node = self._root[length_key]
+
+        for token in tokens[: max(self.depth - 2, 1)]:
+            key = self._generalize(token)
+            if key not in node:
+                if not create:
+                    if WILDCARD not in node:
+                        return None
+                    key = WILDCARD
+                elif len(node) < self.max_children:
+                    node[key] = {}
+                else:
+                    # 子節點數已達上限，後續 token 一律歸入萬用字元分支
+                    key = WILDCARD
+                    node.setdefault(key, {})
+            node = node[key]
+
+        if create:
+            return node.setdefault("__templates__", [])
+        return node.get("__templates__")
+
+    def _tree_search(self, tokens: List[str]) -> Optional[LogTemplate]:
+        leaf = self._leaf_for(tokens, create=False)
+        if not leaf:
+            return None
+
+        best, best_similarity, best_params = None, -1.0, -1
+        for template_id in leaf:
+            template = self.templates.get(template_id)
+            if template is None or len(template.tokens) != len(tokens):
+                continue
+            similarity, params = self._similarity(template.tokens, tokens)
+            if similarity > best_similarity or (similarity == best_similarity and params > best_params):
+                best, best_similarity, best_params = template, similarity, params
+
+        if best is not None and best_similarity >= self.similarity_threshold:
+            return best
+        return None
+
+    @staticmethod
+    def _similarity(template_tokens: List[str], tokens: List[str]) -> tuple:
+        if not tokens:
+            return 1.0, 0
+        same, params = 0, 0
+        for t, m in zip(template_tokens, tokens):
+            if t == WILDCARD:
+                params += 1
+            elif t == m:
+                same += 1
+        return same / len(tokens), params
+
+    @classmethod
+    def _make_id(cls, tokens: List[str]) -> str:
+        return hashlib.sha1(" ".join(cls._generalize(token) for token in tokens).encode("utf-8")).hexdigest()[:12]
+
+    def _create_template(self, tokens: List[str]) -> LogTemplate:
+        template = LogTemplate(self._make_id(tokens), list(tokens))
+        self._insert(template)
+        return template
+
+    def _insert(self, template: LogTemplate):
+        if len(self.templates) >= self.max_templates:
+            self._evict()
+        self.templates[template.template_id] = template
+        leaf = self._leaf_for(template.tokens, create=True)
+        if template.template_id not in leaf:
+            leaf.append(template.template_id)
+        self.dirty = True
+
+    def _evict(self):
+        """模板數達到上限時，一次移除出現次數最少的一批模板 (max_templates × evict_fraction)，解析樹只重建一次"""
+        count = max(1, int(self.max_templates * self.evict_fraction))
+        for victim in heapq.nsmallest(count, self.templates.values(), key=lambda t: t.size):
+            del self.templates[victim.template_id]
+        self._rebuild_tree()
+
+    def _rebuild_tree(self):
+        self._root = {}
+        self._line_cache.clear()
+        for template in self.templates.values():
+            leaf = self._leaf_for(template.tokens, create=True)
+            leaf.append(template.template_id)
+
+    # --- 序列化 / 合併 ---
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"depth": self.depth, "similarity_threshold": self.similarity_threshold, "templates": [t.to_dict() for t in self.templates.values()]}
+
+    def load_dict(self, data: Dict[str, Any]):
+        """以持久化的狀態取代目前的模板"""
+        self.templates = {}
+        for item in data.get("templates", []):
+            self.templates[item["id"]] = LogTemplate(item["id"], list(item["tokens"]), item.get("size", 0))
+        self._rebuild_tree()
+        self.dirty = False
+
+    def merge_dict(self, data: Dict[str, Any]):
+        """
+        將其他副本持久化的模板合併進來
+
+        先以模板 ID 對齊；ID 不同但落在同一葉節點且足夠相似的模板視為同一個，
+        一律保留字典序較小的 ID，讓各副本合併後收斂到相同的 ID 而不是產生重複模板
+        """
+        rekeyed = False
+        for item in data.get("templates", []):
+            tokens = list(item["tokens"])
+            existing = self.templates.get(item["id"])
+            if existing is None:
+                existing = self._tree_search(tokens)
+                if existing is None:
+                    self._insert(LogTemplate(item["id"], tokens, item.get("size", 0)))
+                    continue
+                if item["id"] < existing.template_id:
+                    del self.templates[existing.template_id]
+                    existing.template_id = item["id"]
+                    self.templates[existing.template_id] = existing
+                    rekeyed = True
+            existing.size = max(existing.size, item.get("size", 0))
+            if len(existing.tokens) == len(tokens):
+                merged = [t if t == m else WILDCARD for t, m in zip(existing.tokens, tokens)]
+                if merged != existing.tokens:
+                    existing.tokens = merged
+                    self.dirty = True
+        if rekeyed:
+            self._rebuild_tree()
+            self.dirty = True
+
+
+class TemplateStore:
+    """
+    以 Redis 持久化 LogTemplateMiner 的狀態，讓解析樹跨會話、跨副本預熱
+
+    寫回以 WATCH/MULTI 與遠端狀態合併 (並行寫入時重試)，且最多每 `save_interval_seconds` 秒一次；
+    未寫回的變更保留在 dirty 狀態，由下一次儲存或 force=True 帶出
+    """
+
+    def __init__(self, redis_client, key: str = "loki:log_templates", ttl_seconds: int = 7 * 86400, save_interval_seconds: float = 60, max_retries: int = 5):
+        self.redis_client = redis_client
+        self.key = key
+        self.ttl_seconds = ttl_seconds
+        self.save_interval_seconds = save_interval_seconds
+        self.max_retries = max_retries
+        self._last_saved = float("-inf")
+
+    async def load(self, miner: LogTemplateMiner) -> bool:
+        if not self.redis_client:
+            return False
+        try:
+            raw = await self.redis_client.get(self.key)
+            if raw:
+                miner.merge_dict(json.loads(raw))
+                miner.dirty = False
+                logger.info(f"已從 Redis 載入 {len(miner.templates)} 個日誌模板")
+                return True
+        except Exception as e:
+            logger.error(f"Redis 日誌模板讀取失敗: {e}")
+        return False
+
+    async def save(self, miner: LogTemplateMiner, force: bool = False) -> bool:
+        """寫回前先合併遠端狀態，避免覆蓋其他副本學到的模板"""
+        if not self.redis_client or not miner.dirty:
+            return False
+        if not force and time.monotonic() - self._last_saved < self.save_interval_seconds:
+            return False
+        try:
+            async with self.redis_client.pipeline(transaction=True) as pipe:
+                for _ in range(self.max_retries):
+                    try:
+                        await pipe.watch(self.key)
+                        raw = await pipe.get(self.key)
+                        if raw:
+                            miner.merge_dict(json.loads(raw))
+                        pipe.multi()
+                        pipe.set(self.key, json.dumps(miner.to_dict()), ex=self.ttl_seconds)
+                        await pipe.execute()
+                        miner.dirty = False
+                        self._last_saved = time.monotonic()
+                        return True
+                    except WatchError:
+                        continue
+            logger.warning(f"⚠️ 日誌模板在 {self.max_retries} 次重試內仍有並行寫入，留待下次儲存")
+        except Exception as e:
+            logger.error(f"Redis 日誌模板寫入失敗: {e}")
+        return False
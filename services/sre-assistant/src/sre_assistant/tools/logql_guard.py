@@ -0,0 +1,156 @@
+# services/sre-assistant/src/sre_assistant/tools/logql_guard.py
+"""
+LogQL 選擇器防護
+解析並快取 Loki 標籤值、拒絕或收斂無界選擇器、限制查詢時間範圍，並跳脫使用者提供的字串
+"""
+
+import asyncio
+import difflib
+import re
+import time
+import structlog
+import httpx
+from typing import Dict, Any, Optional, List, Set, Tuple
+
+logger = structlog.get_logger(__name__)
+
+_DURATION_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([smhdw]?)\s*$", re.IGNORECASE)
+_DURATION_MINUTES = {"s": 1 / 60, "m": 1, "": 1, "h": 60, "d": 1440, "w": 10080}
+
+
+class SelectorRejectedError(ValueError):
+    """選擇器無界或無法解析為已知的標籤值"""
+
+    def __init__(self, message: str, details: Optional[Dict[str, Any]] = None):
+        super().__init__(message)
+        self.details = details or {}
+
+
+def parse_duration_minutes(value: Any) -> Optional[int]:
+    """
+    將時間長度解析為分鐘數：整數視為分鐘，字串支援 "90s" / "30m" / "24h" / "7d" / "1w"；無法解析時回傳 None
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        match = _DURATION_PATTERN.match(value)
+        if match:
+            return max(1, int(float(match.group(1)) * _DURATION_MINUTES[match.group(2).lower()]))
+    return None
+
+
+def escape_logql_string(value: str) -> str:
+    """跳脫 LogQL 雙引號字串中的反斜線與引號"""
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def line_filter_regex(pattern: str, regex: bool = False) -> str:
+    """
+    將使用者提供的樣式轉為 `|~` 行過濾器使用的正規表示式
+    預設視為字面文字 (regex 跳脫)；regex=True 時保留呼叫端的正規表示式語意
+    """
+    return pattern if regex or not pattern else re.escape(pattern)
+
+
+class LabelValueCache:
+    """
+    快取 `/loki/api/v1/label/{name}/values` 的結果 (每個標籤一把鎖，避免同時重複查詢)
+    """
+
+    def __init__(self, http_client: httpx.AsyncClient, base_url: str, timeout: float = 10, ttl_seconds: float = 300):
+        self.http_client = http_client
+        self.base_url = base_url
+        self.timeout = timeout
+        self.ttl_seconds = ttl_seconds
+        self._values: Dict[str, Tuple[float, Set[str]]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def values(self, label: str) -> Optional[Set[str]]:
+        """回傳標籤的所有值；Loki 無法查詢時回傳 None (由呼叫端決定是否放行)"""
+        cached = self._values.get(label)
+        if cached and time.monotonic() - cached[0] < self.ttl_seconds:
+            return cached[1]
+
+        lock = self._locks.setdefault(label, asyncio.Lock())
+        async with lock:
+            cached = self._values.get(label)
+            if cached and time.monotonic() - cached[0] < self.ttl_seconds:
+                return cached[1]
+            try:
+                response = await self.http_client.get(f"{self.base_url}/loki/api/v1/label/{label}/values", timeout=self.timeout)
+                response.raise_for_status()
+                data = response.json()
+                if data.get("status") != "success":
+                    return cached[1] if cached else None
+                values = set(data.get("data") or [])
+            except Exception as e:
+                logger.warning(f"Loki 標籤值查詢失敗 ({label}): {e}")
+                return cached[1] if cached else None
+            self._values[label] = (time.monotonic(), values)
+            return values
+
+
+class SelectorGuard:
+    """
+    LogQL 查詢前的防護層
+
+    - 沒有任何選擇器 (會掃描整個叢集) 時拒絕查詢
+    - 將 service / namespace 對照 Loki 實際的標籤值，必要時收斂為唯一的相符值 (大小寫、前綴、子字串)
+    - 將查詢時間範圍限制在 `max_time_range` 內
+    """
+
+    def __init__(self, label_cache: LabelValueCache, max_time_range: Any = None, service_label: str = "app", namespace_label: str = "namespace", allow_unbounded: bool = False):
+        self.label_cache = label_cache
+        self.max_time_range = max_time_range
+        self.service_label = service_label
+        self.namespace_label = namespace_label
+        self.allow_unbounded = allow_unbounded
+
+    def clamp_time_range(self, minutes: int) -> int:
+        limit = parse_duration_minutes(self.max_time_range)
+        if limit is not None and minutes > limit:
+            logger.warning(f"⚠️ 查詢時間範圍 {minutes}m 超過上限 {limit}m，已自動截斷")
+            return limit
+        return minutes
+
+    async def resolve(self, service: str, namespace: str, namespace_explicit: bool = True) -> Tuple[str, str]:
+        """
+        回傳收斂後的 (service, namespace)；無法安全查詢時拋出 SelectorRejectedError
+
+        namespace 為呼叫端未明確指定的預設值時，若 Loki 中不存在該值則直接略過 (由 service 選擇器限定範圍)
+        """
+        if not service and not namespace and not self.allow_unbounded:
+            raise SelectorRejectedError("查詢未指定 service 或 namespace，拒絕掃描整個 Loki 叢集", {"service": service, "namespace": namespace})
+        if namespace and not namespace_explicit and service:
+            known = await self.label_cache.values(self.namespace_label)
+            if known is not None and namespace not in known:
+                namespace = ""
+        if namespace:
+            namespace = await self._resolve_value(self.namespace_label, namespace)
+        if service:
+            service = await self._resolve_value(self.service_label, service)
+        return service, namespace
+
+    async def _resolve_value(self, label: str, value: str) -> str:
+        known = await self.label_cache.values(label)
+        if known is None or value in known:
+            # 無法取得標籤值時放行原值 (選擇器本身仍是有界的)
+            return value
+
+        lowered = value.lower()
+        candidates = [v for v in known if v.lower() == lowered]
+        if not candidates:
+            candidates = [v for v in known if v.lower().startswith(lowered)]
+        if not candidates:
+            candidates = [v for v in known if lowered in v.lower()]
+        if len(candidates) == 1:
+            logger.info(f"🔎 將 {label}='{value}' 收斂為 Loki 中的 '{candidates[0]}'")
+            return candidates[0]
+
+        suggestions: List[str] = sorted(candidates)[:5] or difflib.get_close_matches(value, list(known), n=5)
+        raise SelectorRejectedError(
+            f"Loki 中找不到唯一符合的 {label}='{value}'",
+            {"label": label, "value": value, "suggestions": suggestions},
+        )
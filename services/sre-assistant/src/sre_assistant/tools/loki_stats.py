@@ -0,0 +1,142 @@
+# services/sre-assistant/src/sre_assistant/tools/loki_stats.py
+"""
+Loki 查詢統計 (`data.stats`)
+解析每次查詢的掃描量、執行時間與快取命中，並匯出為 Prometheus 直方圖
+"""
+
+from typing import Dict, Any, Optional, List
+
+from prometheus_client import Counter, Histogram
+
+# 以查詢形狀 (查詢種類 / 行過濾器 / 呼叫來源) 為標籤，基數固定且很小
+_LABELS = ("shape", "line_filter", "caller")
+
+LOKI_BYTES_PROCESSED = Histogram(
+    "sre_assistant_loki_query_bytes_processed",
+    "Loki 查詢處理的位元組數 (data.stats.summary.totalBytesProcessed)",
+    _LABELS,
+    buckets=(1e3, 1e4, 1e5, 1e6, 1e7, 1e8, 1e9, 1e10, 1e11, 1e12, 1e13),
+)
+LOKI_LINES_PROCESSED = Histogram(
+    "sre_assistant_loki_query_lines_processed",
+    "Loki 查詢掃描的日誌行數 (data.stats.summary.totalLinesProcessed)",
+    _LABELS,
+    buckets=(1e2, 1e3, 1e4, 1e5, 1e6, 1e7, 1e8, 1e9, 1e10),
+)
+LOKI_EXEC_SECONDS = Histogram(
+    "sre_assistant_loki_query_exec_seconds",
+    "Loki 回報的查詢執行時間 (data.stats.summary.execTime)",
+    _LABELS,
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+LOKI_CACHE_ENTRIES = Counter(
+    "sre_assistant_loki_query_cache_entries",
+    "Loki 查詢快取的請求與命中筆數 (data.stats.cache.*)",
+    _LABELS + ("cache", "result"),
+)
+
+
+class LokiQueryStats:
+    """
+    單次 Loki 查詢的統計摘要
+    """
+
+    __slots__ = ("shape", "line_filter", "caller", "bytes_processed", "lines_processed", "exec_time_seconds", "queue_time_seconds", "cache")
+
+    def __init__(self, shape: str, line_filter: str = "none", caller: str = "direct"):
+        self.shape = shape
+        self.line_filter = line_filter
+        self.caller = caller
+        self.bytes_processed = 0
+        self.lines_processed = 0
+        self.exec_time_seconds = 0.0
+        self.queue_time_seconds = 0.0
+        # {cache 名稱: {"requested": n, "found": n}}
+        self.cache: Dict[str, Dict[str, int]] = {}
+
+    @classmethod
+    def from_response(cls, data: Dict[str, Any], shape: str, line_filter: str = "none", caller: str = "direct") -> Optional["LokiQueryStats"]:
+        """由 Loki 回應的 `data` 區塊解析統計；沒有 stats 時回傳 None"""
+        raw = (data or {}).get("stats")
+        if not raw:
+            return None
+        stats = cls(shape, line_filter, caller)
+        summary = raw.get("summary", {})
+        stats.bytes_processed = int(summary.get("totalBytesProcessed", 0) or 0)
+        stats.lines_processed = int(summary.get("totalLinesProcessed", 0) or 0)
+        stats.exec_time_seconds = float(summary.get("execTime", 0) or 0)
+        stats.queue_time_seconds = float(summary.get("queueTime", 0) or 0)
+        for name, cache in (raw.get("cache") or {}).items():
+            if isinstance(cache, dict):
+                stats.cache[name] = {"requested": int(cache.get("entriesRequested", 0) or 0), "found": int(cache.get("entriesFound", 0) or 0)}
+        return stats
+
+    @property
+    def cache_hits(self) -> int:
+        return sum(c["found"] for c in self.cache.values())
+
+    @property
+    def cache_requests(self) -> int:
+        return sum(c["requested"] for c in self.cache.values())
+
+    def observe(self):
+        """將統計寫入 Prometheus 指標"""
+        labels = (self.shape, self.line_filter, self.caller)
+        LOKI_BYTES_PROCESSED.labels(*labels).observe(self.bytes_processed)
+        LOKI_LINES_PROCESSED.labels(*labels).observe(self.lines_processed)
+        LOKI_EXEC_SECONDS.labels(*labels).observe(self.exec_time_seconds)
+        for name, cache in self.cache.items():
+            if cache["requested"]:
+                LOKI_CACHE_ENTRIES.labels(*labels, name, "requested").inc(cache["requested"])
+            if cache["found"]:
+                LOKI_CACHE_ENTRIES.labels(*labels, name, "found").inc(cache["found"])
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "shape": self.shape,
+            "line_filter": self.line_filter,
+            "bytes_processed": self.bytes_processed,
+            "lines_processed": self.lines_processed,
+            "exec_time_seconds": self.exec_time_seconds,
+            "queue_time_seconds": self.queue_time_seconds,
+            "cache_hits": self.cache_hits,
+            "cache_requests": self.cache_requests,
+        }
+
+
+def line_filter_shape(log_level: str, pattern: str) -> str:
+    """將行過濾條件歸納為固定的形狀標籤"""
+    parts = []
+    if log_level and log_level.lower() != "all":
+        parts.append("level")
+    if pattern:
+        parts.append("pattern")
+    return "+".join(parts) or "none"
+
+
+class QueryStatsCollector:
+    """
+    收集一次工具執行中所有 Loki 查詢的統計 (並行查詢共用同一個收集器)
+    """
+
+    def __init__(self, caller: str = "direct"):
+        self.caller = caller
+        self.items: List[LokiQueryStats] = []
+
+    def record(self, data: Dict[str, Any], shape: str, line_filter: str = "none") -> Optional[LokiQueryStats]:
+        stats = LokiQueryStats.from_response(data, shape, line_filter, self.caller)
+        if stats is not None:
+            stats.observe()
+            self.items.append(stats)
+        return stats
+
+    def summary(self) -> Dict[str, Any]:
+        """彙總統計，用於 ToolResult.metadata"""
+        return {
+            "queries": [s.to_dict() for s in self.items],
+            "total_bytes_processed": sum(s.bytes_processed for s in self.items),
+            "total_lines_processed": sum(s.lines_processed for s in self.items),
+            "total_exec_time_seconds": round(sum(s.exec_time_seconds for s in self.items), 6),
+            "cache_hits": sum(s.cache_hits for s in self.items),
+            "cache_requests": sum(s.cache_requests for s in self.items),
+        }
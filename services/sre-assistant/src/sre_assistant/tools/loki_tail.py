@@ -0,0 +1,182 @@
+# services/sre-assistant/src/sre_assistant/tools/loki_tail.py
+"""
+Loki 即時追蹤 (tail) 管理器
+每個 (selector, filter) 只維持一條上游 WebSocket，並扇出給所有訂閱的會話
+"""
+
+import asyncio
+import json
+import structlog
+from typing import Dict, Any, Optional, Callable, Set
+from urllib.parse import urlencode
+
+from .log_sketches import SpaceSaving
+from .logql_guard import line_filter_regex
+
+logger = structlog.get_logger(__name__)
+
+
+class TailSubscription:
+    """
+    單一客戶端的訂閱，透過有界佇列接收日誌；客戶端過慢時丟棄最舊的資料
+    """
+
+    def __init__(self, key: str, max_queue_size: int = 1000):
+        self.key = key
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self.dropped = 0
+
+    def publish(self, entry: Dict[str, Any]):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(entry)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """等待下一筆日誌，逾時回傳 None"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class _TailStream:
+    """一條共享的上游 tail 連線及其線上分析狀態"""
+
+    def __init__(self, query: str):
+        self.query = query
+        self.subscribers: Set[TailSubscription] = set()
+        self.task: Optional[asyncio.Task] = None
+        self.total_lines = 0
+        self.dropped_upstream = 0
+        self.level_counts: Dict[str, int] = {}
+        self.template_counts = SpaceSaving(capacity=64)
+
+
+class LokiTailManager:
+    """
+    Loki tail 串流管理器
+
+    - 以 LogQL 查詢為鍵共享上游 `/loki/api/v1/tail` WebSocket
+    - 將每一筆日誌扇出給所有訂閱者 (供 SSE 端點使用)
+    - 同時持續更新線上分析 (級別分佈、模板計數)
+    - 最後一個訂閱者離開時關閉上游連線
+    """
+
+    def __init__(self, loki_tool, connect: Optional[Callable] = None, reconnect_delay: float = 1.0, max_reconnect_delay: float = 30.0, max_queue_size: int = 1000):
+        """
+        初始化 tail 管理器
+
+        Args:
+            loki_tool: LokiLogQueryTool，用於建構查詢、解析日誌與模板探勘。
+            connect: WebSocket 連線工廠 (預設為 websockets.connect)，測試時可注入。
+        """
+        self.loki_tool = loki_tool
+        self.ws_base_url = loki_tool.base_url.replace("https://", "wss://", 1).replace("http://", "ws://", 1)
+        self._connect = connect
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.max_queue_size = max_queue_size
+        self._streams: Dict[str, _TailStream] = {}
+        self._lock = asyncio.Lock()
+
+    def build_query(self, service: str, namespace: str, log_level: str = "all", pattern: str = "") -> str:
+        """建構 tail 查詢；pattern 視為字面文字"""
+        return self.loki_tool._build_logql_query(service, namespace, log_level, line_filter_regex(pattern))
+
+    async def resolve_query(self, service: str, namespace: Optional[str] = None, log_level: str = "all", pattern: str = "") -> str:
+        """
+        經選擇器防護收斂標籤值後建構 tail 查詢；無界或無法解析時拋出 SelectorRejectedError
+
+        未指定 namespace 時以 "default" 查詢，但 Loki 中不存在該值時改由 service 選擇器限定範圍
+        """
+        service, namespace = await self.loki_tool.selector_guard.resolve(service, namespace or "default", namespace_explicit=namespace is not None)
+        return self.build_query(service, namespace, log_level, pattern)
+
+    async def subscribe(self, query: str) -> TailSubscription:
+        """訂閱一條 LogQL tail 串流，必要時建立上游連線"""
+        async with self._lock:
+            stream = self._streams.get(query)
+            if stream is None:
+                stream = _TailStream(query)
+                self._streams[query] = stream
+                stream.task = asyncio.create_task(self._run_upstream(stream))
+                logger.info(f"📡 建立 Loki tail 上游連線: {query}")
+            subscription = TailSubscription(query, self.max_queue_size)
+            stream.subscribers.add(subscription)
+            return subscription
+
+    async def unsubscribe(self, subscription: TailSubscription):
+        """取消訂閱；最後一個訂閱者離開時關閉上游連線"""
+        async with self._lock:
+            stream = self._streams.get(subscription.key)
+            if stream is None:
+                return
+            stream.subscribers.discard(subscription)
+            if not stream.subscribers:
+                del self._streams[subscription.key]
+                if stream.task:
+                    stream.task.cancel()
+                logger.info(f"📴 關閉 Loki tail 上游連線: {stream.query}")
+
+    def snapshot(self, query: str) -> Optional[Dict[str, Any]]:
+        """回傳某條串流目前的線上分析結果"""
+        stream = self._streams.get(query)
+        if stream is None:
+            return None
+        top_templates = stream.template_counts.top(5)
+        templates = self.loki_tool.template_miner.templates
+        return {
+            "query": stream.query,
+            "subscribers": len(stream.subscribers),
+            "total_lines": stream.total_lines,
+            "dropped_upstream": stream.dropped_upstream,
+            "level_distribution": dict(stream.level_counts),
+            "top_errors": [{"template_id": tid, "pattern": templates[tid].template if tid in templates else tid, "count": count} for tid, count, _ in top_templates],
+        }
+
+    async def close(self):
+        async with self._lock:
+            for stream in self._streams.values():
+                if stream.task:
+                    stream.task.cancel()
+            self._streams.clear()
+
+    def _open(self, url: str):
+        if self._connect is not None:
+            return self._connect(url)
+        # websockets 由 uvicorn[standard] 提供，延遲匯入以免影響非 tail 路徑
+        import websockets
+        return websockets.connect(url, open_timeout=self.loki_tool.timeout)
+
+    async def _run_upstream(self, stream: _TailStream):
+        url = f"{self.ws_base_url}/loki/api/v1/tail?{urlencode({'query': stream.query, 'limit': 100})}"
+        delay = self.reconnect_delay
+        while True:
+            try:
+                async with self._open(url) as ws:
+                    delay = self.reconnect_delay
+                    async for raw in ws:
+                        self._dispatch(stream, json.loads(raw))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Loki tail 連線中斷，{delay:.1f}s 後重新連線: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    def _dispatch(self, stream: _TailStream, message: Dict[str, Any]):
+        """解析一則 tail 訊息、更新線上分析並扇出給訂閱者"""
+        stream.dropped_upstream += len(message.get("dropped_entries") or [])
+        batch = self.loki_tool._parse_log_results(message.get("streams", []))
+        batch.sort(reverse=False)  # tail 需依時間先後送出
+
+        for entry in batch.to_dicts():
+            stream.total_lines += 1
+            level = entry.get("parsed", {}).get("level", "UNKNOWN")
+            stream.level_counts[level] = stream.level_counts.get(level, 0) + 1
+            if level == "ERROR":
+                template_id = self.loki_tool.template_miner.add(entry.get("message", "")).template_id
+                stream.template_counts.add(template_id)
+            for subscription in stream.subscribers:
+                subscription.publish(entry)
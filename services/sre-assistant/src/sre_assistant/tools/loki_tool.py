@@ -7,12 +7,18 @@ Loki 日誌查詢工具
 import asyncio
 import structlog
 import httpx
-import json
-import re
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Union, Iterator, Tuple
 from datetime import datetime, timedelta, timezone
 
 from ..contracts import ToolResult, ToolError
+from .log_templates import LogTemplateMiner, TemplateStore
+from .log_batch import LogBatch, to_unix_ns
+from .log_parser import LazyLogLine
+from .loki_stats import QueryStatsCollector, line_filter_shape
+from .log_sampling import StratifiedReservoirSampler
+from .log_sketches import LogSketches, SketchStore
+from .template_profiles import TemplateProfileStore
+from .logql_guard import LabelValueCache, SelectorGuard, SelectorRejectedError, escape_logql_string, line_filter_regex
 
 logger = structlog.get_logger(__name__)
 
@@ -22,13 +28,49 @@ class LokiLogQueryTool:
     Loki 日誌查詢工具
     """
     
-    def __init__(self, config, http_client: httpx.AsyncClient):
+    def __init__(self, config, http_client: httpx.AsyncClient, redis_client=None):
         """初始化 Loki 工具"""
         self.base_url = config.loki.base_url
         self.timeout = config.loki.timeout_seconds
         self.default_limit = config.loki.default_limit
         self.max_time_range = config.loki.max_time_range
         self.http_client = http_client
+
+        # 選擇器防護：標籤值快取、拒絕無界選擇器並限制時間範圍
+        self.label_cache = LabelValueCache(http_client, self.base_url, self.timeout, config.loki.get("label_cache_ttl_seconds", 300))
+        self.selector_guard = SelectorGuard(self.label_cache, self.max_time_range, service_label=config.loki.get("service_label", "app"))
+
+        # 聚合模式：計數下推到 Loki，原始日誌只抓少量樣本作為證據
+        self.aggregate_by_default = config.loki.get("aggregate_by_default", False)
+        self.sample_limit = config.loki.get("sample_limit", 100)
+        self.default_parser = config.loki.get("default_parser", "logfmt")
+
+        # 分層抽樣：將時間範圍切成多個桶分別查詢，再依 (級別, 模板) 分層以蓄水池抽樣
+        self.stratified_sampling = config.loki.get("stratified_sampling", False)
+        self.sample_buckets = config.loki.get("sample_buckets", 6)
+        self.sample_fetch_limit = config.loki.get("sample_fetch_limit", 1000)
+        self.sample_per_stratum = config.loki.get("sample_per_stratum", 5)
+
+        # 日誌模板探勘 (Drain)，解析樹透過 Redis 跨會話共享
+        self.template_miner = LogTemplateMiner(
+            depth=config.loki.get("template_depth", 4),
+            similarity_threshold=config.loki.get("template_similarity", 0.4),
+        )
+        self.template_store = TemplateStore(
+            redis_client,
+            key=config.loki.get("template_store_key", "loki:log_templates"),
+            save_interval_seconds=config.loki.get("template_store_save_interval_seconds", 60),
+        )
+        self._templates_loaded = False
+
+        # 固定記憶體的串流摘要 (熱門錯誤模板 + 不同值數量)，依小時分片合併寫入 Redis
+        self.sketch_distinct_fields = config.loki.get("sketch_distinct_fields", ["pod", "trace_id", "user_id"])
+        self.sketch_topk_capacity = config.loki.get("sketch_topk_capacity", 64)
+        self.sketch_store = SketchStore(redis_client, prefix=config.loki.get("sketch_store_prefix", "loki:sketches"))
+
+        # 模板頻率基線：診斷時以 O(1) 查詢判斷錯誤模板是否為新出現或突增
+        self.profile_store = TemplateProfileStore(redis_client, prefix=config.loki.get("profile_store_prefix", "loki:template_profile"))
+        self.novelty_spike_ratio = config.loki.get("novelty_spike_ratio", 3.0)
         
         logger.info(f"✅ Loki 工具初始化 (使用共享 HTTP 客戶端): {self.base_url}")
 
@@ -56,21 +98,58 @@ class LokiLogQueryTool:
             service = params.get("service", "")
             namespace = params.get("namespace", "default")
             log_level = params.get("log_level", "error")
-            pattern = params.get("pattern", "")
-            time_range = params.get("time_range", 30)
+            pattern = line_filter_regex(params.get("pattern", ""), params.get("pattern_regex", False))
+            requested_time_range = params.get("time_range", 30)
+            time_range = self.selector_guard.clamp_time_range(requested_time_range)
             limit = params.get("limit", self.default_limit)
             
             logger.info(f"📝 查詢 Loki: service={service}, level={log_level}, pattern={pattern}")
             
-            logs = await self._query_logs(service, namespace, log_level, pattern, time_range, limit)
-            analysis = self._analyze_logs(logs)
+            service, namespace = await self.selector_guard.resolve(service, namespace, namespace_explicit="namespace" in params)
+            stats = QueryStatsCollector(caller=params.get("caller", "direct"))
+
+            if not self._templates_loaded:
+                await self.template_store.load(self.template_miner)
+                self._templates_loaded = True
+
+            stratified = params.get("stratified", self.stratified_sampling)
+            window_end = datetime.now(timezone.utc)
+            sketches = LogSketches(self.sketch_distinct_fields, self.sketch_topk_capacity)
+            if params.get("aggregate", self.aggregate_by_default):
+                parser = params.get("parser", self.default_parser)
+                level_counts, error_rate_trend, (logs, sampling) = await asyncio.gather(
+                    self._query_level_counts(service, namespace, pattern, time_range, parser, params.get("parser_pattern", ""), stats=stats),
+                    self._query_error_rate(service, namespace, pattern, time_range, stats=stats),
+                    self._fetch_logs(service, namespace, log_level, pattern, time_range, min(limit, self.sample_limit), stratified, stats),
+                )
+                analysis = self._analyze_logs(logs, sketches)
+                sampled_errors = analysis["level_distribution"].get("ERROR", 0)
+                self._apply_aggregates(analysis, logs, level_counts, error_rate_trend)
+                # 模板計數來自樣本，依 Loki 端的錯誤總數換算回整個時間範圍再與基線比較
+                count_scale = level_counts.get("ERROR", 0) / sampled_errors if sampled_errors else 1.0
+            else:
+                logs, sampling = await self._fetch_logs(service, namespace, log_level, pattern, time_range, limit, stratified, stats)
+                analysis = self._analyze_logs(logs, sketches)
+                count_scale = 1.0
+            if sampling is not None:
+                analysis["sampling"] = sampling
+            await self._score_novelty(analysis, sketches, namespace, service, time_range, count_scale)
+            await self.template_store.save(self.template_miner)
+            query_params = {"service": service, "namespace": namespace, "log_level": log_level, "time_range": f"{time_range}m"}
+            if time_range != requested_time_range:
+                query_params["requested_time_range"] = f"{requested_time_range}m"
+            # 分片以查詢的日誌時間範圍為鍵，重複查詢同一範圍只會覆寫
+            await self.sketch_store.save(namespace, service, window_end - timedelta(minutes=time_range), window_end, sketches)
             
             return ToolResult(
                 success=True,
-                data={"logs": logs, "analysis": analysis, "query_params": {"service": service, "namespace": namespace, "log_level": log_level, "time_range": f"{time_range}m"}},
-                metadata={"source": "loki", "timestamp": datetime.now(timezone.utc).isoformat(), "total_logs": len(logs)}
+                data={"logs": logs.to_dicts(), "analysis": analysis, "query_params": query_params},
+                metadata={"source": "loki", "timestamp": datetime.now(timezone.utc).isoformat(), "total_logs": len(logs), "loki_stats": stats.summary()}
             )
             
+        except SelectorRejectedError as e:
+            logger.warning(f"🚫 Loki 查詢被選擇器防護拒絕: {e}")
+            return ToolResult(success=False, error=ToolError(code="SELECTOR_REJECTED", message=str(e), details={**e.details, "params": params}))
         except httpx.HTTPStatusError as e:
             return self._handle_error(e, params)
         except httpx.TimeoutException as e:
@@ -94,18 +173,63 @@ class LokiLogQueryTool:
         logger.error(f"❌ Loki 工具執行時發生未預期錯誤: {e}", exc_info=True)
         return ToolResult(success=False, error=ToolError(code="UNEXPECTED_ERROR", message=str(e), details={"error_type": type(e).__name__, "params": params}))
 
-    async def _query_logs(self, service: str, namespace: str, log_level: str, pattern: str, time_range: int, limit: int) -> List[Dict[str, Any]]:
+    async def _fetch_logs(self, service: str, namespace: str, log_level: str, pattern: str, time_range: int, limit: int, stratified: bool, stats: Optional[QueryStatsCollector] = None) -> Tuple[LogBatch, Optional[Dict[str, Any]]]:
         """
-        查詢日誌
+        取得原始日誌：一般模式只取最新的 `limit` 行；分層模式回傳跨時間範圍的代表性樣本與抽樣摘要
+        """
+        if stratified and self.sample_buckets > 1:
+            return await self._query_logs_stratified(service, namespace, log_level, pattern, time_range, limit, stats)
+        return await self._query_logs(service, namespace, log_level, pattern, time_range, limit, stats=stats), None
+
+    async def _query_logs_stratified(self, service: str, namespace: str, log_level: str, pattern: str, time_range: int, limit: int, stats: Optional[QueryStatsCollector] = None) -> Tuple[LogBatch, Dict[str, Any]]:
+        """
+        將時間範圍切成 `sample_buckets` 個桶並行查詢，逐行餵給分層蓄水池抽樣器，只保留有界的樣本
         """
-        query = self._build_logql_query(service, namespace, log_level, pattern)
         end_time = datetime.now(timezone.utc)
-        start_time = end_time - timedelta(minutes=time_range)
+        bucket_minutes = time_range / self.sample_buckets
+        windows = [
+            (end_time - timedelta(minutes=bucket_minutes * (i + 1)), end_time - timedelta(minutes=bucket_minutes * i))
+            for i in range(self.sample_buckets)
+        ]
+        batches = await asyncio.gather(*(
+            self._query_logs(service, namespace, log_level, pattern, time_range, self.sample_fetch_limit, stats=stats, start_time=start, end_time=end)
+            for start, end in windows
+        ))
+
+        sampler = StratifiedReservoirSampler(per_stratum=self.sample_per_stratum)
+        for bucket, batch in enumerate(batches):
+            for i, (message, parsed) in enumerate(batch.iter_parsed()):
+                sampler.offer(bucket, self._sample_stratum(message, parsed), (batch.timestamps[i], batch.labels(i), message, parsed))
+
+        samples = LogBatch(self._parse_log_line)
+        for row in sampler.sample(limit):
+            samples.append(*row)
+        summary = sampler.summary()
+        summary.update({"buckets": self.sample_buckets, "sampled": len(samples)})
+        return samples, summary
+
+    def _sample_stratum(self, message: str, parsed: Any) -> Tuple:
+        """抽樣分層鍵：錯誤日誌依 (級別, 模板 ID)，其他日誌只依級別"""
+        level = parsed.get("level", "UNKNOWN")
+        if level != "ERROR":
+            return (level,)
+        # 只比對不學習：模板計數只在 _analyze_logs 中累加一次；尚無模板的行以遮罩後的內容分層
+        template = self.template_miner.match(message)
+        return (level, template.template_id if template else " ".join(self.template_miner.preprocess(message)))
+
+    async def _query_logs(self, service: str, namespace: str, log_level: str, pattern: str, time_range: int, limit: int, stats: Optional[QueryStatsCollector] = None, start_time: Optional[datetime] = None, end_time: Optional[datetime] = None, end_ns: Optional[int] = None) -> LogBatch:
+        """
+        查詢日誌 (可指定時間窗，預設為最近 `time_range` 分鐘)
+        分頁時以 `end_ns` 傳入上一頁最舊一行的奈秒時間戳，避免轉成 datetime 後失去次微秒精度
+        """
+        query = self._build_logql_query(service, namespace, log_level, pattern)
+        end_time = end_time or datetime.now(timezone.utc)
+        start_time = start_time or end_time - timedelta(minutes=time_range)
         
         params = {
             "query": query,
-            "start": str(int(start_time.timestamp() * 1e9)),
-            "end": str(int(end_time.timestamp() * 1e9)),
+            "start": str(to_unix_ns(start_time)),
+            "end": str(end_ns if end_ns is not None else to_unix_ns(end_time)),
             "limit": limit,
             "direction": "backward"
         }
@@ -113,21 +237,109 @@ class LokiLogQueryTool:
         response = await self.http_client.get(f"{self.base_url}/loki/api/v1/query_range", params=params, timeout=self.timeout)
         response.raise_for_status()
         data = response.json()
+        if stats is not None:
+            stats.record(data.get("data"), "logs", line_filter_shape(log_level, pattern))
 
         if data.get("status") != "success":
             error_msg = data.get('error', 'Unknown Loki query error')
             logger.warning(f"Loki 查詢成功但語法或執行失敗: {error_msg}")
-            return []
+            return LogBatch(self._parse_log_line)
 
         return self._parse_log_results(data.get("data", {}).get("result", []))
+
+    async def _query_metric(self, endpoint: str, params: Dict[str, Any], stats: Optional[QueryStatsCollector] = None, shape: str = "metric", line_filter: str = "none") -> List[Dict[str, Any]]:
+        """
+        執行 LogQL 指標查詢 (instant 或 range)，回傳 result 列表
+        """
+        response = await self.http_client.get(f"{self.base_url}/loki/api/v1/{endpoint}", params=params, timeout=self.timeout)
+        response.raise_for_status()
+        data = response.json()
+        if stats is not None:
+            stats.record(data.get("data"), shape, line_filter)
+
+        if data.get("status") != "success":
+            logger.warning(f"Loki 指標查詢成功但語法或執行失敗: {data.get('error', 'Unknown Loki query error')}")
+            return []
+        return data.get("data", {}).get("result", [])
+
+    async def _query_level_counts(self, service: str, namespace: str, pattern: str, time_range: int, parser: str, parser_pattern: str = "", stats: Optional[QueryStatsCollector] = None) -> Dict[str, int]:
+        """
+        以 sum by (level) (count_over_time(...)) 在 Loki 端計算完整時間範圍內的級別分佈
+        """
+        stream = self._build_logql_query(service, namespace, "all", pattern)
+        if parser == "json":
+            stream += " | json"
+        elif parser == "pattern" and parser_pattern:
+            stream += f' | pattern "{escape_logql_string(parser_pattern)}"'
+        else:
+            stream += " | logfmt"
+
+        query = f"sum by (level) (count_over_time({stream} [{time_range}m]))"
+        end_time = datetime.now(timezone.utc)
+        results = await self._query_metric("query", {"query": query, "time": str(to_unix_ns(end_time))}, stats, "level_counts", line_filter_shape("all", pattern))
+
+        level_counts: Dict[str, int] = {}
+        for series in results:
+            level = self._normalize_level(series.get("metric", {}).get("level", ""))
+            value = series.get("value", [])
+            if len(value) >= 2:
+                level_counts[level] = level_counts.get(level, 0) + int(float(value[1]))
+        return level_counts
+
+    async def _query_error_rate(self, service: str, namespace: str, pattern: str, time_range: int, stats: Optional[QueryStatsCollector] = None) -> List[Dict[str, Any]]:
+        """
+        以 sum(rate(... |~ error [window])) 查詢錯誤率趨勢 (每秒錯誤行數)
+        """
+        end_time = datetime.now(timezone.utc)
+        start_time = end_time - timedelta(minutes=time_range)
+        # 每個序列最多約 200 個點，區間至少 1 分鐘
+        step = max(60, int(time_range * 60 / 200))
+        query = f"sum(rate({self._build_logql_query(service, namespace, 'error', pattern)} [{step}s]))"
+
+        results = await self._query_metric("query_range", {
+            "query": query,
+            "start": str(to_unix_ns(start_time)),
+            "end": str(to_unix_ns(end_time)),
+            "step": f"{step}s",
+        }, stats, "error_rate", line_filter_shape("error", pattern))
+
+        trend = []
+        for series in results:
+            for ts, value in series.get("values", []):
+                trend.append({"timestamp": datetime.fromtimestamp(float(ts), tz=timezone.utc).isoformat(), "errors_per_second": round(float(value), 4)})
+        trend.sort(key=lambda x: x["timestamp"])
+        return trend
+
+    @staticmethod
+    def _normalize_level(level: str) -> str:
+        """將 Loki 標籤中的級別名稱正規化為 ERROR/WARN/INFO/DEBUG/UNKNOWN"""
+        level = (level or "").strip().lower()
+        if level in ("error", "err", "fatal", "panic", "critical", "crit", "emerg", "alert"): return "ERROR"
+        if level in ("warn", "warning"): return "WARN"
+        if level in ("info", "information", "notice"): return "INFO"
+        if level in ("debug", "trace"): return "DEBUG"
+        return "UNKNOWN"
+
+    def _apply_aggregates(self, analysis: Dict[str, Any], samples: LogBatch, level_counts: Dict[str, int], error_rate_trend: List[Dict[str, Any]]):
+        """
+        以 Loki 端的精確計數覆寫僅基於樣本的統計
+        """
+        total = sum(level_counts.values())
+        analysis["sampled_logs"] = len(samples)
+        analysis["total_logs"] = total
+        analysis["level_distribution"] = level_counts
+        analysis["error_percentage"] = round(level_counts.get("ERROR", 0) / total * 100, 2) if total else 0.0
+        analysis["error_rate_trend"] = error_rate_trend
+        analysis["counts_source"] = "loki_aggregate"
+        analysis["critical_indicators"] = self._identify_critical_indicators(samples, level_counts)
     
     def _build_logql_query(self, service: str, namespace: str, log_level: str, pattern: str) -> str:
         """
-        建構 LogQL 查詢語句
+        建構 LogQL 查詢語句 (標籤值與樣式皆做字串跳脫；pattern 為正規表示式，字面文字請先經 line_filter_regex)
         """
         selectors = []
-        if service: selectors.append(f'app="{service}"')
-        if namespace: selectors.append(f'namespace="{namespace}"')
+        if service: selectors.append(f'{self.selector_guard.service_label}="{escape_logql_string(service)}"')
+        if namespace: selectors.append(f'namespace="{escape_logql_string(namespace)}"')
         if not selectors: selectors.append('job=~".+"')
         query = "{" + ",".join(selectors) + "}"
         
@@ -141,35 +353,22 @@ class LokiLogQueryTool:
             if log_level.lower() in level_patterns:
                 query += f' |~ "{level_patterns[log_level.lower()]}"'
         
-        if pattern: query += f' |~ "{pattern}"'
+        if pattern: query += f' |~ "{escape_logql_string(pattern)}"'
         return query
     
-    def _parse_log_results(self, results: List[Dict]) -> List[Dict[str, Any]]:
-        """
-        解析 Loki 查詢結果
-        """
-        logs = []
-        for stream in results:
-            stream_labels = stream.get("stream", {})
-            for value in stream.get("values", []):
-                if len(value) >= 2:
-                    logs.append({
-                        "timestamp": datetime.fromtimestamp(int(value[0]) / 1e9, tz=timezone.utc).isoformat(),
-                        "labels": stream_labels,
-                        "message": value[1],
-                        "parsed": self._parse_log_line(value[1])
-                    })
-        logs.sort(key=lambda x: x["timestamp"], reverse=True)
-        return logs
+    def _parse_log_results(self, results: List[Dict]) -> LogBatch:
+        """
+        解析 Loki 查詢結果為欄式批次 (依奈秒時間戳新到舊排序，逐行解析延遲到首次存取)
+        """
+        batch = LogBatch.from_streams(results, self._parse_log_line)
+        batch.sort(reverse=True)
+        return batch
     
-    def _parse_log_line(self, log_line: str) -> Dict[str, Any]:
+    def _parse_log_line(self, log_line: str) -> LazyLogLine:
         """
-        解析單行日誌
+        解析單行日誌 (嗅探是否為 JSON，欄位延遲到分析器存取時才提取)
         """
-        try:
-            return json.loads(log_line)
-        except json.JSONDecodeError:
-            return {"raw": log_line, "level": self._extract_log_level(log_line), "error_type": self._extract_error_type(log_line)}
+        return LazyLogLine(log_line, {"level": self._extract_log_level, "error_type": self._extract_error_type})
     
     def _extract_log_level(self, log_line: str) -> str:
         """提取日誌級別"""
@@ -187,52 +386,107 @@ class LokiLogQueryTool:
             if pattern in log_line: return error_type
         return None
     
-    def _analyze_logs(self, logs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    @staticmethod
+    def _iter_parsed(logs: Union[LogBatch, List[Dict[str, Any]]]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """逐行產生 (message, parsed)，同時支援 LogBatch 與逐行字典列表"""
+        if isinstance(logs, LogBatch):
+            return logs.iter_parsed()
+        return ((log.get("message", ""), log.get("parsed", {})) for log in logs)
+
+    async def _score_novelty(self, analysis: Dict[str, Any], sketches: LogSketches, namespace: str, service: str, time_range: int, count_scale: float = 1.0):
+        """
+        以模板基線為錯誤模板評分，標註在 top_errors 上並彙整新出現 / 突增的模板
+
+        `count_scale` 為樣本到母體的換算倍數 (聚合模式下 = Loki 錯誤總數 / 樣本中的錯誤行數)
+        """
+        await self.profile_store.track(namespace, service)
+        counts = {template_id: max(1, round(count * count_scale)) for template_id, count, _ in sketches.top_errors.top(sketches.top_errors.capacity)}
+        scores = await self.profile_store.score(namespace, service, counts, time_range, spike_ratio=self.novelty_spike_ratio)
+        if not scores:
+            return
+        for entry in analysis.get("top_errors", []):
+            score = scores.get(entry["template_id"])
+            if score:
+                entry["novelty"] = score["status"]
+        templates = self.template_miner.templates
+        analysis["novelty"] = {
+            status: [
+                {"template_id": template_id, "pattern": templates[template_id].template if template_id in templates else template_id, **score}
+                for template_id, score in scores.items() if score["status"] == status
+            ]
+            for status in ("novel", "spiking")
+        }
+
+    async def summarize_sketches(self, service: str, namespace: Optional[str] = None, hours: int = 24, top: int = 10) -> Dict[str, Any]:
+        """
+        彙總過去 `hours` 小時內查詢所保存的摘要分片：各維度的不同值數量與最常見的錯誤模板
+
+        只合併彼此不重疊的分片，`coverage_minutes` 為實際涵蓋的分鐘數 (未被查詢過的時段不計入)
+        """
+        service, namespace = await self.selector_guard.resolve(service, namespace or "default", namespace_explicit=namespace is not None)
+        end = datetime.now(timezone.utc)
+        sketches, covered = await self.sketch_store.load(namespace, service, end - timedelta(hours=hours), end)
+        templates = self.template_miner.templates
+        top_errors = [
+            {"pattern": templates[template_id].template if template_id in templates else template_id, "template_id": template_id, "count": count, "error": error}
+            for template_id, count, error in (sketches.top_errors.top(top) if sketches else [])
+        ]
+        return {
+            "service": service,
+            "namespace": namespace,
+            "window_hours": hours,
+            "coverage_minutes": covered,
+            "distinct_counts": sketches.distinct_counts() if sketches else {},
+            "top_errors": top_errors,
+        }
+
+    @staticmethod
+    def _iter_entries(logs: Union[LogBatch, List[Dict[str, Any]]]) -> Iterator[Tuple[str, Dict[str, Any], Dict[str, str]]]:
+        """逐行產生 (message, parsed, labels)"""
+        if isinstance(logs, LogBatch):
+            return logs.iter_entries()
+        return ((log.get("message", ""), log.get("parsed", {}), log.get("labels", {})) for log in logs)
+
+    def _analyze_logs(self, logs: Union[LogBatch, List[Dict[str, Any]]], sketches: Optional[LogSketches] = None) -> Dict[str, Any]:
         """
-        分析日誌模式和統計
+        分析日誌模式和統計 (錯誤模板與不同值數量以固定記憶體的摘要單次串流計算)
         """
-        if not logs: return {"total_logs": 0, "level_distribution": {}, "error_types": {}, "top_errors": []}
+        if not logs: return {"total_logs": 0, "level_distribution": {}, "error_types": {}, "top_errors": [], "distinct_counts": {}}
         
-        level_counts, error_types, error_messages = {}, {}, []
-        for log in logs:
-            level = log.get("parsed", {}).get("level", "UNKNOWN")
+        if sketches is None:
+            sketches = LogSketches(self.sketch_distinct_fields, self.sketch_topk_capacity)
+        level_counts, error_types = {}, {}
+        for message, parsed, labels in self._iter_entries(logs):
+            level = parsed.get("level", "UNKNOWN")
             level_counts[level] = level_counts.get(level, 0) + 1
-            error_type = log.get("parsed", {}).get("error_type")
+            error_type = parsed.get("error_type")
             if error_type: error_types[error_type] = error_types.get(error_type, 0) + 1
-            if level == "ERROR": error_messages.append(log.get("message", ""))
+            if level == "ERROR": sketches.top_errors.add(self.template_miner.add(message).template_id)
+            sketches.observe(labels, parsed)
         
-        top_errors = []
-        if error_messages:
-            error_clusters = self._cluster_errors(error_messages)
-            top_errors = sorted(error_clusters.items(), key=lambda x: x[1], reverse=True)[:5]
+        templates = self.template_miner.templates
+        top_errors = [
+            {"pattern": templates[template_id].template if template_id in templates else template_id, "template_id": template_id, "count": count}
+            for template_id, count, _ in sketches.top_errors.top(5)
+        ]
         
-        return {"total_logs": len(logs), "level_distribution": level_counts, "error_types": error_types, "top_errors": [{"pattern": pattern, "count": count} for pattern, count in top_errors], "critical_indicators": self._identify_critical_indicators(logs)}
-    
-    def _cluster_errors(self, error_messages: List[str]) -> Dict[str, int]:
-        """
-        簡單的錯誤聚類
-        """
-        clusters = {}
-        for message in error_messages:
-            key_parts = []
-            exception_words = re.findall(r'\b\w*Exception\b', message)
-            if exception_words: key_parts.append(max(exception_words, key=len))
-            error_codes = re.findall(r'\b[4-5]\d{2}\b', message)
-            if error_codes: key_parts.extend(error_codes)
-            if not key_parts: key_parts.append(message.splitlines()[0][:50])
-            cluster_key = " | ".join(sorted(list(set(key_parts))))
-            clusters[cluster_key] = clusters.get(cluster_key, 0) + 1
-        return clusters
+        return {"total_logs": len(logs), "level_distribution": level_counts, "error_types": error_types, "top_errors": top_errors, "distinct_counts": sketches.distinct_counts(), "critical_indicators": self._identify_critical_indicators(logs)}
     
-    def _identify_critical_indicators(self, logs: List[Dict[str, Any]]) -> List[str]:
+    def _identify_critical_indicators(self, logs: Union[LogBatch, List[Dict[str, Any]]], level_counts: Optional[Dict[str, int]] = None) -> List[str]:
         """
-        識別關鍵指標
+        識別關鍵指標 (若提供 Loki 端的級別計數，錯誤率以其計算)
         """
         indicators = []
-        if sum(1 for log in logs if "OOMKilled" in log.get("message", "")) > 0: indicators.append(f"發現 {sum(1 for log in logs if 'OOMKilled' in log.get('message', ''))} 次記憶體不足錯誤 (OOMKilled)")
-        if sum(1 for log in logs if "panic" in log.get("message", "").lower()) > 0: indicators.append(f"發現 {sum(1 for log in logs if 'panic' in log.get('message', '').lower())} 次 Panic 錯誤")
-        conn_errors = sum(1 for log in logs if any(p in log.get("message", "") for p in ["Connection refused", "Connection timeout", "connection reset"]))
+        entries = list(self._iter_parsed(logs))
+        oom_errors = sum(1 for message, _ in entries if "OOMKilled" in message)
+        if oom_errors > 0: indicators.append(f"發現 {oom_errors} 次記憶體不足錯誤 (OOMKilled)")
+        panic_errors = sum(1 for message, _ in entries if "panic" in message.lower())
+        if panic_errors > 0: indicators.append(f"發現 {panic_errors} 次 Panic 錯誤")
+        conn_errors = sum(1 for message, _ in entries if any(p in message for p in ["Connection refused", "Connection timeout", "connection reset"]))
         if conn_errors > 5: indicators.append(f"發現 {conn_errors} 次連接錯誤，可能存在網路問題")
-        error_logs = sum(1 for log in logs if log.get("parsed", {}).get("level") == "ERROR")
-        if len(logs) > 0 and (error_logs / len(logs)) * 100 > 50: indicators.append(f"錯誤率過高: {(error_logs / len(logs)) * 100:.1f}%")
+        if level_counts is not None:
+            error_logs, total_logs = level_counts.get("ERROR", 0), sum(level_counts.values())
+        else:
+            error_logs, total_logs = sum(1 for _, parsed in entries if parsed.get("level") == "ERROR"), len(entries)
+        if total_logs > 0 and (error_logs / total_logs) * 100 > 50: indicators.append(f"錯誤率過高: {(error_logs / total_logs) * 100:.1f}%")
         return indicators
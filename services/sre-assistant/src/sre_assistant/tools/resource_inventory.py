@@ -0,0 +1,306 @@
+# services/sre-assistant/src/sre_assistant/tools/resource_inventory.py
+"""
+本地資源庫存鏡像
+在程序內保存 Control Plane 資源並依 ID、名稱、類型、群組與標籤建立索引，
+以 updatedAt 游標增量同步，可選擇以 SQLite 或 PostgreSQL 保存快照以便重啟後快速載入
+"""
+
+import asyncio
+import sqlite3
+import structlog
+from datetime import datetime
+from typing import Dict, Any, Optional, List, Set, Iterable
+
+from .control_plane_contracts import Resource
+from .control_plane_pagination import PageIterator
+
+logger = structlog.get_logger(__name__)
+
+
+def _updated_at(resource: Dict[str, Any]) -> Optional[str]:
+    value = resource.get("updated_at")
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+class ResourceInventory:
+    """
+    記憶體中的資源庫存與索引
+
+    資源以 Resource.model_dump() 的格式保存，與 ControlPlaneTool 遠端查詢的回傳格式一致。
+    `resource:<id>` 標籤失效時 (例如執行腳本後) 資源先移出庫存並記入 stale，查詢改走快取 / API，
+    由下一輪同步重新抓取。
+    """
+
+    _INDEXED = ("name", "type", "group_id")
+
+    def __init__(self):
+        self._resources: Dict[str, Dict[str, Any]] = {}
+        self._indexes: Dict[str, Dict[Any, Set[str]]] = {field: {} for field in (*self._INDEXED, "tag")}
+        self.cursor: Optional[str] = None
+        self.ready = False
+        self.stale: Set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self._resources)
+
+    def __contains__(self, resource_id: str) -> bool:
+        return resource_id in self._resources
+
+    def get(self, resource_id: str) -> Optional[Dict[str, Any]]:
+        resource = self._resources.get(resource_id)
+        return dict(resource) if resource is not None else None
+
+    def get_many(self, resource_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        return {resource_id: dict(self._resources[resource_id]) for resource_id in resource_ids if resource_id in self._resources}
+
+    def find(self, name: Optional[str] = None, type: Optional[str] = None, group_id: Optional[str] = None, tag: Optional[str] = None) -> List[Dict[str, Any]]:
+        """依名稱 / 類型 / 群組 / 標籤查詢 (多個條件取交集)"""
+        criteria = {"name": name, "type": type, "group_id": group_id, "tag": tag}
+        matched: Optional[Set[str]] = None
+        for field, value in criteria.items():
+            if value is None:
+                continue
+            ids = self._indexes[field].get(value, set())
+            matched = set(ids) if matched is None else matched & ids
+        if matched is None:
+            matched = set(self._resources)
+        return [dict(self._resources[resource_id]) for resource_id in sorted(matched)]
+
+    def upsert(self, resources: Iterable[Dict[str, Any]], advance_cursor: bool = True) -> int:
+        """
+        寫入資源；`advance_cursor=False` 時不移動游標 (不完整的同步結果不能代表游標之前的資料都已收到)
+        """
+        resources = list(resources)
+        for resource in resources:
+            resource_id = resource["id"]
+            if resource_id in self._resources:
+                self._unindex(resource_id)
+            self._resources[resource_id] = resource
+            self._index(resource_id)
+            self.stale.discard(resource_id)
+        if advance_cursor:
+            self.advance_cursor(resources)
+        return len(resources)
+
+    def advance_cursor(self, resources: Iterable[Dict[str, Any]]):
+        for resource in resources:
+            updated_at = _updated_at(resource)
+            if updated_at and (self.cursor is None or updated_at > self.cursor):
+                self.cursor = updated_at
+
+    def invalidate_tags(self, tags: Iterable[str]) -> List[str]:
+        """依快取失效標籤移出被修改的資源，回傳移出的 ID"""
+        resource_ids = [tag.split(":", 1)[1] for tag in tags if tag.startswith("resource:")]
+        removed = self.remove(resource_ids)
+        self.stale.update(removed)
+        return removed
+
+    def remove(self, resource_ids: Iterable[str]) -> List[str]:
+        removed = []
+        for resource_id in resource_ids:
+            if resource_id in self._resources:
+                self._unindex(resource_id)
+                del self._resources[resource_id]
+                removed.append(resource_id)
+        return removed
+
+    def ids(self) -> Set[str]:
+        return set(self._resources)
+
+    def _index(self, resource_id: str):
+        resource = self._resources[resource_id]
+        for field in self._INDEXED:
+            value = resource.get(field)
+            if value is not None:
+                self._indexes[field].setdefault(value, set()).add(resource_id)
+        for tag in resource.get("tags") or []:
+            self._indexes["tag"].setdefault(tag, set()).add(resource_id)
+
+    def _unindex(self, resource_id: str):
+        resource = self._resources[resource_id]
+        values = [(field, resource.get(field)) for field in self._INDEXED] + [("tag", tag) for tag in resource.get("tags") or []]
+        for field, value in values:
+            ids = self._indexes[field].get(value)
+            if ids is not None:
+                ids.discard(resource_id)
+                if not ids:
+                    del self._indexes[field][value]
+
+
+class SQLiteInventoryStore:
+    """以 SQLite 保存庫存快照 (同步 I/O 於執行緒中執行)"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path)
+        conn.execute("CREATE TABLE IF NOT EXISTS resource_inventory (id TEXT PRIMARY KEY, updated_at TEXT, data TEXT NOT NULL)")
+        return conn
+
+    async def load(self) -> List[Dict[str, Any]]:
+        def _load():
+            with self._connect() as conn:
+                return [row[0] for row in conn.execute("SELECT data FROM resource_inventory")]
+        return [Resource.model_validate_json(raw).model_dump() for raw in await asyncio.to_thread(_load)]
+
+    async def save(self, resources: List[Dict[str, Any]], removed: List[str]):
+        rows = [(r["id"], _updated_at(r), Resource.model_validate(r).model_dump_json()) for r in resources]
+
+        def _save():
+            with self._connect() as conn:
+                conn.executemany("INSERT OR REPLACE INTO resource_inventory (id, updated_at, data) VALUES (?, ?, ?)", rows)
+                conn.executemany("DELETE FROM resource_inventory WHERE id = ?", [(resource_id,) for resource_id in removed])
+        await asyncio.to_thread(_save)
+
+
+class PostgresInventoryStore:
+    """以 PostgreSQL (asyncpg 連線池) 保存庫存快照"""
+
+    def __init__(self, pool, table: str = "sre_resource_inventory"):
+        self.pool = pool
+        self.table = table
+
+    async def _ensure_table(self, conn):
+        await conn.execute(f"CREATE TABLE IF NOT EXISTS {self.table} (id TEXT PRIMARY KEY, updated_at TEXT, data JSONB NOT NULL)")
+
+    async def load(self) -> List[Dict[str, Any]]:
+        async with self.pool.acquire() as conn:
+            await self._ensure_table(conn)
+            rows = await conn.fetch(f"SELECT data::text AS data FROM {self.table}")
+        return [Resource.model_validate_json(row["data"]).model_dump() for row in rows]
+
+    async def save(self, resources: List[Dict[str, Any]], removed: List[str]):
+        rows = [(r["id"], _updated_at(r), Resource.model_validate(r).model_dump_json()) for r in resources]
+        async with self.pool.acquire() as conn:
+            await self._ensure_table(conn)
+            async with conn.transaction():
+                if rows:
+                    await conn.executemany(
+                        f"INSERT INTO {self.table} (id, updated_at, data) VALUES ($1, $2, $3::jsonb) "
+                        "ON CONFLICT (id) DO UPDATE SET updated_at = EXCLUDED.updated_at, data = EXCLUDED.data",
+                        rows,
+                    )
+                if removed:
+                    await conn.execute(f"DELETE FROM {self.table} WHERE id = ANY($1::text[])", removed)
+
+
+class InventorySyncer:
+    """
+    庫存同步背景工作
+
+    - 啟動時先從快照載入，再與 Control Plane 同步 (沒有快照時做一次完整同步)
+    - 之後每 `interval_seconds` 以 `updated_after=<游標>` 增量同步
+    - 每 `full_sync_every` 輪做一次完整同步，移除 Control Plane 已刪除的資源
+    - 游標只在同步完整時前進，快照也只保存完整同步的結果，從快照推得的游標因此一定有效
+    - 因快取失效而移出的資源 (stale) 在每輪同步時以批次查詢重新抓取
+    - 連續 `max_failed_syncs` 次同步失敗時 ready 改回 False，查詢改走快取 / API，直到下一次完整同步
+    """
+
+    def __init__(self, control_plane_tool, inventory: ResourceInventory, store=None, interval_seconds: float = 60, full_sync_every: int = 60, page_size: int = 100, max_failed_syncs: int = 3):
+        self.control_plane_tool = control_plane_tool
+        self.inventory = inventory
+        self.store = store
+        self.interval_seconds = interval_seconds
+        self.full_sync_every = full_sync_every
+        self.page_size = page_size
+        self.max_failed_syncs = max(1, max_failed_syncs)
+        self.failed_syncs = 0
+        self._rounds = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"🗂️ 資源庫存同步已啟動 (每 {self.interval_seconds}s)")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def bootstrap(self) -> int:
+        loaded = 0
+        if self.store:
+            try:
+                loaded = self.inventory.upsert(await self.store.load())
+                logger.info(f"🗂️ 從快照載入 {loaded} 筆資源 (游標: {self.inventory.cursor})")
+            except Exception as e:
+                logger.warning(f"資源庫存快照載入失敗，改為完整同步: {e}")
+        return await self.sync(full=not loaded)
+
+    async def _run(self):
+        try:
+            await self.bootstrap()
+        except Exception as e:
+            logger.error(f"資源庫存初始同步失敗: {e}", exc_info=True)
+            self._record_failure()
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            self._rounds += 1
+            try:
+                await self.sync(full=self._rounds % self.full_sync_every == 0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"資源庫存同步失敗: {e}", exc_info=True)
+                self._record_failure()
+
+    def _record_failure(self):
+        self.failed_syncs += 1
+        if self.inventory.ready and self.failed_syncs >= self.max_failed_syncs:
+            self.inventory.ready = False
+            logger.warning(f"⚠️ 資源庫存連續 {self.failed_syncs} 次同步失敗，暫停以庫存回應查詢直到同步恢復")
+
+    async def _refresh_stale(self) -> int:
+        """重新抓取因快取失效而移出的資源；抓取失敗的留待下一輪"""
+        stale = sorted(self.inventory.stale)
+        if not stale:
+            return 0
+        result = await self.control_plane_tool.get_resources_bulk(stale)
+        if not result.success:
+            logger.warning(f"資源庫存重新抓取 {len(stale)} 筆失效資源失敗: {result.error.message if result.error else ''}")
+            return 0
+        # 已不存在的資源不再重試，由完整同步處理
+        self.inventory.stale.difference_update(result.data["missing"])
+        return self.inventory.upsert(result.data["resources"].values(), advance_cursor=False)
+
+    async def sync(self, full: bool = False) -> int:
+        """同步一次；回傳更新的資源數。同步不完整時不移除資源、不移動游標，也不寫入快照"""
+        params: Dict[str, Any] = {"page_size": self.page_size}
+        if not full and self.inventory.cursor:
+            params["updated_after"] = self.inventory.cursor
+
+        async def fetch_page(page: int):
+            return await self.control_plane_tool.fetch_resources_page({**params, "page": page})
+
+        async with PageIterator(fetch_page, max_items=None, prefetch=self.control_plane_tool.page_prefetch) as pages:
+            resources = [resource async for resource in pages]
+        complete = pages.error is None and not pages.truncated
+        if not complete:
+            logger.warning(f"⚠️ 資源庫存同步不完整 (已取得 {len(resources)} 筆): {pages.error.message if pages.error else '分頁結果筆數不足'}")
+
+        updated = self.inventory.upsert(resources, advance_cursor=False)
+        removed: List[str] = []
+        if complete:
+            self.inventory.advance_cursor(resources)
+            if full:
+                removed = self.inventory.remove(self.inventory.ids() - {resource["id"] for resource in resources})
+            self.failed_syncs = 0
+            self.inventory.ready = True
+        else:
+            self._record_failure()
+        updated += await self._refresh_stale()
+
+        if self.store and complete and (resources or removed):
+            try:
+                await self.store.save(resources, removed)
+            except Exception as e:
+                logger.warning(f"資源庫存快照寫入失敗: {e}")
+        if resources or removed:
+            logger.info(f"🗂️ 資源庫存{'完整' if full else '增量'}同步: 更新 {updated}、移除 {len(removed)}、共 {len(self.inventory)} 筆")
+        return updated
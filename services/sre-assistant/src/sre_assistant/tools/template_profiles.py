@@ -0,0 +1,239 @@
+# services/sre-assistant/src/sre_assistant/tools/template_profiles.py
+"""
+日誌模板頻率基線 (profile)
+背景工作依服務維護每個模板 ID 的每小時 / 每日計數，診斷時以 O(1) 查詢判斷錯誤是「新出現」還是「突增」
+"""
+
+import asyncio
+import structlog
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Optional, List, Tuple
+
+from .log_batch import to_unix_ns
+
+logger = structlog.get_logger(__name__)
+
+
+class TemplateProfileStore:
+    """
+    以 Redis hash 保存模板頻率
+
+    - `{prefix}:{namespace}:{service}:h:{YYYYMMDDHH}` → {template_id: count}，保留 `hourly_retention_hours`
+    - `{prefix}:{namespace}:{service}:d:{YYYYMMDD}` → {template_id: count}，保留 `daily_retention_days`
+    - `{prefix}:tracked` → 需要由背景工作維護基線的 "namespace/service" 集合
+    """
+
+    def __init__(self, redis_client, prefix: str = "loki:template_profile", hourly_retention_hours: int = 48, daily_retention_days: int = 14):
+        self.redis_client = redis_client
+        self.prefix = prefix
+        self.hourly_retention_hours = hourly_retention_hours
+        self.daily_retention_days = daily_retention_days
+
+    def _key(self, namespace: str, service: str, granularity: str, at: datetime) -> str:
+        bucket = at.strftime("%Y%m%d%H" if granularity == "h" else "%Y%m%d")
+        return f"{self.prefix}:{namespace or '-'}:{service or '-'}:{granularity}:{bucket}"
+
+    async def track(self, namespace: str, service: str):
+        """登記一個需要維護基線的服務"""
+        if not self.redis_client or not service:
+            return
+        try:
+            await self.redis_client.sadd(f"{self.prefix}:tracked", f"{namespace or ''}/{service}")
+        except Exception as e:
+            logger.warning(f"登記模板基線服務失敗: {e}")
+
+    async def tracked(self) -> List[Tuple[str, str]]:
+        if not self.redis_client:
+            return []
+        members = await self.redis_client.smembers(f"{self.prefix}:tracked")
+        result = []
+        for member in members or []:
+            namespace, _, service = (member.decode() if isinstance(member, bytes) else member).partition("/")
+            result.append((namespace, service))
+        return sorted(result)
+
+    async def record(self, namespace: str, service: str, counts: Dict[str, int], at: Optional[datetime] = None) -> bool:
+        """將一段時間內的模板計數累加到對應的小時與日分桶"""
+        if not self.redis_client or not counts:
+            return False
+        at = at or datetime.now(timezone.utc)
+        hourly, daily = self._key(namespace, service, "h", at), self._key(namespace, service, "d", at)
+        try:
+            pipe = self.redis_client.pipeline()
+            for template_id, count in counts.items():
+                pipe.hincrby(hourly, template_id, count)
+                pipe.hincrby(daily, template_id, count)
+            pipe.expire(hourly, self.hourly_retention_hours * 3600)
+            pipe.expire(daily, self.daily_retention_days * 86400)
+            await pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"模板基線寫入失敗: {e}")
+            return False
+
+    async def baseline(self, namespace: str, service: str, template_ids: List[str], days: int = 7, at: Optional[datetime] = None) -> Tuple[Dict[str, float], int]:
+        """
+        回傳 ({template_id: 平均每小時次數}, 涵蓋的小時數)
+
+        優先使用今天以前 `days` 天的日分桶；沒有任何日資料時退回最近 24 個完整小時的小時分桶。
+        每個分桶只需一次 HMGET，與日誌量無關。
+        """
+        if not self.redis_client or not template_ids:
+            return {}, 0
+        at = at or datetime.now(timezone.utc)
+        for granularity, buckets, hours_per_bucket in (("d", [at - timedelta(days=i) for i in range(1, days + 1)], 24), ("h", [at - timedelta(hours=i) for i in range(1, 25)], 1)):
+            pipe = self.redis_client.pipeline()
+            for bucket in buckets:
+                key = self._key(namespace, service, granularity, bucket)
+                pipe.exists(key)
+                pipe.hmget(key, template_ids)
+            replies = await pipe.execute()
+
+            covered, totals = 0, {template_id: 0 for template_id in template_ids}
+            for exists, values in zip(replies[0::2], replies[1::2]):
+                if not exists:
+                    continue
+                covered += 1
+                for template_id, value in zip(template_ids, values):
+                    if value:
+                        totals[template_id] += int(value)
+            if covered:
+                hours = covered * hours_per_bucket
+                return {template_id: total / hours for template_id, total in totals.items()}, hours
+        return {}, 0
+
+    async def score(self, namespace: str, service: str, counts: Dict[str, int], window_minutes: int, spike_ratio: float = 3.0, min_count: int = 5, at: Optional[datetime] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        為目前觀察到的模板計數評分：novel (基線中從未出現)、spiking (超過基線 `spike_ratio` 倍)、normal；沒有基線時為 unknown
+        """
+        if not counts:
+            return {}
+        try:
+            rates, covered_hours = await self.baseline(namespace, service, list(counts), at=at)
+        except Exception as e:
+            logger.warning(f"模板基線讀取失敗: {e}")
+            return {}
+
+        window_hours = max(window_minutes, 1) / 60
+        scores = {}
+        for template_id, count in counts.items():
+            if not covered_hours:
+                scores[template_id] = {"status": "unknown", "count": count}
+                continue
+            rate = rates.get(template_id, 0.0)
+            expected = rate * window_hours
+            if rate == 0:
+                status = "novel"
+            elif count >= min_count and count >= expected * spike_ratio:
+                status = "spiking"
+            else:
+                status = "normal"
+            scores[template_id] = {"status": status, "count": count, "baseline_per_hour": round(rate, 3), "expected": round(expected, 2), "ratio": round(count / expected, 2) if expected else None}
+        return scores
+
+
+class TemplateProfiler:
+    """
+    背景工作：每個週期為所有登記的服務抓取已完成週期的錯誤日誌，依模板計數後累加到基線
+
+    - 多副本部署時以 Redis `SET NX` 鎖定每個 (週期, 服務)，確保只會被記錄一次；處理失敗時釋放鎖定，
+      最近 `catch_up_periods` 個週期中尚未記錄的部分會在下一輪 (或其他副本) 補上
+    - 每個週期以每頁 `fetch_limit` 行往回分頁抓取；超過 `max_pages` 頁時依已涵蓋的時間比例換算計數
+    """
+
+    def __init__(self, loki_tool, store: TemplateProfileStore, interval_seconds: int = 3600, fetch_limit: int = 5000, max_pages: int = 20, catch_up_periods: int = 3):
+        self.loki_tool = loki_tool
+        self.store = store
+        self.interval_seconds = interval_seconds
+        self.fetch_limit = fetch_limit
+        self.max_pages = max(1, max_pages)
+        self.catch_up_periods = max(1, catch_up_periods)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"📈 模板基線背景工作已啟動 (每 {self.interval_seconds}s)")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"模板基線背景工作失敗: {e}", exc_info=True)
+            await asyncio.sleep(self.interval_seconds)
+
+    async def run_once(self, now: Optional[datetime] = None) -> int:
+        """記錄最近幾個完整週期中尚未被記錄的 (週期, 服務)；回傳本次記錄的數量"""
+        now = now or datetime.now(timezone.utc)
+        redis_client = self.store.redis_client
+        if not redis_client:
+            return 0
+
+        latest = int(now.timestamp()) // self.interval_seconds * self.interval_seconds
+        tracked = await self.store.tracked()
+        processed = 0
+        # 由舊到新，讓補記的週期與本週期依時間順序寫入
+        for periods_ago in range(self.catch_up_periods - 1, -1, -1):
+            epoch = latest - periods_ago * self.interval_seconds
+            end = datetime.fromtimestamp(epoch, tz=timezone.utc)
+            start = end - timedelta(seconds=self.interval_seconds)
+            for namespace, service in tracked:
+                if await self._record_period(namespace, service, epoch, start, end):
+                    processed += 1
+        if processed:
+            await self.loki_tool.template_store.save(self.loki_tool.template_miner, force=True)
+            logger.info(f"📈 已記錄 {processed} 個 (週期, 服務) 的模板基線 (截至 {datetime.fromtimestamp(latest, tz=timezone.utc).isoformat()})")
+        return processed
+
+    async def _record_period(self, namespace: str, service: str, epoch: int, start: datetime, end: datetime) -> bool:
+        redis_client = self.store.redis_client
+        claim_key = f"{self.store.prefix}:job:{epoch}:{namespace}/{service}"
+        claimed = await redis_client.set(claim_key, "1", nx=True, ex=self.interval_seconds * (self.catch_up_periods + 1))
+        if not claimed:
+            return False
+        try:
+            counts = await self._count_templates(namespace, service, start, end)
+            if not await self.store.record(namespace, service, counts, at=start) and counts:
+                raise RuntimeError("模板基線寫入失敗")
+            return True
+        except Exception as e:
+            logger.warning(f"模板基線記錄失敗 ({namespace}/{service} {start.isoformat()})，釋放鎖定待下次重試: {e}")
+            try:
+                await redis_client.delete(claim_key)
+            except Exception as release_error:
+                logger.warning(f"釋放模板基線鎖定失敗: {release_error}")
+            return False
+
+    async def _count_templates(self, namespace: str, service: str, start: datetime, end: datetime) -> Dict[str, int]:
+        """往回分頁抓取 [start, end) 的錯誤日誌並依模板計數"""
+        counts: Dict[str, int] = {}
+        # 分頁游標以整數奈秒保存，轉成 datetime 會截斷到微秒而重複計入或漏掉同一微秒內的行
+        start_ns, end_ns = to_unix_ns(start), to_unix_ns(end)
+        page_end_ns = end_ns
+        for page in range(1, self.max_pages + 1):
+            logs = await self.loki_tool._query_logs(service, namespace, "error", "", self.interval_seconds // 60, self.fetch_limit, start_time=start, end_time=end, end_ns=page_end_ns)
+            for message in logs.messages:
+                template_id = self.loki_tool.template_miner.add(message).template_id
+                counts[template_id] = counts.get(template_id, 0) + 1
+            if len(logs) < self.fetch_limit:
+                return counts
+            # Loki 的 end 不含邊界：下一頁從本頁最舊的一行往前接續
+            page_end_ns = min(logs.timestamps)
+            if page_end_ns <= start_ns:
+                return counts
+
+        covered = (end_ns - page_end_ns) / (end_ns - start_ns)
+        logger.warning(f"⚠️ 模板基線 {namespace}/{service} 在 {self.max_pages} 頁內未抓完，依涵蓋比例 {covered:.0%} 換算計數")
+        return {template_id: round(count / covered) for template_id, count in counts.items()}
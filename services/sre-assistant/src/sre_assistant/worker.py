@@ -0,0 +1,93 @@
+# services/sre-assistant/src/sre_assistant/worker.py
+"""
+診斷 worker 程序
+從 Redis Stream 任務佇列讀取 API 排入的診斷任務並執行 SREWorkflow。
+可獨立於 API 水平擴展：每個程序以 performance.background_workers 為並行度，
+多個程序共用同一個消費者群組。每個程序依優先級權重從各優先級 stream 預取最多
+task_queue.prefetch 個任務，並依優先級與呼叫端以加權公平排程決定執行順序
+"""
+
+import asyncio
+import os
+import signal
+import socket
+import uuid
+import httpx
+import redis.asyncio as redis
+import structlog
+from prometheus_client import start_http_server
+
+from .dependencies import config_manager
+from .contracts import DiagnosticStatus
+from .observability import configure_logging, init_tracer
+from .task_queue import DiagnosisTaskQueue, DiagnosisWorker
+from .scheduler import WeightedFairScheduler
+from .workflow import SREWorkflow, SREWorkflowRequest
+
+logger = structlog.get_logger(__name__)
+
+
+async def run_worker():
+    config = config_manager.get_config()
+    queue_config = config.get("task_queue", {})
+    performance = config.get("performance", {})
+
+    redis_client = redis.from_url(config.redis.url, encoding="utf-8", decode_responses=True)
+    await redis_client.ping()
+    transport = httpx.AsyncHTTPTransport(retries=3)
+    limits = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+    http_client = httpx.AsyncClient(transport=transport, limits=limits, http2=True)
+    workflow = SREWorkflow(config, redis_client, http_client)
+    init_tracer(config, logger)
+    # worker 沒有 HTTP API，另開埠匯出等待時間等指標
+    metrics_port = queue_config.get("metrics_port", 9108)
+    if metrics_port:
+        start_http_server(metrics_port)
+
+    async def handle(session_id: uuid.UUID, request: SREWorkflowRequest, request_type: str):
+        # 重新交付時狀態可能停在上一次執行的中途，從頭開始
+        status = DiagnosticStatus(session_id=session_id, status="processing", progress=10, current_step=f"開始執行 {request_type} 工作流程")
+        await redis_client.set(str(session_id), status.model_dump_json(), ex=86400)
+        await workflow.execute(session_id, request, request_type)
+
+    queue = DiagnosisTaskQueue(
+        redis_client,
+        stream=queue_config.get("stream", "sre:diagnostics"),
+        group=queue_config.get("group", "sre-workers"),
+        dead_letter_stream=queue_config.get("dead_letter_stream", "sre:diagnostics:dead"),
+    )
+    background_workers = performance.get("background_workers", 4)
+    scheduler = WeightedFairScheduler(
+        background_workers,
+        weights=performance.get("priority_weights", {}),
+        p0_reserved_slots=performance.get("p0_reserved_slots", 1),
+    )
+    worker = DiagnosisWorker(
+        queue,
+        handle,
+        consumer=f"{socket.gethostname()}-{os.getpid()}",
+        concurrency=queue_config.get("prefetch", background_workers * 2),
+        scheduler=scheduler,
+        visibility_timeout=queue_config.get("visibility_timeout_seconds", 300),
+        max_deliveries=queue_config.get("max_deliveries", 3),
+    )
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, worker.stop)
+
+    try:
+        await worker.run()
+    finally:
+        await workflow.control_plane_tool.execution_tracker.stop()
+        await http_client.aclose()
+        await redis_client.close()
+
+
+def main():
+    configure_logging()
+    asyncio.run(run_worker())
+
+
+if __name__ == "__main__":
+    main()
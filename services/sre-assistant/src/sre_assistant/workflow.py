@@ -4,7 +4,6 @@ SRE 工作流程協調器 (已重構以支援非同步任務)
 """
 
 import asyncio
-import functools
 import re
 import structlog
 import uuid
@@ -24,14 +23,18 @@ from .contracts import (
     CapacityAnalysisRequest,
     ExecuteRequest,
     CapacityAnalysisResponse,
+    BulkRemediationRequest,
 )
 
 from .tools.prometheus_tool import PrometheusQueryTool
 from .tools.loki_tool import LokiLogQueryTool
 from .tools.control_plane_tool import ControlPlaneTool
+from .tools.bulk_remediation import BulkRemediationExecutor, BulkRemediationProgress
+from .workflow_dag import DagNode, DagRun, DagScheduler, WorkflowDefinition
+from .pii_scrubber import scrubber_from_config
 
 # Define a union type for all possible request models
-SREWorkflowRequest = Union[DiagnosticRequest, AlertAnalysisRequest, CapacityAnalysisRequest, ExecuteRequest]
+SREWorkflowRequest = Union[DiagnosticRequest, AlertAnalysisRequest, CapacityAnalysisRequest, ExecuteRequest, BulkRemediationRequest]
 
 logger = structlog.get_logger(__name__)
 
@@ -55,14 +58,83 @@ class SREWorkflow:
 
         # 將共享的客戶端和 redis_client 傳遞給工具
         self.prometheus_tool = PrometheusQueryTool(config, self.http_client, self.redis_client)
-        self.loki_tool = LokiLogQueryTool(config, self.http_client)
+        self.loki_tool = LokiLogQueryTool(config, self.http_client, self.redis_client)
         self.control_plane_tool = ControlPlaneTool(config, self.http_client, self.redis_client)
         self.parallel_diagnosis = config.workflow.get("parallel_diagnosis", True)
         self.diagnosis_timeout = config.workflow.get("diagnosis_timeout_seconds", 120)
         self.max_retries = config.workflow.get("max_retries", 2)  # 2 retries = 3 total attempts
         self.retry_delay = config.workflow.get("retry_delay_seconds", 1)
+        # compliance.pii_detection 啟用時，證據寫入狀態儲存前先遮罩個資
+        self.pii_scrubber = scrubber_from_config(config)
+        # 以 DAG 宣告的工作流程：節點在輸入完成後立即啟動，受單一節點逾時與全域並行上限約束
+        self.node_timeouts = config.workflow.get("node_timeouts", {})
+        self.dag_scheduler = DagScheduler(max_parallelism=config.workflow.get("max_parallelism", 4))
+        # 單一節點內對多個資源的扇出查詢上限 (例如容量分析的飽和度查詢)
+        self.fanout_concurrency = config.workflow.get("fanout_concurrency", 10)
+        self.definitions = self._build_definitions()
         logger.info("✅ SRE 工作流程初始化完成")
     
+    def _build_definitions(self) -> Dict[str, WorkflowDefinition]:
+        """宣告所有 DAG 工作流程 (同時作為 /api/v1/workflows/templates 的模板)"""
+        definitions = [
+            WorkflowDefinition(
+                id="deployment_diagnosis",
+                name="部署問題診斷",
+                description="分析部署失敗或應用程式啟動異常問題。",
+                parameters=[{"name": "service", "type": "string"}],
+                nodes=[
+                    self._tool_node("prometheus", lambda p: self.prometheus_tool.execute({"service": p["service"]}), "查詢服務的黃金指標"),
+                    self._tool_node("loki", lambda p: self.loki_tool.execute({"service": p["service"], "caller": "diagnose_deployment"}), "分析服務錯誤日誌"),
+                    self._tool_node("audit", lambda p: self.control_plane_tool.query_all_audit_logs({"resource_type": "deployment", "search": p["service"]}), "查詢部署審計日誌"),
+                    self._tool_node("incidents", lambda p: self.control_plane_tool.query_all_incidents({"search": p["service"], "status": "new,acknowledged"}), "查詢未結事件"),
+                ],
+            ),
+            WorkflowDefinition(
+                id="capacity_analysis",
+                name="容量分析",
+                description="依資源查詢飽和度指標並提出擴縮容建議。",
+                parameters=[{"name": "resource_ids", "type": "list"}],
+                nodes=[
+                    self._tool_node("resources", lambda p: self.control_plane_tool.get_resources_bulk(p["resource_ids"]), "批次取得資源詳情 (服務名稱)"),
+                    DagNode("saturation", self._query_saturation, depends_on=("resources",), timeout_seconds=self._node_timeout("saturation"), description="並行查詢每個資源的飽和度指標"),
+                ],
+            ),
+        ]
+        return {definition.id: definition for definition in definitions}
+
+    def _node_timeout(self, name: str) -> Optional[float]:
+        """節點逾時：workflow.node_timeouts 中的設定，否則為所有重試嘗試的總時間"""
+        timeouts = self.node_timeouts if isinstance(self.node_timeouts, dict) else {}
+        if name in timeouts:
+            return timeouts[name]
+        return self.diagnosis_timeout * (self.max_retries + 1) + self.retry_delay * (2 ** self.max_retries)
+
+    def _tool_node(self, name: str, call, description: str) -> DagNode:
+        """以重試包裝單一工具呼叫的節點"""
+        async def run(params: Dict[str, Any], inputs: Dict[str, Any]) -> Any:
+            return await self._run_task_with_retry(name, lambda: call(params))
+        return DagNode(name, run, timeout_seconds=self._node_timeout(name), description=description)
+
+    def templates(self) -> List[Dict[str, Any]]:
+        return [definition.to_template() for definition in self.definitions.values()]
+
+    async def _run_dag(self, session_id: uuid.UUID, workflow_id: str, params: Dict[str, Any]) -> DagRun:
+        dag_run = await self.dag_scheduler.run(self.definitions[workflow_id], params)
+        logger.info(f"🧭 [Session: {session_id}] {workflow_id} 節點耗時: {dag_run.timings()}")
+        return dag_run
+
+    @staticmethod
+    def _tool_results(dag_run: DagRun) -> Dict[str, ToolResult]:
+        """將節點結果轉為 ToolResult；失敗或逾時的節點轉為錯誤結果"""
+        results = {}
+        for name, run in dag_run.nodes.items():
+            if run.status == "success":
+                results[name] = run.result
+            else:
+                error_code = "TOOL_TIMEOUT_ERROR" if run.status == "timeout" or isinstance(run.error, asyncio.TimeoutError) else "TOOL_EXECUTION_ERROR"
+                results[name] = ToolResult(success=False, error=ToolError(code=error_code, message=str(run.error or run.status)))
+        return results
+
     async def _get_task_status(self, session_id: uuid.UUID) -> Optional[DiagnosticStatus]:
         """Helper to get task status from Redis."""
         task_json = await self.redis_client.get(str(session_id))
@@ -96,6 +168,8 @@ class SREWorkflow:
                 result_data = await self._execute_query(session_id, request, status)
             elif request_type == "capacity_analysis" and isinstance(request, CapacityAnalysisRequest):
                 result_data = await self._analyze_capacity(session_id, request, status)
+            elif request_type == "bulk_remediation" and isinstance(request, BulkRemediationRequest):
+                result_data = await self._bulk_remediate(session_id, request, status)
             else:
                 raise ValueError(f"未知的請求類型或請求與類型不匹配: {request_type}")
 
@@ -104,7 +178,7 @@ class SREWorkflow:
             final_status = await self._get_task_status(session_id)
             if final_status:
                 if isinstance(result_data, DiagnosticResult):
-                    final_status.result = result_data
+                    final_status.result = self._scrub_result(result_data)
                     final_status.result.execution_time = execution_time
                 # Note: CapacityAnalysisResponse is a direct return, not part of DiagnosticStatus
                 final_status.status = "completed"
@@ -122,6 +196,15 @@ class SREWorkflow:
                 final_status.error = f"工作流程發生未預期錯誤: {e}"
                 await self._update_task_status(session_id, final_status)
     
+    def _scrub_result(self, result: DiagnosticResult) -> DiagnosticResult:
+        """遮罩發現中的個資 (僅在 compliance.pii_detection 啟用時)"""
+        if not self.pii_scrubber.enabled:
+            return result
+        for finding in result.findings:
+            finding.message = self.pii_scrubber.scrub(finding.message)
+            finding.evidence = self.pii_scrubber.scrub_evidence(finding.evidence)
+        return result
+    
     async def _diagnose_deployment(self, session_id: uuid.UUID, request: DiagnosticRequest, status: DiagnosticStatus) -> DiagnosticResult:
         """
         診斷部署問題
@@ -132,18 +215,12 @@ class SREWorkflow:
         status.progress = 20
         await self._update_task_status(session_id, status)
         
-        tool_tasks = [
-            ("prometheus", functools.partial(self.prometheus_tool.execute, {"service": request.affected_services[0]})),
-            ("loki", functools.partial(self.loki_tool.execute, {"service": request.affected_services[0]})),
-            ("audit", functools.partial(self.control_plane_tool.query_audit_logs, {"resource_type": "deployment", "search": request.affected_services[0]})),
-            ("incidents", functools.partial(self.control_plane_tool.query_incidents, {"search": request.affected_services[0], "status": "new,acknowledged"}))
-        ]
-        
         status.current_step = "並行執行診斷工具 (含重試)"
         status.progress = 50
         await self._update_task_status(session_id, status)
 
-        results = await self._execute_parallel_tasks(tool_tasks)
+        dag_run = await self._run_dag(session_id, "deployment_diagnosis", {"service": request.affected_services[0]})
+        results = self._tool_results(dag_run)
         
         status.current_step = "分析診斷結果"
         status.progress = 80
@@ -178,27 +255,6 @@ class SREWorkflow:
                     )
                     raise last_exception
 
-    async def _execute_parallel_tasks(self, tool_tasks: List[tuple]) -> Dict[str, ToolResult]:
-        """
-        並行執行多個異步診斷工具任務。
-        """
-        results = {}
-
-        tasks_to_gather = [
-            self._run_task_with_retry(name, coro_factory) for name, coro_factory in tool_tasks
-        ]
-
-        task_results = await asyncio.gather(*tasks_to_gather, return_exceptions=True)
-        
-        for i, (name, _) in enumerate(tool_tasks):
-            result = task_results[i]
-            if isinstance(result, Exception):
-                error_code = "TOOL_TIMEOUT_ERROR" if isinstance(result, asyncio.TimeoutError) else "TOOL_EXECUTION_ERROR"
-                results[name] = ToolResult(success=False, error=ToolError(code=error_code, message=str(result)))
-            else:
-                results[name] = result
-        return results
-    
     def _analyze_deployment_results(self, results: Dict[str, ToolResult]) -> DiagnosticResult:
         """分析部署診斷結果"""
         all_findings = []
@@ -219,18 +275,22 @@ class SREWorkflow:
             critical_indicators = analysis.get("critical_indicators")
             if critical_indicators:
                 all_findings.append(Finding(source="Loki", severity="critical", message=f"發現嚴重日誌指標: {', '.join(critical_indicators)}", evidence=logs))
+            novelty = analysis.get("novelty") or {}
+            changed = novelty.get("novel", []) + novelty.get("spiking", [])
+            if changed:
+                all_findings.append(Finding(source="Loki", severity="warning", message=f"與基線相比有 {len(novelty.get('novel', []))} 個新出現、{len(novelty.get('spiking', []))} 個突增的錯誤模板", evidence=novelty))
 
         if "audit" in results and results["audit"].success:
             tools_used.append("ControlPlaneTool (Audit)")
             audit = results["audit"].data
-            if audit.get("logs"):
-                all_findings.append(Finding(source="Control-Plane", severity="info", message=f"發現 {len(audit['logs'])} 筆相關審計日誌。", evidence=audit))
+            if audit.get("items"):
+                all_findings.append(Finding(source="Control-Plane", severity="info", message=f"發現 {len(audit['items'])} 筆相關審計日誌。", evidence=audit))
 
         if "incidents" in results and results["incidents"].success:
             tools_used.append("ControlPlaneTool (Incidents)")
             incidents = results["incidents"].data
-            if incidents.get("incidents"):
-                all_findings.append(Finding(source="Control-Plane", severity="warning", message=f"發現 {len(incidents['incidents'])} 件相關的活躍事件。", evidence=incidents))
+            if incidents.get("items"):
+                all_findings.append(Finding(source="Control-Plane", severity="warning", message=f"發現 {len(incidents['items'])} 件相關的活躍事件。", evidence=incidents))
 
         if all_findings:
             summary = f"診斷完成，共發現 {len(all_findings)} 個問題點。"
@@ -259,50 +319,54 @@ class SREWorkflow:
             # 雖然 API 契約要求至少一個 ID，但還是做個防禦性檢查
             raise ValueError("CapacityAnalysisRequest 中必須至少提供一個 resource_id。")
 
-        # 暫時只處理第一個 resource_id
-        resource_id = request.resource_ids[0]
-
-        # 1. 從 Control Plane 獲取資源詳情，以得到服務名稱
-        resource_details_result = await self.control_plane_tool.get_resource_details(resource_id)
-        if not resource_details_result.success:
-            logger.error(f"無法獲取資源詳情 {resource_id}: {resource_details_result.error.message}")
-            # 這裡可以根據錯誤類型決定是否要拋出異常或回傳一個錯誤的回應
-            # 為了簡單起見，我們直接拋出異常，讓外層的 try-except 捕捉
-            raise Exception(f"獲取資源 {resource_id} 詳情失敗。")
-
-        service_name = resource_details_result.data.get("name")
-        if not service_name:
-            raise ValueError(f"資源 {resource_id} 的詳細資料中缺少 'name' 欄位。")
-
-        # 2. 使用服務名稱從 Prometheus 查詢飽和度指標
-        prometheus_params = {"service": service_name, "metric_type": "saturation"}
-        saturation_result = await self.prometheus_tool.execute(prometheus_params)
-        if not saturation_result.success:
-            logger.error(f"無法獲取服務 {service_name} 的飽和度指標: {saturation_result.error.message}")
-            raise Exception(f"獲取服務 {service_name} 的飽和度指標失敗。")
-
-        metrics = saturation_result.data
+        # 1-2. 以 DAG 執行：批次取得資源詳情 (服務名稱) → 並行查詢每個資源的飽和度指標
+        dag_run = await self._run_dag(session_id, "capacity_analysis", {"resource_ids": request.resource_ids})
+        for name in ("resources", "saturation"):
+            error = dag_run.nodes[name].error
+            if error is not None:
+                raise error
+        targets, saturation_results = dag_run.result("saturation")
 
         # 3. 進行簡單的分析和預測
         # 注意：這是一個非常簡化的模型，真實世界中會使用更複雜的時間序列預測演算法
-        cpu_usage = float(metrics.get("cpu_usage", "0%").strip('%'))
-        mem_usage = float(metrics.get("memory_usage", "0%").strip('%'))
-
         recommendations = []
-        if cpu_usage > 85.0:
-            recommendations.append({
-                "type": "scale_up",
-                "resource": resource_id,
-                "priority": "high",
-                "reasoning": f"當前 CPU 使用率 ({cpu_usage:.1f}%) 已超過 85% 的閾值。"
-            })
-        if mem_usage > 85.0:
-            recommendations.append({
-                "type": "scale_up",
-                "resource": resource_id,
-                "priority": "high",
-                "reasoning": f"當前記憶體使用率 ({mem_usage:.1f}%) 已超過 85% 的閾值。"
-            })
+        cpu_values, mem_values = [], []
+        failed = {}
+        for (resource_id, service_name), saturation_result in zip(targets, saturation_results):
+            if not saturation_result.success:
+                message = saturation_result.error.message if saturation_result.error else "unknown error"
+                logger.error(f"無法獲取資源 {resource_id} ({service_name}) 的飽和度指標: {message}")
+                failed[resource_id] = message
+                continue
+
+            metrics = saturation_result.data
+            cpu_usage = float(metrics.get("cpu_usage", "0%").strip('%'))
+            mem_usage = float(metrics.get("memory_usage", "0%").strip('%'))
+            cpu_values.append(cpu_usage)
+            mem_values.append(mem_usage)
+
+            if cpu_usage > 85.0:
+                recommendations.append({
+                    "type": "scale_up",
+                    "resource": resource_id,
+                    "priority": "high",
+                    "reasoning": f"當前 CPU 使用率 ({cpu_usage:.1f}%) 已超過 85% 的閾值。"
+                })
+            if mem_usage > 85.0:
+                recommendations.append({
+                    "type": "scale_up",
+                    "resource": resource_id,
+                    "priority": "high",
+                    "reasoning": f"當前記憶體使用率 ({mem_usage:.1f}%) 已超過 85% 的閾值。"
+                })
+
+        if not cpu_values:
+            raise Exception(f"所有資源的飽和度指標都無法取得: {failed}")
+        if failed:
+            logger.warning(f"⚠️ [Session: {session_id}] 以下資源的飽和度指標無法取得，已排除於分析之外: {sorted(failed)}")
+
+        # 多個資源時，以最吃緊的資源代表整體使用情況
+        cpu_usage, mem_usage = max(cpu_values), max(mem_values)
 
         # 4. 建立並回傳回應
         return CapacityAnalysisResponse(
@@ -311,6 +375,39 @@ class SREWorkflow:
             recommendations=recommendations
         )
 
+    async def _query_saturation(self, params: Dict[str, Any], inputs: Dict[str, Any]) -> tuple:
+        """capacity_analysis 的 saturation 節點：依 resources 節點取得的服務名稱並行查詢飽和度指標"""
+        resource_ids = params["resource_ids"]
+        resources_result: ToolResult = inputs["resources"]
+        if not resources_result.success:
+            logger.error(f"無法獲取資源詳情 {resource_ids}: {resources_result.error.message}")
+            raise Exception(f"獲取資源 {resource_ids} 詳情失敗。")
+
+        resources = resources_result.data.get("resources", {})
+        missing = resources_result.data.get("missing", [])
+        if missing:
+            logger.warning(f"⚠️ 以下資源無法取得詳情，將略過: {missing}")
+        targets = [(resource_id, resources[resource_id].get("name")) for resource_id in resource_ids if resource_id in resources]
+        if not targets:
+            raise Exception(f"獲取資源 {resource_ids} 詳情失敗。")
+
+        # 以有限並行度查詢；單一資源失敗 (包含例外) 只記錄為該資源的錯誤結果，不中斷整個分析
+        semaphore = asyncio.Semaphore(max(1, self.fanout_concurrency))
+
+        async def query(service_name: Optional[str]) -> ToolResult:
+            if not service_name:
+                raise ValueError("資源的詳細資料中缺少 'name' 欄位。")
+            async with semaphore:
+                return await self.prometheus_tool.execute({"service": service_name, "metric_type": "saturation"})
+
+        outcomes = await asyncio.gather(*(query(service_name) for _, service_name in targets), return_exceptions=True)
+        saturation_results = [
+            ToolResult(success=False, error=ToolError(code="SATURATION_QUERY_FAILED", message=f"{type(outcome).__name__}: {outcome}"))
+            if isinstance(outcome, BaseException) else outcome
+            for outcome in outcomes
+        ]
+        return targets, saturation_results
+
     async def _diagnose_alerts(self, session_id: uuid.UUID, request: AlertAnalysisRequest, status: DiagnosticStatus) -> DiagnosticResult:
         """
         診斷告警問題
@@ -318,6 +415,49 @@ class SREWorkflow:
         logger.info(f"🔍 [Session: {session_id}] 開始診斷告警: {request.alert_ids}")
         return DiagnosticResult(summary="告警分析功能尚未完全實作。", findings=[], recommended_actions=[])
 
+    async def _bulk_remediate(self, session_id: uuid.UUID, request: BulkRemediationRequest, status: DiagnosticStatus) -> DiagnosticResult:
+        """
+        分波次將自動化腳本套用到多個資源，並將彙整進度寫入會話狀態
+        """
+        logger.info(f"🛠️ [Session: {session_id}] 大量修復: {request.script_id} → {len(request.target_resources)} 個資源")
+        settings = self.config.control_plane
+        executor = BulkRemediationExecutor(
+            self.control_plane_tool,
+            concurrency=request.concurrency or settings.get("bulk_concurrency", 5),
+            wave_size=request.wave_size or settings.get("bulk_wave_size", 50),
+            resources_per_call=settings.get("bulk_resources_per_call", 10),
+            max_failures=request.max_failures,
+            max_failure_ratio=request.max_failure_ratio if request.max_failure_ratio is not None else settings.get("bulk_max_failure_ratio", 0.2),
+            execution_timeout=settings.get("bulk_execution_timeout_seconds", 900),
+        )
+
+        async def publish(progress: BulkRemediationProgress):
+            # 進度 0-95%，最後 5% 保留給結果整理
+            status.progress = min(95, progress.percent * 95 // 100)
+            status.current_step = (
+                f"第 {progress.current_wave}/{progress.total_waves} 波: "
+                f"成功 {len(progress.succeeded)}、失敗 {len(progress.failed)}、略過 {len(progress.skipped)} / 共 {progress.total}"
+            )
+            await self._update_task_status(session_id, status)
+
+        progress = await executor.run(request.script_id, request.target_resources, request.parameters, dry_run=request.dry_run, on_progress=publish)
+
+        findings = [Finding(source="Control Plane", severity="info", message="大量修復彙整結果", evidence=progress.to_dict())]
+        findings += [
+            Finding(source="Control Plane", severity="critical", message=f"資源 {resource_id} 執行 {request.script_id} 失敗: {error}", evidence={"resource_id": resource_id})
+            for resource_id, error in progress.failed.items()
+        ]
+        if progress.stopped_reason:
+            findings.append(Finding(source="Control Plane", severity="warning", message=f"大量修復提前停止: {progress.stopped_reason}", evidence={"skipped": progress.skipped}))
+        mode = "模擬執行" if request.dry_run else "執行"
+        return DiagnosticResult(
+            summary=f"{mode} {request.script_id}: 成功 {len(progress.succeeded)}、失敗 {len(progress.failed)}、略過 {len(progress.skipped)} (共 {progress.total} 個資源)",
+            findings=findings,
+            recommended_actions=[f"檢查失敗的資源後重新執行: {', '.join(list(progress.failed)[:10])}"] if progress.failed else [],
+            tools_used=["ControlPlaneTool"],
+            execution_plan=[f"第 {index + 1} 波" for index in range(progress.total_waves)],
+        )
+
     def _parse_natural_language_query(self, query: str) -> tuple[Optional[str], Optional[str], Optional[dict]]:
         """
         一個簡單的自然語言查詢解析器。
@@ -342,7 +482,7 @@ class SREWorkflow:
 
         for keyword in loki_keywords:
             if keyword in query:
-                return "loki", service_name, {"service": service_name, "query": "error"} # 簡化查詢
+                return "loki", service_name, {"service": service_name, "query": "error", "caller": "execute_query"} # 簡化查詢
 
         for keyword in control_plane_keywords:
             if keyword in query:
@@ -0,0 +1,212 @@
+# services/sre-assistant/src/sre_assistant/workflow_dag.py
+"""
+以 DAG 宣告的工作流程與排程器
+工作流程由工具節點與明確的資料相依組成；排程器在節點的所有輸入完成後立即啟動它，
+並套用單一節點逾時與全域並行上限，執行結束後回報每個節點的耗時與關鍵路徑
+"""
+
+import asyncio
+import time
+import structlog
+from dataclasses import dataclass, field
+from typing import Dict, Any, Optional, List, Callable, Awaitable, Tuple
+
+logger = structlog.get_logger(__name__)
+
+# 節點函式: (工作流程參數, {相依節點名稱: 結果}) -> 節點結果
+NodeFunc = Callable[[Dict[str, Any], Dict[str, Any]], Awaitable[Any]]
+
+
+@dataclass(frozen=True)
+class DagNode:
+    """
+    工作流程中的一個節點
+
+    - depends_on: 需要其結果的上游節點；上游失敗或被略過時，此節點被略過
+    - timeout_seconds: 單一節點逾時 (None 表示使用排程器預設值)
+    """
+    name: str
+    run: NodeFunc
+    depends_on: Tuple[str, ...] = ()
+    timeout_seconds: Optional[float] = None
+    description: str = ""
+
+
+@dataclass
+class WorkflowDefinition:
+    """一個以 DAG 宣告的工作流程，同時作為 /api/v1/workflows/templates 的模板來源"""
+    id: str
+    name: str
+    description: str
+    nodes: List[DagNode]
+    parameters: List[Dict[str, Any]] = field(default_factory=list)
+
+    def __post_init__(self):
+        self._by_name = {node.name: node for node in self.nodes}
+        if len(self._by_name) != len(self.nodes):
+            raise ValueError(f"工作流程 {self.id} 有重複的節點名稱")
+        for node in self.nodes:
+            unknown = [dep for dep in node.depends_on if dep not in self._by_name]
+            if unknown:
+                raise ValueError(f"工作流程 {self.id} 的節點 {node.name} 相依於不存在的節點: {unknown}")
+        self.topological_order()
+
+    def node(self, name: str) -> DagNode:
+        return self._by_name[name]
+
+    def dependents(self, name: str) -> List[DagNode]:
+        return [node for node in self.nodes if name in node.depends_on]
+
+    def topological_order(self) -> List[str]:
+        """回傳拓撲排序；有環時拋出 ValueError"""
+        remaining = {node.name: set(node.depends_on) for node in self.nodes}
+        order = []
+        while remaining:
+            ready = sorted(name for name, deps in remaining.items() if not deps)
+            if not ready:
+                raise ValueError(f"工作流程 {self.id} 存在循環相依: {sorted(remaining)}")
+            for name in ready:
+                order.append(name)
+                del remaining[name]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+        return order
+
+    def to_template(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "description": self.description,
+            "parameters": self.parameters,
+            "nodes": [
+                {"name": node.name, "depends_on": list(node.depends_on), "timeout_seconds": node.timeout_seconds, "description": node.description}
+                for node in self.nodes
+            ],
+        }
+
+
+@dataclass
+class NodeRun:
+    """單一節點的執行紀錄 (時間為相對於工作流程開始的秒數)"""
+    name: str
+    status: str = "pending"  # pending / success / failed / timeout / skipped
+    result: Any = None
+    error: Optional[BaseException] = None
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def duration(self) -> Optional[float]:
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+
+@dataclass
+class DagRun:
+    """一次工作流程執行的結果"""
+    workflow_id: str
+    nodes: Dict[str, NodeRun]
+    total_seconds: float = 0.0
+    critical_path: List[str] = field(default_factory=list)
+
+    def succeeded(self, name: str) -> bool:
+        return self.nodes[name].status == "success"
+
+    def result(self, name: str) -> Any:
+        return self.nodes[name].result
+
+    def timings(self) -> Dict[str, Any]:
+        return {
+            "total_seconds": round(self.total_seconds, 3),
+            "critical_path": self.critical_path,
+            "nodes": {name: {"status": run.status, "duration": round(run.duration, 3) if run.duration is not None else None} for name, run in self.nodes.items()},
+        }
+
+
+class DagScheduler:
+    """
+    DAG 排程器
+
+    所有沒有未完成輸入的節點都會被啟動，但同時執行的節點數不超過 `max_parallelism`。
+    節點失敗 / 逾時不會中斷其他分支，只會使其下游節點被略過。
+    """
+
+    def __init__(self, max_parallelism: int = 4, default_timeout: Optional[float] = None):
+        self.max_parallelism = max(1, max_parallelism)
+        self.default_timeout = default_timeout
+
+    async def run(self, definition: WorkflowDefinition, params: Optional[Dict[str, Any]] = None) -> DagRun:
+        params = params or {}
+        runs = {node.name: NodeRun(node.name) for node in definition.nodes}
+        dag_run = DagRun(definition.id, runs)
+        started = time.monotonic()
+        waiting = {node.name: set(node.depends_on) for node in definition.nodes}
+        ready = [name for name in definition.topological_order() if not waiting[name]]
+        running: Dict[asyncio.Task, str] = {}
+
+        def settle(name: str):
+            """節點結束後解除下游的相依；上游未成功時遞迴略過下游"""
+            for dependent in definition.dependents(name):
+                if runs[dependent.name].status != "pending":
+                    continue
+                if runs[name].status != "success":
+                    runs[dependent.name].status = "skipped"
+                    settle(dependent.name)
+                    continue
+                waiting[dependent.name].discard(name)
+                if not waiting[dependent.name]:
+                    ready.append(dependent.name)
+
+        try:
+            while ready or running:
+                while ready and len(running) < self.max_parallelism:
+                    name = ready.pop(0)
+                    node = definition.node(name)
+                    runs[name].status = "running"
+                    runs[name].started_at = time.monotonic() - started
+                    inputs = {dep: runs[dep].result for dep in node.depends_on}
+                    timeout = node.timeout_seconds if node.timeout_seconds is not None else self.default_timeout
+                    running[asyncio.create_task(asyncio.wait_for(node.run(params, inputs), timeout=timeout))] = name
+
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = running.pop(task)
+                    run = runs[name]
+                    run.finished_at = time.monotonic() - started
+                    try:
+                        run.result = task.result()
+                        run.status = "success"
+                    except asyncio.TimeoutError as e:
+                        run.status, run.error = "timeout", e
+                        logger.warning(f"⏱️ 工作流程 {definition.id} 節點 {name} 逾時")
+                    except Exception as e:
+                        run.status, run.error = "failed", e
+                        logger.warning(f"⚠️ 工作流程 {definition.id} 節點 {name} 失敗: {e}")
+                    settle(name)
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+        dag_run.total_seconds = time.monotonic() - started
+        dag_run.critical_path = self._critical_path(definition, runs)
+        logger.info(f"🧭 工作流程 {definition.id} 完成 ({dag_run.total_seconds:.2f}s)，關鍵路徑: {' → '.join(dag_run.critical_path)}")
+        return dag_run
+
+    @staticmethod
+    def _critical_path(definition: WorkflowDefinition, runs: Dict[str, NodeRun]) -> List[str]:
+        """從最後結束的節點開始，沿著最晚結束的上游節點回溯"""
+        finished = [run for run in runs.values() if run.finished_at is not None]
+        if not finished:
+            return []
+        current = max(finished, key=lambda run: run.finished_at)
+        path = [current.name]
+        while True:
+            upstream = [runs[dep] for dep in definition.node(current.name).depends_on if runs[dep].finished_at is not None]
+            if not upstream:
+                break
+            current = max(upstream, key=lambda run: run.finished_at)
+            path.append(current.name)
+        return list(reversed(path))
@@ -0,0 +1,305 @@
+"""
+測試共用的記憶體 Redis 與 ControlPlaneTool 建立方式
+"""
+
+import asyncio
+import json
+import time
+import httpx
+import pytest
+from redis.exceptions import WatchError
+from unittest.mock import MagicMock
+
+from sre_assistant import task_queue
+from sre_assistant.tools import cache_invalidation, control_plane_tool
+from sre_assistant.tools.control_plane_tool import ControlPlaneTool
+
+BASE_URL = "http://mock-control-plane"
+
+
+class InMemoryRedis:
+    """
+    僅實作測試所需指令的記憶體 Redis (字串、集合、雜湊、有序集合、TTL、pub/sub 發布與每個 stream 一個消費者群組的 Stream)
+
+    pipeline() 依序記錄指令，execute() 時才逐一套用；WATCH 後的指令立即執行直到 multi()，
+    被 WATCH 的鍵在 execute() 前被改寫時拋出 WatchError，與 redis-py 的行為相同。
+    """
+
+    def __init__(self):
+        self.strings, self.sets, self.hashes, self.zsets, self.ttls = {}, {}, {}, {}, {}
+        self.versions = {}
+        self.published = []
+        self.streams, self.pending, self.delivered, self.counter = {}, {}, set(), 0
+
+    def pipeline(self, transaction: bool = True):
+        return _Pipeline(self)
+
+    # --- 字串 / 鍵 ---
+
+    async def get(self, key):
+        return self.strings.get(key)
+
+    async def mget(self, keys):
+        return [self.strings.get(key) for key in keys]
+
+    async def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.strings:
+            return None
+        self.strings[key] = value
+        self.ttls[key] = ex
+        self._touch(key)
+        return True
+
+    async def delete(self, *keys):
+        deleted = 0
+        for key in keys:
+            found = [store.pop(key, None) is not None for store in (self.strings, self.sets, self.hashes, self.zsets)]
+            self.ttls.pop(key, None)
+            self._touch(key)
+            deleted += any(found)
+        return deleted
+
+    async def exists(self, key):
+        return int(any(key in store for store in (self.strings, self.sets, self.hashes, self.zsets)))
+
+    async def expire(self, key, seconds):
+        self.ttls[key] = seconds
+        return True
+
+    async def eval(self, script, numkeys, *args):
+        """以對應的 Python 實作模擬服務中使用的 Lua 腳本"""
+        keys, argv = list(args[:numkeys]), list(args[numkeys:])
+        return await _SCRIPTS[script](self, keys, argv)
+
+    def _touch(self, key):
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    async def publish(self, channel, message):
+        self.published.append((channel, json.loads(message)))
+        return 1
+
+    # --- 集合 / 雜湊 ---
+
+    async def sadd(self, key, *members):
+        added = self.sets.setdefault(key, set())
+        before = len(added)
+        added.update(members)
+        self._touch(key)
+        return len(added) - before
+
+    async def smembers(self, key):
+        return set(self.sets.get(key, set()))
+
+    async def hincrby(self, key, field, amount=1):
+        fields = self.hashes.setdefault(key, {})
+        fields[field] = fields.get(field, 0) + amount
+        self._touch(key)
+        return fields[field]
+
+    async def hmget(self, key, fields):
+        return [self.hashes.get(key, {}).get(field) for field in fields]
+
+    async def hget(self, key, field):
+        return self.hashes.get(key, {}).get(field)
+
+    async def hset(self, key, field, value):
+        fields = self.hashes.setdefault(key, {})
+        added = field not in fields
+        fields[field] = value
+        self._touch(key)
+        return int(added)
+
+    async def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    async def hdel(self, key, *fields):
+        removed = sum(self.hashes.get(key, {}).pop(field, None) is not None for field in fields)
+        self._touch(key)
+        return removed
+
+    # --- 有序集合 ---
+
+    async def zadd(self, key, mapping):
+        members = self.zsets.setdefault(key, {})
+        added = sum(member not in members for member in mapping)
+        members.update({member: float(score) for member, score in mapping.items()})
+        self._touch(key)
+        return added
+
+    async def zrangebyscore(self, key, min, max):
+        low, high = float(min), float(max)
+        members = self.zsets.get(key, {})
+        return [member for member, score in sorted(members.items(), key=lambda x: x[1]) if low <= score <= high]
+
+    async def zremrangebyscore(self, key, min, max):
+        low, high = float(min), float(max)
+        members = self.zsets.get(key, {})
+        removed = [member for member, score in members.items() if low <= score <= high]
+        for member in removed:
+            del members[member]
+        return len(removed)
+
+    # --- Stream (每個 stream 一個消費者群組) ---
+
+    async def xgroup_create(self, stream, group, id="0", mkstream=False):
+        if stream in self.streams:
+            raise Exception("BUSYGROUP Consumer Group name already exists")
+        self.streams[stream] = []
+
+    async def xadd(self, stream, fields, maxlen=None, approximate=True):
+        self.counter += 1
+        message_id = f"{self.counter}-0"
+        self.streams.setdefault(stream, []).append((message_id, dict(fields)))
+        return message_id
+
+    async def xlen(self, stream):
+        return len(self.streams.get(stream, []))
+
+    async def xinfo_groups(self, stream):
+        entries = self.streams.get(stream, [])
+        pending = sum(entry["stream"] == stream for entry in self.pending.values())
+        return [{"name": "sre-workers", "pending": pending, "lag": sum(mid not in self.delivered for mid, _ in entries)}]
+
+    async def xreadgroup(self, group, consumer, streams, count=None, block=None):
+        response = []
+        for stream in streams:
+            fresh = [(mid, fields) for mid, fields in self.streams.get(stream, []) if mid not in self.delivered][:count]
+            for mid, _ in fresh:
+                self.delivered.add(mid)
+                self.pending[mid] = {"stream": stream, "consumer": consumer, "since": time.monotonic(), "times_delivered": 1}
+            if fresh:
+                response.append([stream, fresh])
+        if not response and block is not None:
+            await asyncio.sleep(0.01)
+        return response
+
+    async def xack(self, stream, group, *ids):
+        for mid in ids:
+            self.pending.pop(mid, None)
+        return len(ids)
+
+    async def xautoclaim(self, stream, group, consumer, min_idle_time, start_id="0-0", count=None):
+        now, claimed = time.monotonic(), []
+        entries = dict(self.streams.get(stream, []))
+        for mid, entry in [(mid, entry) for mid, entry in self.pending.items() if entry["stream"] == stream][:count]:
+            if (now - entry["since"]) * 1000 >= min_idle_time:
+                entry.update(consumer=consumer, since=now, times_delivered=entry["times_delivered"] + 1)
+                claimed.append((mid, entries.get(mid)))
+        return ["0-0", claimed, []]
+
+    async def xpending_range(self, stream, group, min, max, count):
+        entry = self.pending.get(min)
+        return [{"message_id": min, "times_delivered": entry["times_delivered"]}] if entry else []
+
+    async def xclaim(self, stream, group, consumer, min_idle_time, message_ids, justid=False):
+        for mid in message_ids:
+            if mid in self.pending:
+                self.pending[mid]["since"] = time.monotonic()
+        return message_ids
+
+
+async def _extend_ttl(redis: InMemoryRedis, keys, argv):
+    current = redis.ttls.get(keys[0])
+    if current is None or current < int(argv[0]):
+        return await redis.expire(keys[0], int(argv[0]))
+    return 0
+
+
+async def _release_lock(redis: InMemoryRedis, keys, argv):
+    if redis.strings.get(keys[0]) == argv[0]:
+        return await redis.delete(keys[0])
+    return 0
+
+
+async def _enqueue_task(redis: InMemoryRedis, keys, argv):
+    stream, backlog_key, clients_key, tasks_key = keys
+    _, request_type, client, *pairs = argv
+    message_id = await redis.xadd(stream, dict(zip(pairs[::2], pairs[1::2])))
+    await redis.hincrby(backlog_key, request_type, 1)
+    await redis.hincrby(clients_key, client, 1)
+    await redis.hset(tasks_key, f"{stream}/{message_id}", json.dumps([request_type, client]))
+    return message_id
+
+
+async def _complete_task(redis: InMemoryRedis, keys, argv):
+    stream, backlog_key, clients_key, tasks_key = keys
+    group, message_id = argv
+    acked = await redis.xack(stream, group, message_id)
+    raw = await redis.hget(tasks_key, f"{stream}/{message_id}")
+    if raw:
+        await redis.hdel(tasks_key, f"{stream}/{message_id}")
+        for counter, field in zip((backlog_key, clients_key), json.loads(raw)):
+            if await redis.hincrby(counter, field, -1) < 0:
+                await redis.hset(counter, field, 0)
+    return acked
+
+
+_SCRIPTS = {
+    task_queue._ENQUEUE_SCRIPT: _enqueue_task,
+    task_queue._COMPLETE_SCRIPT: _complete_task,
+    cache_invalidation._EXTEND_TTL_SCRIPT: _extend_ttl,
+    control_plane_tool._RELEASE_LOCK_SCRIPT: _release_lock,
+}
+
+
+class _Pipeline:
+    def __init__(self, redis: InMemoryRedis):
+        self.redis, self.ops = redis, []
+        self.watched, self.immediate = None, False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.reset()
+
+    async def reset(self):
+        self.ops, self.watched, self.immediate = [], None, False
+
+    async def watch(self, *keys):
+        self.watched = {key: self.redis.versions.get(key, 0) for key in keys}
+        self.immediate = True
+
+    def multi(self):
+        self.immediate = False
+
+    def __getattr__(self, name):
+        command = getattr(self.redis, name)
+        if self.immediate:
+            return command
+
+        def queue(*args, **kwargs):
+            self.ops.append((command, args, kwargs))
+            return self
+
+        return queue
+
+    async def execute(self):
+        ops, watched = self.ops, self.watched
+        await self.reset()
+        if watched and any(self.redis.versions.get(key, 0) != version for key, version in watched.items()):
+            raise WatchError("Watched variable changed.")
+        return [await command(*args, **kwargs) for command, args, kwargs in ops]
+
+
+@pytest.fixture
+def redis_client() -> InMemoryRedis:
+    return InMemoryRedis()
+
+
+@pytest.fixture
+def make_control_plane_tool(mocker):
+    """
+    建立略過認證的 ControlPlaneTool；關鍵字參數覆寫 config.control_plane 的設定值，其餘使用程式預設值
+    """
+    mocker.patch('sre_assistant.tools.control_plane_tool.ControlPlaneTool._get_auth_token', return_value="dummy-jwt-token")
+
+    def make(redis_client=None, **settings) -> ControlPlaneTool:
+        config = MagicMock()
+        config.control_plane.base_url = BASE_URL
+        config.control_plane.timeout_seconds = 5
+        config.control_plane.get = lambda key, default=None: settings.get(key, default)
+        config.auth.keycloak.token_url = f"{BASE_URL}/auth/token"
+        return ControlPlaneTool(config, httpx.AsyncClient(), redis_client)
+
+    return make
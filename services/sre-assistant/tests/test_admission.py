@@ -0,0 +1,130 @@
+"""
+診斷任務准入控制的單元測試
+"""
+
+import asyncio
+import pytest
+
+from sre_assistant.admission import AdmissionController, AdmissionRejected, QueueBacklog, ADMISSION_QUEUE_DEPTH
+
+
+def test_queue_size_and_type_limits_are_enforced():
+    controller = AdmissionController(max_queue_size=3, type_limits={"execute_query": 1})
+
+    controller.admit("execute_query")
+    with pytest.raises(AdmissionRejected) as type_limited:
+        controller.admit("execute_query")
+    controller.admit("deployment")
+    controller.admit("deployment")
+    with pytest.raises(AdmissionRejected) as full:
+        controller.admit("alert_analysis")
+
+    assert type_limited.value.reason == "type_limit"
+    assert full.value.reason == "queue_full"
+    assert controller.depth() == 3
+    assert ADMISSION_QUEUE_DEPTH.labels("deployment", "queued")._value.get() == 2
+
+
+def test_external_backlog_counts_toward_limits():
+    """測試佇列模式下總上限與各類型上限以 Redis 中的待處理量加上尚未排入的憑證計算"""
+    controller = AdmissionController(max_queue_size=10, type_limits={"bulk_remediation": 2})
+
+    controller.admit("deployment", backlog=QueueBacklog({"deployment": 8}))
+    with pytest.raises(AdmissionRejected) as full:
+        controller.admit("deployment", backlog=QueueBacklog({"deployment": 9}))
+    with pytest.raises(AdmissionRejected) as type_limited:
+        controller.admit("bulk_remediation", backlog=QueueBacklog({"bulk_remediation": 2}))
+
+    assert full.value.reason == "queue_full"
+    assert type_limited.value.reason == "type_limit"
+
+
+def test_retry_after_uses_worker_durations_and_concurrency():
+    """測試 Retry-After 以 worker 回報的執行時間與 worker 執行名額估算，沒有 worker 時回傳上限"""
+    controller = AdmissionController(max_queue_size=10, concurrency=1, default_duration=1, type_limits={"deployment": 4}, max_retry_after=600)
+
+    with pytest.raises(AdmissionRejected) as limited:
+        controller.admit("deployment", backlog=QueueBacklog({"deployment": 5}, durations={"deployment": 60}, concurrency=4))
+    with pytest.raises(AdmissionRejected) as no_workers:
+        controller.admit("deployment", backlog=QueueBacklog({"deployment": 4}, durations={"deployment": 60}, concurrency=0))
+
+    assert limited.value.retry_after == 30
+    assert no_workers.value.retry_after == 600
+
+
+def test_retry_after_scales_with_backlog_and_is_clamped():
+    controller = AdmissionController(max_queue_size=1, concurrency=2, default_duration=10, max_retry_after=60)
+
+    assert controller.retry_after(1, 10) == 5
+    assert controller.retry_after(4, 10) == 20
+    assert controller.retry_after(100, 10) == 60
+    assert controller.retry_after(1, 0.01) == 1
+
+
+@pytest.mark.asyncio
+async def test_slot_bounds_concurrency_and_releases_tickets():
+    controller = AdmissionController(max_queue_size=10, concurrency=1)
+    running, peak = 0, 0
+
+    async def job():
+        nonlocal running, peak
+        async with controller.slot(controller.admit("deployment")):
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+    await asyncio.gather(*(job() for _ in range(3)))
+
+    assert peak == 1
+    assert controller.depth() == 0
+    assert controller.average_duration("deployment") >= 0.01
+
+
+def test_release_is_idempotent():
+    controller = AdmissionController()
+    ticket = controller.admit("deployment")
+
+    controller.release(ticket)
+    controller.release(ticket)
+
+    assert controller.depth("deployment") == 0
+
+
+def test_p0_reserved_queue_and_default_priorities():
+    controller = AdmissionController(max_queue_size=3, p0_reserved_queue=1, default_priorities={"execute_query": "P3"})
+
+    ticket = controller.admit("execute_query")
+    controller.admit("deployment", priority="P2")
+    with pytest.raises(AdmissionRejected) as reserved:
+        controller.admit("deployment", priority="P1")
+    controller.admit("deployment", priority="P0")
+
+    assert ticket.priority == "P3"
+    assert reserved.value.reason == "queue_full"
+    assert controller.depth() == 3
+
+
+def test_client_limit_isolates_noisy_callers():
+    controller = AdmissionController(max_queue_size=10, client_limit=2)
+
+    first = controller.admit("execute_query", client="noisy")
+    controller.admit("execute_query", client="noisy")
+    with pytest.raises(AdmissionRejected) as limited:
+        controller.admit("execute_query", client="noisy")
+    controller.admit("execute_query", client="quiet")
+    controller.release(first)
+    controller.admit("execute_query", client="noisy")
+
+    assert limited.value.reason == "client_limit"
+
+
+def test_client_limit_counts_queued_tasks():
+    """測試佇列模式下呼叫端上限也計入 Redis 中該呼叫端尚未完成的任務"""
+    controller = AdmissionController(max_queue_size=10, client_limit=2)
+
+    controller.admit("execute_query", client="quiet", backlog=QueueBacklog({"execute_query": 2}, by_client={"noisy": 2}))
+    with pytest.raises(AdmissionRejected) as limited:
+        controller.admit("execute_query", client="noisy", backlog=QueueBacklog({"execute_query": 2}, by_client={"noisy": 2}))
+
+    assert limited.value.reason == "client_limit"
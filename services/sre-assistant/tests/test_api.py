@@ -111,6 +111,19 @@ class TestDiagnosticEndpoints:
         assert call_args[1].incident_id == "INC-123" # request object
         assert call_args[2] == "deployment" # request_type
 
+    @patch("sre_assistant.main.run_workflow_bg", new_callable=AsyncMock)
+    def test_bulk_remediation_accepted(self, mock_run_workflow_bg, client):
+        """測試 /remediations/bulk 端點接受任務並以 bulk_remediation 類型在背景執行"""
+        request_data = {"script_id": "restart", "target_resources": ["res-1", "res-2"], "dry_run": True}
+        response = client.post("/api/v1/remediations/bulk", json=request_data)
+
+        assert response.status_code == 202
+        call_args = mock_run_workflow_bg.call_args[0]
+        assert call_args[1].target_resources == ["res-1", "res-2"]
+        assert call_args[2] == "bulk_remediation"
+
+        assert client.post("/api/v1/remediations/bulk", json={"script_id": "restart", "target_resources": []}).status_code == 422
+
     @patch("sre_assistant.main.redis_client")
     async def test_get_diagnostic_status_found(self, mock_redis, client):
         """測試成功獲取任務狀態"""
@@ -184,6 +197,83 @@ class TestDiagnosticEndpoints:
         assert final_data["result"]["summary"] == "發現 CPU 使用率過高"
 
 
+    def test_run_workflow_bg_enqueues_when_task_queue_enabled(self, client_with_redis, mocker):
+        """啟用任務佇列時 API 只排入任務，不在自身程序中執行工作流程"""
+        import asyncio
+        from sre_assistant import main
+        from sre_assistant.contracts import DiagnosticRequest
+
+        _, redis_store = client_with_redis
+        queue = AsyncMock()
+        queue.accepts = lambda request_type: request_type != "bulk_remediation"
+        mocker.patch.object(main, "task_queue", queue)
+        execute = mocker.patch.object(main.workflow, "execute", new_callable=AsyncMock)
+        session_id = uuid.uuid4()
+        request = DiagnosticRequest(incident_id="INC-9", severity="P2", affected_services=["api"])
+
+        asyncio.run(main.run_workflow_bg(session_id, request, "deployment"))
+
+        queue.enqueue.assert_awaited_once_with(session_id, "deployment", request, priority="P2", client="anonymous")
+        execute.assert_not_called()
+        assert '"progress":0' in redis_store[str(session_id)]
+
+
+    def test_bulk_remediation_runs_in_process_when_task_queue_enabled(self, client_with_redis, mocker):
+        """大量修復不可重複執行，即使啟用任務佇列也不排入至少一次交付的佇列"""
+        import asyncio
+        from sre_assistant import main
+        from sre_assistant.contracts import BulkRemediationRequest
+
+        queue = AsyncMock()
+        queue.accepts = lambda request_type: request_type != "bulk_remediation"
+        mocker.patch.object(main, "task_queue", queue)
+        execute = mocker.patch.object(main.workflow, "execute", new_callable=AsyncMock)
+        session_id = uuid.uuid4()
+        request = BulkRemediationRequest(script_id="restart", target_resources=["res-1"])
+
+        asyncio.run(main.run_workflow_bg(session_id, request, "bulk_remediation"))
+
+        queue.enqueue.assert_not_called()
+        execute.assert_awaited_once_with(session_id, request, "bulk_remediation")
+
+
+    @patch("sre_assistant.main.run_workflow_bg", new_callable=AsyncMock)
+    def test_diagnostics_rejected_with_retry_after_when_queue_full(self, mock_run_workflow_bg, client, mocker):
+        """佇列已滿時回傳 429 與 Retry-After，且不排入背景任務"""
+        from sre_assistant import main
+        from sre_assistant.admission import AdmissionController
+
+        mocker.patch.object(main, "admission", AdmissionController(max_queue_size=1, concurrency=1, default_duration=20))
+        request_data = {"incident_id": "INC-1", "severity": "P1", "affected_services": ["api"]}
+
+        assert client.post("/api/v1/diagnostics/deployment", json=request_data).status_code == 202
+        response = client.post("/api/v1/diagnostics/deployment", json=request_data)
+
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "20"
+        mock_run_workflow_bg.assert_called_once()
+
+
+class TestPriorityAdmission:
+    """測試呼叫端送出的 P0 需要具備 p0_roles 角色"""
+
+    def test_p0_requires_oncall_role(self, mocker):
+        import asyncio
+        from sre_assistant import main
+        from sre_assistant.admission import AdmissionController
+        from sre_assistant.contracts import DiagnosticRequest
+
+        mocker.patch.object(main, "task_queue", None)
+        mocker.patch.object(main, "admission", AdmissionController(max_queue_size=10))
+        request = DiagnosticRequest(incident_id="INC-1", severity="P0", affected_services=["api"])
+
+        noisy = asyncio.run(main.admit_task("deployment", request, {"sub": "noisy", "roles": ["viewer"]}))
+        oncall = asyncio.run(main.admit_task("deployment", request, {"azp": "pager", "resource_access": {"pager": {"roles": ["sre-oncall"]}}}))
+
+        assert noisy.priority == "P1"
+        assert oncall.priority == "P0"
+
+
 class TestAuthentication:
     """測試 JWT 認證邏輯"""
 
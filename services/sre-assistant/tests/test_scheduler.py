@@ -0,0 +1,99 @@
+"""
+加權公平排程器的單元測試
+"""
+
+import asyncio
+import pytest
+
+from sre_assistant.scheduler import WeightedFairScheduler
+
+
+async def _drain(scheduler: WeightedFairScheduler, jobs):
+    """依序送出 (priority, client) 任務，回傳實際取得名額的順序"""
+    order = []
+    gate = asyncio.Event()
+
+    async def job(priority, client, label):
+        async with scheduler.slot(priority, client):
+            order.append(label)
+            await gate.wait()
+
+    # 先佔滿唯一的名額，讓其餘任務全部排隊後再開始分配
+    blocker = asyncio.create_task(job("P3", "blocker", "blocker"))
+    await asyncio.sleep(0)
+    tasks = [asyncio.create_task(job(priority, client, label)) for priority, client, label in jobs]
+    await asyncio.sleep(0)
+    gate.set()
+    await asyncio.gather(blocker, *tasks)
+    return order[1:]
+
+
+@pytest.mark.asyncio
+async def test_higher_priority_classes_get_proportionally_more_slots():
+    scheduler = WeightedFairScheduler(concurrency=1, weights={"P0": 4, "P3": 1})
+    jobs = [("P3", "c", f"p3-{i}") for i in range(4)] + [("P0", "c", f"p0-{i}") for i in range(8)]
+
+    order = await _drain(scheduler, jobs)
+
+    # P0 先完成多數，但 P3 仍在 P0 全部完成前取得名額 (不會被餓死)
+    assert order[0] == "p0-0"
+    first_p3 = next(i for i, label in enumerate(order) if label.startswith("p3"))
+    assert 4 <= first_p3 <= 5
+
+
+@pytest.mark.asyncio
+async def test_clients_within_a_class_take_turns():
+    scheduler = WeightedFairScheduler(concurrency=1)
+    jobs = [("P2", "noisy", f"noisy-{i}") for i in range(5)] + [("P2", "quiet", "quiet-0")]
+
+    order = await _drain(scheduler, jobs)
+
+    assert order.index("quiet-0") == 1
+
+
+@pytest.mark.asyncio
+async def test_reserved_slots_are_only_used_by_p0():
+    scheduler = WeightedFairScheduler(concurrency=2, p0_reserved_slots=1)
+    release = asyncio.Event()
+    started = []
+
+    async def job(priority, label):
+        async with scheduler.slot(priority, label):
+            started.append(label)
+            await release.wait()
+
+    tasks = [asyncio.create_task(job("P3", "p3-a")), asyncio.create_task(job("P3", "p3-b"))]
+    await asyncio.sleep(0.01)
+    assert started == ["p3-a"]
+
+    tasks.append(asyncio.create_task(job("P0", "p0")))
+    await asyncio.sleep(0.01)
+    assert started == ["p3-a", "p0"]
+
+    release.set()
+    await asyncio.gather(*tasks)
+    assert scheduler.running == 0 and scheduler.waiting() == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_leak_a_slot():
+    scheduler = WeightedFairScheduler(concurrency=1)
+    await scheduler.acquire("P2", "a")
+    waiter = asyncio.create_task(scheduler.acquire("P2", "b"))
+    await asyncio.sleep(0)
+
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    scheduler.release("P2")
+
+    assert scheduler.running == 0 and scheduler.waiting() == 0
+    assert await asyncio.wait_for(scheduler.acquire("P1", "c"), timeout=1) == "P1"
+
+
+def test_rejects_non_positive_or_unknown_weights():
+    """測試權重設定為 0、負數或未知優先級時拒絕建立排程器 (避免 stride 計算除以 0)"""
+    for weights in ({"P3": 0}, {"P1": -2}, {"P9": 1}, {"P2": "high"}):
+        with pytest.raises(ValueError):
+            WeightedFairScheduler(2, weights=weights)
+    assert WeightedFairScheduler(2, weights={"P3": 0.5}).weights["P3"] == 0.5
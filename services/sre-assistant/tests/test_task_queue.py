@@ -0,0 +1,165 @@
+"""
+Redis Streams 診斷任務佇列與 worker 的單元測試
+"""
+
+import asyncio
+import time
+import uuid
+import pytest
+
+from sre_assistant.contracts import DiagnosticRequest
+from sre_assistant.task_queue import DiagnosisTaskQueue, DiagnosisWorker
+
+
+@pytest.fixture
+def queue(redis_client):
+    return DiagnosisTaskQueue(redis_client)
+
+
+def _request() -> DiagnosticRequest:
+    return DiagnosticRequest(incident_id="INC-1", severity="P1", affected_services=["api"])
+
+
+async def _run_until(worker: DiagnosisWorker, condition, timeout: float = 2.0):
+    runner = asyncio.create_task(worker.run())
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+    worker.stop()
+    await asyncio.wait_for(runner, timeout=2)
+
+
+@pytest.mark.asyncio
+async def test_enqueue_round_trips_request(queue):
+    session_id = uuid.uuid4()
+    message_id = await queue.enqueue(session_id, "deployment", _request())
+
+    (stored_id, fields), = queue.redis_client.streams[queue.streams["P2"]]
+    decoded_session, request_type, request = queue.decode(fields)
+
+    assert stored_id == message_id
+    assert (decoded_session, request_type) == (session_id, "deployment")
+    assert request.incident_id == "INC-1"
+    assert (await queue.depth())["length"] == 1
+    with pytest.raises(ValueError):
+        await queue.enqueue(session_id, "unknown", _request())
+    with pytest.raises(ValueError):
+        await queue.enqueue(session_id, "bulk_remediation", _request())
+    assert not queue.accepts("bulk_remediation")
+
+
+@pytest.mark.asyncio
+async def test_worker_acks_completed_tasks(queue):
+    handled = []
+
+    async def handler(session_id, request, request_type):
+        handled.append((session_id, request_type))
+
+    for _ in range(3):
+        await queue.enqueue(uuid.uuid4(), "deployment", _request())
+    worker = DiagnosisWorker(queue, handler, consumer="w1", concurrency=2, block_ms=10)
+    await _run_until(worker, lambda: len(handled) == 3)
+
+    assert len(handled) == 3
+    assert queue.redis_client.pending == {}
+
+
+@pytest.mark.asyncio
+async def test_failed_task_is_redelivered_then_dead_lettered(queue):
+    attempts = []
+
+    async def handler(session_id, request, request_type):
+        attempts.append(session_id)
+        raise RuntimeError("boom")
+
+    await queue.enqueue(uuid.uuid4(), "deployment", _request())
+    worker = DiagnosisWorker(queue, handler, consumer="w1", visibility_timeout=0.05, max_deliveries=2, block_ms=10)
+    await _run_until(worker, lambda: queue.redis_client.streams.get(queue.dead_letter_stream))
+
+    (_, dead), = queue.redis_client.streams[queue.dead_letter_stream]
+    assert len(attempts) == 2
+    assert dead["deliveries"] == "2" and "RuntimeError: boom" in dead["error"]
+    assert queue.redis_client.pending == {}
+
+
+@pytest.mark.asyncio
+async def test_heartbeat_keeps_long_task_from_being_reclaimed(queue):
+    calls = []
+
+    async def slow_handler(session_id, request, request_type):
+        calls.append(session_id)
+        await asyncio.sleep(0.3)
+
+    await queue.enqueue(uuid.uuid4(), "deployment", _request())
+    worker = DiagnosisWorker(queue, slow_handler, consumer="w1", visibility_timeout=0.1, block_ms=10)
+    await _run_until(worker, lambda: calls and not queue.redis_client.pending)
+
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_backlog_counts_follow_enqueue_and_ack(queue):
+    """測試各類型待處理數隨排入與確認增減，並包含 worker 回報的執行時間與執行名額"""
+    handled = []
+
+    async def handler(session_id, request, request_type):
+        handled.append(request_type)
+
+    for _ in range(2):
+        await queue.enqueue(uuid.uuid4(), "deployment", _request())
+    assert (await queue.backlog()).by_type == {"deployment": 2}
+
+    worker = DiagnosisWorker(queue, handler, consumer="w1", concurrency=3, block_ms=10)
+    await _run_until(worker, lambda: len(handled) == 2 and not queue.redis_client.pending)
+    await queue.advertise("w2", 5, ttl_seconds=60)
+    await queue.advertise("gone", 7, ttl_seconds=-1)
+
+    backlog = await queue.backlog()
+    assert backlog.by_type == {"deployment": 0}
+    assert backlog.by_client == {"anonymous": 0}
+    assert "deployment" in backlog.durations
+    # w1 停止時已註銷，過期的 worker 不計入
+    assert backlog.concurrency == 5
+
+
+@pytest.mark.asyncio
+async def test_reclaiming_trimmed_entry_releases_its_backlog(queue):
+    """測試已交付但被 XTRIM / XDEL 移除的項目在領取時確認並扣除待處理數，重複確認不會扣成負數"""
+    await queue.enqueue(uuid.uuid4(), "deployment", _request(), client="ci")
+    stream = queue.streams["P2"]
+    await queue.redis_client.xreadgroup(queue.group, "gone", {stream: ">"}, count=1)
+    (message_id, _), = queue.redis_client.streams[stream]
+    queue.redis_client.streams[stream] = []
+
+    worker = DiagnosisWorker(queue, lambda *args: None, consumer="w1", visibility_timeout=0)
+    assert await worker.reclaim() == 0
+    assert queue.redis_client.pending == {}
+    assert (await queue.backlog()).by_type == {"deployment": 0}
+
+    await queue.complete(stream, message_id)
+    backlog = await queue.backlog()
+    assert backlog.by_type == {"deployment": 0}
+    assert backlog.by_client == {"ci": 0}
+
+
+@pytest.mark.asyncio
+async def test_fetch_reads_priority_streams_by_weight(queue):
+    """測試大量 P3 任務排在前面時，worker 仍依權重優先讀取 P0，且 P3 不會被完全餓死"""
+    release = asyncio.Event()
+
+    async def handler(session_id, request, request_type):
+        await release.wait()
+
+    for priority in ("P3", "P0"):
+        for _ in range(10):
+            await queue.enqueue(uuid.uuid4(), "deployment", _request(), priority=priority, client="pager")
+    worker = DiagnosisWorker(queue, handler, consumer="w1", concurrency=9)
+
+    assert await worker.fetch(9) == 9
+    streams = [entry["stream"] for entry in queue.redis_client.pending.values()]
+    assert streams.count(queue.streams["P0"]) == 8
+    assert streams.count(queue.streams["P3"]) == 1
+    assert (await queue.backlog()).by_client == {"pager": 20}
+
+    release.set()
+    await asyncio.gather(*worker._running.values())
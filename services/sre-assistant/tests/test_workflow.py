@@ -2,6 +2,7 @@
 SRE 工作流程測試 (已重構以匹配目前的實作)
 """
 
+import asyncio
 import pytest
 import uuid
 import httpx
@@ -16,6 +17,7 @@ from sre_assistant.contracts import (
     AlertAnalysisRequest,
     CapacityAnalysisRequest,
     ExecuteRequest,
+    BulkRemediationRequest,
 )
 
 
@@ -88,11 +90,11 @@ async def test_diagnose_deployment_success_e2e(workflow, mock_redis_client):
     workflow.loki_tool.execute = AsyncMock(return_value=ToolResult(
         success=True, data={"analysis": {"critical_indicators": ["發現 5 次 OOMKilled"]}}
     ))
-    workflow.control_plane_tool.query_audit_logs = AsyncMock(return_value=ToolResult(
-        success=True, data={"logs": [{"user": "test-user", "action": "deploy"}]}
+    workflow.control_plane_tool.query_all_audit_logs = AsyncMock(return_value=ToolResult(
+        success=True, data={"items": [{"user": "test-user", "action": "deploy"}], "total": 1, "pages_fetched": 1, "truncated": False}
     ))
-    workflow.control_plane_tool.query_incidents = AsyncMock(return_value=ToolResult(
-        success=True, data={"incidents": [{"id": "INC-999", "title": "Related DB issue"}]}
+    workflow.control_plane_tool.query_all_incidents = AsyncMock(return_value=ToolResult(
+        success=True, data={"items": [{"id": "INC-999", "title": "Related DB issue"}], "total": 1, "pages_fetched": 1, "truncated": False}
     ))
 
     await workflow.execute(session_id, request, "deployment")
@@ -107,8 +109,8 @@ async def test_diagnose_deployment_success_e2e(workflow, mock_redis_client):
     
     workflow.prometheus_tool.execute.assert_called_once()
     workflow.loki_tool.execute.assert_called_once()
-    workflow.control_plane_tool.query_audit_logs.assert_called_once()
-    workflow.control_plane_tool.query_incidents.assert_called_once()
+    workflow.control_plane_tool.query_all_audit_logs.assert_called_once()
+    workflow.control_plane_tool.query_all_incidents.assert_called_once()
     
     findings = final_status.result.findings
     assert len(findings) == 4
@@ -124,8 +126,8 @@ async def test_diagnose_deployment_with_tool_failure(workflow, mock_redis_client
 
     workflow.prometheus_tool.execute = AsyncMock(return_value=ToolResult(success=True, data={"cpu_usage": "95%"}))
     workflow.loki_tool.execute = AsyncMock(side_effect=Exception("Loki connection failed"))
-    workflow.control_plane_tool.query_audit_logs = AsyncMock(return_value=ToolResult(success=True, data={"logs": []}))
-    workflow.control_plane_tool.query_incidents = AsyncMock(return_value=ToolResult(success=True, data={"incidents": []}))
+    workflow.control_plane_tool.query_all_audit_logs = AsyncMock(return_value=ToolResult(success=True, data={"items": []}))
+    workflow.control_plane_tool.query_all_incidents = AsyncMock(return_value=ToolResult(success=True, data={"items": []}))
 
     await workflow.execute(session_id, request, "deployment")
     final_status = DiagnosticStatus.model_validate_json(await redis_client.get(str(session_id)))
@@ -230,8 +232,8 @@ async def test_analyze_capacity_workflow(workflow):
 
     # 模擬 ControlPlaneTool 的回傳值
     mock_resource_data = {"id": resource_id, "name": service_name, "type": "deployment", "status": "running", "createdAt": "2023-01-01T00:00:00Z", "updatedAt": "2023-01-01T00:00:00Z"}
-    workflow.control_plane_tool.get_resource_details = AsyncMock(
-        return_value=ToolResult(success=True, data=mock_resource_data)
+    workflow.control_plane_tool.get_resources_bulk = AsyncMock(
+        return_value=ToolResult(success=True, data={"resources": {resource_id: mock_resource_data}, "missing": [], "cache_hits": 0})
     )
 
     # 模擬 PrometheusTool 的回傳值
@@ -253,7 +255,77 @@ async def test_analyze_capacity_workflow(workflow):
     assert "CPU 使用率" in recommendation.reasoning
 
     # 驗證工具是否被正確呼叫
-    workflow.control_plane_tool.get_resource_details.assert_called_once_with(resource_id)
+    workflow.control_plane_tool.get_resources_bulk.assert_called_once_with([resource_id])
     workflow.prometheus_tool.execute.assert_called_once_with(
         {"service": service_name, "metric_type": "saturation"}
     )
+
+@pytest.mark.asyncio
+async def test_capacity_saturation_fanout_is_bounded_and_tolerates_failures(workflow):
+    """
+    測試飽和度查詢的並行度受 fanout_concurrency 限制，且單一資源的例外只排除該資源。
+    """
+    resource_ids = [f"res-{i}" for i in range(6)]
+    resources = {rid: {"id": rid, "name": f"svc-{rid}"} for rid in resource_ids}
+    workflow.fanout_concurrency = 2
+    workflow.control_plane_tool.get_resources_bulk = AsyncMock(
+        return_value=ToolResult(success=True, data={"resources": resources, "missing": [], "cache_hits": 0})
+    )
+    running, peak = 0, 0
+
+    async def saturation(params):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        if params["service"] == "svc-res-3":
+            raise RuntimeError("prometheus unavailable")
+        return ToolResult(success=True, data={"cpu_usage": "90%" if params["service"] == "svc-res-5" else "10%", "memory_usage": "20%"})
+
+    workflow.prometheus_tool.execute = AsyncMock(side_effect=saturation)
+    request = CapacityAnalysisRequest(resource_ids=resource_ids, metric_type="cpu", forecast_days=30)
+
+    response = await workflow._analyze_capacity(uuid.uuid4(), request, DiagnosticStatus(session_id=uuid.uuid4(), status="processing"))
+
+    assert peak == 2
+    assert response.current_usage.peak == 90.0
+    assert [r.resource for r in response.recommendations] == ["res-5"]
+
+@pytest.mark.asyncio
+async def test_bulk_remediation_publishes_progress(workflow, mock_redis_client):
+    """
+    測試大量修復將彙整進度寫入會話狀態，並以發現列出失敗的資源。
+    """
+    _, redis_store = mock_redis_client
+    session_id = uuid.uuid4()
+    status = DiagnosticStatus(session_id=session_id, status="processing", progress=0)
+    redis_store[str(session_id)] = status.model_dump_json()
+    workflow.config.control_plane.get = lambda key, default=None: default
+    request = BulkRemediationRequest(script_id="restart", target_resources=["res-1", "res-2", "res-3"], wave_size=2, max_failure_ratio=1.0)
+
+    workflow.control_plane_tool.execute_script = AsyncMock(side_effect=lambda script_id, parameters=None, target_resources=None, dry_run=False: ToolResult(
+        success=True, data={"execution_id": f"exec-{target_resources[0]}", "status": "pending"}
+    ))
+    workflow.control_plane_tool.wait_for_execution = AsyncMock(side_effect=lambda execution_id, timeout=None: ToolResult(
+        success=True, data={"id": execution_id, "status": "failed" if execution_id == "exec-res-3" else "success", "error": "exit 1"}
+    ))
+
+    result = await workflow._bulk_remediate(session_id, request, status)
+
+    stored = DiagnosticStatus.model_validate_json(redis_store[str(session_id)])
+    assert stored.progress == 95
+    assert "第 2/2 波" in stored.current_step
+    assert "成功 2、失敗 1" in result.summary
+    assert [f.evidence for f in result.findings if f.severity == "critical"] == [{"resource_id": "res-3"}]
+
+def test_workflow_templates_describe_dag_nodes(workflow):
+    """
+    測試工作流程模板來自 DAG 定義，並包含節點相依。
+    """
+    templates = {template["id"]: template for template in workflow.templates()}
+
+    assert set(templates) >= {"deployment_diagnosis", "capacity_analysis"}
+    nodes = {node["name"]: node for node in templates["capacity_analysis"]["nodes"]}
+    assert nodes["saturation"]["depends_on"] == ["resources"]
+    assert all(node["depends_on"] == [] for node in templates["deployment_diagnosis"]["nodes"])
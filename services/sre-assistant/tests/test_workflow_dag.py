@@ -0,0 +1,90 @@
+"""
+DAG 工作流程排程器測試
+"""
+
+import asyncio
+import pytest
+
+from sre_assistant.workflow_dag import DagNode, DagScheduler, WorkflowDefinition
+
+
+def _sleeper(seconds, value=None, log=None, name=None):
+    async def run(params, inputs):
+        if log is not None:
+            log.append(("start", name))
+        await asyncio.sleep(seconds)
+        if log is not None:
+            log.append(("end", name))
+        return value if value is not None else inputs
+    return run
+
+
+@pytest.mark.asyncio
+async def test_nodes_start_as_soon_as_inputs_resolve():
+    """測試節點只等待自己的輸入：fast → after_fast 不需等待 slow"""
+    log = []
+    definition = WorkflowDefinition("demo", "Demo", "", nodes=[
+        DagNode("slow", _sleeper(0.1, "s", log, "slow")),
+        DagNode("fast", _sleeper(0.01, "f", log, "fast")),
+        DagNode("after_fast", _sleeper(0.01, None, log, "after_fast"), depends_on=("fast",)),
+        DagNode("join", _sleeper(0, None), depends_on=("slow", "after_fast")),
+    ])
+
+    run = await DagScheduler(max_parallelism=4).run(definition)
+
+    assert log.index(("start", "after_fast")) < log.index(("end", "slow"))
+    assert run.result("after_fast") == {"fast": "f"}
+    assert run.result("join") == {"slow": "s", "after_fast": {"fast": "f"}}
+    assert run.critical_path == ["slow", "join"]
+    assert run.total_seconds < 0.2
+
+
+@pytest.mark.asyncio
+async def test_parallelism_cap_and_per_node_timeout():
+    in_flight, peak = 0, 0
+
+    async def tracked(params, inputs):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.02)
+        in_flight -= 1
+
+    definition = WorkflowDefinition("cap", "Cap", "", nodes=[
+        *(DagNode(f"n{i}", tracked) for i in range(5)),
+        DagNode("hang", _sleeper(10), timeout_seconds=0.05),
+        DagNode("downstream", _sleeper(0), depends_on=("hang",)),
+    ])
+
+    run = await DagScheduler(max_parallelism=2).run(definition)
+
+    assert peak <= 2
+    assert run.nodes["hang"].status == "timeout"
+    assert run.nodes["downstream"].status == "skipped"
+    assert all(run.succeeded(f"n{i}") for i in range(5))
+
+
+@pytest.mark.asyncio
+async def test_failed_node_skips_only_its_dependents():
+    async def boom(params, inputs):
+        raise RuntimeError("boom")
+
+    definition = WorkflowDefinition("fail", "Fail", "", nodes=[
+        DagNode("a", boom),
+        DagNode("b", _sleeper(0, "b")),
+        DagNode("c", _sleeper(0), depends_on=("a",)),
+        DagNode("d", _sleeper(0), depends_on=("c",)),
+    ])
+
+    run = await DagScheduler().run(definition, {"service": "x"})
+
+    assert run.nodes["a"].status == "failed" and str(run.nodes["a"].error) == "boom"
+    assert run.nodes["c"].status == run.nodes["d"].status == "skipped"
+    assert run.result("b") == "b"
+
+
+def test_definition_rejects_cycles_and_unknown_dependencies():
+    with pytest.raises(ValueError, match="循環"):
+        WorkflowDefinition("cycle", "", "", nodes=[DagNode("a", _sleeper(0), depends_on=("b",)), DagNode("b", _sleeper(0), depends_on=("a",))])
+    with pytest.raises(ValueError, match="不存在"):
+        WorkflowDefinition("unknown", "", "", nodes=[DagNode("a", _sleeper(0), depends_on=("missing",))])
@@ -0,0 +1,91 @@
+"""
+BulkRemediationExecutor 的單元測試
+"""
+
+import asyncio
+import pytest
+
+from sre_assistant.contracts import ToolResult, ToolError
+from sre_assistant.tools.bulk_remediation import BulkRemediationExecutor
+
+
+class FakeControlPlane:
+    """記錄每次 execute_script 的分塊與同時進行的呼叫數；failing 中的資源執行結果為 failed"""
+
+    def __init__(self, failing=(), reject=()):
+        self.failing, self.reject = set(failing), set(reject)
+        self.calls, self.in_flight, self.max_in_flight = [], 0, 0
+        self._targets = {}
+
+    async def execute_script(self, script_id, parameters=None, target_resources=None, dry_run=False):
+        self.calls.append((list(target_resources), dry_run))
+        if self.reject & set(target_resources):
+            return ToolResult(success=False, error=ToolError(code="HTTP_STATUS_ERROR", message="API returned HTTP 409"))
+        execution_id = f"exec-{len(self.calls)}"
+        self._targets[execution_id] = target_resources
+        return ToolResult(success=True, data={"execution_id": execution_id, "status": "pending" if not dry_run else "dry_run"})
+
+    async def wait_for_execution(self, execution_id, timeout=None):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        status = "failed" if self.failing & set(self._targets[execution_id]) else "success"
+        return ToolResult(success=True, data={"id": execution_id, "status": status, "error": "exit 1" if status == "failed" else None})
+
+
+@pytest.mark.asyncio
+async def test_waves_bound_concurrency_and_report_progress():
+    control_plane = FakeControlPlane(failing={"res-3"})
+    executor = BulkRemediationExecutor(control_plane, concurrency=2, wave_size=4, resources_per_call=1)
+    snapshots = []
+
+    async def on_progress(progress):
+        snapshots.append((progress.current_wave, progress.completed))
+
+    progress = await executor.run("restart", [f"res-{i}" for i in range(10)], on_progress=on_progress)
+
+    assert progress.total_waves == 3
+    assert len(progress.succeeded) == 9 and progress.failed == {"res-3": "exit 1"}
+    assert control_plane.max_in_flight == 2
+    # 波次依序執行，進度單調遞增
+    assert [wave for wave, _ in snapshots] == sorted(wave for wave, _ in snapshots)
+    assert snapshots[-1] == (3, 10)
+    assert progress.percent == 100
+
+
+@pytest.mark.asyncio
+async def test_failure_ratio_stops_remaining_waves():
+    control_plane = FakeControlPlane(failing={"res-0", "res-1"})
+    executor = BulkRemediationExecutor(control_plane, concurrency=4, wave_size=4, resources_per_call=2, max_failure_ratio=0.25)
+
+    progress = await executor.run("patch", [f"res-{i}" for i in range(12)])
+
+    assert "失敗比例" in progress.stopped_reason
+    assert len(control_plane.calls) == 2
+    assert progress.skipped == [f"res-{i}" for i in range(4, 12)]
+    assert progress.to_dict()["skipped"] == 8
+
+
+@pytest.mark.asyncio
+async def test_max_failures_skips_chunks_not_yet_started():
+    control_plane = FakeControlPlane(reject={"res-0"})
+    executor = BulkRemediationExecutor(control_plane, concurrency=1, wave_size=10, resources_per_call=2, max_failures=1)
+
+    progress = await executor.run("patch", [f"res-{i}" for i in range(6)])
+
+    assert progress.failed == {"res-0": "API returned HTTP 409", "res-1": "API returned HTTP 409"}
+    assert progress.skipped == ["res-2", "res-3", "res-4", "res-5"]
+    assert len(control_plane.calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_dry_run_fans_out_without_waiting():
+    control_plane = FakeControlPlane()
+    executor = BulkRemediationExecutor(control_plane, concurrency=3, wave_size=5, resources_per_call=5)
+
+    progress = await executor.run("patch", [f"res-{i}" for i in range(10)], dry_run=True)
+
+    assert all(dry_run for _, dry_run in control_plane.calls)
+    assert control_plane.max_in_flight == 0
+    assert progress.dry_run is True and len(progress.succeeded) == 10
@@ -0,0 +1,125 @@
+"""
+以標籤為基礎的快取失效單元測試
+"""
+
+import json
+import pytest
+import respx
+from httpx import Response
+from dataclasses import replace
+from datetime import datetime, timezone
+
+from sre_assistant.tools.cache_invalidation import CacheTagIndex, CacheInvalidationListener, cache_tags
+from sre_assistant.tools.control_plane_tool import ControlPlaneTool
+
+BASE_URL = "http://mock-control-plane"
+NOW_ISO = datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+@pytest.fixture
+def tool(make_control_plane_tool, redis_client):
+    return make_control_plane_tool(redis_client)
+
+
+def _incident(incident_id: str, status: str) -> dict:
+    return {"id": incident_id, "title": "DB slow", "status": status, "severity": "P2", "createdAt": NOW_ISO, "updatedAt": NOW_ISO}
+
+
+def test_cache_tags_include_collection_and_entity_ids():
+    data = {"items": [{"id": "inc-1"}, {"id": "inc-2"}], "pagination": {}}
+    assert cache_tags("incidents", "incident", data) == ["incidents", "incident:inc-1", "incident:inc-2"]
+    assert cache_tags("resources", "resource", {"id": "res-1"}) == ["resources", "resource:res-1"]
+    assert cache_tags("audit_logs", None, data) == ["audit_logs"]
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_acknowledge_invalidates_cached_incident_lists(tool: ControlPlaneTool):
+    """測試確認事件後，快取的事件列表立即失效並廣播"""
+    statuses = iter(["new", "acknowledged"])
+    route = respx.get(f"{BASE_URL}/api/v1/incidents").mock(side_effect=lambda request: Response(200, json={
+        "items": [_incident("inc-1", next(statuses))],
+        "pagination": {"page": 1, "pageSize": 10, "total": 1, "totalPages": 1},
+    }))
+    respx.post(f"{BASE_URL}/api/v1/incidents/inc-1/acknowledge").mock(return_value=Response(200, json=_incident("inc-1", "acknowledged")))
+
+    first = await tool.query_incidents({"status": "new"})
+    assert first.data["items"][0]["status"] == "new"
+    assert "controlplane:tag:incident:inc-1" in tool.redis_client.sets
+
+    await tool.acknowledge_incident("inc-1")
+    second = await tool.query_incidents({"status": "new"})
+
+    assert route.call_count == 2
+    assert second.data["items"][0]["status"] == "acknowledged"
+    channel, message = tool.redis_client.published[0]
+    assert channel == "controlplane:invalidations"
+    assert set(message["tags"]) == {"incidents", "incident:inc-1", "audit_logs"}
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_negative_cache_entry_is_tagged_and_invalidated(tool: ControlPlaneTool):
+    """測試 404 負面快取也以集合與實體標籤登記，資源建立後的失效事件會清除它"""
+    route = respx.get(f"{BASE_URL}/api/v1/resources/res-new").mock(return_value=Response(404, json={"error": "not found"}))
+
+    await tool.get_resource_details("res-new")
+    key = "controlplane:get_resource_details:res-new"
+    assert key in tool.redis_client.sets["controlplane:tag:resources"]
+    assert key in tool.redis_client.sets["controlplane:tag:resource:res-new"]
+
+    await tool.invalidate(["resource:res-new"])
+    await tool.get_resource_details("res-new")
+
+    assert route.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_tag_ttl_is_only_extended(redis_client):
+    """測試較短存活時間的項目 (例如負面快取) 不會縮短共用標籤集合的存活時間"""
+    index = CacheTagIndex(redis_client)
+    for key, ttl in (("controlplane:a", 600), ("controlplane:b", 30), ("controlplane:c", 900)):
+        pipe = redis_client.pipeline()
+        index.add_to_pipeline(pipe, key, ["resources"], ttl_seconds=ttl)
+        await pipe.execute()
+
+    assert redis_client.ttls["controlplane:tag:resources"] == 900
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_revalidated_entry_keeps_its_tags(tool: ControlPlaneTool):
+    """測試 304 延長快取項目時重新登記標籤，延長後的項目仍可被失效"""
+    etag = 'W/"v1"'
+    respx.get(f"{BASE_URL}/api/v1/incidents").mock(side_effect=lambda request: Response(304, headers={"ETag": etag}) if request.headers.get("If-None-Match") == etag else Response(200, headers={"ETag": etag}, json={
+        "items": [_incident("inc-1", "new")],
+        "pagination": {"page": 1, "pageSize": 10, "total": 1, "totalPages": 1},
+    }))
+    tool.cache_policies["incidents"] = replace(tool.cache_policies["incidents"], ttl_seconds=0)
+
+    await tool.query_incidents({"status": "new"})
+    # 模擬標籤集合比快取項目先過期
+    tool.redis_client.sets.clear()
+    await tool.query_incidents({"status": "new"})
+
+    assert len(tool.redis_client.sets["controlplane:tag:incident:inc-1"]) == 1
+    assert await tool.invalidate(["incident:inc-1"]) == 1
+
+
+@pytest.mark.asyncio
+async def test_listener_applies_foreign_invalidations_only(redis_client):
+    """測試監聽器處理 Control Plane / 其他副本的廣播，但略過自己發出的訊息"""
+    index = CacheTagIndex(redis_client)
+    pipe = redis_client.pipeline()
+    pipe.set("controlplane:query_incidents:{}", "{}")
+    index.add_to_pipeline(pipe, "controlplane:query_incidents:{}", ["incidents"], ttl_seconds=60)
+    await pipe.execute()
+    listener = CacheInvalidationListener(index)
+
+    assert await listener.handle(json.dumps({"tags": ["incidents"], "origin": index.origin})) == 0
+    assert "controlplane:query_incidents:{}" in redis_client.strings
+
+    assert await listener.handle(json.dumps({"tags": ["incidents"]})) == 1
+    assert "controlplane:query_incidents:{}" not in redis_client.strings
+    assert redis_client.published == []
+    assert await listener.handle("not json") == 0
@@ -0,0 +1,114 @@
+"""
+Control Plane 快取策略的單元測試
+"""
+
+import pytest
+import respx
+from httpx import Response
+from dataclasses import replace
+from datetime import datetime, timezone
+from unittest.mock import MagicMock
+
+from sre_assistant.tools.cache_policy import DEFAULT_CACHE_POLICIES, load_cache_policies, encode_payload, decode_payload
+from sre_assistant.tools.control_plane_tool import ControlPlaneTool
+
+BASE_URL = "http://mock-control-plane"
+NOW_ISO = datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+@pytest.fixture
+def tool(make_control_plane_tool, redis_client):
+    return make_control_plane_tool(redis_client)
+
+
+def _resource(resource_id: str) -> dict:
+    return {"id": resource_id, "name": f"server-{resource_id}", "type": "server", "status": "healthy", "createdAt": NOW_ISO, "updatedAt": NOW_ISO}
+
+
+def test_overrides_merge_with_defaults_and_ignore_unknown_fields():
+    policies = load_cache_policies({"incidents": {"ttl_seconds": 5, "bogus": 1}, "custom": {"ttl_seconds": 7}}, revalidate_seconds=60)
+    assert policies["incidents"].ttl_seconds == 5
+    assert policies["incidents"].negative_ttl_seconds == DEFAULT_CACHE_POLICIES["incidents"].negative_ttl_seconds
+    assert policies["custom"].ttl_seconds == 7
+    assert all(policy.revalidate_seconds == 60 for name, policy in policies.items() if name != "custom")
+    # 設定物件不是 dict 時 (例如測試中的 Mock) 沿用預設值
+    assert load_cache_policies(MagicMock(), MagicMock()) == DEFAULT_CACHE_POLICIES
+    assert policies["alert_rules"].ttl_seconds > policies["incidents"].ttl_seconds
+
+
+def test_payload_encoding_respects_size_limits():
+    policy = replace(DEFAULT_CACHE_POLICIES["resources"], compress_min_bytes=10, max_payload_bytes=10_000)
+    encoding, stored = encode_payload('{"items": []}' + " " * 100, policy)
+    assert encoding == "zlib"
+    assert decode_payload(encoding, stored).startswith('{"items": []}')
+    assert encode_payload("x" * 10_001, policy) is None
+    assert encode_payload("{}", policy) == (None, "{}")
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_not_found_is_negatively_cached(tool: ControlPlaneTool):
+    route = respx.get(f"{BASE_URL}/api/v1/resources/res-404").mock(return_value=Response(404, json={"error": "not found"}))
+
+    first = await tool.get_resource_details("res-404")
+    second = await tool.get_resource_details("res-404")
+
+    assert route.call_count == 1
+    assert first.error.code == second.error.code == "HTTP_STATUS_ERROR"
+    assert second.error.details["status_code"] == 404 and second.error.details["cached"] is True
+    assert tool.redis_client.ttls["controlplane:get_resource_details:res-404"] == DEFAULT_CACHE_POLICIES["resource_details"].redis_ttl_seconds
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_bulk_lookup_skips_known_missing_resources(tool: ControlPlaneTool):
+    route = respx.post(f"{BASE_URL}/api/v1/resources/batch").mock(return_value=Response(200, json={
+        "success_count": 1, "failure_count": 1,
+        "failures": [{"resource_id": "res-gone", "error": "not found"}],
+        "resources": [_resource("res-1")],
+    }))
+
+    first = await tool.get_resources_bulk(["res-1", "res-gone"])
+    second = await tool.get_resources_bulk(["res-1", "res-gone"])
+
+    assert route.call_count == 1
+    assert first.data["missing"] == second.data["missing"] == ["res-gone"]
+    assert second.data["cache_hits"] == 2
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_stale_entry_is_served_when_control_plane_fails(tool: ControlPlaneTool):
+    tool.cache_policies["incidents"] = replace(tool.cache_policies["incidents"], ttl_seconds=0, stale_seconds=600)
+    page = {"items": [{"id": "inc-1", "title": "DB slow", "status": "new", "severity": "P2", "createdAt": NOW_ISO, "updatedAt": NOW_ISO}],
+            "pagination": {"page": 1, "pageSize": 10, "total": 1, "totalPages": 1}}
+    respx.get(f"{BASE_URL}/api/v1/incidents").mock(side_effect=[Response(200, json=page), Response(503), Response(400)])
+
+    assert (await tool.query_incidents()).success is True
+    stale = await tool.query_incidents()
+    client_error = await tool.query_incidents()
+
+    assert stale.success is True and stale.data["items"][0]["id"] == "inc-1"
+    # 4xx 不是暫時性錯誤，不回傳過期資料
+    assert client_error.success is False
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_large_payloads_are_compressed_and_empty_lists_use_negative_ttl(tool: ControlPlaneTool):
+    tool.cache_policies["resources"] = replace(tool.cache_policies["resources"], compress_min_bytes=256)
+    page = {"items": [_resource(f"res-{i}") for i in range(20)], "pagination": {"page": 1, "pageSize": 20, "total": 20, "totalPages": 1}}
+    empty = {"items": [], "pagination": {"page": 1, "pageSize": 20, "total": 0, "totalPages": 0}}
+    route = respx.get(f"{BASE_URL}/api/v1/resources").mock(side_effect=lambda request: Response(200, json=empty if request.url.params.get("status") else page))
+
+    await tool.query_resources()
+    cached = await tool.query_resources()
+    await tool.query_resources({"status": "critical"})
+
+    assert route.call_count == 2
+    assert len(cached.data["items"]) == 20
+    meta, _ = tool._parse_entry(tool.redis_client.strings["controlplane:query_resources:{}"])
+    assert meta["encoding"] == "zlib"
+    empty_meta, _ = tool._parse_entry(tool.redis_client.strings['controlplane:query_resources:{"status": "critical"}'])
+    assert empty_meta["empty"] is True
+    assert empty_meta["fresh_until"] - meta["fresh_until"] < 0
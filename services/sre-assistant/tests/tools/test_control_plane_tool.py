@@ -9,10 +9,14 @@ import httpx
 from httpx import Response, TimeoutException, ConnectError
 from unittest.mock import MagicMock, AsyncMock
 from datetime import datetime, timezone
+from dataclasses import replace
+import asyncio
+import json
 import time
 from jose import jwt
 
 from sre_assistant.tools.control_plane_tool import ControlPlaneTool
+from sre_assistant.tools.control_plane_pagination import PageIterator
 from sre_assistant.contracts import ToolResult
 import types
 
@@ -45,13 +49,38 @@ def mock_redis_client():
     async def get(key):
         return redis_store.get(key)
 
-    async def set(key, value, ex=None):
+    async def set(key, value, ex=None, nx=False):
+        if nx and key in redis_store:
+            return None
         redis_store[key] = value
         return True
 
+    async def delete(*keys):
+        return sum(1 for key in keys if redis_store.pop(key, None) is not None)
+
+    async def mget(keys):
+        return [redis_store.get(key) for key in keys]
+
+    async def eval(script, numkeys, key, value):
+        # 僅支援鎖的 compare-and-delete 腳本
+        if redis_store.get(key) == value:
+            del redis_store[key]
+            return 1
+        return 0
+
+    def pipeline():
+        pipe = MagicMock()
+        pipe.set.side_effect = lambda key, value, ex=None: redis_store.__setitem__(key, value)
+        pipe.execute = AsyncMock(return_value=[])
+        return pipe
+
     client = AsyncMock()
     client.get.side_effect = get
     client.set.side_effect = set
+    client.mget.side_effect = mget
+    client.delete.side_effect = delete
+    client.eval.side_effect = eval
+    client.pipeline = MagicMock(side_effect=pipeline)
 
     return client, redis_store
 
@@ -261,6 +290,82 @@ class TestControlPlaneAuth:
         assert token2 == fake_token2
         assert route.call_count == 2
 
+    @pytest.mark.asyncio
+    @respx.mock
+    async def test_concurrent_refresh_is_singleflight(self, mock_config, http_client):
+        """測試 Token 過期時並行請求只會向 Keycloak 發出一次刷新"""
+        tool = ControlPlaneTool(mock_config, http_client)
+        fake_token = jwt.encode({"exp": int(time.time()) + 3600}, "secret", "HS256")
+
+        async def slow_token(request):
+            await asyncio.sleep(0.05)
+            return Response(200, json={"access_token": fake_token})
+
+        route = respx.post(mock_config.auth.keycloak.token_url).mock(side_effect=slow_token)
+
+        tokens = await asyncio.gather(*(tool._get_auth_token() for _ in range(10)))
+
+        assert tokens == [fake_token] * 10
+        assert route.call_count == 1
+
+    @pytest.mark.asyncio
+    @respx.mock
+    async def test_proactive_refresh_in_background(self, mock_config, http_client):
+        """測試超過刷新比例後仍立即回傳舊 Token，並於背景取得新 Token"""
+        tool = ControlPlaneTool(mock_config, http_client)
+        now = int(time.time())
+        old_token = jwt.encode({"iat": now - 3000, "exp": now + 600}, "secret", "HS256")
+        new_token = jwt.encode({"iat": now, "exp": now + 3600}, "secret", "HS256")
+        route = respx.post(mock_config.auth.keycloak.token_url).mock(side_effect=[
+            Response(200, json={"access_token": old_token}),
+            Response(200, json={"access_token": new_token}),
+        ])
+
+        assert await tool._get_auth_token() == old_token
+        # 已超過生命週期的 75%：本次仍回傳舊 Token，但觸發背景刷新
+        assert await tool._get_auth_token() == old_token
+        await tool._refresh_future
+        assert route.call_count == 2
+        assert await tool._get_auth_token() == new_token
+
+    @pytest.mark.asyncio
+    @respx.mock
+    async def test_token_shared_via_redis(self, mock_config, http_client, mock_redis_client):
+        """測試啟用共用 Token 時，多個 worker 只會向 Keycloak 取得一次 Token"""
+        redis_client, redis_store = mock_redis_client
+        base_get = mock_config.control_plane.get
+        mock_config.control_plane.get = lambda key, default=None: True if key == "share_token_via_redis" else base_get(key, default)
+
+        fake_token = jwt.encode({"iat": int(time.time()), "exp": int(time.time()) + 3600}, "secret", "HS256")
+        route = respx.post(mock_config.auth.keycloak.token_url).mock(return_value=Response(200, json={"access_token": fake_token}))
+
+        worker_a = ControlPlaneTool(mock_config, http_client, redis_client)
+        worker_b = ControlPlaneTool(mock_config, http_client, redis_client)
+
+        assert await worker_a._get_auth_token() == fake_token
+        assert await worker_b._get_auth_token() == fake_token
+        assert route.call_count == 1
+        assert "controlplane:m2m_token" in redis_store
+        assert "controlplane:m2m_token:lock" not in redis_store
+
+    @pytest.mark.asyncio
+    @respx.mock
+    async def test_shared_token_lock_is_not_released_when_owned_by_another_replica(self, mock_config, http_client, mock_redis_client):
+        """測試刷新超過鎖的存活時間、鎖已被其他副本取得時，不會刪除他人的鎖"""
+        redis_client, redis_store = mock_redis_client
+        base_get = mock_config.control_plane.get
+        mock_config.control_plane.get = lambda key, default=None: True if key == "share_token_via_redis" else base_get(key, default)
+        fake_token = jwt.encode({"iat": int(time.time()), "exp": int(time.time()) + 3600}, "secret", "HS256")
+
+        def token_after_lock_expired(request):
+            redis_store["controlplane:m2m_token:lock"] = "other-replica"
+            return Response(200, json={"access_token": fake_token})
+
+        respx.post(mock_config.auth.keycloak.token_url).mock(side_effect=token_after_lock_expired)
+
+        assert await ControlPlaneTool(mock_config, http_client, redis_client)._get_auth_token() == fake_token
+        assert redis_store["controlplane:m2m_token:lock"] == "other-replica"
+
 # --- 測試 acknowledge_incident ---
 
 @pytest.mark.asyncio
@@ -394,6 +499,29 @@ class TestControlPlaneCaching:
         await control_plane_tool.get_resource_details(resource_id)
         assert route.call_count == 1
 
+    @pytest.mark.asyncio
+    @respx.mock
+    async def test_cache_stores_validated_json_and_hits_skip_validation(self, control_plane_tool: ControlPlaneTool, mock_redis_client, mocker):
+        """測試快取保存驗證後的 JSON，命中時不再經過 TypeAdapter 驗證"""
+        _, redis_store = mock_redis_client
+        respx.get(f"{BASE_URL}/api/v1/incidents").mock(return_value=Response(200, json={
+            "items": [{"id": "inc-1", "title": "T", "status": "new", "severity": "P2", "createdAt": NOW_ISO, "updatedAt": NOW_ISO}],
+            "pagination": {"page": 1, "pageSize": 10, "total": 1, "totalPages": 1},
+        }))
+
+        first = await control_plane_tool.query_incidents()
+        header, payload = redis_store["controlplane:query_incidents:{}"].split("\n", 1)
+        assert json.loads(header)["fresh_until"] > time.time()
+        assert json.loads(payload)["items"][0]["created_at"]
+
+        from sre_assistant.tools import control_plane_tool as module
+        validate = mocker.spy(module, "_type_adapter")
+        second = await control_plane_tool.query_incidents()
+
+        validate.assert_not_called()
+        assert second.data["items"][0]["id"] == first.data["items"][0]["id"]
+        assert second.data["pagination"] == first.data["pagination"]
+
     @pytest.mark.asyncio
     @respx.mock
     async def test_cache_failure_graceful_degradation(self, control_plane_tool: ControlPlaneTool, mock_redis_client, mocker):
@@ -412,3 +540,189 @@ class TestControlPlaneCaching:
         assert route.call_count == 1
         assert result.success is True
         assert result.data["name"] == "No-Cache-R"
+
+
+# --- 測試 get_resources_bulk ---
+
+def _resource(resource_id: str) -> dict:
+    return {"id": resource_id, "name": f"svc-{resource_id}", "status": "healthy", "type": "deployment", "createdAt": NOW_ISO, "updatedAt": NOW_ISO}
+
+class TestGetResourcesBulk:
+    """測試批次資源查詢：MGET 快取 + 分塊批次 API + pipeline 寫回"""
+
+    @pytest.mark.asyncio
+    @respx.mock
+    async def test_bulk_uses_cache_and_chunks_misses(self, control_plane_tool: ControlPlaneTool, mock_redis_client):
+        redis_client, redis_store = mock_redis_client
+        control_plane_tool.batch_chunk_size = 2
+
+        # 先以單筆查詢讓 res-0 進入快取
+        respx.get(f"{BASE_URL}/api/v1/resources/res-0").mock(return_value=Response(200, json=_resource("res-0")))
+        await control_plane_tool.get_resource_details("res-0")
+
+        def batch_handler(request):
+            body = json.loads(request.content)
+            assert body["operation"] == "get"
+            found = [_resource(i) for i in body["resource_ids"] if i != "res-missing"]
+            failures = [{"resource_id": i, "error": "not found"} for i in body["resource_ids"] if i == "res-missing"]
+            return Response(200, json={"success_count": len(found), "failure_count": len(failures), "failures": failures, "resources": found})
+
+        route = respx.post(f"{BASE_URL}/api/v1/resources/batch").mock(side_effect=batch_handler)
+
+        ids = ["res-0", "res-1", "res-2", "res-3", "res-missing", "res-1"]
+        result = await control_plane_tool.get_resources_bulk(ids)
+
+        assert result.success is True
+        assert result.data["cache_hits"] == 1
+        assert set(result.data["resources"]) == {"res-0", "res-1", "res-2", "res-3"}
+        assert result.data["missing"] == ["res-missing"]
+        # 4 個未命中 (去重後) 以每塊 2 個分成 2 次請求
+        assert route.call_count == 2
+        redis_client.mget.assert_awaited_once()
+        assert "controlplane:get_resource_details:res-3" in redis_store
+
+        # 第二次全部命中快取，不再呼叫 API
+        result = await control_plane_tool.get_resources_bulk(["res-1", "res-2"])
+        assert result.data["cache_hits"] == 2
+        assert route.call_count == 2
+
+    @pytest.mark.asyncio
+    @respx.mock
+    async def test_bulk_all_chunks_failed(self, control_plane_tool: ControlPlaneTool):
+        respx.post(f"{BASE_URL}/api/v1/resources/batch").mock(return_value=Response(503))
+        result = await control_plane_tool.get_resources_bulk(["res-1"])
+        assert result.success is False
+        assert result.error.code == "HTTP_STATUS_ERROR"
+
+
+# --- 測試自動分頁 ---
+
+def _incident_page(page: int, page_size: int, total: int) -> dict:
+    start = (page - 1) * page_size
+    items = [{"id": f"inc-{i}", "title": f"Incident {i}", "status": "new", "severity": "P2", "createdAt": NOW_ISO, "updatedAt": NOW_ISO} for i in range(start, min(start + page_size, total))]
+    return {"items": items, "pagination": {"page": page, "pageSize": page_size, "total": total, "totalPages": -(-total // page_size)}}
+
+class TestPagination:
+    """測試 iter_* / query_all_* 的自動分頁與預取"""
+
+    @pytest.mark.asyncio
+    @respx.mock
+    async def test_iter_incidents_walks_all_pages(self, control_plane_tool: ControlPlaneTool):
+        control_plane_tool.page_size = 2
+        route = respx.get(f"{BASE_URL}/api/v1/incidents").mock(
+            side_effect=lambda request: Response(200, json=_incident_page(int(request.url.params["page"]), 2, 5))
+        )
+
+        ids = [item["id"] async for item in control_plane_tool.iter_incidents({"status": "new"})]
+
+        assert ids == [f"inc-{i}" for i in range(5)]
+        assert route.call_count == 3
+        assert all(call.request.url.params["status"] == "new" for call in route.calls)
+
+    @pytest.mark.asyncio
+    async def test_break_inside_async_with_cancels_prefetched_pages(self):
+        started, cancelled = [], []
+
+        async def fetch_page(page):
+            if page > 1:
+                started.append(page)
+                try:
+                    await asyncio.sleep(10)
+                except asyncio.CancelledError:
+                    cancelled.append(page)
+                    raise
+            return ToolResult(success=True, data={"items": [{"id": f"p{page}-{i}"} for i in range(2)], "pagination": {"total": 10, "total_pages": 5, "page_size": 2}})
+
+        async with PageIterator(fetch_page, prefetch=3) as pages:
+            async for item in pages:
+                break
+            await asyncio.sleep(0)
+
+        assert item == {"id": "p1-0"}
+        assert sorted(started) == sorted(cancelled) == [2, 3, 4]
+        assert [item async for item in pages] == []
+
+    @pytest.mark.asyncio
+    @respx.mock
+    async def test_query_all_respects_max_items(self, control_plane_tool: ControlPlaneTool):
+        control_plane_tool.page_size = 2
+        route = respx.get(f"{BASE_URL}/api/v1/incidents").mock(
+            side_effect=lambda request: Response(200, json=_incident_page(int(request.url.params["page"]), 2, 50))
+        )
+
+        result = await control_plane_tool.query_all_incidents(max_items=3)
+
+        assert result.success is True
+        assert [item["id"] for item in result.data["items"]] == ["inc-0", "inc-1", "inc-2"]
+        assert result.data["total"] == 50
+        assert result.data["truncated"] is True
+        # 只需要抓取涵蓋 max_items 的頁面
+        assert route.call_count == 2
+
+    @pytest.mark.asyncio
+    @respx.mock
+    async def test_query_all_first_page_error(self, control_plane_tool: ControlPlaneTool):
+        respx.get(f"{BASE_URL}/api/v1/incidents").mock(return_value=Response(500))
+        result = await control_plane_tool.query_all_incidents()
+        assert result.success is False
+        assert result.error.code == "HTTP_STATUS_ERROR"
+
+
+# --- 測試條件請求重新驗證 (ETag / If-None-Match) ---
+
+class ControlPlaneStub:
+    """
+    模擬支援條件請求的 Control Plane：回應帶 ETag，If-None-Match 相符時回傳 304
+    """
+
+    def __init__(self, payload: dict):
+        self.payload = payload
+        self.full_responses = 0
+        self.not_modified = 0
+
+    @property
+    def etag(self) -> str:
+        return f'W/"{hash(json.dumps(self.payload, sort_keys=True)) & 0xFFFFFFFF:x}"'
+
+    def __call__(self, request):
+        if request.headers.get("If-None-Match") == self.etag:
+            self.not_modified += 1
+            return Response(304, headers={"ETag": self.etag})
+        self.full_responses += 1
+        return Response(200, json=self.payload, headers={"ETag": self.etag, "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"})
+
+class TestConditionalRevalidation:
+
+    @pytest.mark.asyncio
+    @respx.mock
+    async def test_expired_entry_revalidates_with_304(self, control_plane_tool: ControlPlaneTool, mocker):
+        stub = ControlPlaneStub({"items": [_resource("res-1")], "pagination": {"page": 1, "pageSize": 10, "total": 1, "totalPages": 1}})
+        route = respx.get(f"{BASE_URL}/api/v1/resources").mock(side_effect=stub)
+        control_plane_tool.cache_policies["resources"] = replace(control_plane_tool.cache_policies["resources"], ttl_seconds=0)
+
+        first = await control_plane_tool.query_resources()
+        from sre_assistant.tools import control_plane_tool as module
+        validate = mocker.spy(module, "_type_adapter")
+        second = await control_plane_tool.query_resources()
+
+        assert stub.full_responses == 1 and stub.not_modified == 1
+        assert route.calls[-1].request.headers["If-None-Match"] == stub.etag
+        assert route.calls[-1].request.headers["If-Modified-Since"] == "Mon, 01 Jan 2024 00:00:00 GMT"
+        assert second.success is True
+        assert second.data["items"][0]["id"] == first.data["items"][0]["id"]
+        # 304 不應重新解析回應
+        validate.assert_not_called()
+
+    @pytest.mark.asyncio
+    @respx.mock
+    async def test_changed_payload_is_refetched(self, control_plane_tool: ControlPlaneTool):
+        stub = ControlPlaneStub(_resource("res-1"))
+        respx.get(f"{BASE_URL}/api/v1/resources/res-1").mock(side_effect=stub)
+        control_plane_tool.cache_policies["resource_details"] = replace(control_plane_tool.cache_policies["resource_details"], ttl_seconds=0)
+
+        await control_plane_tool.get_resource_details("res-1")
+        stub.payload = {**_resource("res-1"), "status": "critical"}
+        result = await control_plane_tool.get_resource_details("res-1")
+
+        assert stub.full_responses == 2 and stub.not_modified == 0
+        assert result.data["status"] == "critical"
@@ -0,0 +1,125 @@
+"""
+ExecutionTracker 的單元測試
+"""
+
+import asyncio
+import pytest
+import respx
+from httpx import Response
+
+from sre_assistant.tools.execution_tracker import ExecutionTracker
+
+BASE_URL = "http://mock-control-plane"
+
+
+class FakeControlPlane:
+    """依序回傳預先排定狀態的 Control Plane，記錄每次批次查詢的 ID"""
+
+    def __init__(self, timelines):
+        self.timelines = {execution_id: list(statuses) for execution_id, statuses in timelines.items()}
+        self.calls = []
+
+    async def fetch_executions(self, execution_ids):
+        self.calls.append(list(execution_ids))
+        executions = []
+        for execution_id in execution_ids:
+            timeline = self.timelines.get(execution_id)
+            if not timeline:
+                continue
+            status = timeline.pop(0) if len(timeline) > 1 else timeline[0]
+            executions.append({"id": execution_id, "status": status})
+        return executions
+
+
+@pytest.mark.asyncio
+async def test_many_waiters_share_one_batched_poll_loop():
+    """測試多個並行等待只由單一迴圈批次輪詢，且依各自完成時間解析"""
+    control_plane = FakeControlPlane({
+        "exec-1": ["running", "success"],
+        "exec-2": ["running", "running", "failed"],
+        "exec-3": ["success"],
+    })
+    tracker = ExecutionTracker(control_plane, batch_size=2, min_interval=0.01, max_interval=0.02)
+
+    results = await asyncio.wait_for(asyncio.gather(*(tracker.wait(f"exec-{i}") for i in (1, 2, 3, 1))), timeout=2)
+
+    assert [r["status"] for r in results] == ["success", "failed", "success", "success"]
+    # 第一輪 3 個 ID 以每批 2 個查詢 → 2 次呼叫；之後只查詢仍待完成的 ID
+    assert sorted(sum(control_plane.calls[:2], [])) == ["exec-1", "exec-2", "exec-3"]
+    assert all(len(batch) <= 2 for batch in control_plane.calls)
+    assert control_plane.calls[-1] == ["exec-2"]
+    assert tracker.pending == []
+    # 沒有待完成的執行時迴圈會自動結束
+    await asyncio.sleep(0.05)
+    assert tracker._task.done()
+
+
+@pytest.mark.asyncio
+async def test_waiter_timeout_does_not_cancel_shared_future():
+    control_plane = FakeControlPlane({"exec-slow": ["running"]})
+    tracker = ExecutionTracker(control_plane, min_interval=0.01, max_interval=0.01)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await tracker.wait("exec-slow", timeout=0.05)
+    assert tracker.pending == ["exec-slow"]
+
+    control_plane.timelines["exec-slow"] = ["success"]
+    assert (await tracker.wait("exec-slow", timeout=1))["status"] == "success"
+    await tracker.stop()
+
+
+@pytest.mark.asyncio
+async def test_backoff_grows_when_nothing_changes():
+    control_plane = FakeControlPlane({"exec-1": ["running"]})
+    tracker = ExecutionTracker(control_plane, min_interval=0.01, max_interval=1, backoff=4)
+    intervals = []
+
+    async def fake_sleep(interval):
+        # 以假時鐘取代實際等待：記錄每次的間隔，第 5 次後讓執行完成
+        intervals.append(interval)
+        if len(intervals) == 5:
+            control_plane.timelines["exec-1"] = ["success"]
+        return False
+
+    tracker._sleep = fake_sleep
+    assert (await asyncio.wait_for(tracker.wait("exec-1"), timeout=1))["status"] == "success"
+
+    # 第一輪狀態由未知變為 running 視為變化，之後間隔依 backoff 成長並受 max_interval 限制
+    assert intervals == pytest.approx([0.01, 0.04, 0.16, 0.64, 1])
+
+
+@pytest.mark.asyncio
+async def test_execution_tracked_during_poll_is_polled_without_waiting():
+    """測試輪詢期間加入的執行不會被下一次等待的清除動作吞掉喚醒訊號"""
+    control_plane = FakeControlPlane({"exec-1": ["running"], "exec-2": ["success"]})
+    tracker = ExecutionTracker(control_plane, min_interval=10, max_interval=10)
+    fetch = control_plane.fetch_executions
+
+    async def fetch_and_track(execution_ids):
+        if len(control_plane.calls) == 0:
+            tracker.track("exec-2")
+        return await fetch(execution_ids)
+
+    control_plane.fetch_executions = fetch_and_track
+    tracker.track("exec-1")
+
+    assert (await tracker.wait("exec-2", timeout=1))["status"] == "success"
+    await tracker.stop()
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_control_plane_tool_wait_for_execution(make_control_plane_tool):
+    """測試 ControlPlaneTool 透過 ids 參數批次查詢執行狀態"""
+    tool = make_control_plane_tool(execution_poll_min_seconds=0.01)
+
+    route = respx.get(f"{BASE_URL}/api/v1/automation/executions").mock(return_value=Response(200, json={
+        "items": [{"id": "exec-1", "scriptId": "s-1", "scriptName": "restart", "status": "success"}],
+        "pagination": {"page": 1, "pageSize": 1, "total": 1, "totalPages": 1},
+    }))
+
+    result = await tool.wait_for_execution("exec-1", timeout=1)
+
+    assert result.success is True
+    assert result.data["status"] == "success"
+    assert route.calls[0].request.url.params["ids"] == "exec-1"
@@ -0,0 +1,59 @@
+"""
+LogBatch 欄式日誌批次的單元測試
+"""
+
+from datetime import datetime, timezone
+
+from sre_assistant.tools.log_batch import LogBatch, to_unix_ns
+
+
+def _results():
+    return [
+        {"stream": {"app": "api", "pod": "a"}, "values": [["1609459200000000000", "first"], ["1609459202000000000", "third"]]},
+        {"stream": {"pod": "a", "app": "api"}, "values": [["1609459201000000000", "second"]]},
+    ]
+
+
+def test_identical_label_sets_are_interned():
+    """測試相同的標籤集合 (不論鍵順序) 只保存一份"""
+    batch = LogBatch.from_streams(_results())
+    assert len(batch) == 3
+    assert len(batch.label_sets) == 1
+    assert batch.labels(0) is batch.labels(2)
+
+
+def test_sort_uses_integer_timestamps():
+    """測試以奈秒整數排序，並同步重排所有欄位"""
+    batch = LogBatch.from_streams(_results())
+    batch.sort(reverse=True)
+    assert batch.messages == ["third", "second", "first"]
+    assert list(batch.timestamps) == [1609459202000000000, 1609459201000000000, 1609459200000000000]
+    batch.sort(reverse=False)
+    assert batch.messages == ["first", "second", "third"]
+
+
+def test_parse_is_lazy_and_cached():
+    """測試解析延遲到首次存取，且每行只解析一次"""
+    calls = []
+
+    def parser(line):
+        calls.append(line)
+        return {"level": "INFO"}
+
+    batch = LogBatch.from_streams(_results(), parser)
+    assert calls == []
+    batch.parsed(1)
+    batch.parsed(1)
+    assert len(calls) == 1
+
+    dicts = batch.to_dicts()
+    assert dicts[0]["timestamp"].startswith("2021-01-01T00:00:00")
+    assert dicts[0]["parsed"] == {"level": "INFO"}
+    assert len(calls) == 3
+
+
+def test_to_unix_ns_is_exact():
+    """測試換算奈秒時間戳時不經過 float，微秒部分不會被捨入"""
+    at = datetime(2024, 5, 10, 11, 59, 59, 999999, tzinfo=timezone.utc)
+    assert to_unix_ns(at) == 1715342399999999000
+    assert to_unix_ns(datetime(2021, 1, 1, tzinfo=timezone.utc)) == 1609459200000000000
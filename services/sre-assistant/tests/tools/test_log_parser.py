@@ -0,0 +1,45 @@
+"""
+LazyLogLine 延遲日誌解析的單元測試
+"""
+
+from sre_assistant.tools.log_parser import LazyLogLine, looks_like_json
+
+
+def test_sniffs_first_non_space_character():
+    """測試只有以 '{' 開頭 (忽略空白) 的行才視為 JSON 候選"""
+    assert looks_like_json('  {"level": "error"}')
+    assert not looks_like_json('level=error msg="boom"')
+    assert not looks_like_json("")
+
+
+def test_text_fields_are_extracted_lazily():
+    """測試純文字行的欄位在首次存取時才提取，且只提取一次"""
+    calls = []
+
+    def level(line):
+        calls.append("level")
+        return "ERROR"
+
+    def error_type(line):
+        calls.append("error_type")
+        return None
+
+    parsed = LazyLogLine('level=error msg="boom"', {"level": level, "error_type": error_type})
+    assert calls == []
+    assert parsed.get("level") == "ERROR"
+    assert parsed["level"] == "ERROR"
+    assert calls == ["level"]
+    assert parsed.get("error_type") is None
+    assert parsed.to_dict() == {"raw": 'level=error msg="boom"', "level": "ERROR", "error_type": None}
+
+
+def test_json_line_decodes_once_and_malformed_falls_back():
+    """測試 JSON 行解碼後直接提供欄位；格式錯誤的 JSON 則退回文字提取"""
+    parsed = LazyLogLine('{"level": "ERROR", "msg": "db down"}', {"level": lambda line: "UNKNOWN"})
+    assert parsed.is_json
+    assert parsed.get("msg") == "db down"
+    assert parsed.to_dict() == {"level": "ERROR", "msg": "db down"}
+
+    broken = LazyLogLine('{"level": "ERROR", ', {"level": lambda line: "WARN"})
+    assert not broken.is_json
+    assert broken.get("level") == "WARN"
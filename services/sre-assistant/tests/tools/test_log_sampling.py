@@ -0,0 +1,44 @@
+"""
+StratifiedReservoirSampler 分層蓄水池抽樣的單元測試
+"""
+
+from sre_assistant.tools.log_sampling import StratifiedReservoirSampler, OVERFLOW_STRATUM
+
+
+def _row(ts, message):
+    return (ts, {}, message, {"level": "ERROR"})
+
+
+def test_reservoirs_are_bounded_per_bucket_and_stratum():
+    """測試每個 (時間桶, 分層) 的樣本數有上限，且每個時間桶都有代表"""
+    sampler = StratifiedReservoirSampler(per_stratum=3, seed=7)
+    for bucket in range(4):
+        for i in range(1000):
+            sampler.offer(bucket, ("ERROR", "timeout"), _row(bucket * 10_000 + i, f"timeout {bucket}-{i}"))
+
+    sample = sampler.sample()
+    assert sampler.offered == 4000
+    assert len(sample) <= 4 * 3 + 1
+    assert {row[0] // 10_000 for row in sample} == {0, 1, 2, 3}
+    assert [row[0] for row in sample] == sorted((row[0] for row in sample), reverse=True)
+
+
+def test_rare_first_occurrence_survives_limit():
+    """測試罕見分層的首次出現一定會被保留，即使大量常見錯誤佔滿樣本上限"""
+    sampler = StratifiedReservoirSampler(per_stratum=10, seed=1)
+    for i in range(5000):
+        sampler.offer(0, ("ERROR", "common"), _row(100_000 + i, f"common {i}"))
+    sampler.offer(5, ("ERROR", "rare"), _row(42, "disk corrupted"))
+
+    sample = sampler.sample(limit=5)
+    assert len(sample) == 5
+    assert "disk corrupted" in [row[2] for row in sample]
+
+
+def test_strata_beyond_limit_go_to_overflow():
+    """測試分層數超過上限後併入 overflow 分層，記憶體維持有界"""
+    sampler = StratifiedReservoirSampler(per_stratum=1, max_strata=2)
+    for i in range(10):
+        sampler.offer(0, ("ERROR", f"t{i}"), _row(i, f"line {i}"))
+    assert sampler.strata == 3
+    assert OVERFLOW_STRATUM in sampler._first
@@ -0,0 +1,94 @@
+"""
+SpaceSaving / HyperLogLog / SketchStore 的單元測試
+"""
+
+import json
+import pytest
+from datetime import datetime, timedelta, timezone
+
+from sre_assistant.tools.log_sketches import SpaceSaving, HyperLogLog, LogSketches, SketchStore
+
+NOW = datetime(2024, 1, 1, 10, 30, tzinfo=timezone.utc)
+
+
+def test_space_saving_keeps_heavy_hitters_in_fixed_memory():
+    """測試 SpaceSaving 在容量有限時仍能找出熱門項目"""
+    sketch = SpaceSaving(capacity=10)
+    for i in range(5000):
+        sketch.add("db-timeout" if i % 3 == 0 else f"noise-{i}")
+        if i % 5 == 0:
+            sketch.add("oom")
+
+    assert len(sketch.counters) == 10
+    top = [item for item, _, _ in sketch.top(2)]
+    assert set(top) == {"db-timeout", "oom"}
+
+
+def test_space_saving_merge_matches_single_stream():
+    """測試分片摘要合併後的熱門項目與單一串流一致"""
+    left, right = SpaceSaving(capacity=8), SpaceSaving(capacity=8)
+    for i in range(1000):
+        (left if i % 2 else right).add("a" if i % 4 else "b")
+        (left if i % 2 else right).add(f"rare-{i}")
+
+    left.merge(SpaceSaving.from_dict(json.loads(json.dumps(right.to_dict()))))
+    top = dict((item, count) for item, count, _ in left.top(2))
+    assert top["a"] >= 750 and top["b"] >= 250
+
+
+def test_hyperloglog_estimates_and_merges():
+    """測試 HyperLogLog 的估計誤差在可接受範圍內，且合併等同於聯集"""
+    a, b = HyperLogLog(), HyperLogLog()
+    a.update(f"pod-{i}" for i in range(20000))
+    b.update(f"pod-{i}" for i in range(10000, 30000))
+    assert abs(a.count() - 20000) / 20000 < 0.05
+
+    restored = HyperLogLog.from_dict(json.loads(json.dumps(a.to_dict())))
+    restored.merge(b)
+    assert abs(restored.count() - 30000) / 30000 < 0.05
+
+    small = HyperLogLog()
+    small.update(["u1", "u2", "u3", "u1"])
+    assert small.count() == 3
+
+
+@pytest.mark.asyncio
+async def test_sketch_store_overwrites_repeated_windows(redis_client):
+    """測試相同日誌範圍重複寫入 (重複查詢或不同副本) 只覆寫同一個分片，計數不會累加"""
+    store = SketchStore(redis_client, prefix="test:sketches")
+    sketches = LogSketches(["pod"])
+    sketches.top_errors.add("t1", 3)
+    sketches.observe({"pod": "api-1"}, {})
+
+    for _ in range(3):
+        assert await store.save("prod", "api", NOW - timedelta(minutes=30), NOW, sketches)
+
+    merged, covered = await store.load("prod", "api", NOW - timedelta(hours=1), NOW)
+    assert merged.top_errors.top(1)[0][:2] == ("t1", 3)
+    assert merged.distinct_counts() == {"pod": 1}
+    assert covered == 30
+
+
+@pytest.mark.asyncio
+async def test_sketch_store_merges_only_non_overlapping_shards(redis_client):
+    """測試跨分片彙總時略過與較長分片重疊的分片，只合併不重疊的時間範圍"""
+    store = SketchStore(redis_client, prefix="test:sketches")
+
+    def shard(template_id: str, count: int, pod: str) -> LogSketches:
+        sketches = LogSketches(["pod"])
+        sketches.top_errors.add(template_id, count)
+        sketches.observe({"pod": pod}, {})
+        return sketches
+
+    await store.save("prod", "api", NOW - timedelta(minutes=60), NOW, shard("t1", 10, "api-1"))
+    # 與上一個分片重疊，不應再計入
+    await store.save("prod", "api", NOW - timedelta(minutes=15), NOW, shard("t1", 4, "api-1"))
+    await store.save("prod", "api", NOW - timedelta(minutes=120), NOW - timedelta(minutes=60), shard("t1", 5, "api-2"))
+    # 超出查詢視窗
+    await store.save("prod", "api", NOW - timedelta(hours=5), NOW - timedelta(hours=4), shard("t9", 99, "api-9"))
+
+    merged, covered = await store.load("prod", "api", NOW - timedelta(hours=3), NOW)
+    assert merged.top_errors.top(5) == [("t1", 15, 0)]
+    assert merged.distinct_counts() == {"pod": 2}
+    assert covered == 120
+    assert await store.load("prod", "other", NOW - timedelta(hours=3), NOW) == (None, 0)
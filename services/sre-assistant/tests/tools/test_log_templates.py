@@ -0,0 +1,115 @@
+"""
+LogTemplateMiner / TemplateStore 的單元測試
+"""
+
+import json
+import pytest
+
+from sre_assistant.tools.log_templates import LogTemplateMiner, TemplateStore, WILDCARD
+
+
+def test_variable_tokens_share_one_template():
+    """測試僅變數不同的日誌行會被歸入同一個模板"""
+    miner = LogTemplateMiner()
+    t1 = miner.add("2024-01-01T10:00:00Z Connection to 10.0.0.1:5432 failed after 300ms user=42")
+    t2 = miner.add("2024-01-01T10:05:13Z Connection to 10.0.0.7:5432 failed after 1200ms user=99")
+    assert t1.template_id == t2.template_id
+    assert t1.size == 2
+    assert WILDCARD in t1.template
+
+
+def test_different_messages_get_different_templates():
+    """測試結構不同的日誌行會產生不同模板"""
+    miner = LogTemplateMiner()
+    t1 = miner.add("NullPointerException in OrderService.process")
+    t2 = miner.add("upstream timed out while reading response header")
+    assert t1.template_id != t2.template_id
+    assert len(miner.templates) == 2
+
+
+def test_template_generalizes_differing_tokens():
+    """測試相似日誌行會把相異位置泛化為萬用字元，且模板 ID 保持穩定"""
+    miner = LogTemplateMiner()
+    t1 = miner.add("login failed for user alice from web")
+    t2 = miner.add("login failed for user bob from web")
+    assert t1.template_id == t2.template_id
+    assert t1.tokens == ["login", "failed", "for", "user", WILDCARD, "from", "web"]
+    assert miner.match("login failed for user carol from web").template_id == t1.template_id
+
+
+def test_serialization_round_trip_keeps_ids():
+    """測試序列化與還原後模板 ID 與比對結果一致"""
+    miner = LogTemplateMiner()
+    template = miner.add("payment gateway returned 503 for order 1234")
+    restored = LogTemplateMiner()
+    restored.load_dict(json.loads(json.dumps(miner.to_dict())))
+    assert restored.match("payment gateway returned 502 for order 99").template_id == template.template_id
+
+
+def test_template_ids_do_not_depend_on_first_seen_line():
+    """測試不同副本以不同的日誌行建立同一模板時，模板 ID 相同"""
+    replica_a, replica_b = LogTemplateMiner(), LogTemplateMiner()
+    a = replica_a.add("connection to db-1 refused by peer")
+    b = replica_b.add("connection to db-7 refused by peer")
+    assert a.template_id == b.template_id
+
+
+def test_merge_dict_converges_similar_templates_to_one_id():
+    """測試相似但 ID 不同的模板合併後不會重複，且兩邊收斂到同一個 ID"""
+    replica_a, replica_b = LogTemplateMiner(), LogTemplateMiner()
+    a = replica_a.add("login failed for user alice from web")
+    b = replica_b.add("login failed for user bob from web")
+    assert a.template_id != b.template_id
+
+    replica_a.merge_dict(replica_b.to_dict())
+    replica_b.merge_dict(replica_a.to_dict())
+
+    assert list(replica_a.templates) == list(replica_b.templates) == [min(a.template_id, b.template_id)]
+    assert replica_a.match("login failed for user carol from web").template_id == min(a.template_id, b.template_id)
+
+
+def test_eviction_removes_a_batch_of_rare_templates():
+    """測試達到模板上限時一次淘汰一批最少出現的模板，而不是每次插入都重建解析樹"""
+    miner = LogTemplateMiner(max_templates=10, evict_fraction=0.5)
+    for word in "alpha bravo charlie delta echo foxtrot golf hotel india juliet".split():
+        miner.add(f"{word} service unavailable")
+    miner.add("alpha service unavailable")
+    rebuilds = []
+    miner._rebuild_tree = lambda original=miner._rebuild_tree: rebuilds.append(1) or original()
+
+    miner.add("kilo queue overflow detected now")
+    miner.add("lima queue overflow detected now")
+
+    assert len(rebuilds) == 1
+    assert len(miner.templates) == 7
+    assert miner.match("alpha service unavailable") is not None
+
+
+@pytest.mark.asyncio
+async def test_template_store_merges_remote_state(redis_client):
+    """測試 TemplateStore 寫回前會合併其他副本的模板"""
+    replica_a, replica_b = LogTemplateMiner(), LogTemplateMiner()
+    a = replica_a.add("disk quota exceeded on volume data-1")
+    b = replica_b.add("circuit breaker opened for inventory client")
+
+    assert await TemplateStore(redis_client, key="test:templates").save(replica_a) is True
+    assert await TemplateStore(redis_client, key="test:templates").save(replica_b) is True
+
+    fresh = LogTemplateMiner()
+    assert await TemplateStore(redis_client, key="test:templates").load(fresh) is True
+    assert {a.template_id, b.template_id} <= set(fresh.templates)
+
+
+@pytest.mark.asyncio
+async def test_template_store_save_is_debounced(redis_client):
+    """測試儲存間隔內的變更只保留在 dirty 狀態，不會每次查詢都寫回整份模板"""
+    store = TemplateStore(redis_client, key="test:templates", save_interval_seconds=60)
+    miner = LogTemplateMiner()
+    miner.add("disk quota exceeded on volume data-1")
+    assert await store.save(miner) is True
+
+    miner.add("circuit breaker opened for inventory client")
+    assert await store.save(miner) is False
+    assert miner.dirty is True
+    assert await store.save(miner, force=True) is True
+    assert len(json.loads(redis_client.strings["test:templates"])["templates"]) == 2
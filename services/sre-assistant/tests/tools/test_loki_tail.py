@@ -0,0 +1,109 @@
+"""
+LokiTailManager 的單元測試
+"""
+
+import asyncio
+import json
+import pytest
+import httpx
+from unittest.mock import MagicMock
+
+from sre_assistant.tools.loki_tool import LokiLogQueryTool
+from sre_assistant.tools.loki_tail import LokiTailManager
+
+
+class FakeWebSocket:
+    """模擬 Loki tail WebSocket：依序送出預先排好的訊息，之後保持連線"""
+
+    def __init__(self, messages):
+        self.messages = messages
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for message in self.messages:
+            yield json.dumps(message)
+        await asyncio.Event().wait()
+
+
+@pytest.fixture
+def loki_tool():
+    config = MagicMock()
+    config.loki.base_url = "http://mock-loki"
+    config.loki.timeout_seconds = 5
+    config.loki.default_limit = 100
+    config.loki.max_time_range = 1440
+    config.loki.get = lambda key, default=None: default
+    return LokiLogQueryTool(config, httpx.AsyncClient())
+
+
+@pytest.mark.asyncio
+async def test_tail_shares_one_upstream_and_fans_out(loki_tool):
+    """測試相同查詢的多個訂閱者共享一條上游連線，且每筆日誌都會扇出"""
+    opened_urls = []
+    message = {"streams": [{"stream": {"app": "api"}, "values": [
+        ["1609459201000000000", "level=error msg=\"db timeout after 30s\""],
+        ["1609459200000000000", "level=info msg=\"request served\""],
+    ]}]}
+
+    def connect(url):
+        opened_urls.append(url)
+        return FakeWebSocket([message])
+
+    manager = LokiTailManager(loki_tool, connect=connect)
+    query = manager.build_query("api", "prod")
+    sub_a = await manager.subscribe(query)
+    sub_b = await manager.subscribe(query)
+
+    first_a, first_b = await sub_a.get(timeout=1), await sub_b.get(timeout=1)
+    assert first_a["message"] == first_b["message"] == "level=info msg=\"request served\""
+    assert (await sub_a.get(timeout=1))["parsed"]["level"] == "ERROR"
+    assert len(opened_urls) == 1
+    assert opened_urls[0].startswith("ws://mock-loki/loki/api/v1/tail?")
+
+    snapshot = manager.snapshot(query)
+    assert snapshot["subscribers"] == 2
+    assert snapshot["total_lines"] == 2
+    assert snapshot["level_distribution"] == {"ERROR": 1, "INFO": 1}
+    assert snapshot["top_errors"][0]["count"] == 1
+
+    await manager.unsubscribe(sub_a)
+    assert manager.snapshot(query)["subscribers"] == 1
+    await manager.unsubscribe(sub_b)
+    assert manager.snapshot(query) is None
+
+
+@pytest.mark.asyncio
+async def test_slow_subscriber_drops_oldest_entries(loki_tool):
+    """測試訂閱者佇列已滿時丟棄最舊的日誌而非阻塞上游"""
+    values = [[str(1609459200000000000 + i * 1000000000), f"line {i}"] for i in range(5)]
+    manager = LokiTailManager(loki_tool, connect=lambda url: FakeWebSocket([{"streams": [{"stream": {}, "values": values}]}]), max_queue_size=2)
+    query = manager.build_query("api", "prod")
+    subscription = await manager.subscribe(query)
+
+    for _ in range(50):
+        if manager.snapshot(query)["total_lines"] == 5:
+            break
+        await asyncio.sleep(0.01)
+
+    assert subscription.dropped == 3
+    assert (await subscription.get(timeout=1))["message"] == "line 3"
+    await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_resolve_query_drops_implicit_default_namespace(loki_tool):
+    """測試未指定 namespace 且 Loki 中沒有 "default" 時只以 service 限定範圍；明確指定時保留"""
+    known = {"app": {"api"}, "namespace": {"prod"}}
+    loki_tool.selector_guard.label_cache.values = lambda label: asyncio.sleep(0, known[label])
+    manager = LokiTailManager(loki_tool, connect=lambda url: FakeWebSocket([]))
+
+    assert await manager.resolve_query("api") == manager.build_query("api", "")
+    assert await manager.resolve_query("api", "prod") == manager.build_query("api", "prod")
@@ -2,7 +2,7 @@ import pytest
 import respx
 import httpx
 from httpx import Response
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, MagicMock
 
 from sre_assistant.tools.loki_tool import LokiLogQueryTool
 
@@ -16,6 +16,7 @@ def mock_config():
     config.loki.timeout_seconds = 5
     config.loki.default_limit = 100
     config.loki.max_time_range = 1440
+    config.loki.get = lambda key, default=None: default
     return config
 
 @pytest.fixture
@@ -114,3 +115,169 @@ async def test_log_aggregation_logic(loki_tool: LokiLogQueryTool):
     assert analysis["total_logs"] == 3
     assert analysis["level_distribution"] == {"ERROR": 2, "WARN": 1}
     assert analysis["error_types"] == {"記憶體不足": 1, "連接超時": 1}
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_loki_aggregate_mode_pushes_counts_to_loki(loki_tool: LokiLogQueryTool):
+    """測試聚合模式以 LogQL 指標查詢取得計數，原始日誌只作為樣本"""
+    def loki_router(request):
+        query = request.url.params["query"]
+        if request.url.path.endswith("/query"):
+            assert query.startswith("sum by (level) (count_over_time(")
+            assert "| logfmt" in query
+            return Response(200, json={"status": "success", "data": {"resultType": "vector", "result": [
+                {"metric": {"level": "error"}, "value": [1609459200, "600"]},
+                {"metric": {"level": "info"}, "value": [1609459200, "400"]},
+            ]}})
+        if "step" in request.url.params:
+            assert query.startswith("sum(rate(")
+            return Response(200, json={"status": "success", "data": {"resultType": "matrix", "result": [
+                {"metric": {}, "values": [[1609459140, "1.5"], [1609459200, "2.0"]]},
+            ]}})
+        assert request.url.params["limit"] == "100"
+        return Response(200, json={"status": "success", "data": {"resultType": "streams", "result": [
+            {"stream": {"app": "big-app"}, "values": [["1609459200000000000", "level=error msg=\"Connection refused\""]]},
+        ]}})
+
+    respx.get(url__regex=f"{BASE_URL}/loki/api/v1/query.*").mock(side_effect=loki_router)
+    loki_tool.profile_store.score = AsyncMock(return_value={})
+
+    result = await loki_tool.execute({"service": "big-app", "aggregate": True, "time_range": 10080})
+
+    assert result.success is True
+    analysis = result.data["analysis"]
+    assert analysis["total_logs"] == 1000
+    assert analysis["sampled_logs"] == 1
+    assert analysis["level_distribution"] == {"ERROR": 600, "INFO": 400}
+    assert analysis["error_percentage"] == 60.0
+    assert [p["errors_per_second"] for p in analysis["error_rate_trend"]] == [1.5, 2.0]
+    assert any("錯誤率過高" in i for i in analysis["critical_indicators"])
+    # 基線比較使用換算回 Loki 錯誤總數的模板計數，而不是樣本中的 1 行
+    assert list(loki_tool.profile_store.score.call_args.args[2].values()) == [600]
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_loki_query_stats_are_attached_and_exported(loki_tool: LokiLogQueryTool):
+    """測試 Loki 回應中的 data.stats 會附加到 metadata 並匯出為 Prometheus 直方圖"""
+    from prometheus_client import REGISTRY
+
+    labels = {"shape": "logs", "line_filter": "level", "caller": "stats-test"}
+    before = REGISTRY.get_sample_value("sre_assistant_loki_query_bytes_processed_sum", labels) or 0.0
+    respx.get(url__regex=f"{BASE_URL}/loki/api/v1/query_range.*").mock(return_value=Response(200, json={
+        "status": "success",
+        "data": {
+            "resultType": "streams",
+            "result": [{"stream": {"app": "test-app"}, "values": [["1609459200000000000", "level=error msg=\"boom\""]]}],
+            "stats": {
+                "summary": {"totalBytesProcessed": 2048, "totalLinesProcessed": 40, "execTime": 0.25, "queueTime": 0.01},
+                "cache": {"chunk": {"entriesRequested": 4, "entriesFound": 3}, "result": {"entriesRequested": 1, "entriesFound": 0}},
+            },
+        },
+    }))
+
+    result = await loki_tool.execute({"service": "test-app", "log_level": "error", "caller": "stats-test"})
+
+    assert result.success is True
+    loki_stats = result.metadata["loki_stats"]
+    assert loki_stats["total_bytes_processed"] == 2048
+    assert loki_stats["total_lines_processed"] == 40
+    assert loki_stats["cache_hits"] == 3 and loki_stats["cache_requests"] == 5
+    assert loki_stats["queries"][0]["shape"] == "logs"
+    assert REGISTRY.get_sample_value("sre_assistant_loki_query_bytes_processed_sum", labels) == before + 2048
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_loki_stratified_sampling_queries_each_bucket(loki_tool: LokiLogQueryTool):
+    """測試分層抽樣模式會逐一查詢各時間桶，並保留各時間桶與罕見錯誤的樣本"""
+    loki_tool.sample_buckets = 3
+    loki_tool.sample_per_stratum = 2
+    calls = []
+
+    def respond(request):
+        bucket = len(calls)
+        calls.append(request.url.params["start"])
+        base = 1609459200000000000 - bucket * 10**12
+        values = [[str(base - i), f"level=error msg=\"timeout talking to db attempt {i}\""] for i in range(50)]
+        if bucket == 2:
+            values.append([str(base - 1000), "level=error msg=\"checksum mismatch on segment\""])
+        return Response(200, json={"status": "success", "data": {"resultType": "streams", "result": [{"stream": {"app": "test-app"}, "values": values}]}})
+
+    respx.get(url__regex=f"{BASE_URL}/loki/api/v1/query_range.*").mock(side_effect=respond)
+
+    result = await loki_tool.execute({"service": "test-app", "stratified": True, "limit": 6})
+
+    assert result.success is True
+    assert len(calls) == 3 and len(set(calls)) == 3
+    messages = [log["message"] for log in result.data["logs"]]
+    assert len(messages) <= 6
+    assert any("checksum mismatch" in m for m in messages)
+    sampling = result.data["analysis"]["sampling"]
+    assert sampling["offered"] == 151
+    assert sampling["buckets"] == 3
+
+def test_sample_stratum_does_not_count_templates(loki_tool: LokiLogQueryTool):
+    """測試抽樣分層只比對模板，不會讓同一行在分析時被重複計數"""
+    known = loki_tool.template_miner.add("timeout talking to db attempt 1")
+    parsed = {"level": "ERROR"}
+
+    assert loki_tool._sample_stratum("timeout talking to db attempt 2", parsed) == ("ERROR", known.template_id)
+    assert loki_tool._sample_stratum("checksum mismatch on segment 7", parsed) == ("ERROR", "checksum mismatch on segment <*>")
+    assert known.size == 1
+    assert len(loki_tool.template_miner.templates) == 1
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_selector_guard_rejects_unbounded_and_narrows_labels(loki_tool: LokiLogQueryTool):
+    """測試無界選擇器會被拒絕、service 會收斂為 Loki 中的實際標籤值，且時間範圍與樣式受到限制與跳脫"""
+    respx.get(f"{BASE_URL}/loki/api/v1/label/app/values").mock(return_value=Response(200, json={"status": "success", "data": ["billing-api", "auth-service"]}))
+    respx.get(f"{BASE_URL}/loki/api/v1/label/namespace/values").mock(return_value=Response(200, json={"status": "success", "data": ["prod"]}))
+    route = respx.get(url__regex=f"{BASE_URL}/loki/api/v1/query_range.*").mock(return_value=Response(200, json={"status": "success", "data": {"resultType": "streams", "result": []}}))
+
+    rejected = await loki_tool.execute({"service": "", "namespace": ""})
+    assert rejected.success is False
+    assert rejected.error.code == "SELECTOR_REJECTED"
+    assert route.call_count == 0
+
+    result = await loki_tool.execute({"service": "billing", "pattern": 'user="a.b"', "time_range": 100000})
+    assert result.success is True
+    query = route.calls[0].request.url.params["query"]
+    assert query.startswith('{app="billing-api"}')
+    assert '|~ "user=\\"a\\\\.b\\""' in query
+    assert result.data["query_params"]["time_range"] == "1440m"
+    assert result.data["query_params"]["requested_time_range"] == "100000m"
+
+    unknown = await loki_tool.execute({"service": "payments", "namespace": "prod"})
+    assert unknown.error.code == "SELECTOR_REJECTED"
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_parser_pattern_is_escaped_in_level_count_query(loki_tool: LokiLogQueryTool):
+    """測試 pattern 解析器的樣式中的引號與反斜線會被跳脫，不會破壞或注入 LogQL"""
+    route = respx.get(f"{BASE_URL}/loki/api/v1/query").mock(return_value=Response(200, json={"status": "success", "data": {"resultType": "vector", "result": []}}))
+
+    await loki_tool._query_level_counts("api", "default", "", 60, "pattern", parser_pattern='<ip> "<method>" \\ <_>')
+
+    query = route.calls.last.request.url.params["query"]
+    assert '| pattern "<ip> \\"<method>\\" \\\\ <_>"' in query
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_repeated_queries_do_not_inflate_sketch_summary(mock_config, http_client, redis_client):
+    """測試重複查詢同一範圍後，跨分片彙總的錯誤計數與不同 pod 數仍與單次查詢相同"""
+    tool = LokiLogQueryTool(mock_config, http_client, redis_client)
+    respx.get(url__regex=f"{BASE_URL}/loki/api/v1/query_range.*").mock(return_value=Response(200, json={
+        "status": "success",
+        "data": {"resultType": "streams", "result": [
+            {"stream": {"app": "api", "pod": "api-1"}, "values": [["1609459200000000000", "level=error msg=\"db timeout\""]]},
+            {"stream": {"app": "api", "pod": "api-2"}, "values": [["1609459100000000000", "level=error msg=\"db timeout\""]]},
+        ]},
+    }))
+
+    for _ in range(3):
+        assert (await tool.execute({"service": "api", "namespace": "prod", "time_range": 30})).success
+
+    summary = await tool.summarize_sketches("api", "prod", hours=1)
+    assert summary["coverage_minutes"] == 30
+    assert summary["distinct_counts"]["pod"] == 2
+    assert [entry["count"] for entry in summary["top_errors"]] == [2]
@@ -0,0 +1,198 @@
+"""
+本地資源庫存鏡像的單元測試
+"""
+
+import pytest
+import respx
+from httpx import Response
+
+from sre_assistant.contracts import ToolResult, ToolError
+from sre_assistant.tools.control_plane_tool import ControlPlaneTool
+from sre_assistant.tools.control_plane_contracts import Resource
+from sre_assistant.tools.resource_inventory import ResourceInventory, InventorySyncer, SQLiteInventoryStore
+
+BASE_URL = "http://mock-control-plane"
+
+
+def _resource(resource_id: str, name: str, updated_at: str, type: str = "server", group_id: str = "grp-1", tags=None) -> dict:
+    return {
+        "id": resource_id, "name": name, "type": type, "status": "healthy", "groupId": group_id,
+        "tags": tags or [], "createdAt": "2026-01-01T00:00:00Z", "updatedAt": updated_at,
+    }
+
+
+def _page(items, page=1, total_pages=1, total=None) -> dict:
+    return {"items": items, "pagination": {"page": page, "pageSize": 100, "total": len(items) if total is None else total, "totalPages": total_pages}}
+
+
+@pytest.fixture
+def tool(make_control_plane_tool):
+    return make_control_plane_tool()
+
+
+def test_indexes_follow_upserts_and_removals():
+    inventory = ResourceInventory()
+    inventory.upsert([
+        {"id": "res-1", "name": "web-01", "type": "server", "group_id": "grp-1", "tags": ["prod", "web"], "updated_at": "2026-01-01T00:00:00+00:00"},
+        {"id": "res-2", "name": "db-01", "type": "database", "group_id": "grp-1", "tags": ["prod"], "updated_at": "2026-01-02T00:00:00+00:00"},
+    ])
+    assert [r["id"] for r in inventory.find(tag="prod")] == ["res-1", "res-2"]
+    assert [r["id"] for r in inventory.find(group_id="grp-1", type="database")] == ["res-2"]
+    assert inventory.cursor == "2026-01-02T00:00:00+00:00"
+
+    # 更新後舊的索引值不應再命中
+    inventory.upsert([{"id": "res-1", "name": "web-01", "type": "server", "group_id": "grp-2", "tags": ["staging"], "updated_at": "2026-01-03T00:00:00+00:00"}])
+    assert inventory.find(group_id="grp-1", tag="web") == []
+    assert [r["id"] for r in inventory.find(tag="staging")] == ["res-1"]
+
+    assert inventory.remove(["res-2", "missing"]) == ["res-2"]
+    assert inventory.find(name="db-01") == [] and len(inventory) == 1
+    # 回傳的是複本，呼叫端修改不影響庫存
+    inventory.get("res-1")["name"] = "changed"
+    assert inventory.get("res-1")["name"] == "web-01"
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_incremental_sync_uses_updated_after_cursor(tool: ControlPlaneTool):
+    """測試首次完整同步後以游標增量同步，並由完整同步移除已刪除的資源"""
+    pages = iter([
+        _page([_resource("res-1", "web-01", "2026-01-01T00:00:00Z"), _resource("res-2", "db-01", "2026-01-02T00:00:00Z")]),
+        _page([_resource("res-2", "db-primary", "2026-01-05T00:00:00Z")]),
+        _page([_resource("res-2", "db-primary", "2026-01-05T00:00:00Z")]),
+    ])
+    route = respx.get(f"{BASE_URL}/api/v1/resources").mock(side_effect=lambda request: Response(200, json=next(pages)))
+    syncer = InventorySyncer(tool, tool.inventory)
+
+    assert await syncer.bootstrap() == 2
+    assert tool.inventory.ready is True
+    assert "updated_after" not in route.calls[0].request.url.params
+
+    assert await syncer.sync() == 1
+    assert route.calls[1].request.url.params["updated_after"].startswith("2026-01-02T00:00:00")
+    assert tool.inventory.find(name="db-primary")[0]["id"] == "res-2"
+
+    await syncer.sync(full=True)
+    assert tool.inventory.ids() == {"res-2"}
+
+
+@pytest.mark.asyncio
+async def test_failed_full_sync_keeps_existing_resources(tool: ControlPlaneTool):
+    tool.inventory.upsert([{"id": "res-1", "name": "web-01", "updated_at": "2026-01-01T00:00:00+00:00"}])
+
+    async def fetch_resources_page(params):
+        return ToolResult(success=False, error=ToolError(code="TIMEOUT_ERROR", message="API request timed out"))
+    tool.fetch_resources_page = fetch_resources_page
+
+    assert await InventorySyncer(tool, tool.inventory).sync(full=True) == 0
+    assert tool.inventory.ids() == {"res-1"}
+    assert tool.inventory.ready is False
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_lookups_resolve_locally_once_inventory_is_ready(tool: ControlPlaneTool):
+    """測試庫存同步完成後，單筆與批次資源查詢不再呼叫 Control Plane"""
+    respx.get(f"{BASE_URL}/api/v1/resources").mock(return_value=Response(200, json=_page([_resource("res-1", "web-01", "2026-01-01T00:00:00Z")])))
+    detail_route = respx.get(f"{BASE_URL}/api/v1/resources/res-1").mock(return_value=Response(500))
+    batch_route = respx.post(f"{BASE_URL}/api/v1/resources/batch").mock(return_value=Response(200, json={
+        "success_count": 0, "failure_count": 1, "failures": [{"resource_id": "res-9", "error": "not found"}], "resources": [],
+    }))
+
+    await InventorySyncer(tool, tool.inventory).bootstrap()
+    detail = await tool.get_resource_details("res-1")
+    bulk = await tool.get_resources_bulk(["res-1", "res-9"])
+
+    assert detail.success is True and detail.data["name"] == "web-01"
+    assert detail_route.call_count == 0
+    assert bulk.data["inventory_hits"] == 1
+    assert bulk.data["missing"] == ["res-9"]
+    assert batch_route.calls[0].request.content.count(b"res-1") == 0
+
+
+@pytest.mark.asyncio
+async def test_sqlite_snapshot_round_trip(tmp_path, tool: ControlPlaneTool):
+    store = SQLiteInventoryStore(str(tmp_path / "inventory.db"))
+    resource = Resource.model_validate(_resource("res-1", "web-01", "2026-01-01T00:00:00Z", tags=["prod"]))
+    await store.save([resource.model_dump()], removed=[])
+
+    async def fetch_resources_page(params):
+        assert "updated_after" in params  # 有快照時直接從游標增量同步
+        return ToolResult(success=True, data={"items": [], "pagination": {"page": 1, "page_size": 100, "total": 0, "total_pages": 1}})
+    tool.fetch_resources_page = fetch_resources_page
+
+    await InventorySyncer(tool, tool.inventory, store=store).bootstrap()
+    assert tool.inventory.find(tag="prod")[0]["name"] == "web-01"
+    assert tool.inventory.ready is True
+
+    await store.save([], removed=["res-1"])
+    assert await store.load() == []
+
+
+@pytest.mark.asyncio
+async def test_incomplete_sync_does_not_advance_cursor(tool: ControlPlaneTool):
+    """測試分頁中途失敗時已收到的資源仍寫入，但游標不前進，下一輪會從原游標重新同步"""
+    tool.inventory.upsert([{"id": "res-0", "name": "old", "updated_at": "2026-01-01T00:00:00+00:00"}])
+    responses = iter([
+        ToolResult(success=True, data={"items": [{"id": "res-9", "name": "newest", "updated_at": "2026-01-09T00:00:00+00:00"}], "pagination": {"page": 1, "page_size": 1, "total": 2, "total_pages": 2}}),
+        ToolResult(success=False, error=ToolError(code="TIMEOUT_ERROR", message="API request timed out")),
+    ])
+
+    async def fetch_resources_page(params):
+        return next(responses)
+    tool.fetch_resources_page = fetch_resources_page
+
+    await InventorySyncer(tool, tool.inventory).sync()
+
+    assert "res-9" in tool.inventory
+    assert tool.inventory.cursor == "2026-01-01T00:00:00+00:00"
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_script_execution_invalidates_inventory_entries(tool: ControlPlaneTool):
+    """測試執行腳本使 resource:<id> 失效後，該資源改由 API 查詢，並在下一輪同步重新抓取"""
+    respx.get(f"{BASE_URL}/api/v1/resources").mock(side_effect=lambda request: Response(200, json=_page(
+        [] if "updated_after" in request.url.params else [_resource("res-1", "web-01", "2026-01-01T00:00:00Z")]
+    )))
+    detail_route = respx.get(f"{BASE_URL}/api/v1/resources/res-1").mock(return_value=Response(200, json=_resource("res-1", "web-01-restarted", "2026-01-01T00:00:00Z")))
+    respx.post(f"{BASE_URL}/api/v1/automation/execute").mock(return_value=Response(202, json={"executionId": "exec-1", "status": "pending"}))
+    batch_route = respx.post(f"{BASE_URL}/api/v1/resources/batch").mock(return_value=Response(200, json={
+        "success_count": 1, "failure_count": 0, "failures": [], "resources": [_resource("res-1", "web-01-restarted", "2026-01-01T00:00:00Z")],
+    }))
+    syncer = InventorySyncer(tool, tool.inventory)
+    await syncer.bootstrap()
+
+    await tool.execute_script("restart", target_resources=["res-1"])
+    detail = await tool.get_resource_details("res-1")
+
+    assert detail.data["name"] == "web-01-restarted" and detail_route.call_count == 1
+    assert tool.inventory.stale == {"res-1"}
+
+    await syncer.sync()
+    assert batch_route.call_count == 1
+    assert tool.inventory.get("res-1")["name"] == "web-01-restarted"
+    assert tool.inventory.stale == set()
+
+
+@pytest.mark.asyncio
+async def test_repeated_sync_failures_take_inventory_out_of_service(tool: ControlPlaneTool):
+    """測試連續同步失敗達上限時 ready 改回 False，成功同步後恢復"""
+    failing = True
+
+    async def fetch_resources_page(params):
+        if failing:
+            return ToolResult(success=False, error=ToolError(code="TIMEOUT_ERROR", message="API request timed out"))
+        return ToolResult(success=True, data={"items": [], "pagination": {"page": 1, "page_size": 100, "total": 0, "total_pages": 1}})
+    tool.fetch_resources_page = fetch_resources_page
+    tool.inventory.ready = True
+    syncer = InventorySyncer(tool, tool.inventory, max_failed_syncs=2)
+
+    await syncer.sync()
+    assert tool.inventory.ready is True
+    await syncer.sync()
+    assert tool.inventory.ready is False
+
+    failing = False
+    await syncer.sync()
+    assert tool.inventory.ready is True and syncer.failed_syncs == 0
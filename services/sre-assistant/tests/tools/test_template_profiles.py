@@ -0,0 +1,113 @@
+"""
+TemplateProfileStore / TemplateProfiler 的單元測試
+"""
+
+import pytest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, MagicMock
+
+from sre_assistant.tools.log_batch import LogBatch
+from sre_assistant.tools.log_templates import LogTemplateMiner
+from sre_assistant.tools.template_profiles import TemplateProfileStore, TemplateProfiler
+
+
+NOW = datetime(2024, 5, 10, 12, 30, tzinfo=timezone.utc)
+
+
+@pytest.mark.asyncio
+async def test_scores_novel_spiking_and_normal_templates(redis_client):
+    """測試依過去幾天的日分桶將模板評為新出現、突增或正常"""
+    store = TemplateProfileStore(redis_client)
+    for days_ago in range(1, 4):
+        # 每天 240 次 → 每小時 10 次
+        await store.record("prod", "api", {"steady": 240, "bursty": 24}, at=NOW - timedelta(days=days_ago))
+
+    scores = await store.score("prod", "api", {"steady": 12, "bursty": 30, "brand-new": 1}, window_minutes=60, at=NOW)
+
+    assert scores["steady"]["status"] == "normal"
+    assert scores["bursty"]["status"] == "spiking"
+    assert scores["bursty"]["baseline_per_hour"] == 1.0
+    assert scores["brand-new"]["status"] == "novel"
+
+
+@pytest.mark.asyncio
+async def test_without_baseline_status_is_unknown(redis_client):
+    """測試沒有任何基線資料時不會誤判為新出現"""
+    store = TemplateProfileStore(redis_client)
+    scores = await store.score("prod", "api", {"anything": 3}, window_minutes=30, at=NOW)
+    assert scores["anything"]["status"] == "unknown"
+
+
+@pytest.mark.asyncio
+async def test_profiler_records_each_period_once(redis_client):
+    """測試背景工作為登記的服務累加上一個完整週期的模板計數，且同一週期只處理一次"""
+    store = TemplateProfileStore(redis_client)
+    await store.track("prod", "api")
+
+    batch = LogBatch()
+    for i in range(3):
+        batch.append(1715340000000000000 + i, {}, f"connection to db-{i} refused")
+    loki_tool = MagicMock()
+    loki_tool.template_miner = LogTemplateMiner()
+    loki_tool._query_logs = AsyncMock(return_value=batch)
+    loki_tool.template_store.save = AsyncMock()
+
+    profiler = TemplateProfiler(loki_tool, store, interval_seconds=3600, catch_up_periods=1)
+    assert await profiler.run_once(now=NOW) == 1
+    assert await profiler.run_once(now=NOW) == 0
+
+    kwargs = loki_tool._query_logs.call_args.kwargs
+    assert kwargs["start_time"] == datetime(2024, 5, 10, 11, 0, tzinfo=timezone.utc)
+    assert kwargs["end_time"] == datetime(2024, 5, 10, 12, 0, tzinfo=timezone.utc)
+    assert kwargs["end_ns"] == 1715342400 * 10**9
+    assert list(redis_client.hashes["loki:template_profile:prod:api:h:2024051011"].values()) == [3]
+
+
+def _profiler_loki_tool():
+    loki_tool = MagicMock()
+    loki_tool.template_miner = LogTemplateMiner()
+    loki_tool.template_store.save = AsyncMock()
+    return loki_tool
+
+
+@pytest.mark.asyncio
+async def test_failed_period_releases_claim_and_is_caught_up(redis_client):
+    """測試抓取失敗時釋放鎖定，下一輪會補記該週期且不重複記錄已完成的週期"""
+    store = TemplateProfileStore(redis_client)
+    await store.track("prod", "api")
+    batch = LogBatch()
+    batch.append(1715340000000000000, {}, "connection to db-1 refused")
+    loki_tool = _profiler_loki_tool()
+    loki_tool._query_logs = AsyncMock(side_effect=[RuntimeError("loki down"), batch, batch])
+
+    profiler = TemplateProfiler(loki_tool, store, interval_seconds=3600, catch_up_periods=2)
+    assert await profiler.run_once(now=NOW) == 1
+    assert "loki:template_profile:job:1715338800:prod/api" not in redis_client.strings
+    assert await profiler.run_once(now=NOW) == 1
+    assert await profiler.run_once(now=NOW) == 0
+
+    assert list(redis_client.hashes["loki:template_profile:prod:api:h:2024051010"].values()) == [1]
+    assert list(redis_client.hashes["loki:template_profile:prod:api:h:2024051011"].values()) == [1]
+
+
+@pytest.mark.asyncio
+async def test_profiler_pages_through_the_whole_period(redis_client):
+    """測試單頁達到 fetch_limit 時往回分頁，而不是只計入最新的一頁"""
+    store = TemplateProfileStore(redis_client)
+    await store.track("prod", "api")
+    end_ns = 1715342400 * 10**9
+    pages = []
+    for page in range(3):
+        batch = LogBatch()
+        for i in range(2 if page < 2 else 1):
+            # 相鄰兩行只差 1 ns，游標不可經過 datetime 截斷
+            batch.append(end_ns - (page * 2 + i + 1) * 10**9 - i, {}, "connection to db-1 refused")
+        pages.append(batch)
+    loki_tool = _profiler_loki_tool()
+    loki_tool._query_logs = AsyncMock(side_effect=pages)
+
+    profiler = TemplateProfiler(loki_tool, store, interval_seconds=3600, fetch_limit=2, catch_up_periods=1)
+    assert await profiler.run_once(now=NOW) == 1
+
+    assert list(redis_client.hashes["loki:template_profile:prod:api:h:2024051011"].values()) == [5]
+    assert [call.kwargs["end_ns"] for call in loki_tool._query_logs.call_args_list] == [end_ns, end_ns - 2 * 10**9 - 1, end_ns - 4 * 10**9 - 1]